@@ -1,8 +1,9 @@
 # gateway/main.py
 import os
 import time
+import hashlib
 import logging
-from collections import defaultdict, deque
+from contextlib import asynccontextmanager
 from typing import Dict, Any
 from pathlib import Path
 
@@ -11,10 +12,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
-from openai import OpenAI
 # === Prometheus Metrics（minimal set） ===
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
-from services.retrieval_service import retrieve_best
+# 多 worker 部署請設 PROMETHEUS_MULTIPROC_DIR（見 services/prom_multiprocess.py）
+from prometheus_client import Counter, Histogram
+from services.async_logging import setup_async_logging
+from services.openai_pool import close_client
+from services.prom_multiprocess import mark_worker_exit, render_latest
+from services.provider_pool import NoHealthyUpstream, Upstream, build_pool
+from services.rate_limiter import Limit, build_limiter, retry_after_header
+from services.response_cache import bucket_key, build_response_cache, cache_key
+from services.retrieval_service import embed_query, ensure_index, search_best
+from services import tracing
+from services.tracing import span, trace, traced
 
 REQS = Counter(
     "gateway_requests_total", "Total HTTP requests",
@@ -28,31 +37,78 @@ ERRS = Counter(
     "gateway_errors_total", "Errors by type",
     labelnames=["route", "type"]
 )
+CACHE_HITS = Counter(
+    "gateway_response_cache_hits_total", "Response cache hits by kind (exact/semantic)",
+    labelnames=["kind"]
+)
+CACHE_MISSES = Counter(
+    "gateway_response_cache_misses_total", "Response cache misses"
+)
+UPSTREAM_REQS = Counter(
+    "gateway_upstream_requests_total", "LLM upstream attempts by outcome (ok/error/client_error/cancelled)",
+    labelnames=["upstream", "outcome"]
+)
+UPSTREAM_LAT = Histogram(
+    "gateway_upstream_duration_seconds", "LLM upstream attempt latency (seconds)",
+    labelnames=["upstream"]
+)
+STAGE_LAT = Histogram(
+    "gateway_stage_duration_seconds", "Per-stage latency within /ask (embed/search/cache/llm/...)",
+    labelnames=["stage"]
+)
+# 各階段耗時寫進 STAGE_LAT；TRACING_EXPORTER 有設時另外匯出 OpenTelemetry span（見 services/tracing.py）
+tracing.configure(histogram=STAGE_LAT, service_name="day18-gateway")
 
 # ============================================================
 # 🟠 Logging：同時輸出 console + 檔案 gateway.log
+#   - LOG_ASYNC=true（預設）：JSON lines，event loop 只丟 queue，背景執行緒批次寫檔
+#     （buffer 滿時抽樣 / 丟棄，不阻塞請求；見 services/async_logging.py）
+#   - LOG_ASYNC=false：舊的同步 handler（每筆都在 event loop 上格式化 + 寫檔）
 # ============================================================
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
 root_logger = logging.getLogger()
+_log_handler = None
 if not root_logger.handlers:
-    root_logger.setLevel(logging.INFO)
-    fmt = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-
-    # Console Handler
-    ch = logging.StreamHandler()
-    ch.setFormatter(fmt)
-    root_logger.addHandler(ch)
-
-    # File Handler
-    fh = logging.FileHandler("gateway.log", encoding="utf-8")
-    fh.setFormatter(fmt)
-    root_logger.addHandler(fh)
+    handlers = [logging.StreamHandler(), logging.FileHandler("gateway.log", encoding="utf-8")]
+    if LOG_ASYNC:
+        _log_handler = setup_async_logging(
+            root_logger, handlers,
+            maxsize=int(os.getenv("LOG_QUEUE_MAXSIZE", "10000")),
+            batch_size=int(os.getenv("LOG_BATCH_SIZE", "256")),
+            flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL_MS", "200")) / 1000,
+            sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "0.1")),
+        )
+    else:
+        root_logger.setLevel(logging.INFO)
+        fmt = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+        for h in handlers:
+            h.setFormatter(fmt)
+            root_logger.addHandler(h)
 
 log = logging.getLogger(__name__)
 
 # ============================================================
 # 🟢 FastAPI 初始化 + CORS
+#   - lifespan：啟動時先建好檢索索引（避免第一個請求吃冷啟動），關閉時釋放連線池
 # ============================================================
-app = FastAPI(title="LLM Gateway (Day18)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await ensure_index()
+    except Exception:
+        log.exception("[startup] retrieval index warm-up failed; will build lazily")
+    yield
+    await close_client()
+    pool.reset_clients()
+    await limiter.close()
+    if response_cache is not None:
+        await response_cache.close()
+    tracing.shutdown()
+    mark_worker_exit()
+    if _log_handler is not None:
+        _log_handler.stop()
+
+app = FastAPI(title="LLM Gateway (Day18)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -63,6 +119,10 @@ app.add_middleware(
 
 # ============================================================
 # 🟢 讀取環境變數 / 初始化 OpenAI
+#   - AsyncOpenAI + 共用 httpx 連線池（見 services/openai_pool.py）
+#   - LLM 呼叫期間不佔 threadpool，併發量不再受限於 worker 的執行緒數
+#   - 多上游：LLM_UPSTREAMS 設定多組 base_url / key，依 EWMA 延遲路由 + 熔斷 + hedging
+#     （見 services/provider_pool.py；沒設就只有 OPENAI_BASE_URL 一個上游）
 # ============================================================
 load_dotenv()
 
@@ -70,9 +130,17 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("沒有找到 OPENAI_API_KEY，請在 .env 或環境變數中設定！")
 
-OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
-client = OpenAI(timeout=OPENAI_TIMEOUT, max_retries=0)
+
+def _observe_upstream(upstream: str, outcome: str, seconds: float) -> None:
+    UPSTREAM_REQS.labels(upstream, outcome).inc()
+    if outcome == "ok":
+        UPSTREAM_LAT.labels(upstream).observe(seconds)
+
+pool = build_pool(on_result=_observe_upstream)
+
+# 回應快取（RESPONSE_CACHE_BACKEND=off | memory | redis，見 services/response_cache.py）
+response_cache = build_response_cache()
 
 # ============================================================
 # 🟢 前端頁面（serve index.html）
@@ -97,68 +165,137 @@ app.mount("/_static", StaticFiles(directory=FRONTEND_DIR, html=True), name="fron
 def healthz():
     return {"ok": True}
 
+# 各上游目前的 EWMA 延遲 / p95 / 錯誤率 / 熔斷狀態
+@app.get("/upstreams")
+def upstreams():
+    return {"hedge": pool.hedge, "upstreams": pool.snapshot()}
+
 # ============================================================
 # 🟢 metrics 
 # 目的：
 # - 暴露 Prometheus 可抓取的指標（text exposition format）。
 # - 部署時在 Prometheus 設定 scrape_configs 指向此端點即可。
+# - 有設 PROMETHEUS_MULTIPROC_DIR 時回傳所有 worker 加總後的值（不管 scrape 打到哪個 worker）。
 # ============================================================
 @app.get("/metrics")
 def metrics():
     # CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
-    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    data, content_type = render_latest()
+    return Response(content=data, media_type=content_type)
 
 # ============================================================
-# 🟢 記憶體限流 (In-Memory Rate Limit)
-#   - Demo 用：每 IP 每分鐘最多 10 次
-#   - 程式重啟會清空；多 worker/多機不共享狀態；LB/水平擴展時無法全局生效
-#   - 生產環境請換 Redis / 雲端 API Gateway
+# 🟢 限流 (Token Bucket，見 services/rate_limiter.py)
+#   - RATE_LIMIT_BACKEND=memory：行程內，O(1)/key，補滿的 key 定期 GC；多 worker 不共享
+#   - RATE_LIMIT_BACKEND=redis ：Lua script 原子扣款，多 worker / 多機全域生效
+#   - 請求數：每 IP、每 API Key（X-API-Key）、每模型各一個桶（0 = 不限，跳過該桶）
+#   - Token 配額：每個呼叫者（API Key，沒有就用 IP）prompt + completion tokens，事後依 usage 扣款
 # ============================================================
 _WINDOW_SEC = int(os.getenv("RATE_LIMIT_WINDOW_SEC", "60"))
 _LIMIT = int(os.getenv("RATE_LIMIT_MAX_PER_IP", "10"))
-_BUCKETS: dict[str, deque] = defaultdict(deque)
+_LIMIT_PER_KEY = int(os.getenv("RATE_LIMIT_MAX_PER_KEY", "0"))
+_LIMIT_PER_MODEL = int(os.getenv("RATE_LIMIT_MAX_PER_MODEL", "0"))
+_TOKEN_QUOTA = int(os.getenv("TOKEN_QUOTA_PER_CALLER", "0"))
+_TOKEN_QUOTA_WINDOW_SEC = int(os.getenv("TOKEN_QUOTA_WINDOW_SEC", "3600"))
+if _WINDOW_SEC <= 0 or _TOKEN_QUOTA_WINDOW_SEC <= 0:
+    raise ValueError("RATE_LIMIT_WINDOW_SEC and TOKEN_QUOTA_WINDOW_SEC must be > 0")
 
-def in_memory_rate_limit(request: Request):
-    ip = request.client.host
-    now = time.time()
-    dq = _BUCKETS[ip]
+limiter = build_limiter()
 
-    # 移除視窗外的請求
-    while dq and now - dq[0] > _WINDOW_SEC:
-        dq.popleft()
+def _caller_id(request: Request) -> str:
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        # 不把原始 key 寫進限流器 / Redis
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return f"ip:{request.client.host}"
 
-    if len(dq) >= _LIMIT:
-        raise HTTPException(status_code=429, detail="Too Many Requests (demo limiter)")
-    dq.append(now)
+@traced("rate_limit")
+async def rate_limit(request: Request) -> str:
+    """依序檢查各個桶；任何一個不夠就 429。回傳 caller id（給事後 token 記帳用）"""
+    caller = _caller_id(request)
+    checks = []
+    if _LIMIT > 0:
+        checks.append((f"req:ip:{request.client.host}", Limit(_LIMIT, _WINDOW_SEC), 1))
+    if _LIMIT_PER_KEY > 0 and caller.startswith("key:"):
+        checks.append((f"req:{caller}", Limit(_LIMIT_PER_KEY, _WINDOW_SEC), 1))
+    if _LIMIT_PER_MODEL > 0:
+        checks.append((f"req:model:{CHAT_MODEL}", Limit(_LIMIT_PER_MODEL, _WINDOW_SEC), 1))
+    if _TOKEN_QUOTA > 0:
+        # cost=0：還沒把配額用成負數就放行；實際用量在回答後 debit
+        checks.append((f"tok:{caller}", Limit(_TOKEN_QUOTA, _TOKEN_QUOTA_WINDOW_SEC), 0))
+
+    for key, lim, cost in checks:
+        d = await limiter.acquire(key, lim, cost)
+        if not d.allowed:
+            raise HTTPException(status_code=429, detail="Too Many Requests", headers=retry_after_header(d))
+    return caller
+
+async def charge_tokens(caller: str, tokens: int) -> None:
+    if _TOKEN_QUOTA > 0 and tokens > 0:
+        await limiter.debit(f"tok:{caller}", Limit(_TOKEN_QUOTA, _TOKEN_QUOTA_WINDOW_SEC), tokens)
 
 # ============================================================
 # 🟢 小工具：檢索 + LLM 回答
 # ============================================================
-def handle_ask(question: str, temperature: float = 0.2) -> Dict[str, Any]:
+@traced("ask")
+async def handle_ask(question: str, temperature: float = 0.2) -> Dict[str, Any]:
     q = (question or "").strip()
     if not q:
         raise HTTPException(status_code=400, detail="question is required")
 
-    # 1) 檢索知識庫
-    context, dist = retrieve_best(q, k=3)
+    # 1) 檢索知識庫（查詢向量留著給語意快取用）
+    q_emb = await embed_query(q)
+    context, dist = await search_best(q_emb, k=3)
 
-    # 2) 呼叫 LLM
+    # 2) 回應快取：精準（問題 + context + 模型 + temperature）→ 語意（同 bucket 的近似問題）
+    bucket = bucket_key(context, CHAT_MODEL, temperature)
+    key = cache_key(q, bucket)
+    if response_cache is not None:
+        with span("cache_lookup"):
+            cached, kind, score = await response_cache.get(key), "exact", 1.0
+            if cached is None:
+                hit = await response_cache.get_similar(bucket, q_emb)
+                if hit is not None:
+                    (cached, score), kind = hit, "semantic"
+        if cached is not None:
+            CACHE_HITS.labels(kind).inc()
+            return {
+                "question": q,
+                "context": context,
+                "answer": cached["answer"],
+                "debug": {"l2": dist, "model": cached["model"], "upstream": cached["upstream"],
+                          "total_tokens": 0, "cache": kind, "similarity": round(score, 4)}
+            }
+        CACHE_MISSES.inc()
+
+    # 3) 呼叫 LLM
     messages = [
         {"role": "system", "content": "你是一個企業 FAQ 助理。"},
         {"role": "user", "content": f"根據以下知識庫內容回答：\n{context}\n\n問題：{q}"},
     ]
-    resp = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=messages,
-        temperature=temperature,
-    )
+    async def _chat(up: Upstream):
+        resp = await up.client.chat.completions.create(
+            model=up.model or CHAT_MODEL,
+            messages=messages,
+            temperature=temperature,
+        )
+        return up, resp
+
+    with span("llm") as s:
+        up, resp = await pool.call(_chat)
+        s.set("upstream", up.name)
     answer = resp.choices[0].message.content
+    total_tokens = resp.usage.total_tokens if resp.usage else 0
+    if response_cache is not None:
+        with span("cache_store"):
+            await response_cache.set(key, bucket, q_emb,
+                                     {"answer": answer, "model": up.model or CHAT_MODEL, "upstream": up.name})
 
     return {
         "question": q,
         "context": context,
         "answer": answer,
-        "debug": {"l2": dist, "model": CHAT_MODEL}
+        "debug": {"l2": dist, "model": up.model or CHAT_MODEL, "upstream": up.name,
+                  "total_tokens": total_tokens, "cache": "miss"}
     }
 
 # ============================================================
@@ -167,24 +304,37 @@ def handle_ask(question: str, temperature: float = 0.2) -> Dict[str, Any]:
 #   - 成功與失敗都會 log
 # ============================================================
 @app.post("/ask")
-def ask(payload: Dict[str, Any], request: Request):
+async def ask(payload: Dict[str, Any], request: Request):
     # 🟢 限流檢查
-    in_memory_rate_limit(request)
+    caller = await rate_limit(request)
 
     q = (payload.get("question") or "").strip()
     temp = float(payload.get("temperature", 0.2))
 
     # 🟠 Logging：記錄來源與問題
-    log.info(f"[ASK] ip={request.client.host} q={q!r} temp={temp}")
+    log.info("[ASK] request", extra={"ip": request.client.host, "q": q, "temp": temp})
 
     start = time.time()
     try:
-        result = handle_ask(q, temp)
-        log.info(f"[ASK] success in {time.time()-start:.2f}s, answer_len={len(result['answer'])}")
+        with trace() as t:
+            result = await handle_ask(q, temp)
+        # 各階段耗時（ms）：embed / search / cache_lookup / llm / ...
+        result["debug"]["stages_ms"] = t.ms()
+        await charge_tokens(caller, result["debug"]["total_tokens"])
+        log.info("[ASK] success", extra={
+            "latency_s": round(time.time() - start, 3),
+            "stages_ms": result["debug"]["stages_ms"],
+            "answer_len": len(result["answer"]),
+            "cache": result["debug"].get("cache"),
+            "upstream": result["debug"].get("upstream"),
+        })
         return result
     except HTTPException:
         log.exception("[ASK] http error")
         raise
+    except NoHealthyUpstream:
+        log.exception("[ASK] all upstreams unavailable")
+        return JSONResponse(status_code=503, content={"error": "no healthy upstream"})
     except Exception:
         log.exception("[ASK] failed")
         return JSONResponse(status_code=500, content={"error": "internal error"})
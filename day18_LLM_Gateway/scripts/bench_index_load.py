@@ -0,0 +1,114 @@
+# scripts/bench_index_load.py
+"""
+檢索索引載入基準測試：舊 JSON（vector_index.json）vs 二進位 FAISS + mmap chunk blob
+
+量測：
+- startup：開索引到可以查詢所需時間 + RSS 增量
+- per-query：取出 top-1 chunk 文字的耗時與 Python 配置量（tracemalloc peak）
+  - json-reread：舊版 retrieve_best 的做法，每次查詢重讀 + 重 parse 整個 JSON
+  - mmap-offset：依 offset 從 mmap blob 切出單一 chunk
+
+資料為隨機合成向量，不呼叫 API。
+
+用法：
+    python scripts/bench_index_load.py
+    python scripts/bench_index_load.py --n 20000 --dim 1536 --queries 5
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from services.index_store import ChunkStore, read_index, write_store  # noqa: E402
+
+
+def _rss_mb() -> float:
+    # Linux 讀目前 RSS；其他平台退回 ru_maxrss（峰值，增量會偏低）
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _timed(fn):
+    rss0, t0 = _rss_mb(), time.perf_counter()
+    out = fn()
+    return out, (time.perf_counter() - t0) * 1000, _rss_mb() - rss0
+
+
+def _per_query(fn, ids) -> tuple:
+    times, peaks = [], []
+    for i in ids:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn(int(i))
+        times.append((time.perf_counter() - t0) * 1e6)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return np.median(times), np.median(peaks)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=5000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=5, help="json-reread 每次都要 parse 整包，別設太大")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.n, args.dim), dtype=np.float32)
+    chunks = [f"第 {i} 段：請假、加班、報銷等規定說明。" * 5 for i in range(args.n)]
+    ids = rng.integers(0, args.n, size=args.queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        json_path = tmp / "vector_index.json"
+        json_path.write_text(
+            json.dumps({"items": [{"vector": v.tolist(), "chunk": c} for v, c in zip(vectors, chunks)]}),
+            encoding="utf-8",
+        )
+        write_store(tmp / "index", vectors, chunks)
+        del vectors
+        print(f"n={args.n} dim={args.dim}  json={json_path.stat().st_size / 1e6:.1f} MB  "
+              f"faiss={(tmp / 'index' / 'index.faiss').stat().st_size / 1e6:.1f} MB")
+
+        def load_mmap():
+            return read_index(tmp / "index"), ChunkStore(tmp / "index")
+
+        (index, store), ms, rss = _timed(load_mmap)
+        print(f"startup  mmap-offset   {ms:9.1f} ms  rss +{rss:7.1f} MB  ntotal={index.ntotal}")
+
+        def load_json():
+            data = json.loads(json_path.read_text(encoding="utf-8"))
+            v = np.array([it["vector"] for it in data["items"]], dtype="float32")
+            idx = faiss.IndexFlatL2(v.shape[1])
+            idx.add(v)
+            return idx
+
+        _, ms, rss = _timed(load_json)
+        print(f"startup  json-parse    {ms:9.1f} ms  rss +{rss:7.1f} MB")
+
+        def json_reread(i):
+            return json.loads(json_path.read_text(encoding="utf-8"))["items"][i]["chunk"]
+
+        for name, fn in (("mmap-offset", store.get), ("json-reread", json_reread)):
+            us, peak = _per_query(fn, ids)
+            print(f"query    {name:<12}  {us:9.1f} µs  alloc peak {peak / 1024:10.1f} KB")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
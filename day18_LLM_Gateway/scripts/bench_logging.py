@@ -0,0 +1,129 @@
+# scripts/bench_logging.py
+"""
+日誌對請求延遲的影響：off / sync（舊版 FileHandler，f-string）/ async（QueueHandler + 背景批次寫 JSON）
+
+建一個和 /ask 一樣每個請求寫 2 筆 log 的最小 FastAPI app，用 httpx ASGITransport
+在行程內以高並發打（不經網路），比較每個請求的 p50 / p99 與 RPS。
+
+用法：
+    python scripts/bench_logging.py
+    python scripts/bench_logging.py --requests 20000 --concurrency 200
+    python scripts/bench_logging.py --write-delay-ms 1      # 模擬慢磁碟 / 被塞住的 stdout pipe
+    python scripts/bench_logging.py --queue-maxsize 100     # 小 buffer：看 async 模式的丟棄 / 抽樣
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, Request
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from services.async_logging import setup_async_logging  # noqa: E402
+
+
+def build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+    log = logging.getLogger(f"bench.{mode}")
+
+    @app.post("/ask")
+    async def ask(payload: dict, request: Request):
+        q = payload.get("question", "")
+        start = time.time()
+        if mode == "sync":
+            log.info(f"[ASK] ip={request.client.host} q={q!r} temp=0.2")
+            log.info(f"[ASK] success in {time.time()-start:.2f}s, answer_len=42")
+        elif mode == "async":
+            log.info("[ASK] request", extra={"ip": request.client.host, "q": q, "temp": 0.2})
+            log.info("[ASK] success", extra={"latency_s": round(time.time() - start, 3), "answer_len": 42})
+        return {"answer": "ok"}
+
+    return app
+
+
+class SlowFileHandler(logging.FileHandler):
+    """每次 write 多睡 delay 秒（阻塞），模擬慢磁碟 / 網路檔案系統 / 被塞住的 pipe"""
+
+    def __init__(self, path: str, delay: float):
+        super().__init__(path, encoding="utf-8")
+        self._delay = delay
+        raw_write = self.stream.write
+
+        def slow_write(data):
+            time.sleep(self._delay)
+            return raw_write(data)
+
+        self.stream.write = slow_write
+
+
+def configure(mode: str, path: str, args):
+    log = logging.getLogger(f"bench.{mode}")
+    log.propagate = False
+    fh = SlowFileHandler(path, args.write_delay_ms / 1000) if args.write_delay_ms > 0 \
+        else logging.FileHandler(path, encoding="utf-8")
+    if mode == "sync":
+        fh.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        log.addHandler(fh)
+        log.setLevel(logging.INFO)
+        return None
+    if mode == "async":
+        return setup_async_logging(log, [fh], maxsize=args.queue_maxsize, batch_size=args.batch_size)
+    fh.close()
+    log.setLevel(logging.CRITICAL)
+    return None
+
+
+async def run(mode: str, args) -> None:
+    with tempfile.NamedTemporaryFile(suffix=".log", delete=False) as f:
+        path = f.name
+    handler = configure(mode, path, args)
+    transport = httpx.ASGITransport(app=build_app(mode))
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def one(i):
+            async with sem:
+                t0 = time.perf_counter()
+                await client.post("/ask", json={"question": f"加班規則是什麼？#{i}"})
+                latencies.append((time.perf_counter() - t0) * 1e6)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(args.requests)])
+        elapsed = time.perf_counter() - t0
+
+    dropped = 0
+    if handler is not None:
+        handler.stop()
+        dropped = handler.dropped
+    lines = sum(1 for _ in open(path, encoding="utf-8"))
+    os.unlink(path)
+    us = np.asarray(latencies)
+    print(
+        f"{mode:<6} rps={args.requests / elapsed:8.0f}  p50={np.percentile(us, 50):8.1f} µs  "
+        f"p99={np.percentile(us, 99):8.1f} µs  lines={lines:>6}  dropped={dropped}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=10000)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--queue-maxsize", type=int, default=10000)
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--write-delay-ms", type=float, default=0.0, help="每次 write 額外阻塞的毫秒數")
+    args = ap.parse_args()
+    for mode in ("off", "sync", "async"):
+        asyncio.run(run(mode, args))
+
+
+if __name__ == "__main__":
+    main()
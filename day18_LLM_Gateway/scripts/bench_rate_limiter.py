@@ -0,0 +1,95 @@
+# scripts/bench_rate_limiter.py
+"""
+限流器每次判斷的額外延遲（目標 < 100µs / request）
+
+- legacy deque  ：舊版 in_memory_rate_limit（每 IP 一個 timestamp deque，滑動視窗）
+- memory bucket ：MemoryTokenBucket（O(1)，含定期 GC）
+- redis bucket  ：RedisTokenBucket（一次 EVALSHA；預設 fakeredis，不含網路 RTT）
+
+用法：
+    python scripts/bench_rate_limiter.py
+    python scripts/bench_rate_limiter.py --keys 10000 --ops 100000
+    python scripts/bench_rate_limiter.py --redis-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from services.rate_limiter import Limit, MemoryTokenBucket, RedisTokenBucket  # noqa: E402
+
+
+class LegacyDeque:
+    """gateway/main.py 舊版 in_memory_rate_limit 的邏輯（不丟例外，改回傳 bool）"""
+
+    def __init__(self, window: float, limit: int):
+        self.window, self.limit = window, limit
+        self.buckets = defaultdict(deque)
+
+    async def acquire(self, key, _limit, cost=1):
+        now = time.time()
+        dq = self.buckets[key]
+        while dq and now - dq[0] > self.window:
+            dq.popleft()
+        if len(dq) >= self.limit:
+            return False
+        dq.append(now)
+        return True
+
+
+async def bench(lim, keys, ops: int, limit: Limit) -> np.ndarray:
+    samples = np.empty(ops)
+    for i in range(ops):
+        key = keys[i % len(keys)]
+        t0 = time.perf_counter()
+        await lim.acquire(key, limit)
+        samples[i] = (time.perf_counter() - t0) * 1e6
+    return samples
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--keys", type=int, default=1000, help="不同 client 數")
+    ap.add_argument("--ops", type=int, default=50000)
+    ap.add_argument("--limit", type=int, default=600, help="每個 key 每 60 秒允許的請求數")
+    ap.add_argument("--redis-url", default=None, help="不給就用 fakeredis")
+    args = ap.parse_args()
+
+    limit = Limit(args.limit, 60)
+    keys = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(args.keys)]
+
+    if args.redis_url:
+        redis_lim = RedisTokenBucket(args.redis_url, prefix="bench-ratelimit")
+    else:
+        import fakeredis
+        redis_lim = RedisTokenBucket(client=fakeredis.FakeAsyncRedis(decode_responses=True), prefix="bench-ratelimit")
+
+    limiters = {
+        "legacy deque": LegacyDeque(60, args.limit),
+        "memory bucket": MemoryTokenBucket(),
+        "redis bucket": redis_lim,
+    }
+    for name, lim in limiters.items():
+        ops = args.ops if name != "redis bucket" else min(args.ops, 10000)
+        us = await bench(lim, keys, ops, limit)
+        print(
+            f"{name:<14} p50={np.percentile(us, 50):8.2f} µs  p99={np.percentile(us, 99):8.2f} µs  "
+            f"mean={us.mean():8.2f} µs  (ops={ops})"
+        )
+
+    keys_left = [k async for k in redis_lim.r.scan_iter("bench-ratelimit:*")]
+    if keys_left:
+        await redis_lim.r.delete(*keys_left)
+    await redis_lim.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
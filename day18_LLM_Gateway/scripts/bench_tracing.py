@@ -0,0 +1,81 @@
+# scripts/bench_tracing.py
+"""
+每個 span 的額外開銷（目標：關閉時 < 5µs）
+
+- disabled     ：TRACING_ENABLED=false（共用 no-op）
+- histogram    ：只寫 stage histogram（預設）
+- hist + trace ：再加上 trace() 收集單一請求的各階段耗時（gateway /ask 的情況）
+- otel file    ：再加上 OpenTelemetry span 匯出到檔案（需安裝 opentelemetry-sdk）
+
+用法：
+    python scripts/bench_tracing.py
+    python scripts/bench_tracing.py --spans 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from prometheus_client import CollectorRegistry, Histogram  # noqa: E402
+
+from services import tracing  # noqa: E402
+from services.tracing import span, trace, traced  # noqa: E402
+
+
+def per_span_us(n: int, with_trace: bool = False) -> tuple:
+    @traced("decorated")
+    def f():
+        return 1
+
+    def loop():
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with span("ctx"):
+                pass
+        t1 = time.perf_counter()
+        for _ in range(n):
+            f()
+        t2 = time.perf_counter()
+        return (t1 - t0) / n * 1e6, (t2 - t1) / n * 1e6
+
+    if with_trace:
+        with trace():
+            return loop()
+    return loop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--spans", type=int, default=100000)
+    args = ap.parse_args()
+
+    hist = Histogram("bench_stage_seconds", "stage", ["stage"], registry=CollectorRegistry())
+    cases = [
+        ("disabled", dict(enabled=False, exporter="none"), False),
+        ("histogram", dict(enabled=True, exporter="none"), False),
+        ("hist + trace", dict(enabled=True, exporter="none"), True),
+    ]
+    try:
+        import opentelemetry.sdk  # noqa: F401
+        os.environ["TRACING_FILE"] = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+        cases.append(("otel file", dict(enabled=True, exporter="file"), True))
+    except ImportError:
+        print("(未安裝 opentelemetry-sdk，略過 otel file)")
+
+    print(f"{'mode':<14} {'with span()':>14} {'@traced':>14}")
+    for name, cfg, with_trace in cases:
+        tracing.configure(histogram=hist, **cfg)
+        # BatchSpanProcessor 的 queue 只有 2048，otel 模式少跑一點，不然量到的是丟 span 的路徑
+        n = min(args.spans, 1000) if cfg["exporter"] != "none" else args.spans
+        ctx_us, deco_us = per_span_us(n, with_trace)
+        print(f"{name:<14} {ctx_us:11.3f} µs {deco_us:11.3f} µs")
+    tracing.shutdown()
+
+
+if __name__ == "__main__":
+    main()
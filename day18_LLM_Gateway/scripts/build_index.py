@@ -0,0 +1,71 @@
+# scripts/build_index.py
+"""
+離線建檢索索引：embed chunk → 寫出 FAISS 二進位索引 + chunk 文字 blob（見 services/index_store.py）
+gateway 啟動時直接 mmap 開，不再冷啟動 embed，也不再每次查詢重讀 JSON。
+
+用法：
+    python scripts/build_index.py                                  # embed 內建 DOCS
+    python scripts/build_index.py --docs my_chunks.txt              # 一行一個 chunk
+    python scripts/build_index.py --from-json data/vector_index.json  # 舊格式轉檔（不呼叫 API）
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from services.index_store import write_store  # noqa: E402
+
+
+async def embed_chunks(chunks, batch_size: int) -> np.ndarray:
+    from services.openai_pool import close_client
+    from services.retrieval_service import _get_embeddings
+
+    vectors = []
+    try:
+        for i in range(0, len(chunks), batch_size):
+            vectors.extend(await _get_embeddings(chunks[i:i + batch_size]))
+            print(f"embedded {min(i + batch_size, len(chunks))}/{len(chunks)}")
+    finally:
+        await close_client()
+    return np.array(vectors, dtype="float32")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", default=os.getenv("RETRIEVAL_INDEX_DIR", "data/index"))
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--docs", help="文字檔，一行一個 chunk")
+    src.add_argument("--from-json", help="舊格式 vector_index.json（items: [{vector, chunk}]）")
+    ap.add_argument("--batch-size", type=int, default=256, help="每次 embeddings API 的 input 筆數")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    if args.from_json:
+        items = json.loads(Path(args.from_json).read_text(encoding="utf-8")).get("items", [])
+        chunks = [it["chunk"] for it in items]
+        vectors = np.array([it["vector"] for it in items], dtype="float32")
+    else:
+        if args.docs:
+            lines = Path(args.docs).read_text(encoding="utf-8").splitlines()
+            chunks = [ln.strip() for ln in lines if ln.strip()]
+        else:
+            from services.retrieval_service import DOCS
+            chunks = list(DOCS)
+        vectors = asyncio.run(embed_chunks(chunks, args.batch_size))
+
+    out = Path(args.out)
+    write_store(out, vectors, chunks)
+    print(f"wrote {len(chunks)} chunks (dim={vectors.shape[1]}) to {out}/ in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# scripts/loadtest.py
+"""
+Gateway 壓測：對本機 stub 上游（scripts/stub_upstream.py）跑 /ask，量測持續 RPS 與 p50/p99
+
+預設會自己起兩個子行程：
+- stub 上游（embedding + chat，各有固定延遲）
+- gateway（uvicorn gateway.main:app，指向 stub，限流調到不會觸發）
+然後分別以 50 / 200 / 500 個並發 client 持續打 --duration 秒。
+
+用法：
+    python scripts/loadtest.py
+    python scripts/loadtest.py --concurrency 50 200 500 --duration 10 --upstream-latency-ms 200
+    python scripts/loadtest.py --gateway-url http://localhost:8000   # 打已經在跑的 gateway
+
+備註：舊版 sync handler 每個請求會佔住一個 threadpool slot（AnyIO 預設 40 個），
+      上游延遲 200ms 時 RPS 上限約 40 / 0.2s ≈ 200；async 版本只受連線池上限影響。
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def start_stack(upstream_latency_ms: float, extra_env: dict | None = None):
+    stub_port, gw_port = _free_port(), _free_port()
+    stub = subprocess.Popen(
+        [sys.executable, "scripts/stub_upstream.py", "--port", str(stub_port),
+         "--latency-ms", str(upstream_latency_ms)],
+        cwd=ROOT_DIR,
+    )
+    _wait_ready(f"http://127.0.0.1:{stub_port}/docs")
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "RATE_LIMIT_MAX_PER_IP": str(10**9),
+        "PYTHONPATH": ROOT_DIR,
+    })
+    env.update(extra_env or {})
+    gateway = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "gateway.main:app", "--port", str(gw_port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    _wait_ready(f"http://127.0.0.1:{gw_port}/healthz")
+    return f"http://127.0.0.1:{gw_port}", [stub, gateway]
+
+
+async def run_level(base_url: str, concurrency: int, duration: float) -> None:
+    latencies, statuses = [], {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(wid: int):
+            i = 0
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post("/ask", json={"question": f"加班規則是什麼？#{wid}-{i}"})
+                    code = r.status_code
+                except httpx.HTTPError as e:
+                    code = type(e).__name__
+                latencies.append(time.perf_counter() - t0)
+                statuses[code] = statuses.get(code, 0) + 1
+                i += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*[worker(w) for w in range(concurrency)])
+        elapsed = time.perf_counter() - t0
+
+    ms = np.asarray(latencies) * 1000
+    ok = statuses.get(200, 0)
+    print(
+        f"c={concurrency:>4}  rps={ok / elapsed:8.1f}  p50={np.percentile(ms, 50):8.1f} ms  "
+        f"p99={np.percentile(ms, 99):8.1f} ms  statuses={statuses}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500])
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--upstream-latency-ms", type=float, default=100.0)
+    ap.add_argument("--gateway-url", default=None)
+    args = ap.parse_args()
+
+    procs = []
+    base_url = args.gateway_url
+    if base_url is None:
+        base_url, procs = start_stack(args.upstream_latency_ms)
+    try:
+        for c in args.concurrency:
+            asyncio.run(run_level(base_url, c, args.duration))
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+
+
+if __name__ == "__main__":
+    main()
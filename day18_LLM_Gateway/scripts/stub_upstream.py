@@ -0,0 +1,101 @@
+# scripts/stub_upstream.py
+"""
+本機 stub 上游：模擬 OpenAI 相容的 /v1/embeddings 與 /v1/chat/completions
+（壓測 / 測試用，不會對外呼叫、不花錢）
+
+- --latency-ms / --jitter-ms：每次回應前的延遲（固定 + 隨機）
+- --tail-rate / --tail-ms：以此機率再多等 tail-ms（模擬長尾延遲）
+- --error-rate：以此機率回 500
+
+用法：
+    python scripts/stub_upstream.py --port 9001 --latency-ms 50
+    OPENAI_BASE_URL=http://127.0.0.1:9001/v1 OPENAI_API_KEY=sk-stub uvicorn gateway.main:app
+"""
+import argparse
+import asyncio
+import base64
+import random
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DIM = 1536
+
+
+def build_app(
+    latency_ms: float = 50.0,
+    jitter_ms: float = 0.0,
+    error_rate: float = 0.0,
+    name: str = "stub",
+    tail_rate: float = 0.0,
+    tail_ms: float = 0.0,
+) -> FastAPI:
+    app = FastAPI(title=f"stub upstream ({name})")
+
+    async def _delay():
+        ms = latency_ms + random.random() * jitter_ms
+        if random.random() < tail_rate:
+            ms += tail_ms
+        await asyncio.sleep(ms / 1000.0)
+
+    def _fail():
+        return random.random() < error_rate
+
+    @app.post("/v1/embeddings")
+    async def embeddings(req: Request):
+        body = await req.json()
+        await _delay()
+        if _fail():
+            return JSONResponse(status_code=500, content={"error": {"message": f"{name}: injected error"}})
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            v = np.zeros(DIM, dtype=np.float32)
+            v[hash(text) % DIM] = 1.0
+            emb = base64.b64encode(v.tobytes()).decode() if body.get("encoding_format") == "base64" else v.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": emb})
+        # 直接回 JSONResponse，跳過 FastAPI 的 jsonable_encoder（1536 維向量很吃 CPU）
+        return JSONResponse({"object": "list", "data": data, "model": body.get("model", "stub"),
+                             "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}})
+
+    @app.post("/v1/chat/completions")
+    async def chat(req: Request):
+        body = await req.json()
+        await _delay()
+        if _fail():
+            return JSONResponse(status_code=500, content={"error": {"message": f"{name}: injected error"}})
+        question = body["messages"][-1]["content"]
+        answer = f"[{name}] {question[-40:]}"
+        return JSONResponse({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(question) // 4, "completion_tokens": len(answer) // 4,
+                      "total_tokens": (len(question) + len(answer)) // 4},
+        })
+
+    return app
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9001)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--tail-rate", type=float, default=0.0)
+    ap.add_argument("--tail-ms", type=float, default=0.0)
+    ap.add_argument("--name", default="stub")
+    args = ap.parse_args()
+    app = build_app(args.latency_ms, args.jitter_ms, args.error_rate, args.name, args.tail_rate, args.tail_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
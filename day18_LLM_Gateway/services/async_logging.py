@@ -0,0 +1,166 @@
+# services/async_logging.py
+"""
+非阻塞 JSON 日誌：event loop 只把 LogRecord 丟進有界 queue，格式化與寫檔交給背景執行緒
+
+- AsyncLogHandler（QueueHandler）：只 append 到有界 buffer，不格式化、不碰磁碟
+  - buffer 超過高水位（80%）時 INFO 以下只抽樣保留 sample_rate；滿了直接丟，不阻塞請求
+- 背景 writer：每 flush_interval 醒來一次，整批格式化成 JSON lines，每個 handler 一次 write + flush
+  - 有丟棄時補一筆 WARNING 記錄丟了多少
+- JsonFormatter：精簡 JSON（ts / level / logger / msg + extra 欄位 + exc）
+
+用法：
+    handler = setup_async_logging(logging.getLogger(), [logging.FileHandler("gateway.log")])
+    log.info("[ASK] request", extra={"ip": ip, "q": q})
+    ...
+    handler.stop()  # 關閉時把 buffer 裡剩下的寫完
+"""
+from __future__ import annotations
+
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Deque, List, Optional
+
+# LogRecord 內建屬性；其他屬性（logger.info(..., extra={...}) 帶進來的）都當成 JSON 欄位
+_STD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _STD_ATTRS:
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class _BatchWriter(threading.Thread):
+    """背景寫檔：每 flush_interval 醒來把 buffer 取光，每批每個 handler 只 write + flush 一次"""
+
+    def __init__(self, buf: Deque[logging.LogRecord], handlers: List[logging.Handler], batch_size: int,
+                 flush_interval: float, owner: "AsyncLogHandler") -> None:
+        super().__init__(name="async-log-writer", daemon=True)
+        self.buf = buf
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.owner = owner
+        self.stopping = threading.Event()
+        self._reported_dropped = 0
+
+    def run(self) -> None:
+        while True:
+            stopping = self.stopping.wait(self.flush_interval)
+            while self.buf:
+                batch = []
+                while self.buf and len(batch) < self.batch_size:
+                    batch.append(self.buf.popleft())
+                self._write(batch)
+                time.sleep(0)  # 批次之間讓出 GIL，別讓 event loop 等太久
+            self._report_dropped()
+            if stopping:
+                return
+
+    def _report_dropped(self) -> None:
+        dropped = self.owner.dropped
+        if dropped > self._reported_dropped:
+            self._write([logging.makeLogRecord({
+                "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "log records dropped (buffer full)", "dropped": dropped - self._reported_dropped,
+            })])
+            self._reported_dropped = dropped
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        for h in self.handlers:
+            lines = []
+            for r in records:
+                if r.levelno < h.level:
+                    continue
+                try:
+                    lines.append(h.format(r) + h.terminator)
+                except Exception:
+                    h.handleError(r)
+            if not lines:
+                continue
+            data = "".join(lines)
+            h.acquire()
+            try:
+                if isinstance(h, RotatingFileHandler) and h.maxBytes > 0 and h.stream is not None \
+                        and h.stream.tell() + len(data) >= h.maxBytes:
+                    h.doRollover()
+                if getattr(h, "stream", None) is None and hasattr(h, "_open"):
+                    h.stream = h._open()  # FileHandler(delay=True) 或剛 rollover 完
+                h.stream.write(data)
+                h.flush()
+            except Exception:
+                h.handleError(records[-1])
+            finally:
+                h.release()
+
+
+class AsyncLogHandler(QueueHandler):
+    """
+    熱路徑只有「檢查長度 + msg % args + deque.append」：不格式化成 JSON、不拿 lock、不喚醒執行緒
+    （deque 的 append / popleft 本身是 thread-safe）
+    """
+
+    def __init__(self, handlers: List[logging.Handler], maxsize: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 0.2, sample_rate: float = 0.1) -> None:
+        super().__init__(deque())
+        self.maxsize = maxsize
+        self.high_water = int(maxsize * 0.8)
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._writer = _BatchWriter(self.queue, handlers, batch_size, flush_interval, self)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 預設 QueueHandler 會在這裡 format；我們留給背景執行緒做
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        size = len(self.queue)
+        if size >= self.maxsize or (
+            size >= self.high_water and record.levelno < logging.WARNING and random.random() >= self.sample_rate
+        ):
+            self.dropped += 1
+            return
+        # 不 format，但 msg % args 要現在算：args 可能是呼叫端之後還會改的物件，等背景執行緒再算就不是當下的值
+        record.msg = record.getMessage()
+        record.args = None
+        self.queue.append(record)
+
+    def start(self) -> None:
+        self._writer.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """通知背景執行緒把 buffer 寫完再結束"""
+        self._writer.stopping.set()
+        if self._writer.is_alive():
+            self._writer.join(timeout)
+
+
+def setup_async_logging(logger: logging.Logger, handlers: List[logging.Handler], level: int = logging.INFO,
+                        maxsize: int = 10000, batch_size: int = 256, flush_interval: float = 0.2,
+                        sample_rate: float = 0.1, formatter: Optional[logging.Formatter] = None) -> AsyncLogHandler:
+    """把 logger 既有 handlers 換成 AsyncLogHandler；handlers 由背景執行緒寫（預設 JSON lines）"""
+    formatter = formatter or JsonFormatter()
+    for h in handlers:
+        h.setFormatter(formatter)
+    for h in logger.handlers[:]:
+        logger.removeHandler(h)
+    handler = AsyncLogHandler(handlers, maxsize, batch_size, flush_interval, sample_rate)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    handler.start()
+    return handler
@@ -0,0 +1,73 @@
+# services/index_store.py
+"""
+檢索索引的離線產物（由 scripts/build_index.py 產生）
+
+目錄結構（預設 data/index/）：
+- index.faiss         FAISS 二進位索引，啟動時 mmap 開，不整包讀進記憶體
+- chunks.bin          所有 chunk 文字（UTF-8）直接串接成一個 blob
+- chunks.offsets.npy  int64 offsets（n+1 筆），第 i 筆 chunk = blob[off[i]:off[i+1]]
+
+查詢時只依 offset 切出需要的那一段，不用重讀 / 重 parse 整個 JSON。
+"""
+from __future__ import annotations
+
+import mmap
+from pathlib import Path
+from typing import List
+
+import faiss
+import numpy as np
+
+INDEX_FILE = "index.faiss"
+BLOB_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets.npy"
+
+
+def store_exists(index_dir: Path) -> bool:
+    return all((index_dir / f).exists() for f in (INDEX_FILE, BLOB_FILE, OFFSETS_FILE))
+
+
+def write_store(index_dir: Path, vectors: np.ndarray, chunks: List[str]) -> None:
+    """寫出 FAISS 索引 + chunk 文字 blob + offsets"""
+    if len(vectors) != len(chunks):
+        raise ValueError(f"vectors ({len(vectors)}) and chunks ({len(chunks)}) length mismatch")
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    faiss.write_index(index, str(index_dir / INDEX_FILE))
+
+    encoded = [c.encode("utf-8") for c in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    (index_dir / BLOB_FILE).write_bytes(b"".join(encoded))
+    np.save(index_dir / OFFSETS_FILE, offsets)
+
+
+def read_index(index_dir: Path) -> faiss.Index:
+    # Flat 索引要 IO_FLAG_MMAP_IFC（faiss >= 1.8）才真的 mmap，只有 IO_FLAG_MMAP 時 codes 仍會被複製進記憶體
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(str(index_dir / INDEX_FILE), flag)
+
+
+class ChunkStore:
+    """mmap 開 chunks.bin，依 offset 取單一 chunk 文字"""
+
+    def __init__(self, index_dir: Path) -> None:
+        self._offsets = np.load(index_dir / OFFSETS_FILE, mmap_mode="r")
+        self._file = open(index_dir / BLOB_FILE, "rb")
+        # 空 blob 不能 mmap
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] > 0 else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def get(self, i: int) -> str:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def close(self) -> None:
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
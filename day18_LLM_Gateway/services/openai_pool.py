@@ -0,0 +1,75 @@
+# services/openai_pool.py
+"""
+整個 gateway 共用的 AsyncOpenAI client
+- 底層共用同一個 httpx.AsyncClient 連線池：keep-alive、HTTP/2（有裝 h2 才開）、連線數上限
+- gateway 的 chat 與 retrieval 的 embedding 都從這裡拿 client，不再各自建 sync client
+- 多個上游（不同 base_url / key）用 make_client() 建，仍共用同一個連線池
+"""
+import os
+import logging
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() == "true"
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "50"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+
+_http_client: httpx.AsyncClient | None = None
+_client: AsyncOpenAI | None = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        http2 = OPENAI_HTTP2 and _http2_available()
+        if OPENAI_HTTP2 and not http2:
+            log.warning("OPENAI_HTTP2=true 但未安裝 h2（pip install 'httpx[http2]'），改用 HTTP/1.1")
+        _http_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=OPENAI_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _http_client
+
+
+def make_client(base_url: str | None = None, api_key: str | None = None) -> AsyncOpenAI:
+    """建立指向特定上游的 AsyncOpenAI；底層共用同一個連線池（多上游見 services/provider_pool.py）"""
+    return AsyncOpenAI(
+        base_url=base_url, api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=0, http_client=get_http_client()
+    )
+
+
+def get_client() -> AsyncOpenAI:
+    """預設上游（OPENAI_BASE_URL / OPENAI_API_KEY）"""
+    global _client
+    if _client is None:
+        _client = make_client()
+    return _client
+
+
+async def close_client() -> None:
+    # 所有 AsyncOpenAI 共用 _http_client，關它一次就好
+    global _http_client, _client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client, _client = None, None
@@ -0,0 +1,262 @@
+# services/provider_pool.py
+"""
+多上游（OpenAI 相容 base_url / key）Provider Pool
+
+- 每個上游追蹤 EWMA 延遲、EWMA 錯誤率、最近 N 筆成功延遲（算 p95）
+- 路由：挑「健康」上游中分數最低的（EWMA 延遲 / (1 - 錯誤率)）；還沒量過的先試
+- 失敗自動換下一個上游（failover）；4xx（非 429）視為請求本身有問題，直接拋出、不換、不計入熔斷
+- 沒有別的健康上游可換時（例如只設定一個上游），退避後重試還沒被熔斷的上游，最多 retries 輪
+- 熔斷：連續失敗 >= failure_threshold 就踢出 cooldown 秒；冷卻後放一個試探請求（half-open），成功才恢復
+- Hedging（選用）：主請求超過該上游 p95 還沒回來，就對次佳上游再發一次，先回來的贏、輸的 cancel
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+from openai import APIStatusError
+
+from services.openai_pool import make_client
+
+
+class NoHealthyUpstream(RuntimeError):
+    pass
+
+
+class _Fatal(Exception):
+    """包住不該 failover 的錯誤（例如 400），讓 call() 原樣拋出"""
+
+    def __init__(self, error: Exception) -> None:
+        super().__init__(str(error))
+        self.error = error
+
+
+@dataclass
+class Upstream:
+    name: str
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    model: Optional[str] = None  # 各家模型名稱可能不同；None = 用呼叫端預設
+    client: Any = None
+
+    ewma_latency: Optional[float] = None
+    ewma_error: float = 0.0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    half_open: bool = False
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+
+    def score(self) -> float:
+        if self.ewma_latency is None:
+            # 還沒成功過：沒失敗過就先試（探索），失敗過就排最後
+            return 0.0 if self.ewma_error == 0 else float("inf")
+        return self.ewma_latency / (1.0 - min(self.ewma_error, 0.9))
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < 10:
+            return None
+        return float(np.percentile(self.samples, 95))
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "ewma_latency_ms": None if self.ewma_latency is None else round(self.ewma_latency * 1000, 1),
+            "p95_ms": None if self.p95() is None else round(self.p95() * 1000, 1),
+            "ewma_error": round(self.ewma_error, 3),
+            "state": "open" if self.open_until > now else ("half_open" if self.half_open else "closed"),
+        }
+
+
+Outcome = Callable[[str, str, float], None]  # (upstream, outcome, seconds)
+
+
+class ProviderPool:
+    def __init__(
+        self,
+        upstreams: List[Upstream],
+        hedge: bool = False,
+        hedge_min_delay: float = 0.05,
+        alpha: float = 0.2,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        retries: int = 1,
+        retry_backoff: float = 0.2,
+        on_result: Optional[Outcome] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not upstreams:
+            raise ValueError("ProviderPool needs at least one upstream")
+        self.upstreams = upstreams
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.retries = retries
+        self.retry_backoff = retry_backoff  # 第 n 輪重試前等 retry_backoff · 2^(n-1) 秒
+        self.on_result = on_result
+        self._clock = clock
+
+    # ---------- 狀態 ----------
+    def _enter_half_open(self, up: Upstream, now: float) -> None:
+        if up.consecutive_failures >= self.failure_threshold:
+            # 冷卻結束：放這一個請求當試探，其他請求先繼續避開它
+            up.half_open = True
+            up.open_until = now + self.cooldown
+
+    def _record_success(self, up: Upstream, seconds: float) -> None:
+        up.ewma_latency = seconds if up.ewma_latency is None else (
+            self.alpha * seconds + (1 - self.alpha) * up.ewma_latency
+        )
+        up.ewma_error *= 1 - self.alpha
+        up.samples.append(seconds)
+        up.consecutive_failures = 0
+        up.open_until = 0.0
+        up.half_open = False
+
+    def _record_failure(self, up: Upstream) -> None:
+        up.ewma_error = self.alpha + (1 - self.alpha) * up.ewma_error
+        up.consecutive_failures += 1
+        if up.consecutive_failures >= self.failure_threshold:
+            up.open_until = self._clock() + self.cooldown
+            up.half_open = False
+
+    def _emit(self, up: Upstream, outcome: str, seconds: float) -> None:
+        if self.on_result is not None:
+            self.on_result(up.name, outcome, seconds)
+
+    # ---------- 路由 ----------
+    def pick(self, exclude=()) -> Optional[Upstream]:
+        now = self._clock()
+        candidates = [u for u in self.upstreams if u.name not in exclude and u.open_until <= now]
+        if not candidates:
+            return None
+        # 冷卻結束、等著試探的上游優先（不然分數差的永遠沒機會恢復）
+        probe = next((u for u in candidates if u.consecutive_failures >= self.failure_threshold), None)
+        best = probe or min(candidates, key=Upstream.score)
+        self._enter_half_open(best, now)
+        return best
+
+    def hedge_delay(self, up: Upstream) -> float:
+        p95 = up.p95()
+        return self.hedge_min_delay if p95 is None else max(self.hedge_min_delay, p95)
+
+    async def _attempt(self, up: Upstream, fn: Callable[[Upstream], Awaitable[Any]]) -> Any:
+        if up.client is None:
+            # 第一次用到才建（共用 openai_pool 的連線池；pool 關掉後會重建）
+            up.client = make_client(up.base_url, up.api_key)
+        t0 = time.perf_counter()
+        try:
+            result = await fn(up)
+        except asyncio.CancelledError:
+            self._emit(up, "cancelled", time.perf_counter() - t0)
+            raise
+        except APIStatusError as e:
+            if e.status_code < 500 and e.status_code != 429:
+                self._emit(up, "client_error", time.perf_counter() - t0)
+                raise _Fatal(e) from e
+            self._record_failure(up)
+            self._emit(up, "error", time.perf_counter() - t0)
+            raise
+        except Exception:
+            self._record_failure(up)
+            self._emit(up, "error", time.perf_counter() - t0)
+            raise
+        seconds = time.perf_counter() - t0
+        self._record_success(up, seconds)
+        self._emit(up, "ok", seconds)
+        return result
+
+    async def call(self, fn: Callable[[Upstream], Awaitable[Any]]) -> Any:
+        """
+        fn(upstream) -> awaitable：用 upstream.client / upstream.model 發請求
+        依序 failover；都試過了還有重試次數就退避後再來一輪（熔斷中的不算），
+        直到成功或沒有可用上游（NoHealthyUpstream）
+        """
+        tried: set = set()
+        last_exc: Optional[BaseException] = None
+        rounds = 0
+        while True:
+            primary = self.pick(exclude=tried)
+            if primary is None and tried and rounds < self.retries:
+                # 沒有別的上游可換：一次暫時性的 5xx / 逾時不該直接變成 503
+                await asyncio.sleep(self.retry_backoff * 2 ** rounds)
+                rounds += 1
+                tried.clear()
+                primary = self.pick()
+            if primary is None:
+                raise NoHealthyUpstream(f"no healthy upstream (tried={sorted(tried)})") from last_exc
+            tried.add(primary.name)
+
+            tasks: Dict[asyncio.Task, Upstream] = {asyncio.create_task(self._attempt(primary, fn)): primary}
+            try:
+                if self.hedge:
+                    done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+                    if not done:
+                        backup = self.pick(exclude=tried)
+                        if backup is not None:
+                            tried.add(backup.name)
+                            tasks[asyncio.create_task(self._attempt(backup, fn))] = backup
+                while tasks:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for t in done:
+                        tasks.pop(t)
+                        exc = t.exception()
+                        if exc is None:
+                            return t.result()
+                        if isinstance(exc, _Fatal):
+                            raise exc.error
+                        last_exc = exc
+            finally:
+                for t in tasks:
+                    t.cancel()
+                # 等輸家真的收尾（記 cancelled、例外被取走）再回傳，不留到 call() 結束之後
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        now = self._clock()
+        return [u.snapshot(now) for u in self.upstreams]
+
+    def reset_clients(self) -> None:
+        """openai_pool.close_client() 之後呼叫；底層連線池已關，下次請求重建 client"""
+        for up in self.upstreams:
+            up.client = None
+
+
+def load_upstreams() -> List[Upstream]:
+    """
+    LLM_UPSTREAMS：JSON 陣列，例如
+      [{"name": "openai", "base_url": "https://api.openai.com/v1", "api_key": "sk-..."},
+       {"name": "azure-proxy", "base_url": "http://proxy:8080/v1", "api_key": "...", "model": "gpt-4o-mini"}]
+    沒設定就只有一個預設上游（OPENAI_BASE_URL / OPENAI_API_KEY）
+    """
+    raw = os.getenv("LLM_UPSTREAMS", "").strip()
+    if not raw:
+        return [Upstream(name="default", base_url=os.getenv("OPENAI_BASE_URL"), api_key=os.getenv("OPENAI_API_KEY"))]
+    items = json.loads(raw)
+    return [
+        Upstream(name=it.get("name", f"upstream-{i}"), base_url=it.get("base_url"),
+                 api_key=it.get("api_key"), model=it.get("model"))
+        for i, it in enumerate(items)
+    ]
+
+
+def build_pool(on_result: Optional[Outcome] = None) -> ProviderPool:
+    return ProviderPool(
+        load_upstreams(),
+        hedge=os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true",
+        hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "50")) / 1000,
+        alpha=float(os.getenv("LLM_EWMA_ALPHA", "0.2")),
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "3")),
+        cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN_SEC", "30")),
+        retries=int(os.getenv("LLM_RETRIES", "1")),
+        retry_backoff=float(os.getenv("LLM_RETRY_BACKOFF_MS", "200")) / 1000,
+        on_result=on_result,
+    )
@@ -0,0 +1,156 @@
+# services/rate_limiter.py
+"""
+可插拔限流器（token bucket）
+
+- MemoryTokenBucket：行程內；每個 key 只存 (tokens, 上次時間, 補滿時間)，O(1)；補滿的 key 定期 GC 掉
+- RedisTokenBucket：Lua script 原子扣款，多 worker / 多機共用同一個桶；key 以 PEXPIRE 在補滿後自動過期
+
+兩者介面相同：
+- await acquire(key, limit, cost)：桶內 >= cost 才放行並扣款（請求數限流；cost=0 代表「沒欠額就放行」）
+- await debit(key, limit, cost)  ：無條件扣款、可扣成負數（事後依實際 token 用量記帳）
+"""
+from __future__ import annotations
+
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class Limit:
+    capacity: float     # 桶子容量（= 允許的 burst）
+    per_seconds: float  # 從空到滿需要幾秒
+
+    def __post_init__(self) -> None:
+        # rate = capacity / per_seconds 會拿來除：0 或負數直接拒絕（「不限」請在呼叫端跳過這個桶）
+        if not (self.capacity > 0 and self.per_seconds > 0):
+            raise ValueError(f"Limit needs capacity > 0 and per_seconds > 0, got {self.capacity} / {self.per_seconds}")
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    remaining: float
+    retry_after: float  # 秒；allowed 時為 0
+
+
+class MemoryTokenBucket:
+    """行程內 token bucket；只在 event loop 執行緒內使用，不加鎖"""
+
+    def __init__(self, gc_interval: float = 60.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self._buckets: Dict[str, List[float]] = {}  # key -> [tokens, ts, full_at]
+        self._clock = clock
+        self._gc_interval = gc_interval
+        self._next_gc = clock() + gc_interval
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _take(self, key: str, limit: Limit, cost: float, force: bool) -> Decision:
+        now = self._clock()
+        b = self._buckets.get(key)
+        tokens = limit.capacity if b is None else min(limit.capacity, b[0] + (now - b[1]) * limit.rate)
+        allowed = force or tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = [tokens, now, now + (limit.capacity - tokens) / limit.rate]
+        if now >= self._next_gc:
+            self.gc(now)
+        retry_after = 0.0 if allowed else (cost - tokens) / limit.rate
+        return Decision(allowed, tokens, retry_after)
+
+    async def acquire(self, key: str, limit: Limit, cost: float = 1.0) -> Decision:
+        return self._take(key, limit, cost, force=False)
+
+    async def debit(self, key: str, limit: Limit, cost: float) -> Decision:
+        return self._take(key, limit, cost, force=True)
+
+    def gc(self, now: Optional[float] = None) -> int:
+        """移除已經補滿的桶（和新建的桶等價），回傳移除數"""
+        now = self._clock() if now is None else now
+        stale = [k for k, b in self._buckets.items() if b[2] <= now]
+        for k in stale:
+            del self._buckets[k]
+        self._next_gc = now + self._gc_interval
+        return len(stale)
+
+    async def close(self) -> None:
+        pass
+
+
+# KEYS[1]=bucket；ARGV: capacity, rate(tokens/sec), cost, force(0/1)
+# 用 Redis 的 TIME 當時鐘，避免各 worker 時鐘不一致
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local force = ARGV[4] == '1'
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1])
+if tokens == nil then
+  tokens = capacity
+else
+  tokens = math.min(capacity, tokens + (now - tonumber(b[2])) * rate)
+end
+local allowed = force or tokens >= cost
+if allowed then
+  tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+local retry = 0
+if not allowed then
+  retry = (cost - tokens) / rate
+end
+return {allowed and 1 or 0, tostring(tokens), tostring(retry)}
+"""
+
+
+class RedisTokenBucket:
+    """Redis token bucket：一次 EVALSHA 完成補充 + 判斷 + 扣款"""
+
+    def __init__(self, url: Optional[str] = None, prefix: str = "ratelimit", client=None) -> None:
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        self.r = client
+        self.prefix = prefix
+        self._script = self.r.register_script(_TOKEN_BUCKET_LUA)
+
+    async def _take(self, key: str, limit: Limit, cost: float, force: bool) -> Decision:
+        allowed, tokens, retry = await self._script(
+            keys=[f"{self.prefix}:{key}"],
+            args=[limit.capacity, limit.rate, cost, 1 if force else 0],
+        )
+        return Decision(bool(allowed), float(tokens), float(retry))
+
+    async def acquire(self, key: str, limit: Limit, cost: float = 1.0) -> Decision:
+        return await self._take(key, limit, cost, force=False)
+
+    async def debit(self, key: str, limit: Limit, cost: float) -> Decision:
+        return await self._take(key, limit, cost, force=True)
+
+    async def close(self) -> None:
+        await self.r.aclose()
+
+
+def build_limiter(backend: Optional[str] = None):
+    """依 RATE_LIMIT_BACKEND（memory | redis）建立限流器"""
+    backend = (backend or os.getenv("RATE_LIMIT_BACKEND", "memory")).lower()
+    if backend == "redis":
+        return RedisTokenBucket(prefix=os.getenv("RATE_LIMIT_REDIS_PREFIX", "ratelimit"))
+    if backend == "memory":
+        return MemoryTokenBucket()
+    raise ValueError(f"unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+def retry_after_header(decision: Decision) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(decision.retry_after)))}
@@ -0,0 +1,212 @@
+# services/response_cache.py
+"""
+/ask 回應快取（可插拔 backend）
+
+- 精準命中：key = hash(正規化問題, 檢索到的 context hash, 模型, temperature)
+- 語意命中（選用）：同一個 bucket（context hash + 模型 + temperature）裡，
+  查詢向量 cosine >= semantic_threshold 就視為同一個問題；向量直接沿用檢索時算好的那個，不多打 API
+- MemoryResponseCache：行程內 LRU + TTL
+- RedisResponseCache ：多 worker 共用；答案存 STRING（EX），語意向量存 HASH（bucket 一個），
+  寫入時清掉答案已過期的向量、每個 bucket 最多留 max_per_bucket 筆
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+_WS = re.compile(r"\s+")
+_TRAILING_PUNCT = "?？!！。.~～ "
+
+
+def normalize_question(q: str) -> str:
+    """全形半形統一、小寫、壓縮空白、去掉結尾標點：「加班規則是什麼？」==「加班規則是什麼」"""
+    q = unicodedata.normalize("NFKC", q or "").lower()
+    return _WS.sub(" ", q).strip().rstrip(_TRAILING_PUNCT)
+
+
+def bucket_key(context: str, model: str, temperature: float) -> str:
+    ctx_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+    return f"{ctx_hash}:{model}:{round(temperature, 3)}"
+
+
+def cache_key(question: str, bucket: str) -> str:
+    return hashlib.sha256(f"{normalize_question(question)}|{bucket}".encode("utf-8")).hexdigest()
+
+
+def _unit(vec: np.ndarray) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    n = float(np.linalg.norm(vec))
+    return vec / n if n > 0 else vec
+
+
+class MemoryResponseCache:
+    """行程內；只在 event loop 執行緒內使用，不加鎖"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600.0, semantic_threshold: float = 0.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self._data: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()  # key -> (expires_at, bucket, value)
+        self._vectors: Dict[str, Dict[str, np.ndarray]] = {}  # bucket -> {key: unit vec}
+
+    def _drop(self, key: str) -> None:
+        _, bucket, _ = self._data.pop(key)
+        vecs = self._vectors.get(bucket)
+        if vecs is not None:
+            vecs.pop(key, None)
+            if not vecs:
+                del self._vectors[bucket]
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            self._drop(key)
+            return None
+        self._data.move_to_end(key)
+        return item[2]
+
+    async def get_similar(self, bucket: str, vec: np.ndarray) -> Optional[Tuple[Dict[str, Any], float]]:
+        vecs = self._vectors.get(bucket)
+        if self.semantic_threshold <= 0 or not vecs:
+            return None
+        keys = list(vecs)
+        scores = np.stack([vecs[k] for k in keys]) @ _unit(vec)
+        best = int(np.argmax(scores))
+        if scores[best] < self.semantic_threshold:
+            return None
+        value = await self.get(keys[best])
+        return (value, float(scores[best])) if value is not None else None
+
+    async def set(self, key: str, bucket: str, vec: Optional[np.ndarray], value: Dict[str, Any]) -> None:
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (time.monotonic() + self.ttl, bucket, value)
+        if self.semantic_threshold > 0 and vec is not None:
+            self._vectors.setdefault(bucket, {})[key] = _unit(vec)
+        while len(self._data) > self.maxsize:
+            self._drop(next(iter(self._data)))
+
+    async def close(self) -> None:
+        pass
+
+
+# KEYS[1]=答案 STRING、KEYS[2]=向量 HASH、KEYS[3]=過期時間 ZSET；ARGV: value, ttl, field, vec bytes, max_per_bucket
+# 寫答案 + 向量，順便清掉 bucket 裡答案已過期的向量，超過上限就丟最早過期的；用 Redis 的 TIME 當時鐘
+_SET_WITH_VECTOR_LUA = """
+local ttl = tonumber(ARGV[2])
+local cap = tonumber(ARGV[5])
+local now = tonumber(redis.call('TIME')[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+redis.call('HSET', KEYS[2], ARGV[3], ARGV[4])
+redis.call('ZADD', KEYS[3], now + ttl, ARGV[3])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+local n = redis.call('ZCARD', KEYS[3]) - #stale
+if n > cap then
+  local oldest = redis.call('ZRANGE', KEYS[3], #stale, #stale + n - cap - 1)
+  for _, f in ipairs(oldest) do stale[#stale + 1] = f end
+end
+for i = 1, #stale, 500 do
+  local chunk = {unpack(stale, i, math.min(i + 499, #stale))}
+  redis.call('HDEL', KEYS[2], unpack(chunk))
+  redis.call('ZREM', KEYS[3], unpack(chunk))
+end
+redis.call('EXPIRE', KEYS[2], ttl)
+redis.call('EXPIRE', KEYS[3], ttl)
+return #stale
+"""
+
+
+class RedisResponseCache:
+    """
+    - {prefix}:r:{key}       STRING，JSON 答案，EX ttl
+    - {prefix}:v:{bucket}    HASH，field=key → float32 bytes（語意比對用），每次寫入續 EX
+    - {prefix}:e:{bucket}    ZSET，field=key → 答案過期時間；寫入時據此清掉過期向量、超過 max_per_bucket 丟最早過期的
+    熱門 bucket 一直有人寫、HASH 不會整個過期，所以不能只靠 EX；答案被提早刪掉（invalidate）時 get_similar 也會順手清
+    """
+
+    def __init__(self, url: Optional[str] = None, prefix: str = "gwcache", ttl: int = 3600,
+                 semantic_threshold: float = 0.0, max_per_bucket: int = 1000, client=None) -> None:
+        if client is None:
+            import redis.asyncio as redis
+            # 存 float32 bytes，不能 decode_responses
+            client = redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self.r = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.max_per_bucket = max_per_bucket
+        self._set_with_vector = self.r.register_script(_SET_WITH_VECTOR_LUA)
+
+    def _rkey(self, key: str) -> str:
+        return f"{self.prefix}:r:{key}"
+
+    def _vkey(self, bucket: str) -> str:
+        return f"{self.prefix}:v:{bucket}"
+
+    def _ekey(self, bucket: str) -> str:
+        return f"{self.prefix}:e:{bucket}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self.r.get(self._rkey(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def get_similar(self, bucket: str, vec: np.ndarray) -> Optional[Tuple[Dict[str, Any], float]]:
+        if self.semantic_threshold <= 0:
+            return None
+        entries = await self.r.hgetall(self._vkey(bucket))
+        if not entries:
+            return None
+        keys = list(entries)
+        matrix = np.stack([np.frombuffer(entries[k], dtype=np.float32) for k in keys])
+        scores = matrix @ _unit(vec)
+        best = int(np.argmax(scores))
+        if scores[best] < self.semantic_threshold:
+            return None
+        key = keys[best].decode() if isinstance(keys[best], bytes) else keys[best]
+        value = await self.get(key)
+        if value is None:
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.hdel(self._vkey(bucket), key)
+                pipe.zrem(self._ekey(bucket), key)
+                await pipe.execute()
+            return None
+        return value, float(scores[best])
+
+    async def set(self, key: str, bucket: str, vec: Optional[np.ndarray], value: Dict[str, Any]) -> None:
+        raw = json.dumps(value, ensure_ascii=False)
+        if self.semantic_threshold > 0 and vec is not None:
+            await self._set_with_vector(
+                keys=[self._rkey(key), self._vkey(bucket), self._ekey(bucket)],
+                args=[raw, self.ttl, key, _unit(vec).tobytes(), self.max_per_bucket],
+            )
+        else:
+            await self.r.set(self._rkey(key), raw, ex=self.ttl)
+
+    async def close(self) -> None:
+        await self.r.aclose()
+
+
+def build_response_cache():
+    """RESPONSE_CACHE_BACKEND：off（預設，需明確開啟）| memory | redis"""
+    backend = os.getenv("RESPONSE_CACHE_BACKEND", "off").lower()
+    ttl = int(os.getenv("RESPONSE_CACHE_TTL_SEC", "3600"))
+    threshold = float(os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0"))
+    if backend == "off":
+        return None
+    if backend == "memory":
+        return MemoryResponseCache(int(os.getenv("RESPONSE_CACHE_MAXSIZE", "10000")), ttl, threshold)
+    if backend == "redis":
+        return RedisResponseCache(prefix=os.getenv("RESPONSE_CACHE_REDIS_PREFIX", "gwcache"), ttl=ttl,
+                                  semantic_threshold=threshold,
+                                  max_per_bucket=int(os.getenv("RESPONSE_CACHE_SEMANTIC_MAX_PER_BUCKET", "1000")))
+    raise ValueError(f"unknown RESPONSE_CACHE_BACKEND: {backend}")
@@ -2,11 +2,15 @@
 from typing import List, Tuple
 from pathlib import Path
 import os, json
+import asyncio
 import numpy as np
 import faiss
 
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from services.index_store import ChunkStore, read_index, store_exists
+from services.openai_pool import get_client
+from services.tracing import span
 
 load_dotenv()
 
@@ -15,12 +19,9 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("沒有找到 OPENAI_API_KEY，請檢查環境變數！")
 
-OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
 EMBEDDING_MODEL = os.getenv("QUERY_EMBEDDING_MODEL", "text-embedding-3-small")
 L2_THRESHOLD = float(os.getenv("L2_THRESHOLD", "1.8"))
 
-client = OpenAI(timeout=OPENAI_TIMEOUT, max_retries=0)
-
 # ---- 知識庫（示範版，和 Day07 相同）----
 DOCS = [
     "請假流程：需要先主管簽核，然後到 HR 系統提交。",
@@ -35,44 +36,61 @@ DOCS = [
     "年度健檢：每位員工需於 9 月前完成公司指定醫院的健康檢查。"
 ]
 
-# 也支援從 data/vector_index.json 載入（可選）
+# 離線建好的索引目錄（scripts/build_index.py 產生）：FAISS 二進位檔 + chunk 文字 blob
+INDEX_DIR = Path(os.getenv("RETRIEVAL_INDEX_DIR", "data/index"))
+# 舊格式：data/vector_index.json（向量 + chunk 的 JSON）；仍可載入，建議用 build_index.py --from-json 轉檔
 INDEX_PATH = Path("data/vector_index.json")
 
-# ---- 內存索引（和 Day07 一樣，啟動時建索引）----
+# ---- 索引（啟動時載入，優先順序：INDEX_DIR → INDEX_PATH → 即時 embed DOCS）----
 _d = 1536
-_index = faiss.IndexFlatL2(_d)
-_doc_embeddings = None
+_index = None
+_chunks = None  # ChunkStore 或 List[str]，兩者都支援依 idx 取文字
+_index_lock = asyncio.Lock()  # 避免並發的第一批請求各自重建索引
+
+async def _get_embeddings(texts: List[str]) -> List[List[float]]:
+    resp = await get_client().embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
 
-def _get_embedding(text: str) -> List[float]:
-    return client.embeddings.create(model=EMBEDDING_MODEL, input=text).data[0].embedding
+async def _get_embedding(text: str) -> List[float]:
+    return (await _get_embeddings([text]))[0]
 
-def _ensure_index():
-    global _doc_embeddings
-    if _index.ntotal == 0:
-        if INDEX_PATH.exists():
-            # 可選：從檔案載入嵌入（若你前面有離線流程）
+def _chunk(i: int) -> str:
+    return _chunks.get(i) if isinstance(_chunks, ChunkStore) else _chunks[i]
+
+async def ensure_index():
+    global _index, _chunks
+    if _index is not None:
+        return
+    async with _index_lock:
+        if _index is not None:
+            return
+        if store_exists(INDEX_DIR):
+            # 建議路徑：mmap 開 FAISS 索引 + chunk blob，不需要 API 呼叫也不整包讀進記憶體
+            index, chunks = read_index(INDEX_DIR), ChunkStore(INDEX_DIR)
+        elif INDEX_PATH.exists():
+            # 舊格式：只在啟動時 parse 一次，chunk 文字留在記憶體
             data = json.loads(INDEX_PATH.read_text(encoding="utf-8"))
-            vectors = [it["vector"] for it in data.get("items", [])]
-            _doc_embeddings = np.array(vectors, dtype="float32")
-            _index.add(_doc_embeddings)
+            items = data.get("items", [])
+            vectors = np.array([it["vector"] for it in items], dtype="float32")
+            index, chunks = faiss.IndexFlatL2(vectors.shape[1]), [it["chunk"] for it in items]
+            index.add(vectors)
         else:
-            # 直接即時產生（示範）
-            _doc_embeddings = np.array([_get_embedding(doc) for doc in DOCS], dtype="float32")
-            _index.add(_doc_embeddings)
+            # 直接即時產生（示範）；一次 API 呼叫 embed 全部 DOCS
+            index, chunks = faiss.IndexFlatL2(_d), list(DOCS)
+            index.add(np.array(await _get_embeddings(DOCS), dtype="float32"))
+        _index, _chunks = index, chunks
+
+async def embed_query(q: str) -> np.ndarray:
+    with span("embed"):
+        return np.array(await _get_embedding(q), dtype="float32")
 
-def retrieve_best(q: str, k: int = 3) -> Tuple[str, float]:
-    """回傳最相關片段與距離（若超過門檻則回『知識庫裡沒有相關答案。』）"""
-    _ensure_index()
-    q_emb = np.array([_get_embedding(q)], dtype="float32")
-    D, I = _index.search(q_emb, k)
+async def search_best(q_emb: np.ndarray, k: int = 3) -> Tuple[str, float]:
+    """用已算好的查詢向量找最相關片段（gateway 會把同一個向量拿去做語意快取比對）"""
+    await ensure_index()
+    with span("search"):
+        D, I = _index.search(q_emb.reshape(1, -1), k)
     best_idx = int(I[0][0])
     best_dist = float(D[0][0])
     if best_dist > L2_THRESHOLD:
         return "知識庫裡沒有相關答案。", best_dist
-    if INDEX_PATH.exists():
-        # 若從檔案載入，沒有 DOCS 文本，需在 json 內保存 chunk 文字；此處簡化
-        data = json.loads(INDEX_PATH.read_text(encoding="utf-8"))
-        chunk = data["items"][best_idx]["chunk"]
-        return chunk, best_dist
-    else:
-        return DOCS[best_idx], best_dist
+    return _chunk(best_idx), best_dist
@@ -0,0 +1,28 @@
+# tests/conftest.py
+# --- 把專案根目錄加到匯入路徑 ---
+import os
+import sys
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+# gateway / retrieval 模組 import 時會檢查 key；測試一律打本機 stub，不會真的呼叫 OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import pytest
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+@pytest.fixture
+async def redis_url():
+    """需要可連線的 Redis（REDIS_URL）；連不到就 skip"""
+    import redis.asyncio as redis
+    r = redis.from_url(REDIS_URL)
+    try:
+        await r.ping()
+    except Exception:
+        pytest.skip(f"Redis not reachable at {REDIS_URL}")
+    finally:
+        await r.aclose()
+    return REDIS_URL
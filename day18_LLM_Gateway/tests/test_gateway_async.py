@@ -0,0 +1,106 @@
+# tests/test_gateway_async.py
+"""
+/ask 的 async 路徑（httpx ASGITransport，不開 server）：AsyncOpenAI 走本機 MockTransport，不打真的 API
+- 並發的第一批請求只建一次索引（asyncio.Lock），DOCS 一次 embeddings 呼叫批次 embed
+- lifespan 啟動時預先建索引、關閉時關掉共用的 httpx 連線池
+"""
+import asyncio
+import json
+import zlib
+
+import httpx
+import numpy as np
+
+import services.openai_pool as openai_pool
+import services.retrieval_service as rs
+from gateway import main
+
+
+def _vec(text: str) -> list:
+    v = np.zeros(rs._d, dtype=np.float32)
+    v[zlib.crc32(text.encode("utf-8")) % rs._d] = 1.0  # 同一段文字 → 同一個向量（L2 = 0）
+    return v.tolist()
+
+
+class _StubOpenAI:
+    """OpenAI API 的 /embeddings 與 /chat/completions；記錄每次 embeddings 呼叫的 input 筆數"""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.embed_batches = []
+        self.chats = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        await asyncio.sleep(self.delay)  # 讓並發的請求真的同時卡在上游
+        if request.url.path.endswith("/embeddings"):
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            self.embed_batches.append(len(texts))
+            return httpx.Response(200, json={
+                "object": "list", "model": body["model"],
+                "data": [{"object": "embedding", "index": i, "embedding": _vec(t)} for i, t in enumerate(texts)],
+                "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)},
+            })
+        self.chats += 1
+        return httpx.Response(200, json={
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "stub answer"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        })
+
+
+def _use_stub(monkeypatch, tmp_path) -> _StubOpenAI:
+    stub = _StubOpenAI()
+    # 共用連線池換成 MockTransport；AsyncOpenAI（retrieval 的 embedding、provider pool 的 chat）都建在它上面
+    monkeypatch.setattr(openai_pool, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(stub)))
+    monkeypatch.setattr(openai_pool, "_client", None)
+    for up in main.pool.upstreams:
+        monkeypatch.setattr(up, "client", None)
+    # 沒有離線索引 → 啟動時即時 embed DOCS
+    monkeypatch.setattr(rs, "_index", None)
+    monkeypatch.setattr(rs, "_chunks", None)
+    monkeypatch.setattr(rs, "INDEX_DIR", tmp_path / "no-index")
+    monkeypatch.setattr(rs, "INDEX_PATH", tmp_path / "no-index.json")
+    monkeypatch.setattr(main, "response_cache", None)
+    monkeypatch.setattr(main, "_LIMIT", 10**6)
+    return stub
+
+
+async def test_concurrent_first_asks_build_index_once(monkeypatch, tmp_path):
+    stub = _use_stub(monkeypatch, tmp_path)
+    http = openai_pool._http_client
+    questions = [rs.DOCS[i % len(rs.DOCS)] for i in range(20)]
+    try:
+        transport = httpx.ASGITransport(app=main.app)  # 不跑 lifespan：索引由第一批請求建
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*[client.post("/ask", json={"question": q}) for q in questions])
+    finally:
+        await http.aclose()
+
+    assert [r.status_code for r in responses] == [200] * len(questions)
+    # DOCS 只 embed 一次、一次呼叫帶全部；其餘是每個問題各一次 query embedding
+    assert stub.embed_batches.count(len(rs.DOCS)) == 1
+    assert sorted(stub.embed_batches) == [1] * len(questions) + [len(rs.DOCS)]
+    assert stub.chats == len(questions)
+    for q, r in zip(questions, responses):
+        body = r.json()
+        assert body["answer"] == "stub answer"
+        assert body["context"] == q and body["debug"]["l2"] == 0.0
+
+
+async def test_lifespan_warms_index_and_closes_shared_pool(monkeypatch, tmp_path):
+    stub = _use_stub(monkeypatch, tmp_path)
+    monkeypatch.setattr(main, "_log_handler", None)  # 不要停掉整個測試行程共用的 root logger
+    http = openai_pool._http_client
+
+    async with main.app.router.lifespan_context(main.app):
+        assert rs._index is not None and stub.embed_batches == [len(rs.DOCS)]  # 啟動時就建好
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            r = await client.post("/ask", json={"question": rs.DOCS[0]})
+        assert r.status_code == 200 and stub.embed_batches == [len(rs.DOCS), 1]
+
+    assert http.is_closed
+    assert openai_pool._http_client is None and openai_pool._client is None
+    assert all(up.client is None for up in main.pool.upstreams)
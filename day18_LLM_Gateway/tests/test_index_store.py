@@ -0,0 +1,129 @@
+# tests/test_index_store.py
+"""
+離線索引：chunk blob / offsets 切片（UTF-8 多位元組）、FAISS mmap 載入與 fallback、
+build_index.py --from-json 轉檔後的檢索結果與舊版 vector_index.json 路徑一致
+"""
+import json
+import sys
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+
+import services.retrieval_service as rs
+from services.index_store import BLOB_FILE, ChunkStore, read_index, store_exists, write_store
+
+CHUNKS = [
+    "請假流程：需要先主管簽核，然後到 HR 系統提交。",
+    "ascii only",
+    "",  # 空 chunk：offset 前後相同
+    "emoji 🚀 與全形：ＶＰＮ",
+    "加班申請：需事先提出。",
+]
+
+
+def _vectors(n: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+
+
+def test_chunk_store_slices_multibyte_utf8(tmp_path):
+    write_store(tmp_path, _vectors(len(CHUNKS)), CHUNKS)
+    assert store_exists(tmp_path)
+    assert (tmp_path / BLOB_FILE).stat().st_size == sum(len(c.encode("utf-8")) for c in CHUNKS)
+
+    store = ChunkStore(tmp_path)
+    try:
+        assert len(store) == len(CHUNKS)
+        assert [store.get(i) for i in range(len(store))] == CHUNKS
+        assert store.get(3) == CHUNKS[3]  # 隨機存取不依賴前一筆
+    finally:
+        store.close()
+
+
+def test_chunk_store_empty_blob(tmp_path):
+    write_store(tmp_path, _vectors(2), ["", ""])
+    store = ChunkStore(tmp_path)
+    try:
+        assert [store.get(0), store.get(1)] == ["", ""]
+    finally:
+        store.close()
+
+
+def test_write_store_rejects_length_mismatch(tmp_path):
+    with pytest.raises(ValueError):
+        write_store(tmp_path, _vectors(3), CHUNKS)
+
+
+@pytest.mark.parametrize("has_ifc", [True, False])
+def test_read_index_mmap_flag_and_fallback(tmp_path, monkeypatch, has_ifc):
+    vectors = _vectors(50)
+    write_store(tmp_path, vectors, [str(i) for i in range(50)])
+
+    flags = []
+    real_read = faiss.read_index
+    monkeypatch.setattr(faiss, "read_index", lambda path, flag=0: flags.append(flag) or real_read(path, flag))
+    if has_ifc:
+        expected = faiss.IO_FLAG_MMAP_IFC
+    else:
+        monkeypatch.delattr(faiss, "IO_FLAG_MMAP_IFC", raising=False)  # faiss < 1.8
+        expected = faiss.IO_FLAG_MMAP
+
+    index = read_index(tmp_path)
+    assert flags == [expected]
+    assert index.ntotal == 50
+    D, I = index.search(vectors[:5], 1)
+    assert I[:, 0].tolist() == [0, 1, 2, 3, 4]
+    assert np.allclose(D[:, 0], 0, atol=1e-5)
+
+
+@pytest.fixture
+def legacy_json(tmp_path):
+    vectors = _vectors(len(CHUNKS), dim=16, seed=1)
+    path = tmp_path / "vector_index.json"
+    path.write_text(json.dumps({"items": [{"vector": v.tolist(), "chunk": c} for v, c in zip(vectors, CHUNKS)]},
+                               ensure_ascii=False), encoding="utf-8")
+    return path, vectors
+
+
+def _reset_index(monkeypatch, index_dir, index_path):
+    monkeypatch.setattr(rs, "_index", None)
+    monkeypatch.setattr(rs, "_chunks", None)
+    monkeypatch.setattr(rs, "INDEX_DIR", index_dir)
+    monkeypatch.setattr(rs, "INDEX_PATH", index_path)
+    monkeypatch.setattr(rs, "L2_THRESHOLD", float("inf"))
+
+
+async def _search_all(queries):
+    return [await rs.search_best(q) for q in queries]
+
+
+async def test_build_index_from_json_matches_legacy_path(tmp_path, monkeypatch, legacy_json):
+    json_path, vectors = legacy_json
+    queries = vectors + np.random.default_rng(2).normal(0, 0.1, vectors.shape).astype("float32")
+
+    # 舊路徑：vector_index.json，只在啟動時 parse 一次
+    parsed = []
+    monkeypatch.setattr(rs, "json", SimpleNamespace(loads=lambda s: parsed.append(1) or json.loads(s)))
+    _reset_index(monkeypatch, tmp_path / "missing", json_path)
+    legacy = await _search_all(queries)
+    assert len(parsed) == 1
+    assert isinstance(rs._chunks, list)
+
+    # build_index.py --from-json 轉檔 → mmap 的 FAISS + chunk blob
+    from scripts import build_index
+    out = tmp_path / "index"
+    monkeypatch.setattr(sys, "argv", ["build_index.py", "--from-json", str(json_path), "--out", str(out)])
+    build_index.main()
+    assert store_exists(out)
+
+    _reset_index(monkeypatch, out, tmp_path / "missing.json")
+    try:
+        mmapped = await _search_all(queries)
+        assert isinstance(rs._chunks, ChunkStore)
+    finally:
+        if isinstance(rs._chunks, ChunkStore):
+            rs._chunks.close()
+
+    assert [c for c, _ in mmapped] == [c for c, _ in legacy] == CHUNKS
+    assert np.allclose([d for _, d in mmapped], [d for _, d in legacy], atol=1e-5)
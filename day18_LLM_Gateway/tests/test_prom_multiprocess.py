@@ -0,0 +1,127 @@
+# tests/test_prom_multiprocess.py
+"""
+多 worker 的 Prometheus 指標：PROMETHEUS_MULTIPROC_DIR 底下每個 worker 各寫一份，/metrics 要回傳加總
+"""
+import multiprocessing as mp
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from services.prom_multiprocess import mark_worker_exit, render_latest, wipe_multiprocess_dir
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _samples(text: str, name: str):
+    return [s for fam in text_string_to_metric_families(text) for s in fam.samples if s.name == name]
+
+
+def _wait_http(url: str, timeout: float = 60.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise TimeoutError(url)
+
+
+def _worker(mp_dir: str, n: int, ready, release) -> None:
+    # spawn 出來的新行程：import prometheus_client 之前設好目錄，值才會寫進 mmap 檔
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = mp_dir
+    from prometheus_client import Counter, Gauge, Histogram
+
+    reqs = Counter("test_requests_total", "requests")
+    lat = Histogram("test_latency_seconds", "latency")
+    inflight = Gauge("test_inflight", "in-flight", multiprocess_mode="livesum")
+    for _ in range(n):
+        reqs.inc()
+        lat.observe(0.01)
+    inflight.set(1)
+    ready.set()
+    release.wait(30)
+
+
+def test_counters_sum_across_worker_processes_and_dead_workers_are_cleaned(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    wipe_multiprocess_dir()
+
+    ctx = mp.get_context("spawn")
+    release = ctx.Event()
+    counts = [3, 5, 7, 11]
+    workers = []
+    for n in counts:
+        ready = ctx.Event()
+        p = ctx.Process(target=_worker, args=(str(tmp_path), n, ready, release))
+        p.start()
+        workers.append((p, ready))
+    for _, ready in workers:
+        assert ready.wait(60)
+
+    text = render_latest()[0].decode()
+    assert _samples(text, "test_requests_total")[0].value == sum(counts)
+    assert _samples(text, "test_latency_seconds_count")[0].value == sum(counts)
+    assert _samples(text, "test_inflight")[0].value == len(counts)
+
+    # worker 結束：counter 保留（總數不倒退），live gauge 只算還活著的
+    release.set()
+    for p, _ in workers:
+        p.join(30)
+        mark_worker_exit(p.pid)
+    text = render_latest()[0].decode()
+    assert _samples(text, "test_requests_total")[0].value == sum(counts)
+    assert _samples(text, "test_inflight") == []
+
+
+def test_gateway_metrics_aggregate_all_uvicorn_workers(tmp_path):
+    stub_port, gw_port = _free_port(), _free_port()
+    mp_dir = tmp_path / "prom"
+    mp_dir.mkdir()
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT_DIR,
+        "PROMETHEUS_MULTIPROC_DIR": str(mp_dir),
+        "OPENAI_API_KEY": "sk-test",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "RETRIEVAL_INDEX_DIR": str(tmp_path / "no-index"),
+    }
+    procs = [
+        subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "scripts", "stub_upstream.py"),
+                          "--port", str(stub_port), "--latency-ms", "0"], env=env, cwd=tmp_path),
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "gateway.main:app", "--port", str(gw_port),
+                          "--workers", "3", "--log-level", "warning"], env=env, cwd=tmp_path),
+    ]
+    try:
+        base = f"http://127.0.0.1:{gw_port}"
+        _wait_http(base + "/healthz")
+        n = 60
+        for _ in range(n):
+            # 每次新連線，讓請求分散到不同 worker
+            httpx.get(base + "/healthz", headers={"Connection": "close"})
+
+        # 不管 scrape 打到哪個 worker，看到的都是所有 worker 的加總
+        # （_wait_http 成功的那一次也算，所以是 n + 1）
+        seen = set()
+        for _ in range(5):
+            text = httpx.get(base + "/metrics", headers={"Connection": "close"}).text
+            ok = [s for s in _samples(text, "gateway_requests_total")
+                  if s.labels["route"] == "/healthz" and s.labels["status"] == "200"]
+            seen.add(ok[0].value)
+        assert seen == {n + 1}
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(30)
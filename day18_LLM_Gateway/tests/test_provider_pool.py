@@ -0,0 +1,173 @@
+# tests/test_provider_pool.py
+"""
+Provider Pool：用多個本機 stub 上游（scripts/stub_upstream.py）注入延遲 / 錯誤 / 長尾
+"""
+import asyncio
+import socket
+import threading
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+import openai
+import pytest
+import uvicorn
+from openai import AsyncOpenAI
+
+from scripts.stub_upstream import build_app
+from services.provider_pool import NoHealthyUpstream, ProviderPool, Upstream
+
+MESSAGES = [{"role": "user", "content": "加班規則是什麼？"}]
+
+
+@pytest.fixture
+def stubs():
+    """stubs(name=..., latency_ms=..., ...) -> Upstream；測試結束時關掉所有 stub server 與 client"""
+    servers, upstreams = [], []
+
+    def start(name: str, **kwargs) -> Upstream:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(build_app(name=name, **kwargs), host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+        servers.append(server)
+        # 每個測試自己的 client（不共用 openai_pool：pytest 每個測試的 event loop 不同）
+        base_url = f"http://127.0.0.1:{port}/v1"
+        up = Upstream(name=name, base_url=base_url,
+                      client=AsyncOpenAI(base_url=base_url, api_key="sk-test", max_retries=0, timeout=10))
+        upstreams.append(up)
+        return up
+
+    yield start
+    for server in servers:
+        server.should_exit = True
+
+
+async def _chat(up: Upstream):
+    resp = await up.client.chat.completions.create(model="stub", messages=MESSAGES)
+    return up.name, resp
+
+
+async def test_routes_to_fastest_upstream(stubs):
+    pool = ProviderPool([stubs("slow", latency_ms=60), stubs("fast", latency_ms=5)])
+    used = Counter([(await pool.call(_chat))[0] for _ in range(40)])
+    assert used["fast"] >= 35, used
+
+
+async def test_circuit_breaker_ejects_failing_upstream_and_probes_after_cooldown(stubs):
+    outcomes = Counter()
+    now = [1000.0]
+    pool = ProviderPool(
+        [stubs("broken", latency_ms=1, error_rate=1.0), stubs("healthy", latency_ms=10)],
+        failure_threshold=1, cooldown=30,
+        on_result=lambda up, outcome, _s: outcomes.update([(up, outcome)]),
+        clock=lambda: now[0],
+    )
+
+    # 所有請求都成功（failover）；broken 被打一次就熔斷
+    results = [(await pool.call(_chat))[0] for _ in range(20)]
+    assert set(results) == {"healthy"}
+    assert outcomes[("broken", "error")] == 1
+    assert {u["name"]: u["state"] for u in pool.snapshot()}["broken"] == "open"
+
+    # 冷卻結束：放一個試探請求，仍失敗 → 再次熔斷
+    now[0] += 31
+    assert (await pool.call(_chat))[0] == "healthy"
+    assert outcomes[("broken", "error")] == 2
+    assert {u["name"]: u["state"] for u in pool.snapshot()}["broken"] == "open"
+
+
+async def test_all_upstreams_down_raises(stubs):
+    pool = ProviderPool([stubs("a", latency_ms=1, error_rate=1.0), stubs("b", latency_ms=1, error_rate=1.0)])
+    with pytest.raises(NoHealthyUpstream):
+        await pool.call(_chat)
+
+
+async def test_client_error_is_not_failed_over():
+    calls = Counter()
+
+    async def bad_request(up: Upstream):
+        calls[up.name] += 1
+        resp = httpx.Response(400, request=httpx.Request("POST", "http://stub/v1/chat/completions"))
+        raise openai.BadRequestError("bad request", response=resp, body=None)
+
+    pool = ProviderPool([Upstream("a", client=object()), Upstream("b", client=object())])
+    with pytest.raises(openai.BadRequestError):
+        await pool.call(bad_request)
+    assert sum(calls.values()) == 1
+    assert all(u["ewma_error"] == 0 for u in pool.snapshot())
+
+
+async def test_single_upstream_retries_transient_error():
+    calls = Counter()
+
+    async def flaky(up: Upstream):
+        calls[up.name] += 1
+        if calls[up.name] == 1:
+            resp = httpx.Response(502, request=httpx.Request("POST", "http://stub/v1/chat/completions"))
+            raise openai.InternalServerError("bad gateway", response=resp, body=None)
+        return "ok"
+
+    pool = ProviderPool([Upstream("only", client=object())], retry_backoff=0)
+    assert await pool.call(flaky) == "ok"
+    assert calls["only"] == 2
+    assert {u["name"]: u["state"] for u in pool.snapshot()}["only"] == "closed"
+
+    # 重試次數用完仍失敗才是 NoHealthyUpstream
+    calls.clear()
+    no_retry = ProviderPool([Upstream("only", client=object())], retries=0)
+    with pytest.raises(NoHealthyUpstream):
+        await no_retry.call(flaky)
+    assert calls["only"] == 1
+
+
+async def test_hedge_loser_is_cancelled_before_call_returns():
+    outcomes = []
+
+    async def slow_then_fast(up: Upstream):
+        await asyncio.sleep(1.0 if up.name == "slow" else 0.01)
+        return up.name
+
+    pool = ProviderPool(
+        [Upstream("slow", client=object()), Upstream("fast", client=object())], hedge=True, hedge_min_delay=0.02,
+        on_result=lambda name, outcome, seconds: outcomes.append((name, outcome)),
+    )
+    pool.upstreams[0].ewma_latency, pool.upstreams[1].ewma_latency = 0.001, 0.002  # 先選 slow 當主請求
+    assert await pool.call(slow_then_fast) == "fast"
+    # 輸家在 call() 回傳前就收尾完畢，不會在之後才記 cancelled
+    assert sorted(outcomes) == [("fast", "ok"), ("slow", "cancelled")]
+    assert not [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+
+async def _latencies(pool: ProviderPool, n: int, concurrency: int) -> np.ndarray:
+    samples = []
+
+    async def one():
+        t0 = time.perf_counter()
+        await pool.call(_chat)
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    for _ in range(n // concurrency):
+        await asyncio.gather(*[one() for _ in range(concurrency)])
+    return np.asarray(samples)
+
+
+async def test_hedging_cuts_tail_latency(stubs):
+    # 兩個上游平常 10ms，但 3% 的請求多卡 500ms（長尾）
+    ups = [stubs(f"u{i}", latency_ms=10, tail_rate=0.03, tail_ms=500) for i in range(2)]
+    plain = ProviderPool(ups)
+    hedged = ProviderPool(
+        [Upstream(u.name, u.base_url, client=u.client) for u in ups], hedge=True, hedge_min_delay=0.03,
+    )
+    # 先暖機：讓每個上游累積足夠樣本，p95（= hedge 延遲）才不會被少數長尾拉高
+    for pool in (plain, hedged):
+        await _latencies(pool, 100, 10)
+
+    p99_plain = np.percentile(await _latencies(plain, 400, 10), 99)
+    p99_hedged = np.percentile(await _latencies(hedged, 400, 10), 99)
+    print(f"p99 without hedging={p99_plain:.1f} ms, with hedging={p99_hedged:.1f} ms")
+    assert p99_hedged < p99_plain * 0.5
@@ -0,0 +1,118 @@
+# tests/test_rate_limiter.py
+import asyncio
+import multiprocessing as mp
+import uuid
+
+import pytest
+
+from services.rate_limiter import Limit, MemoryTokenBucket, RedisTokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+async def test_memory_bucket_burst_then_refill():
+    clock = FakeClock()
+    lim = MemoryTokenBucket(clock=clock)
+    limit = Limit(capacity=3, per_seconds=3)  # 1 token / 秒
+
+    results = [(await lim.acquire("ip:1", limit)).allowed for _ in range(4)]
+    assert results == [True, True, True, False]
+
+    denied = await lim.acquire("ip:1", limit)
+    assert denied.retry_after == pytest.approx(1.0)
+
+    clock.now += 1.0
+    assert (await lim.acquire("ip:1", limit)).allowed
+    # 不同 key 互不影響
+    assert (await lim.acquire("ip:2", limit)).allowed
+
+
+def test_limit_rejects_zero_capacity_or_window():
+    for capacity, per_seconds in [(0, 60), (10, 0), (-1, 60)]:
+        with pytest.raises(ValueError):
+            Limit(capacity, per_seconds)
+
+
+async def test_memory_bucket_token_quota_debit_goes_negative():
+    clock = FakeClock()
+    lim = MemoryTokenBucket(clock=clock)
+    quota = Limit(capacity=100, per_seconds=100)
+
+    assert (await lim.acquire("tok:a", quota, cost=0)).allowed
+    d = await lim.debit("tok:a", quota, 150)  # 單次回答用超過配額
+    assert d.remaining == pytest.approx(-50)
+    assert not (await lim.acquire("tok:a", quota, cost=0)).allowed
+
+    clock.now += 50
+    assert (await lim.acquire("tok:a", quota, cost=0)).allowed
+
+
+async def test_memory_bucket_gc_drops_refilled_keys():
+    clock = FakeClock()
+    lim = MemoryTokenBucket(gc_interval=10, clock=clock)
+    limit = Limit(capacity=10, per_seconds=10)
+    for i in range(1000):
+        await lim.acquire(f"ip:{i}", limit)
+    assert len(lim) == 1000
+
+    clock.now += 0.5  # 還沒補滿
+    assert lim.gc() == 0
+    clock.now += 10
+    await lim.acquire("ip:new", limit)  # 到 gc_interval，順手 GC
+    assert len(lim) == 1
+
+
+# ------------------------------------------------------------
+# Redis backend：需要可連線的 Redis（REDIS_URL），連不到就 skip
+# ------------------------------------------------------------
+@pytest.fixture
+async def redis_limiter(redis_url):
+    lim = RedisTokenBucket(redis_url, prefix=f"test-ratelimit-{uuid.uuid4().hex[:8]}")
+    yield lim
+    keys = [k async for k in lim.r.scan_iter(f"{lim.prefix}:*")]
+    if keys:
+        await lim.r.delete(*keys)
+    await lim.close()
+
+
+async def test_redis_bucket_burst_and_expiry(redis_limiter):
+    limit = Limit(capacity=3, per_seconds=300)
+    results = [(await redis_limiter.acquire("ip:1", limit)).allowed for _ in range(4)]
+    assert results == [True, True, True, False]
+
+    # 補滿所需時間 + 1s 後自動過期 → 不會留下殭屍 key
+    pttl = await redis_limiter.r.pttl(f"{redis_limiter.prefix}:ip:1")
+    assert 0 < pttl <= 301_000
+
+
+def _worker(url: str, prefix: str, n: int, out):
+    async def run():
+        lim = RedisTokenBucket(url, prefix=prefix)
+        limit = Limit(capacity=30, per_seconds=3600)
+        allowed = 0
+        for _ in range(n):
+            allowed += (await lim.acquire("ip:shared", limit)).allowed
+        await lim.close()
+        return allowed
+
+    out.put(asyncio.run(run()))
+
+
+async def test_redis_bucket_global_across_processes(redis_limiter, redis_url):
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(redis_url, redis_limiter.prefix, 25, out)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    totals = [out.get(timeout=60) for _ in procs]
+    for p in procs:
+        p.join(timeout=10)
+
+    # 4 個行程共 100 次請求，全域只放行桶子容量 30 次
+    assert sum(totals) == 30
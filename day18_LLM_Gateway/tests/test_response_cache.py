@@ -0,0 +1,141 @@
+# tests/test_response_cache.py
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from services.response_cache import (
+    MemoryResponseCache,
+    RedisResponseCache,
+    bucket_key,
+    build_response_cache,
+    cache_key,
+    normalize_question,
+)
+
+
+def _vec(*xs):
+    return np.asarray(xs, dtype=np.float32)
+
+
+def test_normalize_question():
+    assert normalize_question("  加班規則是什麼？ ") == normalize_question("加班規則是什麼")
+    assert normalize_question("VPN   怎麼用?") == normalize_question("ｖｐｎ 怎麼用")
+
+
+def test_response_cache_is_off_unless_enabled(monkeypatch):
+    monkeypatch.delenv("RESPONSE_CACHE_BACKEND", raising=False)
+    assert build_response_cache() is None
+    monkeypatch.setenv("RESPONSE_CACHE_BACKEND", "memory")
+    assert isinstance(build_response_cache(), MemoryResponseCache)
+
+
+def test_key_depends_on_context_model_and_temperature():
+    b = bucket_key("ctx", "gpt-4o-mini", 0.2)
+    assert cache_key("加班？", b) == cache_key("加班", b)
+    assert cache_key("加班", b) != cache_key("加班", bucket_key("other ctx", "gpt-4o-mini", 0.2))
+    assert cache_key("加班", b) != cache_key("加班", bucket_key("ctx", "gpt-4o", 0.2))
+    assert cache_key("加班", b) != cache_key("加班", bucket_key("ctx", "gpt-4o-mini", 0.7))
+
+
+async def test_memory_exact_and_semantic():
+    cache = MemoryResponseCache(semantic_threshold=0.95)
+    b = bucket_key("ctx", "m", 0.2)
+    await cache.set(cache_key("加班規則", b), b, _vec(1, 0, 0), {"answer": "A"})
+
+    assert await cache.get(cache_key("加班規則？", b)) == {"answer": "A"}
+    # 近似向量 → 語意命中；不夠像 / 不同 bucket → miss
+    value, score = await cache.get_similar(b, _vec(0.99, 0.05, 0))
+    assert value == {"answer": "A"} and score > 0.95
+    assert await cache.get_similar(b, _vec(0.5, 0.5, 0)) is None
+    assert await cache.get_similar(bucket_key("other", "m", 0.2), _vec(1, 0, 0)) is None
+
+
+async def test_memory_lru_bound_drops_vectors_too():
+    cache = MemoryResponseCache(maxsize=2, semantic_threshold=0.9)
+    b = bucket_key("ctx", "m", 0.2)
+    for i, v in enumerate([_vec(1, 0), _vec(0, 1), _vec(-1, 0)]):
+        await cache.set(f"k{i}", b, v, {"answer": i})
+    assert await cache.get("k0") is None
+    assert await cache.get_similar(b, _vec(1, 0)) is None  # k0 的向量也一起清掉
+    assert (await cache.get_similar(b, _vec(0, 1)))[0] == {"answer": 1}
+
+
+@pytest.fixture
+async def redis_cache(redis_url):
+    cache = RedisResponseCache(redis_url, prefix=f"test-gwcache-{uuid.uuid4().hex[:8]}", semantic_threshold=0.95)
+    yield cache
+    keys = [k async for k in cache.r.scan_iter(f"{cache.prefix}:*")]
+    if keys:
+        await cache.r.delete(*keys)
+    await cache.close()
+
+
+async def test_redis_exact_and_semantic(redis_cache):
+    b = bucket_key("ctx", "m", 0.2)
+    await redis_cache.set(cache_key("加班規則", b), b, _vec(1, 0, 0), {"answer": "加班需事先提出"})
+    assert await redis_cache.get(cache_key("加班規則。", b)) == {"answer": "加班需事先提出"}
+    value, _ = await redis_cache.get_similar(b, _vec(0.99, 0.05, 0))
+    assert value == {"answer": "加班需事先提出"}
+
+    # 答案過期（這裡直接刪掉）但向量還在 → miss，並清掉孤兒向量
+    await redis_cache.r.delete(redis_cache._rkey(cache_key("加班規則", b)))
+    assert await redis_cache.get_similar(b, _vec(1, 0, 0)) is None
+    assert await redis_cache.r.hlen(redis_cache._vkey(b)) == 0
+
+
+async def test_redis_vector_hash_is_bounded_per_bucket(redis_cache):
+    redis_cache.max_per_bucket = 2
+    b = bucket_key("ctx", "m", 0.2)
+    # 熱門 bucket 裡答案早已過期的向量（HASH 一直被續命，不會整個過期）
+    await redis_cache.r.hset(redis_cache._vkey(b), "dead", _vec(0, 0, 1).tobytes())
+    await redis_cache.r.zadd(redis_cache._ekey(b), {"dead": 1})
+
+    async def fields():
+        return {f.decode() for f in await redis_cache.r.hkeys(redis_cache._vkey(b))}
+
+    await redis_cache.set("k0", b, _vec(1, 0, 0), {"answer": 0})
+    assert await fields() == {"k0"}  # 寫入時順手清掉過期的
+    await redis_cache.set("k1", b, _vec(0, 1, 0), {"answer": 1})
+    await redis_cache.set("k2", b, _vec(-1, 0, 0), {"answer": 2})
+    assert await fields() == {"k1", "k2"}  # 超過上限丟最早過期的
+    assert await redis_cache.r.zcard(redis_cache._ekey(b)) == 2
+    assert await redis_cache.get_similar(b, _vec(1, 0, 0)) is None
+    assert (await redis_cache.get_similar(b, _vec(0, 1, 0)))[0] == {"answer": 1}
+
+
+def test_ask_serves_repeated_question_from_cache(monkeypatch):
+    from gateway import main
+
+    calls = []
+
+    async def fake_embed(q):
+        return _vec(1, 0, 0)
+
+    async def fake_search(q_emb, k=3):
+        return "加班申請：需事先提出。", 0.1
+
+    async def fake_call(fn):
+        calls.append(1)
+        resp = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="需事先提出"))],
+                               usage=SimpleNamespace(total_tokens=42))
+        return SimpleNamespace(name="stub", model=None), resp
+
+    monkeypatch.setattr(main, "embed_query", fake_embed)
+    monkeypatch.setattr(main, "search_best", fake_search)
+    monkeypatch.setattr(main.pool, "call", fake_call)
+    monkeypatch.setattr(main, "response_cache", MemoryResponseCache(semantic_threshold=0.95))
+    monkeypatch.setattr(main, "_LIMIT", 10**6)
+
+    client = TestClient(main.app)  # 不進 lifespan：不建索引
+    first = client.post("/ask", json={"question": "加班規則是什麼？"}).json()
+    second = client.post("/ask", json={"question": "加班規則是什麼"}).json()
+    third = client.post("/ask", json={"question": "加班要怎麼申請"}).json()
+
+    assert len(calls) == 1
+    assert first["debug"]["cache"] == "miss"
+    assert second["debug"]["cache"] == "exact" and second["answer"] == first["answer"]
+    assert third["debug"]["cache"] == "semantic"
+    assert "gateway_response_cache_hits_total" in client.get("/metrics").text
@@ -0,0 +1,135 @@
+# tests/test_tracing.py
+"""
+per-stage tracing：span / traced 寫進 stage histogram、trace() 收集單一請求的各階段耗時
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, Histogram
+
+from services import tracing
+from services.tracing import span, trace, traced
+
+
+@pytest.fixture
+def stage_hist():
+    """換成測試自己的 histogram；結束後還原（gateway 若已 import，用的是它的 STAGE_LAT）"""
+    prev = tracing._cfg.histogram
+    hist = Histogram("test_stage_seconds", "stage", ["stage"], registry=CollectorRegistry())
+    tracing.configure(histogram=hist, enabled=True, exporter="none")
+    yield hist
+    tracing.configure(enabled=True, exporter="none")
+    tracing._cfg.histogram, tracing._cfg.children = prev, {}
+
+
+def _observed(hist, stage: str):
+    """(count, sum)；沒有觀測值就是 (0, 0)"""
+    values = {s.name.rsplit("_", 1)[-1]: s.value for m in hist.collect() for s in m.samples
+              if s.labels.get("stage") == stage and not s.name.endswith("_created")}
+    return values.get("count", 0), values.get("sum", 0)
+
+
+async def test_span_and_traced_record_histogram_and_trace(stage_hist):
+    @traced("embed")
+    async def embed():
+        await asyncio.sleep(0.02)
+
+    @traced("search")
+    def search():
+        time.sleep(0.01)
+
+    with trace() as t:
+        # gather 出去的子 task 也算進同一個 trace（同一個 stage 會累加）
+        await asyncio.gather(embed(), embed())
+        search()
+        with span("llm"):
+            await asyncio.sleep(0.03)
+
+    assert set(t.ms()) == {"embed", "search", "llm"}
+    assert t.ms()["embed"] >= 40 and t.ms()["llm"] >= 30
+    count, total = _observed(stage_hist, "embed")
+    assert count == 2 and total >= 0.04
+
+
+def test_span_records_even_when_the_stage_raises(stage_hist):
+    with pytest.raises(ValueError):
+        with trace() as t, span("guardrail"):
+            raise ValueError("boom")
+    assert "guardrail" in t.ms()
+    assert _observed(stage_hist, "guardrail")[0] == 1
+
+
+def test_disabled_span_overhead_is_under_5us(stage_hist):
+    tracing.configure(enabled=False, exporter="none")
+
+    @traced("noop")
+    def f():
+        return 1
+
+    n = 100_000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        with span("noop"):
+            pass
+        f()
+    per_span_us = (time.perf_counter() - t0) / (2 * n) * 1e6
+    print(f"disabled span overhead: {per_span_us:.3f} µs")
+    assert per_span_us < 5
+    assert _observed(stage_hist, "noop") == (0, 0)
+
+
+def test_file_exporter_writes_otel_spans(tmp_path, monkeypatch):
+    pytest.importorskip("opentelemetry.sdk")
+    out = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("TRACING_FILE", str(out))
+    tracing.configure(enabled=True, exporter="file")
+    try:
+        with span("ask"):
+            with span("llm") as s:
+                s.set("upstream", "stub")
+    finally:
+        tracing.configure(enabled=True, exporter="none")  # shutdown → flush
+
+    spans = {d["name"]: d for d in map(json.loads, out.read_text().splitlines())}
+    assert spans["llm"]["attributes"] == {"upstream": "stub"}
+    assert spans["llm"]["parent_id"] == spans["ask"]["context"]["span_id"]
+
+
+def test_ask_reports_stage_timings(monkeypatch):
+    from gateway import main
+    from services import retrieval_service
+    from services.response_cache import MemoryResponseCache
+
+    index = faiss.IndexFlatL2(3)
+    index.add(np.eye(3, dtype="float32"))
+
+    async def fake_embedding(text):
+        await asyncio.sleep(0.01)
+        return [1.0, 0.0, 0.0]
+
+    async def fake_call(fn):
+        await asyncio.sleep(0.02)
+        resp = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="需事先提出"))],
+                               usage=SimpleNamespace(total_tokens=42))
+        return SimpleNamespace(name="stub", model=None), resp
+
+    monkeypatch.setattr(retrieval_service, "_get_embedding", fake_embedding)
+    monkeypatch.setattr(retrieval_service, "_index", index)
+    monkeypatch.setattr(retrieval_service, "_chunks", ["加班申請：需事先提出。", "b", "c"])
+    monkeypatch.setattr(main.pool, "call", fake_call)
+    monkeypatch.setattr(main, "response_cache", MemoryResponseCache())
+    monkeypatch.setattr(main, "_LIMIT", 10**6)
+
+    client = TestClient(main.app)
+    stages = client.post("/ask", json={"question": "加班規則是什麼？"}).json()["debug"]["stages_ms"]
+
+    assert {"ask", "embed", "search", "cache_lookup", "llm", "cache_store"} <= set(stages)
+    assert stages["embed"] >= 10 and stages["llm"] >= 20
+    assert stages["ask"] >= stages["embed"] + stages["llm"]
+    assert 'gateway_stage_duration_seconds_count{stage="llm"}' in client.get("/metrics").text
@@ -0,0 +1,312 @@
+# app/accounting.py
+"""
+Token / 成本計算：版本化價格表 + tokenizer 計數（LRU 快取）+ per-model / route / tenant 成本 counter
+
+- PricingTable：價格（USD / 1M tokens）只載入一次，查詢時不再解析設定
+  - PRICING_FILE 指定 JSON 檔時，每 PRICING_RELOAD_SECONDS 秒最多看一次 mtime，檔案改了就熱載入（不用重啟）
+  - 新檔案壞掉（JSON 錯誤 / 欄位缺）→ 保留舊表、記 warning，不會讓請求失敗
+  - 模型名稱找不到時用最長前綴（gpt-4o-mini-2024-07-18 → gpt-4o-mini），再找不到用 default
+- count_tokens(text, model)：有裝 tiktoken 就用該模型的 encoding；沒裝（或 encoding 檔下載不到）
+  退回估算（CJK 一字一 token、其他約 4 字元一 token）。結果放 LRU（TOKEN_CACHE_SIZE 筆），
+  重複的 system prompt / 模板不會一再 encode
+- estimate_cost(model, messages, max_completion_tokens)：送出前估成本（路由層用，LRU 命中時約 1µs 等級）
+- record(model, prompt_tokens, completion_tokens, route=, tenant=)：算實際成本並累加到 configure() 給的 counter
+- StreamUsage：串流時收集 delta；上游沒回 usage 時用 tokenizer 補算
+
+價格表 JSON：
+    {"version": "2025-06",
+     "models": {"gpt-4o-mini": {"prompt": 0.15, "completion": 0.60}, ...},
+     "default": {"prompt": 0, "completion": 0}}
+"""
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# 內建價格（USD / 1M tokens）；PRICING_FILE 沒設時使用
+DEFAULT_PRICING: Dict[str, Any] = {
+    "version": "builtin-2025-06",
+    "models": {
+        "gpt-4o":       {"prompt": 2.50, "completion": 10.00},
+        "gpt-4o-mini":  {"prompt": 0.15, "completion": 0.60},
+        "gpt-4.1":      {"prompt": 2.00, "completion": 8.00},
+        "gpt-4.1-mini": {"prompt": 0.40, "completion": 1.60},
+        "gpt-4.1-nano": {"prompt": 0.10, "completion": 0.40},
+        "text-embedding-3-small": {"prompt": 0.02, "completion": 0.0},
+        "text-embedding-3-large": {"prompt": 0.13, "completion": 0.0},
+    },
+    "default": {"prompt": 0.0, "completion": 0.0},
+}
+
+
+@dataclass(frozen=True)
+class Price:
+    prompt: float      # USD / 1M prompt tokens
+    completion: float  # USD / 1M completion tokens
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.prompt + completion_tokens * self.completion) / 1_000_000
+
+
+class _Snapshot:
+    """一個版本的價格表；熱載入時整個換掉，查詢端不用拿 lock"""
+
+    __slots__ = ("version", "models", "default", "resolved")
+
+    def __init__(self, version: str, models: Dict[str, Price], default: Price) -> None:
+        self.version = version
+        self.models = models
+        self.default = default
+        self.resolved: Dict[str, Price] = {}  # model -> Price（含前綴比對結果）
+
+    @classmethod
+    def parse(cls, data: Mapping[str, Any], default: Optional[Price] = None) -> "_Snapshot":
+        models = {name: Price(float(p["prompt"]), float(p["completion"]))
+                  for name, p in data.get("models", {}).items()}
+        d = data.get("default")
+        if default is None:
+            default = Price(float(d["prompt"]), float(d["completion"])) if d else Price(0.0, 0.0)
+        return cls(str(data.get("version", "unversioned")), models, default)
+
+    def price(self, model: str) -> Price:
+        p = self.resolved.get(model)
+        if p is None:
+            p = self.models.get(model)
+            if p is None:
+                prefix = max((n for n in self.models if model.startswith(n)), key=len, default=None)
+                p = self.models[prefix] if prefix else self.default
+            self.resolved[model] = p
+        return p
+
+
+class PricingTable:
+    def __init__(self, path: Optional[str] = None, reload_interval: float = 5.0,
+                 default: Optional[Price] = None) -> None:
+        """default：表裡沒有的模型用這個價格（不給就用表裡的 "default"）"""
+        self.path = path
+        self.reload_interval = reload_interval
+        self._default = default
+        self._mtime: Optional[int] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._snap = _Snapshot.parse(DEFAULT_PRICING, default)
+        if path:
+            self.reload()
+
+    @property
+    def version(self) -> str:
+        self._maybe_reload()
+        return self._snap.version
+
+    def price(self, model: str) -> Price:
+        self._maybe_reload()
+        return self._snap.price(model)
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        return self.price(model).cost(prompt_tokens, completion_tokens)
+
+    def set_default(self, default: Price) -> None:
+        """表裡沒有的模型改用這個價格（之後熱載入的版本也沿用）"""
+        with self._lock:
+            self._default = default
+            self._snap = _Snapshot(self._snap.version, self._snap.models, default)
+
+    def reload(self) -> bool:
+        """重新讀 PRICING_FILE；成功換上新版本回傳 True，失敗保留舊表"""
+        if not self.path:
+            return False
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path, encoding="utf-8") as f:
+                    snap = _Snapshot.parse(json.load(f), self._default)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                log.warning("pricing reload failed; keeping version %s: %s", self._snap.version, e)
+                return False
+            self._snap, self._mtime = snap, mtime
+        log.info("pricing table loaded: version=%s models=%d", snap.version, len(snap.models))
+        return True
+
+    def _maybe_reload(self) -> None:
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+
+# ================== Token 計數 ==================
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+_APPROX = "approx"
+
+
+def _approx_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class TokenCounter:
+    """tiktoken 計數 + LRU；key 是 (encoding, text)，同 encoding 的模型共用快取"""
+
+    def __init__(self, cache_size: int = 4096) -> None:
+        self._encoding_of: Dict[str, str] = {}  # model -> encoding 名稱（或 "approx"）
+        self._encoders: Dict[str, Any] = {}
+        self._count = functools.lru_cache(maxsize=cache_size)(self._count_uncached)
+
+    def _encoding_name(self, model: Optional[str]) -> str:
+        key = model or ""
+        name = self._encoding_of.get(key)
+        if name is not None:
+            return name
+        try:
+            import tiktoken
+            try:
+                enc = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+            except KeyError:  # tiktoken 不認得的模型名稱
+                enc = tiktoken.get_encoding("o200k_base")
+            self._encoders[enc.name] = enc
+            name = enc.name
+        except Exception as e:  # 沒裝 tiktoken / encoding 檔下載失敗
+            log.info("tiktoken unavailable for model=%s (%s); using approximate token counts", model, e)
+            name = _APPROX
+        self._encoding_of[key] = name
+        return name
+
+    def _count_uncached(self, encoding: str, text: str) -> int:
+        if encoding == _APPROX:
+            return _approx_tokens(text)
+        return len(self._encoders[encoding].encode_ordinary(text))
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        if not text:
+            return 0
+        return self._count(self._encoding_name(model), text)
+
+    def count_messages(self, messages: Iterable[Mapping[str, Any]], model: Optional[str] = None) -> int:
+        """Chat messages 的 prompt tokens：每則訊息約多 3 個格式 token，回覆開頭再 3 個"""
+        total = 3
+        for m in messages:
+            content = m.get("content") or ""
+            total += 3 + self.count(m.get("role", ""), model) + self.count(
+                content if isinstance(content, str) else json.dumps(content, ensure_ascii=False), model)
+        return total
+
+    def cache_info(self):
+        return self._count.cache_info()
+
+    def cache_clear(self) -> None:
+        self._count.cache_clear()
+
+
+# ================== 串流 ==================
+class StreamUsage:
+    """串流時邊收 delta 邊記；結束時優先用上游 usage，沒有就用 tokenizer 算"""
+
+    def __init__(self, model: str, messages: List[Mapping[str, Any]]) -> None:
+        self.model = model
+        self.messages = messages
+        self.parts: List[str] = []
+        self.usage: Any = None
+
+    def add(self, delta: Optional[str]) -> None:
+        if delta:
+            self.parts.append(delta)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def tokens(self) -> Tuple[int, int]:
+        """(prompt_tokens, completion_tokens)"""
+        u = self.usage
+        if u is not None and getattr(u, "prompt_tokens", None) is not None:
+            return u.prompt_tokens or 0, u.completion_tokens or 0
+        return count_messages(self.messages, self.model), count_tokens(self.text, self.model)
+
+
+# ================== 模組層級單例：app.py 用 configure() 接上 counter ==================
+class _Meters:
+    cost: Any = None    # Counter(labels: model, route, tenant)
+    tokens: Any = None  # Counter(labels: model, route, tenant, <kind_label>)
+    kind_label: str = "type"
+    max_tenants: int = int(os.getenv("ACCOUNTING_MAX_TENANTS", "100"))
+    tenants: set = set()
+
+
+_meters = _Meters()
+pricing = PricingTable(os.getenv("PRICING_FILE") or None, float(os.getenv("PRICING_RELOAD_SECONDS", "5")))
+counter = TokenCounter(int(os.getenv("TOKEN_CACHE_SIZE", "4096")))
+
+
+def configure(cost_counter: Any = None, token_counter: Any = None, kind_label: Optional[str] = None,
+              default_price: Optional[Price] = None, pricing_file: Optional[str] = None) -> None:
+    """
+    cost_counter / token_counter：要累加的 Prometheus Counter；kind_label：token counter 區分 prompt / completion 的 label
+    default_price：表裡沒有的模型的價格；pricing_file：改用這個價格表檔（預設讀 PRICING_FILE）
+    """
+    if cost_counter is not None:
+        _meters.cost = cost_counter
+    if token_counter is not None:
+        _meters.tokens = token_counter
+    if kind_label is not None:
+        _meters.kind_label = kind_label
+    if default_price is not None:
+        pricing.set_default(default_price)
+    if pricing_file:
+        pricing.path = pricing_file
+        pricing.reload()
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return counter.count(text, model)
+
+
+def count_messages(messages: Iterable[Mapping[str, Any]], model: Optional[str] = None) -> int:
+    return counter.count_messages(messages, model)
+
+
+def estimate_cost(model: str, messages: Iterable[Mapping[str, Any]], max_completion_tokens: int = 0) -> float:
+    """送出前的成本上限估計：prompt 實際計數 + 最多 max_completion_tokens 個輸出"""
+    return pricing.cost(model, count_messages(messages, model), max_completion_tokens)
+
+
+def tenant_label(tenant: Optional[str]) -> str:
+    """限制 tenant label 的基數：前 ACCOUNTING_MAX_TENANTS 個出現的 tenant 之後都算 "other" """
+    t = tenant or "default"
+    if t in _meters.tenants:
+        return t
+    if len(_meters.tenants) >= _meters.max_tenants:
+        return "other"
+    _meters.tenants.add(t)
+    return t
+
+
+def record(model: str, prompt_tokens: int, completion_tokens: int, route: str = "", tenant: Optional[str] = None,
+           cost: Optional[float] = None) -> float:
+    """累加 token 與成本 counter，回傳這次的成本（USD）；cost 有給就不查價格表"""
+    if cost is None:
+        cost = pricing.cost(model, prompt_tokens, completion_tokens)
+    tenant = tenant_label(tenant)
+    if _meters.cost is not None:
+        _meters.cost.labels(model=model, route=route, tenant=tenant).inc(cost)
+    if _meters.tokens is not None:
+        kind = _meters.kind_label
+        _meters.tokens.labels(model=model, route=route, tenant=tenant, **{kind: "prompt"}).inc(prompt_tokens)
+        _meters.tokens.labels(model=model, route=route, tenant=tenant, **{kind: "completion"}).inc(completion_tokens)
+    return cost
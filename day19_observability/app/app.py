@@ -1,11 +1,11 @@
 # ⚠️ 注意：
-# 這個 demo 採用單進程 Registry，reload=False 避免 metrics 重複註冊。
-# 如果未來要在 production 使用多進程（例如 gunicorn -w 4），
-# 請改用 prometheus_client.multiprocess.Registry 來收集 metrics。
+# 單進程時用預設 Registry，reload=False 避免 metrics 重複註冊。
+# 多進程（gunicorn -w N）時設 PROMETHEUS_MULTIPROC_DIR，並用 gunicorn.conf.py 啟動：
+# 每個 worker 的值寫在該目錄的 mmap 檔，/metrics 回傳所有 worker 加總（見 prom_multiprocess.py）。
 
-import os, time, json, logging, http
+import os, time, json, logging, http, asyncio
 from logging.handlers import RotatingFileHandler
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 from contextlib import asynccontextmanager
 from pathlib import Path
 
@@ -14,15 +14,29 @@ from fastapi import FastAPI, Request
 
 from fastapi.responses import Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
-from openai import OpenAI
+from prometheus_client import Counter, Histogram
+from openai import AsyncOpenAI, APIStatusError, APITimeoutError
 import httpx
 
+try:
+    import accounting                                  # gunicorn / python app/app.py（app/ 在 sys.path）
+    from async_logging import setup_async_logging
+    from prom_multiprocess import mark_worker_exit, render_latest
+except ImportError:
+    from app import accounting                         # uvicorn app.app:app（從專案根目錄執行）
+    from app.async_logging import setup_async_logging
+    from app.prom_multiprocess import mark_worker_exit, render_latest
+
 # ================== 環境變數 ==================
 load_dotenv(override=False)
 OPENAI_API_KEY  = os.getenv("OPENAI_API_KEY", "")
 DEFAULT_MODEL   = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 REQUEST_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# httpx 連線池：所有請求共用，keep-alive 重用連線（不用每次重新 TCP / TLS 握手）
+OPENAI_MAX_CONNECTIONS  = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE    = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
 APP_PORT        = int(os.getenv("APP_PORT", "8000"))
 
 # 統一路徑：優先吃 LOG_DIR；否則寫到「專案根/logs」
@@ -47,13 +61,14 @@ logger.setLevel(logging.INFO)
 for handler in logger.handlers[:]:
     logger.removeHandler(handler)
 
-# 格式設定
-fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+# 非阻塞 JSON 日誌（見 async_logging.py）：event loop 只把 record 丟進有界 buffer，
+# 背景執行緒批次格式化 + 寫檔；buffer 滿時抽樣 / 丟棄，不阻塞請求
+log_handlers = []
 
 # Console Handler
 console_handler = logging.StreamHandler()
-console_handler.setFormatter(fmt)
 console_handler.setLevel(logging.INFO)
+log_handlers.append(console_handler)
 
 # File Handler - 加上錯誤處理
 try:
@@ -63,16 +78,8 @@ try:
         backupCount=3, 
         encoding="utf-8"
     )
-    file_handler.setFormatter(fmt)
     file_handler.setLevel(logging.INFO)
-    
-    # 測試寫入
-    file_handler.emit(logging.LogRecord(
-        name="test", level=logging.INFO, pathname="", lineno=0,
-        msg="Log handler initialization test", args=(), exc_info=None
-    ))
-    
-    logger.addHandler(file_handler)
+    log_handlers.append(file_handler)
     print(f"✅ File handler 設定成功: {LOG_FILE}")
     
 except PermissionError:
@@ -81,15 +88,19 @@ except PermissionError:
 except Exception as e:
     print(f"❌ File handler 設定失敗: {e}")
 
-# 加入 console handler
-logger.addHandler(console_handler)
+log_queue_handler = setup_async_logging(
+    logger, log_handlers,
+    maxsize=int(os.getenv("LOG_QUEUE_MAXSIZE", "10000")),
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", "256")),
+    flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL_MS", "200")) / 1000,
+    sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "0.1")),
+)
 
 # 防止傳播到 root logger（避免重複輸出）
 logger.propagate = False
 
 # 測試寫入
-logger.info(f"[INIT] Logging 初始化完成，日誌檔案: {LOG_FILE}")
-logger.info(f"[INIT] 日誌目錄: {LOG_DIR}")
+logger.info("[INIT] Logging 初始化完成", extra={"log_file": str(LOG_FILE), "log_dir": str(LOG_DIR)})
 
 print(f"Log 檔案位置: {LOG_FILE}")
 print(f"目錄是否存在: {LOG_DIR.exists()}")
@@ -99,8 +110,30 @@ print(f"檔案是否存在: {LOG_FILE.exists()}")
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY is not set")
 
-http_client = httpx.Client(timeout=REQUEST_TIMEOUT)
-client = OpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+# AsyncOpenAI + 共用 httpx.AsyncClient：等 LLM 回應時不佔住 event loop，並發請求可以同時在途
+# 第一次用到才建（綁定當下的 event loop），lifespan 關閉時釋放
+_http_client: httpx.AsyncClient | None = None
+_client: AsyncOpenAI | None = None
+
+def get_client() -> AsyncOpenAI:
+    global _http_client, _client
+    if _client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, http_client=_http_client)
+    return _client
+
+async def close_client() -> None:
+    global _http_client, _client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = _client = None
 
 # ================== FastAPI 初始化 ==================
 @asynccontextmanager
@@ -108,8 +141,11 @@ async def lifespan(app: FastAPI):
     # 啟動時
     logger.info("[STARTUP] app is up; log file should exist")
     yield
-    # 關閉時
+    # 關閉時（把 buffer 裡剩下的 log 寫完）
     logger.info("[SHUTDOWN] app is stopping")
+    await close_client()
+    mark_worker_exit()
+    log_queue_handler.stop()
 
 app = FastAPI(title="LLM Observability Demo", lifespan=lifespan)
 
@@ -123,25 +159,69 @@ app.add_middleware(
 
 # ================== Prometheus Metrics ==================
 REQUEST_COUNT = Counter("llm_requests_total", "總請求數", ["model"])
-TOKEN_USAGE   = Counter("llm_tokens_total", "Token 使用量", ["model", "type"])  # prompt/completion
+TOKEN_USAGE   = Counter("llm_tokens_total", "Token 使用量", ["model", "route", "tenant", "type"])  # prompt/completion
 LATENCY       = Histogram("llm_request_latency_seconds", "延遲直方圖", ["model"])
 ERROR_COUNT   = Counter("llm_errors_total", "錯誤數", ["model", "error_type"])
-COST          = Counter("llm_cost_usd_total", "總成本 (USD)", ["model"])
-
-# OpenAI 模型價格（每百萬 Token）
-PRICING = {
-    "gpt-4o":       {"prompt": 2.50/1_000_000, "completion": 10.00/1_000_000},
-    "gpt-4o-mini":  {"prompt": 0.15/1_000_000, "completion": 0.60/1_000_000},
-    "gpt-4.1":      {"prompt": 2.00/1_000_000, "completion": 8.00/1_000_000},
-    "gpt-4.1-mini": {"prompt": 0.40/1_000_000, "completion": 1.60/1_000_000},
-}
-
-def calc_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
-    """依照模型單價計算 Token 成本"""
-    p = PRICING.get(model)
-    if not p:
-        return 0.0
-    return prompt_tokens * p["prompt"] + completion_tokens * p["completion"]
+COST          = Counter("llm_cost_usd_total", "總成本 (USD)", ["model", "route", "tenant"])
+
+# 價格表 / token 計數 / 成本累加統一由 accounting.py 處理（PRICING_FILE 可熱更新價格）
+accounting.configure(cost_counter=COST, token_counter=TOKEN_USAGE)
+
+# ================== Responses / Chat API 選擇 ==================
+# 每個模型第一次請求時試 Responses API；上游不支援（404 / 405 / 501，或 400 且錯誤訊息說不支援）就改用 Chat Completions，
+# Chat 成功之後才記在 _api_mode，之後同一個模型直接走對的 API，不再每次都先失敗一輪。
+# 一般的 400（參數錯、context 太長）是這個請求本身的問題：直接回錯，不會讓整個行程改走 Chat。
+# 逾時 / 5xx / 429 之類的暫時性錯誤不會改變決定，也不會再多打一次 Chat。
+_UNSUPPORTED_STATUS = {404, 405, 501}
+_UNSUPPORTED_HINTS = ("not supported", "unsupported", "unknown url", "unrecognized request url", "invalid url")
+_api_mode: Dict[str, str] = {}  # model -> "responses" | "chat"
+_api_probe_locks: Dict[str, asyncio.Lock] = {}  # 同一模型第一批並發請求只讓一個去試
+
+async def _via_responses(model: str, messages: List[Dict[str, Any]], temperature: float) -> Tuple[str, int, int]:
+    resp = await get_client().responses.create(
+        model=model,
+        input=[{"role": m["role"], "content": m["content"]} for m in messages],
+        temperature=temperature,
+    )
+    usage = resp.usage
+    return ((resp.output_text or "").strip(),
+            (getattr(usage, "input_tokens", 0) or 0) if usage else 0,
+            (getattr(usage, "output_tokens", 0) or 0) if usage else 0)
+
+async def _via_chat(model: str, messages: List[Dict[str, Any]], temperature: float) -> Tuple[str, int, int]:
+    chat = await get_client().chat.completions.create(model=model, messages=messages, temperature=temperature)
+    usage = chat.usage
+    return ((chat.choices[0].message.content or "").strip(),
+            (usage.prompt_tokens or 0) if usage else 0,
+            (usage.completion_tokens or 0) if usage else 0)
+
+def _responses_unsupported(e: APIStatusError) -> bool:
+    if e.status_code in _UNSUPPORTED_STATUS:
+        return True
+    return e.status_code == 400 and any(h in str(e).lower() for h in _UNSUPPORTED_HINTS)
+
+async def complete(model: str, messages: List[Dict[str, Any]], temperature: float) -> Tuple[str, int, int]:
+    """回傳 (answer, prompt_tokens, completion_tokens)"""
+    mode = _api_mode.get(model)
+    if mode is None:
+        async with _api_probe_locks.setdefault(model, asyncio.Lock()):
+            mode = _api_mode.get(model)
+            if mode is None:
+                try:
+                    result = await _via_responses(model, messages, temperature)
+                except APIStatusError as e:
+                    if not _responses_unsupported(e):
+                        raise
+                    result = await _via_chat(model, messages, temperature)  # Chat 也失敗就直接拋出，不記住
+                    logger.info("Responses API unsupported; using Chat Completions",
+                                extra={"model": model, "status": e.status_code})
+                    _api_mode[model] = "chat"
+                    return result
+                _api_mode[model] = "responses"
+                return result
+    if mode == "responses":
+        return await _via_responses(model, messages, temperature)
+    return await _via_chat(model, messages, temperature)
 
 # ================== 健康檢查 & 驗證端點 ==================
 @app.get("/health")
@@ -155,52 +235,39 @@ async def ask(request: Request):
     """呼叫 OpenAI API，並記錄 latency / tokens / cost / error"""
     body = await request.json()
     model = body.get("model", DEFAULT_MODEL)
+    tenant = request.headers.get("x-tenant-id") or body.get("tenant") or "default"
     messages: List[Dict[str, Any]] = body.get("messages") or [{"role": "user", "content": "Say hello!"}]
     # 強制加上 system prompt，要求輸出繁體中文
     messages = [{"role": "system", "content": "請一律使用繁體中文回答。"}] + messages
 
     start = time.time()
     try:
-        usage_prompt = usage_completion = 0
-        answer_text = None
-
-        # 優先嘗試 Responses API
-        try:
-            resp = client.responses.create(
-                model=model,
-                input=[{"role": m["role"], "content": m["content"]} for m in messages],
-                temperature=body.get("temperature", 0.2),
-            )
-            answer_text = (resp.output_text or "").strip()
-            if resp.usage:
-                usage_prompt     = getattr(resp.usage, "input_tokens", 0) or 0
-                usage_completion = getattr(resp.usage, "output_tokens", 0) or 0
-        except Exception:
-            # fallback: Chat Completions API
-            chat = client.chat.completions.create(
-                model=model, messages=messages, temperature=body.get("temperature", 0.2)
-            )
-            answer_text = (chat.choices[0].message.content or "").strip()
-            if chat.usage:
-                usage_prompt     = chat.usage.prompt_tokens or 0
-                usage_completion = chat.usage.completion_tokens or 0
+        # Responses API 或 Chat Completions（依模型快取的決定，見 complete()）
+        answer_text, usage_prompt, usage_completion = await complete(
+            model, messages, body.get("temperature", 0.2)
+        )
 
         latency = time.time() - start
 
         # ===== Metrics 更新 =====
+        # 上游沒回 usage（部分相容 API）→ 用 tokenizer 補算
+        if not usage_prompt and not usage_completion:
+            usage_prompt = accounting.count_messages(messages, model)
+            usage_completion = accounting.count_tokens(answer_text, model)
+
         REQUEST_COUNT.labels(model=model).inc()
-        TOKEN_USAGE.labels(model=model, type="prompt").inc(usage_prompt)
-        TOKEN_USAGE.labels(model=model, type="completion").inc(usage_completion)
         LATENCY.labels(model=model).observe(latency)
-
-        cost = calc_cost(model, usage_prompt, usage_completion)
-        COST.labels(model=model).inc(cost)
+        cost = accounting.record(model, usage_prompt, usage_completion, route="/ask", tenant=tenant)
 
         # ===== Logging =====
-        logger.info(
-            f"LLM Request | model={model} latency={latency:.2f}s "
-            f"prompt_tokens={usage_prompt} completion_tokens={usage_completion} cost={cost:.6f}"
-        )
+        logger.info("LLM Request", extra={
+            "model": model,
+            "tenant": tenant,
+            "latency_s": round(latency, 3),
+            "prompt_tokens": usage_prompt,
+            "completion_tokens": usage_completion,
+            "cost_usd": round(cost, 6),
+        })
 
         payload = {
             "model": model,
@@ -213,20 +280,21 @@ async def ask(request: Request):
         return Response(json.dumps(payload, ensure_ascii=False),
                         media_type="application/json; charset=utf-8")
 
-    except httpx.TimeoutException as e:
+    except (APITimeoutError, httpx.TimeoutException) as e:
         ERROR_COUNT.labels(model=model, error_type="timeout").inc()
-        logger.error(f"Timeout | model={model} detail={e}")
+        logger.error("Timeout", extra={"model": model, "detail": str(e)})
         return {"error": "OpenAI timeout", "detail": str(e)}, 504
     except Exception as e:
         ERROR_COUNT.labels(model=model, error_type="runtime").inc()
-        logger.error(f"RuntimeError | model={model} detail={e}")
+        logger.error("RuntimeError", extra={"model": model, "detail": str(e)})
         return {"error": "runtime", "detail": str(e)}, 500
 
 # ================== Metrics Exporter ==================
 @app.get("/metrics")
 def metrics():
-    """Prometheus 抓取 metrics 的 endpoint"""
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    """Prometheus 抓取 metrics 的 endpoint（多進程時為所有 worker 加總）"""
+    data, content_type = render_latest()
+    return Response(data, media_type=content_type)
 
 # ================== 本機啟動 ==================
 if __name__ == "__main__":
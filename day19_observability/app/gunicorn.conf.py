@@ -0,0 +1,24 @@
+# app/gunicorn.conf.py
+# gunicorn -c gunicorn.conf.py app:app
+# 多 worker 時 Prometheus 指標靠 PROMETHEUS_MULTIPROC_DIR 共享（見 prom_multiprocess.py）：
+# - on_starting：master 啟動、還沒 fork worker 前清掉上一輪的 .db 檔
+# - child_exit ：worker 結束（含被 kill / timeout）時由 master 清掉它的 live gauge 檔
+import os
+
+from prom_multiprocess import mark_worker_exit, wipe_multiprocess_dir
+
+bind = "0.0.0.0:8000"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+capture_output = True
+
+
+def on_starting(server):
+    wipe_multiprocess_dir()
+
+
+def child_exit(server, worker):
+    mark_worker_exit(worker.pid)
@@ -0,0 +1,123 @@
+# scripts/bench_log_analytics.py
+"""
+log_analytics 吞吐量（lines/s）與記憶體上限
+
+產生 --lines 行合成 log（JSON lines 為主，混一些舊版文字行、/health 雜訊），
+切成 RotatingFileHandler 的樣子（.log / .log.1 / .log.2.gz），然後量：
+
+- parse   ：只跑 Parser（記憶體裡的行，不含 I/O）
+- ingest  ：讀檔（含 gzip 解壓）→ 解析 → Parquet（另開子行程跑 CLI，peak RSS 由 CLI 自己回報）
+- again   ：沒有新資料時再跑一次 ingest（只看 fingerprint / offset）
+- report  ：Parquet → 每小時 × model 的 p50/p95/p99 / tokens / cost
+
+ingest 的 peak RSS 只跟 --batch-rows 有關，不該隨 --lines 成長（可以用不同 --lines 跑兩次比較）。
+
+用法：
+    python scripts/bench_log_analytics.py
+    python scripts/bench_log_analytics.py --lines 5000000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from log_analytics import Parser, ingest, report_rows, rollup  # noqa: E402
+
+CLI = os.path.join(SCRIPTS_DIR, "log_analytics.py")
+
+MODELS = ["gpt-4o-mini", "gpt-4o", "gpt-4.1-mini"]
+
+
+def _line(rnd: random.Random, ts: float) -> bytes:
+    r = rnd.random()
+    model = rnd.choice(MODELS)
+    if r < 0.05:
+        return json.dumps({"ts": round(ts, 3), "level": "INFO", "logger": "llm", "msg": "[HEALTH] ok"}).encode() + b"\n"
+    if r < 0.07:
+        return json.dumps({"ts": round(ts, 3), "level": "ERROR", "logger": "llm", "msg": "Timeout",
+                           "model": model, "detail": "Request timed out."}).encode() + b"\n"
+    lat, pt, ct = rnd.lognormvariate(0, 0.6), rnd.randint(20, 800), rnd.randint(10, 400)
+    cost = (pt * 0.15 + ct * 0.6) / 1_000_000
+    if r < 0.17:
+        asctime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) + f",{int(ts * 1000) % 1000:03d}"
+        return (f"{asctime} [INFO] LLM Request | model={model} latency={lat:.2f}s "
+                f"prompt_tokens={pt} completion_tokens={ct} cost={cost:.6f}\n").encode()
+    return json.dumps({"ts": round(ts, 3), "level": "INFO", "logger": "llm", "msg": "LLM Request",
+                       "model": model, "tenant": "default", "latency_s": round(lat, 3),
+                       "prompt_tokens": pt, "completion_tokens": ct, "cost_usd": round(cost, 6)},
+                      separators=(",", ":")).encode() + b"\n"
+
+
+def _generate(log_dir: str, n: int) -> list:
+    rnd = random.Random(0)
+    t0 = time.time() - 86400
+    lines = [_line(rnd, t0 + i * 86400 / n) for i in range(n)]
+    # 舊 → 新：.log.2.gz、.log.1、.log
+    a, b = n // 3, 2 * n // 3
+    with gzip.open(os.path.join(log_dir, "llm_requests.log.2.gz"), "wb", compresslevel=1) as f:
+        f.writelines(lines[:a])
+    for name, chunk in (("llm_requests.log.1", lines[a:b]), ("llm_requests.log", lines[b:])):
+        with open(os.path.join(log_dir, name), "wb") as f:
+            f.writelines(chunk)
+    return lines
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--lines", type=int, default=1_000_000)
+    ap.add_argument("--batch-rows", type=int, default=65536)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="log-analytics-")
+    try:
+        log_dir, out_dir = os.path.join(tmp, "logs"), os.path.join(tmp, "dataset")
+        os.makedirs(log_dir)
+        lines = _generate(log_dir, args.lines)
+        size_mb = sum(os.path.getsize(os.path.join(log_dir, f)) for f in os.listdir(log_dir)) / 1e6
+        print(f"lines: {args.lines:,}  on disk: {size_mb:.0f} MB（.log.2.gz 已壓縮）")
+
+        parser = Parser()
+        t = time.perf_counter()
+        for line in lines:
+            parser.parse(line)
+        parse_s = time.perf_counter() - t
+        del lines
+
+        t = time.perf_counter()
+        proc = subprocess.run([sys.executable, CLI, "ingest", log_dir, "--out", out_dir,
+                               "--batch-rows", str(args.batch_rows)], check=True, stderr=subprocess.PIPE, text=True)
+        ingest_s = time.perf_counter() - t
+        # 子行程的 ru_maxrss 會算到 fork 時從本行程（還留著所有 lines）帶過去的頁面，所以讓 CLI 自己回報 VmHWM
+        ingest_rss_mb = re.search(r"peak RSS (\d+) MB", proc.stderr).group(1)
+
+        t = time.perf_counter()
+        again = ingest([log_dir], out_dir)
+        again_s = time.perf_counter() - t
+
+        t = time.perf_counter()
+        groups = rollup(out_dir, 3600)
+        report_s = time.perf_counter() - t
+        rows = sum(g.requests for g in groups.values())
+
+        n = args.lines
+        print(f"{'parse':<8} {n / parse_s:>12,.0f} lines/s")
+        print(f"{'ingest':<8} {n / ingest_s:>12,.0f} lines/s  rows={rows:,}  peak RSS={ingest_rss_mb} MB")
+        print(f"{'again':<8} {again_s * 1000:>12.1f} ms       new lines={again['lines']}")
+        print(f"{'report':<8} {rows / report_s:>12,.0f} rows/s   groups={len(report_rows(groups))}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# scripts/log_analytics.py
+"""
+離線分析 llm_requests.log：串流解析（含輪替 / gzip）→ Parquet 資料集（增量）→ 每個 model × 時間桶的彙總
+
+- ingest：掃描 log 目錄（llm_requests.log、llm_requests.log.1…、*.gz），只讀上次之後新增的行
+  - 用「第一行的 hash」當檔案身分：RotatingFileHandler 改名（.log → .log.1）或事後壓縮成 .gz，
+    都接著上次的 offset 讀，不會重複、也不會漏
+  - 最後一行還沒寫完（沒有換行）就留到下次
+  - 每 --batch-rows 筆寫一個 row group：記憶體只跟 batch 大小有關，跟 log 多大無關
+  - 兩種格式都吃：JSON lines（async_logging.JsonFormatter）與舊版文字行
+    （2025-01-01 12:00:00,123 [INFO] LLM Request | model=... latency=1.23s prompt_tokens=... ...）
+  - 進度記在 <out>/_state.json（底線開頭，Arrow dataset 讀取時會略過）
+- report：逐 batch 掃 Parquet，依 (時間桶, model) 彙總 requests / errors / tokens / cost；
+  延遲 p50 / p95 / p99 用對數桶估算（相對誤差約 1%），不用把所有延遲留在記憶體
+
+用法：
+    python scripts/log_analytics.py ingest logs/ --out analytics/requests
+    python scripts/log_analytics.py report analytics/requests --bucket 1h
+    python scripts/log_analytics.py report analytics/requests --bucket 15m --format csv > rollup.csv
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import resource
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+SCHEMA = pa.schema([
+    ("ts", pa.timestamp("ms", tz="UTC")),
+    ("level", pa.string()),
+    ("event", pa.string()),  # ok | timeout | runtime
+    ("model", pa.string()),
+    ("tenant", pa.string()),
+    ("latency_s", pa.float64()),
+    ("prompt_tokens", pa.int64()),
+    ("completion_tokens", pa.int64()),
+    ("cost_usd", pa.float64()),
+])
+
+_EVENTS = {"LLM Request": "ok", "Timeout": "timeout", "RuntimeError": "runtime"}
+# 快速路徑：JsonFormatter 輸出的請求記錄欄位順序固定，直接用 regex 取值（比 json.loads 快 2～3 倍）
+_JSON_REQUEST = re.compile(
+    rb'\{"ts":([\d.]+),"level":"(\w+)","logger":"[^"]*","msg":"LLM Request","model":"([^"\\]*)",'
+    rb'"tenant":(?:"([^"\\]*)"|null),"latency_s":([\d.]+),"prompt_tokens":(\d+),"completion_tokens":(\d+),'
+    rb'"cost_usd":([\d.eE+-]+)'
+)
+# 其他行先用一個 regex 預篩：/health、[INIT] 之類的行連 json.loads 都不用做
+_INTEREST = re.compile(rb"LLM Request|Timeout|RuntimeError")
+_LEGACY = re.compile(
+    rb"(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) \[(\w+)\] (LLM Request|Timeout|RuntimeError) \| model=(\S+)"
+    rb"(?: latency=([\d.]+)s prompt_tokens=(\d+) completion_tokens=(\d+) cost=([\d.eE+-]+))?"
+)
+
+
+# ================== 解析 ==================
+class Parser:
+    """一行 bytes → 一筆 row（欄位順序同 SCHEMA）；不相關的行回傳 None"""
+
+    def __init__(self) -> None:
+        self.unparsed = 0  # 看起來是請求 / 錯誤記錄，但格式不對的行
+        self._epoch: Dict[bytes, int] = {}  # 舊格式 "YYYY-mm-dd HH:MM:SS"（本地時間）→ epoch ms；同一秒的行很多
+
+    def parse(self, line: bytes) -> Optional[tuple]:
+        m = _JSON_REQUEST.match(line)
+        if m is not None:
+            ts, level, model, tenant, lat, pt, ct, cost = m.groups()
+            return (int(float(ts) * 1000), level.decode(), "ok", model.decode(), tenant and tenant.decode(),
+                    float(lat), int(pt), int(ct), float(cost))
+        if not _INTEREST.search(line):
+            return None
+        if line[:1] == b"{":
+            return self._json(line)
+        return self._legacy(line)
+
+    def _json(self, line: bytes) -> Optional[tuple]:
+        try:
+            d = json.loads(line)
+            event = _EVENTS.get(d.get("msg"))
+            if event is None:
+                return None
+            return (int(d["ts"] * 1000), d.get("level"), event, d.get("model"), d.get("tenant"),
+                    d.get("latency_s"), d.get("prompt_tokens"), d.get("completion_tokens"), d.get("cost_usd"))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.unparsed += 1
+            return None
+
+    def _legacy(self, line: bytes) -> Optional[tuple]:
+        m = _LEGACY.search(line)
+        if m is None:
+            self.unparsed += 1
+            return None
+        sec, ms, level, msg, model, lat, pt, ct, cost = m.groups()
+        base = self._epoch.get(sec)
+        if base is None:
+            if len(self._epoch) > 100_000:
+                self._epoch.clear()
+            base = self._epoch[sec] = int(time.mktime(time.strptime(sec.decode(), "%Y-%m-%d %H:%M:%S"))) * 1000
+        return (base + int(ms), level.decode(), _EVENTS[msg.decode()], model.decode(), None,
+                float(lat) if lat else None, int(pt) if pt else None, int(ct) if ct else None,
+                float(cost) if cost else None)
+
+
+# ================== 讀檔（輪替 / gzip / 增量） ==================
+def _open(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def fingerprint(path: str) -> Optional[str]:
+    """第一行（含毫秒時間戳）的 hash；改名、壓縮都不變。第一行還沒寫完就回 None（下次再讀）"""
+    with _open(path) as f:
+        first = f.readline(64 * 1024)
+    if not first.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first).hexdigest()
+
+
+def discover(inputs: List[str]) -> List[str]:
+    """目錄底下的 *.log / *.log.N / *.gz；依 mtime 由舊到新，輸出大致照時間排序"""
+    files = set()
+    for p in inputs:
+        if os.path.isdir(p):
+            for pattern in ("*.log", "*.log.*", "*.gz"):
+                files.update(glob.glob(os.path.join(p, pattern)))
+        elif os.path.exists(p):
+            files.add(p)
+    return sorted(files, key=lambda f: (os.path.getmtime(f), f))
+
+
+def read_lines(path: str, offset: int) -> Iterator[bytes]:
+    """從 offset（解壓後的位元組）開始逐行讀；最後沒有換行的半行不回傳"""
+    with _open(path) as f:
+        f.seek(offset)  # gzip 的 seek 是往前解壓到該位置
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            yield line
+
+
+def _load_state(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"version": 1, "files": {}}
+
+
+def _save_state(path: str, state: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+class _Batches:
+    """row 累積到 batch_rows 就轉成欄位、寫成一個 row group"""
+
+    def __init__(self, path: str, batch_rows: int) -> None:
+        self.path = path
+        self.batch_rows = batch_rows
+        self.pending: List[tuple] = []
+        self.rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def add(self, row: tuple) -> None:
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        arrays = [pa.array(col, type=field.type) for col, field in zip(zip(*self.pending), SCHEMA)]
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, SCHEMA, compression="zstd")
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=SCHEMA))
+        self.rows += len(self.pending)
+        self.pending = []
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def ingest(inputs: List[str], out_dir: str, state_path: Optional[str] = None, batch_rows: int = 65536) -> dict:
+    """把新增的 log 行轉成 <out_dir>/part-*.parquet；回傳統計"""
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = state_path or os.path.join(out_dir, "_state.json")
+    state = _load_state(state_path)
+    known: Dict[str, dict] = state["files"]
+
+    name = f"part-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+    part, tmp = os.path.join(out_dir, name), os.path.join(out_dir, "." + name + ".tmp")
+    out = _Batches(tmp, batch_rows)
+    parser = Parser()
+    stats = {"files": 0, "lines": 0, "rows": 0, "unparsed": 0, "part": None}
+    seen, scanned = set(), set()
+    parse, add = parser.parse, out.add
+
+    for path in discover(inputs):
+        scanned.add(path)
+        fp = fingerprint(path)
+        if fp is None:
+            continue
+        seen.add(fp)
+        entry = known.get(fp, {})
+        gz = path.endswith(".gz")
+        if gz and entry.get("eof"):
+            continue  # .gz 不會再長，讀完過就不用再解壓一次
+        offset = entry.get("offset", 0)
+        if not gz and offset > os.path.getsize(path):
+            offset = 0  # 同樣第一行但檔案變短：被截斷重寫過
+        start, lines = offset, 0
+        for line in read_lines(path, offset):
+            offset += len(line)
+            lines += 1
+            row = parse(line)
+            if row is not None:
+                add(row)
+        known[fp] = {"offset": offset, "path": path, **({"eof": True} if gz else {})}
+        stats["lines"] += lines
+        stats["files"] += offset > start
+
+    out.close()
+    if out.rows:
+        os.replace(tmp, part)
+        stats["part"] = part
+    # 先有 Parquet 再更新 offset：中途掛掉頂多重讀，不會漏
+    # 這次掃過的路徑上已經找不到的檔案（輪替超過 backupCount 被刪）不再記錄；沒掃到的路徑保留
+    state["files"] = {fp: e for fp, e in known.items()
+                      if fp in seen or (e["path"] not in scanned and os.path.exists(e["path"]))}
+    _save_state(state_path, state)
+    stats["rows"], stats["unparsed"] = out.rows, parser.unparsed
+    return stats
+
+
+# ================== 彙總 ==================
+_GAMMA = 1.02  # 對數桶寬度：估出來的分位數相對誤差 ≤ (γ-1)/(γ+1) ≈ 1%
+_LOG_GAMMA = math.log(_GAMMA)
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_bucket(spec: str) -> int:
+    """'15m' / '1h' / '1d' → 秒"""
+    m = re.fullmatch(r"(\d+)([smhd])", spec.strip())
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid bucket: {spec!r} (e.g. 5m, 1h, 1d)")
+    return int(m.group(1)) * _UNITS[m.group(2)]
+
+
+class Rollup:
+    __slots__ = ("requests", "errors", "prompt_tokens", "completion_tokens", "cost_usd", "hist")
+
+    def __init__(self) -> None:
+        self.requests = self.errors = self.prompt_tokens = self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.hist: Dict[int, int] = {}  # 對數桶 index → 筆數
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = sum(self.hist.values())
+        if not total:
+            return None
+        rank, seen = q * (total - 1), 0
+        for i in sorted(self.hist):
+            seen += self.hist[i]
+            if seen > rank:
+                return 2 * _GAMMA ** i / (_GAMMA + 1)  # 桶 (γ^(i-1), γ^i] 的代表值
+        return None
+
+
+def rollup(data_dir: str, bucket_s: int = 3600, batch_size: int = 131072) -> Dict[Tuple[int, str], Rollup]:
+    """(bucket 起點 epoch ms, model) → Rollup；一次只在記憶體放一個 batch"""
+    bucket_ms = bucket_s * 1000
+    dataset = ds.dataset(data_dir, format="parquet", schema=SCHEMA)
+    cols = ["ts", "event", "model", "latency_s", "prompt_tokens", "completion_tokens", "cost_usd"]
+    out: Dict[Tuple[int, str], Rollup] = {}
+
+    for batch in dataset.to_batches(columns=cols, batch_size=batch_size):
+        if batch.num_rows == 0:
+            continue
+        ts = pc.cast(batch.column("ts"), pa.int64())
+        lat = batch.column("latency_s")
+        t = pa.table({
+            "b": pc.multiply(pc.divide(ts, bucket_ms), bucket_ms),
+            "model": pc.fill_null(batch.column("model"), "unknown"),
+            "err": pc.cast(pc.not_equal(batch.column("event"), "ok"), pa.int64()),
+            "pt": batch.column("prompt_tokens"),
+            "ct": batch.column("completion_tokens"),
+            "cost": batch.column("cost_usd"),
+            "idx": pc.cast(pc.ceil(pc.divide(pc.ln(pc.max_element_wise(lat, 1e-6, skip_nulls=False)), _LOG_GAMMA)), pa.int64()),
+        })
+        sums = t.group_by(["b", "model"]).aggregate([
+            ("b", "count", pc.CountOptions(mode="all")), ("err", "sum"),
+            ("pt", "sum"), ("ct", "sum"), ("cost", "sum"),
+        ])
+        for r in sums.to_pylist():
+            g = out.get((r["b"], r["model"]))
+            if g is None:
+                g = out[(r["b"], r["model"])] = Rollup()
+            g.requests += r["b_count"]
+            g.errors += r["err_sum"] or 0
+            g.prompt_tokens += r["pt_sum"] or 0
+            g.completion_tokens += r["ct_sum"] or 0
+            g.cost_usd += r["cost_sum"] or 0.0
+        hist = t.filter(pc.is_valid(t["idx"])).group_by(["b", "model", "idx"]).aggregate([("idx", "count")])
+        for r in hist.to_pylist():
+            h = out[(r["b"], r["model"])].hist
+            h[r["idx"]] = h.get(r["idx"], 0) + r["idx_count"]
+    return out
+
+
+def report_rows(groups: Dict[Tuple[int, str], Rollup]) -> List[dict]:
+    rows = []
+    for (b, model), g in sorted(groups.items()):
+        q = [g.quantile(p) for p in (0.50, 0.95, 0.99)]
+        rows.append({
+            "bucket": datetime.fromtimestamp(b / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "model": model,
+            "requests": g.requests,
+            "errors": g.errors,
+            "p50_ms": round(q[0] * 1000, 1) if q[0] is not None else None,
+            "p95_ms": round(q[1] * 1000, 1) if q[1] is not None else None,
+            "p99_ms": round(q[2] * 1000, 1) if q[2] is not None else None,
+            "prompt_tokens": g.prompt_tokens,
+            "completion_tokens": g.completion_tokens,
+            "cost_usd": round(g.cost_usd, 6),
+        })
+    return rows
+
+
+def _print_table(rows: List[dict]) -> None:
+    if not rows:
+        print("(no data)")
+        return
+    headers = list(rows[0])
+    cells = [[("" if r[h] is None else str(r[h])) for h in headers] for r in rows]
+    widths = [max(len(h), *(len(c[i]) for c in cells)) for i, h in enumerate(headers)]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for c in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(c, widths)))
+
+
+def peak_rss_mb() -> float:
+    """本行程的最大常駐記憶體；Linux 用 VmHWM（ru_maxrss 會把 fork 前父行程的用量也算進來）"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p_ing = sub.add_parser("ingest", help="log → Parquet（只處理新增的行）")
+    p_ing.add_argument("inputs", nargs="+", help="log 目錄或檔案")
+    p_ing.add_argument("--out", required=True, help="Parquet 資料集目錄")
+    p_ing.add_argument("--state", default=None, help="offset 記錄檔（預設 <out>/_state.json）")
+    p_ing.add_argument("--batch-rows", type=int, default=65536)
+
+    p_rep = sub.add_parser("report", help="依 model × 時間桶彙總延遲分位數 / tokens / cost")
+    p_rep.add_argument("data", help="Parquet 資料集目錄")
+    p_rep.add_argument("--bucket", type=parse_bucket, default=3600, help="時間桶（5m / 1h / 1d，預設 1h）")
+    p_rep.add_argument("--format", choices=["table", "csv", "json"], default="table")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "ingest":
+        t0 = time.perf_counter()
+        stats = ingest(args.inputs, args.out, args.state, args.batch_rows)
+        dt = time.perf_counter() - t0
+        rss_mb = peak_rss_mb()
+        print(f"files={stats['files']} lines={stats['lines']} rows={stats['rows']} unparsed={stats['unparsed']} "
+              f"({stats['lines'] / dt if dt else 0:,.0f} lines/s, peak RSS {rss_mb:.0f} MB) "
+              f"→ {stats['part'] or '(nothing new)'}", file=sys.stderr)
+        return
+
+    rows = report_rows(rollup(args.data, args.bucket))
+    if args.format == "csv":
+        w = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]) if rows else ["bucket"])
+        w.writeheader()
+        w.writerows(rows)
+    elif args.format == "json":
+        for r in rows:
+            print(json.dumps(r, ensure_ascii=False))
+    else:
+        _print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# app.py import 時會檢查 key、建立 log 目錄；測試一律打本機 stub，log 寫到暫存目錄
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="day19-logs-"))
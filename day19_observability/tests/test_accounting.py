@@ -0,0 +1,96 @@
+# tests/test_accounting.py
+"""
+accounting：價格表（前綴比對、熱載入、壞檔保留舊版）、token 計數 LRU、串流補算、per-tenant counter
+"""
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter
+
+from app import accounting
+from app.accounting import Price, PricingTable, StreamUsage, TokenCounter
+
+
+def _write(path, version, prompt):
+    path.write_text(json.dumps({"version": version, "models": {"gpt-4o-mini": {"prompt": prompt, "completion": 0.6}}}))
+    # 確保 mtime 一定改變（有些檔案系統時間解析度只到秒）
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_builtin_prices_match_dated_model_names_by_prefix():
+    table = PricingTable()
+    assert table.price("gpt-4o-mini-2024-07-18") == table.price("gpt-4o-mini") == Price(0.15, 0.60)
+    assert table.price("gpt-4o-2024-08-06") == Price(2.50, 10.00)
+    assert table.cost("unknown-model", 1000, 1000) == 0.0
+    assert PricingTable(default=Price(3.0, 6.0)).cost("unknown-model", 1000, 1000) == pytest.approx(0.009)
+
+
+def test_pricing_file_hot_reload_and_bad_file_keeps_previous_version(tmp_path):
+    path = tmp_path / "pricing.json"
+    _write(path, "v1", 0.15)
+    table = PricingTable(str(path), reload_interval=0)
+    assert table.version == "v1"
+    assert table.cost("gpt-4o-mini", 1_000_000, 0) == pytest.approx(0.15)
+
+    _write(path, "v2", 0.30)
+    assert table.version == "v2"
+    assert table.cost("gpt-4o-mini", 1_000_000, 0) == pytest.approx(0.30)
+
+    path.write_text("{ not json")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2_000_000_000))
+    assert table.version == "v2"
+    assert table.cost("gpt-4o-mini", 1_000_000, 0) == pytest.approx(0.30)
+
+
+def test_token_counts_are_cached_per_text():
+    counter = TokenCounter(cache_size=8)
+    prompt = "請一律使用繁體中文回答。" * 20
+    n = counter.count(prompt, "gpt-4o-mini")
+    assert n > 0
+    assert counter.count(prompt, "gpt-4o-mini") == n
+    assert counter.cache_info().hits == 1
+    assert counter.count("", "gpt-4o-mini") == 0
+
+
+def test_estimate_cost_grows_with_prompt_and_completion_budget():
+    short = [{"role": "user", "content": "hi"}]
+    long = [{"role": "user", "content": "加班規則是什麼？" * 50}]
+    assert accounting.estimate_cost("gpt-4o", long) > accounting.estimate_cost("gpt-4o", short) > 0
+    assert accounting.estimate_cost("gpt-4o", short, 500) > accounting.estimate_cost("gpt-4o", short)
+
+
+def test_stream_usage_prefers_upstream_usage_and_falls_back_to_counting():
+    messages = [{"role": "user", "content": "你好"}]
+    s = StreamUsage("gpt-4o-mini", messages)
+    for delta in ["你", "好", None, "！"]:
+        s.add(delta)
+    assert s.text == "你好！"
+    assert s.tokens() == (accounting.count_messages(messages, "gpt-4o-mini"),
+                          accounting.count_tokens("你好！", "gpt-4o-mini"))
+
+    s.usage = SimpleNamespace(prompt_tokens=11, completion_tokens=3)
+    assert s.tokens() == (11, 3)
+
+
+def test_record_labels_cost_by_model_route_and_bounded_tenant(monkeypatch):
+    reg = CollectorRegistry()
+    cost = Counter("t_cost_usd", "cost", ["model", "route", "tenant"], registry=reg)
+    tokens = Counter("t_tokens", "tokens", ["model", "route", "tenant", "type"], registry=reg)
+    monkeypatch.setattr(accounting, "_meters", accounting._Meters())
+    accounting._meters.tenants = set()
+    accounting._meters.max_tenants = 2
+    accounting.configure(cost_counter=cost, token_counter=tokens)
+
+    for tenant in ["acme", "globex", "initech"]:
+        c = accounting.record("gpt-4o", 1000, 100, route="/ask", tenant=tenant)
+        assert c == pytest.approx((1000 * 2.50 + 100 * 10.00) / 1_000_000)
+
+    def value(name, **labels):
+        return reg.get_sample_value(name, labels)
+
+    assert value("t_cost_usd_total", model="gpt-4o", route="/ask", tenant="acme") == pytest.approx(c)
+    assert value("t_cost_usd_total", model="gpt-4o", route="/ask", tenant="other") == pytest.approx(c)
+    assert value("t_tokens_total", model="gpt-4o", route="/ask", tenant="globex", type="completion") == 100
@@ -0,0 +1,131 @@
+# tests/test_async_ask.py
+"""
+/ask 走 AsyncOpenAI：N 個並發請求應該同時在途（總時間約一次上游延遲），
+Responses / Chat 的選擇每個模型只試一次
+"""
+import asyncio
+import socket
+import threading
+import time
+from collections import Counter
+
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+import app.app as main
+
+UPSTREAM_LATENCY = 0.3
+
+
+def _stub(supports_responses: bool, hits: Counter, bad_request: str = "") -> FastAPI:
+    """最小的 OpenAI 相容上游：每個請求固定睡 UPSTREAM_LATENCY 秒；bad_request 有值時兩個 API 都回這個 400"""
+    stub = FastAPI()
+
+    @stub.post("/v1/responses")
+    async def responses(payload: dict):
+        hits["responses"] += 1
+        if bad_request:
+            return JSONResponse({"error": {"message": bad_request}}, status_code=400)
+        if not supports_responses:
+            return JSONResponse({"error": {"message": "not found"}}, status_code=404)
+        await asyncio.sleep(UPSTREAM_LATENCY)
+        return {
+            "id": "resp-stub", "object": "response", "created_at": 0, "model": payload["model"],
+            "status": "completed", "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+            "output": [{
+                "type": "message", "id": "msg-stub", "role": "assistant", "status": "completed",
+                "content": [{"type": "output_text", "text": "你好", "annotations": []}],
+            }],
+            "usage": {"input_tokens": 10, "output_tokens": 2, "total_tokens": 12,
+                      "input_tokens_details": {"cached_tokens": 0},
+                      "output_tokens_details": {"reasoning_tokens": 0}},
+        }
+
+    @stub.post("/v1/chat/completions")
+    async def chat(payload: dict):
+        hits["chat"] += 1
+        if bad_request:
+            return JSONResponse({"error": {"message": bad_request}}, status_code=400)
+        await asyncio.sleep(UPSTREAM_LATENCY)
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": payload["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "你好"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+        }
+
+    return stub
+
+
+@pytest.fixture
+async def upstream(monkeypatch):
+    """upstream(supports_responses) -> 呼叫次數 Counter；app 的 client 改指向本機 stub"""
+    servers = []
+
+    def start(supports_responses: bool, bad_request: str = "") -> Counter:
+        hits = Counter()
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(_stub(supports_responses, hits, bad_request), host="127.0.0.1",
+                                               port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+        servers.append(server)
+        monkeypatch.setattr(main, "OPENAI_BASE_URL", f"http://127.0.0.1:{port}/v1")
+        return hits
+
+    yield start
+    await main.close_client()
+    main._api_mode.clear()
+    main._api_probe_locks.clear()  # asyncio.Lock 綁定建立時的 event loop，每個測試的 loop 不同
+    for server in servers:
+        server.should_exit = True
+
+
+async def _ask_concurrently(n: int, model: str = "gpt-4o-mini"):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=30) as client:
+        body = {"model": model, "messages": [{"role": "user", "content": "打個招呼"}]}
+        t0 = time.perf_counter()
+        resps = await asyncio.gather(*[client.post("/ask", json=body) for _ in range(n)])
+        return resps, time.perf_counter() - t0
+
+
+@pytest.mark.parametrize("supports_responses", [True, False])
+async def test_parallel_requests_finish_in_about_one_upstream_latency(upstream, supports_responses):
+    upstream(supports_responses)
+    await _ask_concurrently(1)  # 暖機：建 client、決定 Responses / Chat（openai 的 resource 第一次用到才 import）
+    n = 20
+    resps, elapsed = await _ask_concurrently(n)
+
+    assert all(r.status_code == 200 and r.json()["answer"] == "你好" for r in resps)
+    print(f"{n} parallel /ask in {elapsed:.2f}s (upstream latency {UPSTREAM_LATENCY}s)")
+    # 同步 client 會一個接一個：n * 0.3s = 6s；async 應該接近一次上游延遲
+    assert elapsed < UPSTREAM_LATENCY * 2
+
+
+async def test_api_choice_is_probed_once_per_model(upstream):
+    hits = upstream(supports_responses=False)
+    for _ in range(3):
+        await _ask_concurrently(5)
+
+    # Responses 只試了一次（404），之後全部直接走 Chat
+    assert hits["responses"] == 1
+    assert hits["chat"] == 15
+    assert main._api_mode == {"gpt-4o-mini": "chat"}
+
+
+async def test_bad_request_does_not_switch_model_to_chat(upstream):
+    hits = upstream(supports_responses=True, bad_request="This model's maximum context length is 128000 tokens.")
+    messages = [{"role": "user", "content": "很長的問題"}]
+    with pytest.raises(main.APIStatusError):
+        await main.complete("gpt-4o-mini", messages, 0.2)
+
+    # 一般的 400 是請求本身的問題：不改試 Chat，也不記住
+    assert hits == Counter(responses=1)
+    assert main._api_mode == {}
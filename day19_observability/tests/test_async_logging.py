@@ -0,0 +1,107 @@
+# tests/test_async_logging.py
+"""
+非阻塞日誌：高水位抽樣、滿了丟棄並補記丟棄數、stop() 寫完 buffer、批次寫入時 RotatingFileHandler 照常輪替
+"""
+import json
+import logging
+import uuid
+from logging.handlers import RotatingFileHandler
+
+from app.async_logging import AsyncLogHandler, JsonFormatter, setup_async_logging
+
+
+def _logger() -> logging.Logger:
+    logger = logging.getLogger(f"test-async-{uuid.uuid4().hex[:8]}")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def _file_handler(path) -> logging.Handler:
+    h = logging.FileHandler(path, encoding="utf-8", delay=True)
+    h.setFormatter(JsonFormatter())
+    return h
+
+
+def _lines(*paths):
+    out = []
+    for p in paths:
+        out += [json.loads(line) for line in p.read_text(encoding="utf-8").splitlines()]
+    return out
+
+
+def test_samples_below_warning_above_high_water(tmp_path):
+    logger = _logger()
+    # writer 還沒啟動：buffer 只進不出
+    handler = AsyncLogHandler([_file_handler(tmp_path / "a.log")], maxsize=10, sample_rate=0.0)
+    logger.addHandler(handler)
+    for i in range(8):  # 高水位 = 8
+        logger.info("fill %d", i)
+    logger.info("sampled out")
+    logger.debug("sampled out too")
+    logger.warning("kept")
+    assert len(handler.queue) == 9
+    assert handler.dropped == 2
+    assert handler.queue[-1].getMessage() == "kept"
+
+    keep_all = AsyncLogHandler([], maxsize=10, sample_rate=1.0)
+    logger.addHandler(keep_all)
+    for i in range(10):
+        logger.info("fill %d", i)
+    assert len(keep_all.queue) == 10 and keep_all.dropped == 0
+
+
+def test_drops_when_full_and_logs_drop_count(tmp_path):
+    logger = _logger()
+    path = tmp_path / "full.log"
+    handler = AsyncLogHandler([_file_handler(path)], maxsize=5, flush_interval=60)
+    logger.addHandler(handler)
+    for i in range(8):
+        logger.error("boom %d", i)  # WARNING 以上不抽樣，但 buffer 滿了照樣丟
+    assert handler.dropped == 3
+
+    handler.start()
+    handler.stop()
+    records = _lines(path)
+    assert [r["msg"] for r in records[:5]] == [f"boom {i}" for i in range(5)]
+    assert records[-1]["level"] == "WARNING" and records[-1]["dropped"] == 3
+
+
+def test_stop_flushes_every_buffered_record(tmp_path):
+    logger = _logger()
+    path = tmp_path / "flush.log"
+    handler = setup_async_logging(logger, [logging.FileHandler(path, encoding="utf-8", delay=True)],
+                                  level=logging.DEBUG, batch_size=64, flush_interval=60)
+    for i in range(1000):
+        logger.info("line %d", i, extra={"i": i})
+    handler.stop()  # flush_interval 還沒到：stop() 要叫醒 writer 把 buffer 寫完
+    assert [r["i"] for r in _lines(path)] == list(range(1000))
+    assert not handler._writer.is_alive()
+
+
+def test_rotating_file_handler_rolls_over_inside_batch_writer(tmp_path):
+    logger = _logger()
+    path = tmp_path / "rot.log"
+    rot = RotatingFileHandler(path, maxBytes=4096, backupCount=50, encoding="utf-8", delay=True)
+    handler = setup_async_logging(logger, [rot], batch_size=16, flush_interval=60)
+    for i in range(500):
+        logger.info("rotate me", extra={"i": i})
+    handler.stop()
+    rot.close()
+
+    backups = sorted(tmp_path.glob("rot.log.*"), key=lambda p: -int(p.suffix[1:]))
+    assert backups  # 有輪替
+    assert all(p.stat().st_size <= 4096 for p in [*backups, path])
+    assert [r["i"] for r in _lines(*backups, path)] == list(range(500))  # 一筆不漏、順序不亂
+
+
+def test_args_are_rendered_at_log_time(tmp_path):
+    logger = _logger()
+    path = tmp_path / "args.log"
+    handler = setup_async_logging(logger, [logging.FileHandler(path, encoding="utf-8", delay=True)],
+                                  flush_interval=60)
+    state = {"step": 1}
+    logger.info("state=%s", state)
+    state["step"] = 2  # 呼叫端之後改了 args：日誌要記當下的值
+    handler.stop()
+    assert _lines(path)[0]["msg"] == "state={'step': 1}"
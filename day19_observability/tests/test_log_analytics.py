@@ -0,0 +1,106 @@
+# tests/test_log_analytics.py
+"""
+scripts/log_analytics.py：兩種 log 格式的解析、輪替 + gzip 的增量匯入（不重複、不漏）、分位數彙總
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+pytest.importorskip("pyarrow")
+import pyarrow.dataset as ds  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import log_analytics as la  # noqa: E402
+
+T0 = 1_750_000_000.0  # 固定時間，整點對齊方便算桶
+
+
+def _req(i: int, model: str = "gpt-4o-mini", latency: float = 0.5) -> bytes:
+    return json.dumps({"ts": T0 + i, "level": "INFO", "logger": "llm", "msg": "LLM Request", "model": model,
+                       "tenant": "default", "latency_s": latency, "prompt_tokens": 10, "completion_tokens": 5,
+                       "cost_usd": 0.0001}, separators=(",", ":")).encode() + b"\n"
+
+
+def _rows(out_dir):
+    return ds.dataset(out_dir, format="parquet").to_table().sort_by("ts").to_pylist()
+
+
+def test_parser_handles_json_legacy_errors_and_noise():
+    p = la.Parser()
+    fast = p.parse(_req(0))
+    assert fast[2:] == ("ok", "gpt-4o-mini", "default", 0.5, 10, 5, 0.0001)
+
+    # 欄位順序不同 / 多了欄位 → 走 json.loads 的慢路徑，結果一樣
+    slow = json.dumps({"msg": "LLM Request", "ts": T0, "level": "INFO", "model": "gpt-4o-mini", "x": 1,
+                       "latency_s": 0.5, "prompt_tokens": 10, "completion_tokens": 5, "cost_usd": 0.0001,
+                       "tenant": "default"}).encode()
+    assert p.parse(slow) == fast
+
+    legacy = p.parse(b"2025-06-15 23:06:40,250 [INFO] LLM Request | model=gpt-4o latency=1.23s "
+                     b"prompt_tokens=12 completion_tokens=34 cost=0.000370\n")
+    assert legacy[1:] == ("INFO", "ok", "gpt-4o", None, 1.23, 12, 34, 0.00037)
+    assert legacy[0] % 1000 == 250
+
+    assert p.parse(b"2025-06-15 23:06:40,250 [ERROR] Timeout | model=gpt-4o detail=timed out\n")[2] == "timeout"
+    assert p.parse(json.dumps({"ts": T0, "level": "ERROR", "msg": "RuntimeError", "model": "m"}).encode())[2] == "runtime"
+    assert p.parse(b'{"ts":1,"level":"INFO","logger":"llm","msg":"[HEALTH] ok"}\n') is None
+    assert p.parse(b"{not json LLM Request\n") is None and p.unparsed == 1
+
+
+def test_incremental_ingest_follows_rotation_and_gzip_without_duplicates(tmp_path):
+    logs, out = tmp_path / "logs", str(tmp_path / "out")
+    logs.mkdir()
+    log = logs / "llm_requests.log"
+
+    # 第一輪：3 行完整 + 半行（還沒寫完）
+    log.write_bytes(_req(0) + _req(1) + _req(2) + _req(3)[:20])
+    assert la.ingest([str(logs)], out)["rows"] == 3
+
+    # 半行寫完、再多 1 行；接著輪替：.log → .log.1 並壓縮成 .gz，新的 .log 開始寫
+    with open(log, "ab") as f:
+        f.write(_req(3)[20:] + _req(4))
+    with open(log, "rb") as src, gzip.open(logs / "llm_requests.log.1.gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    log.unlink()
+    log.write_bytes(_req(5) + b'{"ts":1,"level":"INFO","logger":"llm","msg":"[HEALTH] ok"}\n' + _req(6))
+
+    stats = la.ingest([str(logs)], out)
+    assert stats["rows"] == 4 and stats["unparsed"] == 0
+    assert la.ingest([str(logs)], out)["rows"] == 0  # 沒有新資料：不重讀、不產生新檔
+
+    rows = _rows(out)
+    assert [int(r["ts"].timestamp()) for r in rows] == [int(T0) + i for i in range(7)]
+    assert len([f for f in os.listdir(out) if f.endswith(".parquet")]) == 2
+
+
+def test_report_rolls_up_per_model_and_bucket_with_quantiles(tmp_path, capsys):
+    logs, out = tmp_path / "logs", str(tmp_path / "out")
+    logs.mkdir()
+    lines = [_req(i, "gpt-4o-mini", latency=(i + 1) / 1000) for i in range(1000)]      # 1~1000 ms
+    lines += [_req(3600 + i, "gpt-4o", latency=0.2) for i in range(10)]                 # 下一個小時
+    lines.append(json.dumps({"ts": T0 + 5, "level": "ERROR", "logger": "llm", "msg": "Timeout",
+                             "model": "gpt-4o-mini"}).encode() + b"\n")
+    (logs / "llm_requests.log").write_bytes(b"".join(lines))
+    la.ingest([str(logs)], out, batch_rows=128)  # 多個 row group
+
+    groups = la.rollup(out, bucket_s=3600, batch_size=100)
+    assert len(groups) == 2
+    (b0, _), (b1, _) = sorted(groups)
+    mini, big = groups[(b0, "gpt-4o-mini")], groups[(b1, "gpt-4o")]
+    assert (mini.requests, mini.errors, mini.prompt_tokens) == (1001, 1, 10000)
+    assert mini.cost_usd == pytest.approx(0.1)
+    for q, exact in [(0.50, 0.5005), (0.95, 0.95005), (0.99, 0.99001)]:
+        assert mini.quantile(q) == pytest.approx(exact, rel=0.02)
+    assert big.quantile(0.99) == pytest.approx(0.2, rel=0.02)
+
+    la.main(["report", out, "--bucket", "1h", "--format", "csv"])
+    rows = list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+    assert [(r["model"], r["requests"], r["errors"]) for r in rows] == [("gpt-4o-mini", "1001", "1"),
+                                                                         ("gpt-4o", "10", "0")]
+    assert float(rows[0]["p95_ms"]) == pytest.approx(950, rel=0.02)
@@ -1,10 +1,14 @@
 # api/main.py
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
 from api.routers import ask, health
+from api.routers.ask import embed_cache, prompt_cache
 from core.config import settings
-from services.redis_client import get_redis
+from core import tracing
+from core.prom_multiprocess import mark_worker_exit
+from services.redis_client import get_redis, get_redis_bytes
 
 # 用 lifespan 取代 on_event
 @asynccontextmanager
@@ -20,17 +24,39 @@ async def lifespan(app: FastAPI):
         # 視情況要不要 raise；如果要服務必須有 Redis 再啟，就 raise
         # raise
 
+    # 語意快取的 ANN 鏡像：啟動時先從 Redis 整包載入，之後靠 events stream 增量同步
+    if settings.ENABLE_EMBED_CACHE and embed_cache.ann is not None:
+        try:
+            n = await embed_cache.load_index()
+            print(f"[startup] ANN index loaded: {n} items ({embed_cache.ann.kind})")
+        except Exception as e:
+            print(f"[startup] ANN index load failed (will retry lazily): {e}")
+
+    # Prompt Cache L1 失效訊息訂閱（其他 worker 寫入/失效時丟掉本機 L1）
+    invalidation_task = asyncio.create_task(prompt_cache.listen_invalidations())
+    # 語意快取背景淘汰（沒設容量也沒設 TTL 時會直接結束）
+    evictor_task = asyncio.create_task(embed_cache.run_evictor(settings.EMBED_CACHE_EVICT_INTERVAL_SECONDS))
+
     # 也可以在這裡讀設定、建 metrics 等
     print(f"[startup] METRICS_NAMESPACE = {settings.METRICS_NAMESPACE}")
 
     yield
 
     # ---- shutdown ----
+    tracing.shutdown()  # 把還沒匯出的 OpenTelemetry span 送完（有設 TRACING_EXPORTER 時）
+    mark_worker_exit()  # 多 worker metrics：清掉本 worker 的 live gauge 檔（見 core/prom_multiprocess.py）
+    for task in (invalidation_task, evictor_task):
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
     try:
         # 如果你的 redis_client 有單例，通常不強制關閉也可
         # 若一定要關閉，請確保 get_redis() 回傳的是同一個 async 連線物件
         r = get_redis()
         await r.aclose()
+        await get_redis_bytes().aclose()
     except Exception as e:
         print(f"[shutdown] Redis close ignored: {e}")
 
@@ -1,40 +1,58 @@
+import json
 import time
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Optional
 from prometheus_client.samples import Sample
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
+from core import accounting
 from core.config import settings
 from core.metrics import (
     REQUEST_COUNTER,
     LATENCY_HISTOGRAM,
+    TTFT_HISTOGRAM,
     CACHE_HIT_COUNTER,
     CACHE_MISS_COUNTER,
     TOKENS_PROMPT_COUNTER,
     TOKENS_COMPLETION_COUNTER,
     COST_USD_COUNTER,
+    COALESCED_COUNTER,
     registry,
 )
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-from fastapi.responses import PlainTextResponse
+from core.prom_multiprocess import render_latest, scrape_registry
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from models.schemas import AskRequest, AskResponse, MetricsJSON
 from services.cache import PromptCache
 from services.embed_cache_redis import EmbeddingCacheRedis
-from services.llm import LLMService
+from services.llm import LLMResult, LLMService
+from services.singleflight import RedisSingleFlight, SingleFlight
 
 router = APIRouter(tags=["ask"])
 
 prompt_cache = PromptCache()
 llm = LLMService()
-embed_cache = EmbeddingCacheRedis(dim=settings.EMBED_CACHE_DIM, embed_fn=llm.embed)
+embed_cache = EmbeddingCacheRedis(
+    dim=settings.EMBED_CACHE_DIM,
+    embed_fn=llm.embed,
+    vector_format=settings.EMBED_VECTOR_FORMAT,
+    ann_kind=settings.EMBED_ANN_KIND,
+    capacity=settings.EMBED_CACHE_CAPACITY,
+    eviction_policy=settings.EMBED_CACHE_EVICTION_POLICY,
+    ttl_seconds=settings.EMBED_CACHE_TTL_SECONDS,
+)
+# 同一問題同時 miss 時只打一次 LLM：local = 行程內合併；redis = 再加一層跨 worker 鎖
+singleflight = (
+    RedisSingleFlight(lock_ttl=settings.SINGLEFLIGHT_LOCK_TTL_SECONDS)
+    if settings.SINGLEFLIGHT_MODE == "redis"
+    else SingleFlight()
+)
 
 @router.post("/ask", response_model=AskResponse)
-async def ask(payload: AskRequest):
+async def ask(payload: AskRequest, x_tenant_id: Optional[str] = Header(None)):
     start = time.perf_counter()
     REQUEST_COUNTER.labels(route="/ask").inc()
 
-    # 1) Prompt Cache（精確字串）
-    cached = await prompt_cache.get(payload.question)
+    # 1) + 2) Prompt Cache → Embedding Cache
+    cached = await _lookup_caches(payload.question)
     if cached is not None:
-        CACHE_HIT_COUNTER.labels(kind="prompt").inc()
         LATENCY_HISTOGRAM.labels(route="/ask").observe(time.perf_counter() - start)
         return AskResponse(
             question=payload.question,
@@ -46,78 +64,159 @@ async def ask(payload: AskRequest):
             cache_hit=True
         )
 
+    # 3) 真正呼叫 LLM（同 key 的並發請求合併成一次上游呼叫）
+    if settings.SINGLEFLIGHT_MODE == "off":
+        value, coalesced = await _call_llm_and_fill_cache(payload.question, x_tenant_id), None
+    else:
+        value, coalesced = await singleflight.do(
+            prompt_cache._key(payload.question),
+            lambda: _call_llm_and_fill_cache(payload.question, x_tenant_id),
+            lookup=lambda: prompt_cache.get(payload.question),
+        )
+    if coalesced:
+        COALESCED_COUNTER.labels(scope=coalesced).inc()
+
+    LATENCY_HISTOGRAM.labels(route="/ask").observe(time.perf_counter() - start)
+
+    return AskResponse(
+        question=payload.question,
+        answer=value["answer"],
+        source=value["source"],
+        prompt_tokens=value.get("prompt_tokens", 0),
+        completion_tokens=value.get("completion_tokens", 0),
+        cost_usd=value.get("cost_usd", 0.0),
+        cache_hit=False
+    )
+
+@router.post("/ask/stream")
+async def ask_stream(payload: AskRequest, x_tenant_id: Optional[str] = Header(None)):
+    """
+    SSE 版本的 /ask：每個事件是一行 `data: {json}`
+    - {"type": "token", "text": ...}：LLM 邊產生邊送
+    - {"type": "done", "answer": 完整答案, "source", "cache_hit", tokens, cost_usd}：結束
+    - {"type": "error", "detail": ...}：上游失敗（不寫快取）
+    快取命中時只會有一個 done 事件。
+    """
+    start = time.perf_counter()
+    REQUEST_COUNTER.labels(route="/ask/stream").inc()
+    cached = await _lookup_caches(payload.question)
+    return StreamingResponse(
+        _stream_answer(payload.question, cached, start, x_tenant_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _stream_answer(question: str, cached: Optional[Dict], start: float,
+                         tenant: Optional[str] = None) -> AsyncIterator[str]:
+    route = "/ask/stream"
+    if cached is not None:
+        TTFT_HISTOGRAM.labels(route=route).observe(time.perf_counter() - start)
+        yield _sse({"type": "done", "cache_hit": True, **cached})
+        LATENCY_HISTOGRAM.labels(route=route).observe(time.perf_counter() - start)
+        return
+
+    result: Optional[LLMResult] = None
+    first = True
+    try:
+        async for item in llm.chat_stream(question):
+            if isinstance(item, LLMResult):
+                result = item
+                continue
+            if first:
+                TTFT_HISTOGRAM.labels(route=route).observe(time.perf_counter() - start)
+                first = False
+            yield _sse({"type": "token", "text": item})
+    except Exception as e:
+        yield _sse({"type": "error", "detail": f"LLM error: {e}"})
+        return
+    if result is None:
+        yield _sse({"type": "error", "detail": "LLM error: stream ended without result"})
+        return
+
+    # 串流完整結束才回寫快取（client 中途斷線時 generator 會被關閉，不會寫入半截答案）
+    value = await _fill_cache(question, result, route, tenant)
+    yield _sse({"type": "done", "cache_hit": False, **value})
+    LATENCY_HISTOGRAM.labels(route=route).observe(time.perf_counter() - start)
+
+def _sse(event: Dict) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+async def _lookup_caches(question: str) -> Optional[Dict]:
+    # 1) Prompt Cache（精確字串）
+    cached = await prompt_cache.get(question)
+    if cached is not None:
+        CACHE_HIT_COUNTER.labels(kind="prompt").inc()
+        return cached
+
     CACHE_MISS_COUNTER.labels(kind="prompt").inc()
 
     # 2) Embedding Cache（語意近似）
     if settings.ENABLE_EMBED_CACHE:
-        near = await embed_cache.search_similar(payload.question, threshold=settings.EMBED_SIM_THRESHOLD)
+        near = await embed_cache.search_similar(question, threshold=settings.EMBED_SIM_THRESHOLD)
         if near is not None:
             CACHE_HIT_COUNTER.labels(kind="embed").inc()
-            LATENCY_HISTOGRAM.labels(route="/ask").observe(time.perf_counter() - start)
-            return AskResponse(
-                question=payload.question,
-                answer=near["answer"],
-                source="embed_cache",
-                prompt_tokens=near.get("prompt_tokens", 0),
-                completion_tokens=near.get("completion_tokens", 0),
-                cost_usd=near.get("cost_usd", 0.0),
-                cache_hit=True
-            )
+            return {
+                "answer": near["answer"],
+                "source": "embed_cache",
+                "prompt_tokens": near.get("prompt_tokens", 0),
+                "completion_tokens": near.get("completion_tokens", 0),
+                "cost_usd": near.get("cost_usd", 0.0),
+            }
     else:
         CACHE_MISS_COUNTER.labels(kind="embed").inc()
+    return None
 
-    # 3) 真正呼叫 LLM
+async def _call_llm_and_fill_cache(question: str, tenant: Optional[str] = None) -> Dict:
     try:
-        result = await llm.chat(payload.question)
+        result = await llm.chat(question)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM error: {e}")
+    return await _fill_cache(question, result, "/ask", tenant)
 
-    # 更新 metrics
+async def _fill_cache(question: str, result: LLMResult, route: str = "/ask", tenant: Optional[str] = None) -> Dict:
+    # 更新 metrics（single-flight 合併的請求只有真的打上游的那一個會算成本）
     TOKENS_PROMPT_COUNTER.inc(result.prompt_tokens)
     TOKENS_COMPLETION_COUNTER.inc(result.completion_tokens)
     COST_USD_COUNTER.inc(result.cost_usd or 0.0)
-
-    # 4) 回寫快取
-    await prompt_cache.set(
-        payload.question,
-        {
-            "answer": result.answer,
-            "source": "llm",
-            "prompt_tokens": result.prompt_tokens,
-            "completion_tokens": result.completion_tokens,
-            "cost_usd": result.cost_usd or 0.0
-        },
-        ttl=settings.CACHE_TTL,
-    )
+    accounting.record(settings.OPENAI_MODEL, result.prompt_tokens, result.completion_tokens,
+                      route=route, tenant=tenant, cost=result.cost_usd or 0.0)
+
+    # 4) 回寫快取（要在 single-flight 結束前寫入，其他 worker 才讀得到）
+    value = {
+        "answer": result.answer,
+        "source": "llm",
+        "prompt_tokens": result.prompt_tokens,
+        "completion_tokens": result.completion_tokens,
+        "cost_usd": result.cost_usd or 0.0
+    }
+    await prompt_cache.set(question, value, ttl=settings.CACHE_TTL)
     if settings.ENABLE_EMBED_CACHE:
-        await embed_cache.upsert(payload.question, result.answer, {
+        await embed_cache.upsert(question, result.answer, {
             "prompt_tokens": result.prompt_tokens,
             "completion_tokens": result.completion_tokens,
             "cost_usd": result.cost_usd or 0.0
         })
-
-    LATENCY_HISTOGRAM.labels(route="/ask").observe(time.perf_counter() - start)
-
-    return AskResponse(
-        question=payload.question,
-        answer=result.answer,
-        source="llm",
-        prompt_tokens=result.prompt_tokens,
-        completion_tokens=result.completion_tokens,
-        cost_usd=result.cost_usd or 0.0,
-        cache_hit=False
-    )
+    return value
 
 @router.get("/metrics", response_class=PlainTextResponse)
 def metrics():
-    data = generate_latest(registry)
-    return PlainTextResponse(content=data, media_type=CONTENT_TYPE_LATEST)
+    # 有設 PROMETHEUS_MULTIPROC_DIR 時是所有 worker 的加總
+    data, content_type = render_latest(registry)
+    return PlainTextResponse(content=data, media_type=content_type)
 
 # JSON metrics（方便人類看）
+def _collect(counter):
+    """counter 的樣本；多 worker 時從加總後的 registry 取，不是只有本行程的值"""
+    agg = scrape_registry(registry)
+    if agg is registry:
+        return counter.collect()
+    name = counter.describe()[0].name
+    return [m for m in agg.collect() if m.name == name]
+
 def _sum_counter_total(counter) -> float:
     """合計一個 Counter 的所有 *_total 樣本值（忽略 labels）。"""
     total = 0.0
-    for metric in counter.collect():
+    for metric in _collect(counter):
         for s in metric.samples:
             if s.name.endswith("_total"):
                 total += float(s.value or 0)
@@ -126,7 +225,7 @@ def _sum_counter_total(counter) -> float:
 def _sum_counter_total_with_labels(counter, match_labels: Dict[str, str]) -> float:
     """合計一個帶 labels 的 Counter 在特定 labels 下的 *_total 值。"""
     total = 0.0
-    for metric in counter.collect():
+    for metric in _collect(counter):
         for s in metric.samples:
             if not s.name.endswith("_total"):
                 continue
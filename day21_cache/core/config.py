@@ -7,10 +7,33 @@ class Settings(BaseSettings):
     # Cache
     CACHE_TTL: int = 3600
 
+    # L1：行程內 LRU（在 Redis 之前），失效訊息走 Redis pub/sub
+    L1_CACHE_ENABLED: bool = True
+    L1_PROMPT_MAXSIZE: int = 1024
+    L1_PROMPT_TTL_SECONDS: float = 60.0
+    L1_EMBED_MAXSIZE: int = 4096
+    L1_EMBED_TTL_SECONDS: float = 3600.0
+    CACHE_INVALIDATION_CHANNEL: str = "prompt_cache:invalidate"
+
     # Embedding Cache
     ENABLE_EMBED_CACHE: bool = True
     EMBED_CACHE_DIM: int = 1536  # 對應 text-embedding-3-small 維度
     EMBED_SIM_THRESHOLD: float = 0.92
+    EMBED_VECTOR_FORMAT: str = "f32"  # f32 | f16 | i8（Redis 內向量的二進位編碼）
+    EMBED_CACHE_CAPACITY: int = 0  # 最多幾筆；0 = 不限
+    EMBED_CACHE_EVICTION_POLICY: str = "lru"  # lru | lfu | ttl（超過容量時怎麼挑 victim）
+    EMBED_CACHE_TTL_SECONDS: float = 0  # 建立後多久過期；0 = 不過期
+    EMBED_CACHE_EVICT_INTERVAL_SECONDS: float = 5.0  # 背景淘汰週期
+    EMBED_ANN_KIND: str | None = None  # hnsw | flat；設定後啟用行程內 FAISS 鏡像（需安裝 faiss-cpu）
+
+    # Single-flight（相同問題並發 miss 時合併成一次 LLM 呼叫）
+    SINGLEFLIGHT_MODE: str = "local"  # off | local | redis（跨 worker）
+    SINGLEFLIGHT_LOCK_TTL_SECONDS: float = 30.0  # redis 模式鎖的存活時間，應大於一次 LLM 呼叫
+
+    # Embedding 微批次：並發請求湊滿 MAX_SIZE 筆或等滿 MAX_WAIT_MS 就送一次
+    EMBED_BATCH_ENABLED: bool = True
+    EMBED_BATCH_MAX_SIZE: int = 64
+    EMBED_BATCH_MAX_WAIT_MS: float = 5.0
 
     # LLM (OpenAI)
     OPENAI_API_KEY: str | None = None
@@ -19,8 +42,9 @@ class Settings(BaseSettings):
     OPENAI_EMBED_MODEL: str = "text-embedding-3-small"
     OPENAI_TIMEOUT_SECONDS: int = 60
 
-    # Cost (per 1K tokens / vectors) — 預設值僅供 Demo，請依實際價格調整
-    # 你也可設定到 .env 以便不同模型切換
+    # Cost — 價格表見 core/accounting.py（內建常見 OpenAI 模型，或用 PRICING_FILE 指定 JSON 檔，改檔會熱載入）
+    # 下面兩個（per 1K tokens）：有明確設定時所有 chat 成本都用它們，沒設定時只給「價格表裡沒有的模型」用
+    PRICING_FILE: str | None = None
     PROMPT_COST_PER_1K: float = 0.003  # USD / 1K prompt tokens
     COMPLETION_COST_PER_1K: float = 0.006  # USD / 1K completion tokens
     EMBED_COST_PER_1K_TOKENS: float = 0.00002  # USD / 1K tokens for embeddings (估算)
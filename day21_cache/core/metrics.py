@@ -1,5 +1,6 @@
 from prometheus_client import Counter, Histogram, CollectorRegistry
 
+from core import accounting, tracing
 from core.config import settings
 
 registry = CollectorRegistry()
@@ -19,6 +20,14 @@ LATENCY_HISTOGRAM = Histogram(
     registry=registry,
 )
 
+TTFT_HISTOGRAM = Histogram(
+    f"{settings.METRICS_NAMESPACE}_time_to_first_token_seconds",
+    "Time from request start to first streamed chunk",
+    ["route"],
+    buckets=(0.01, 0.03, 0.1, 0.3, 0.5, 1, 2, 5, 10),
+    registry=registry,
+)
+
 CACHE_HIT_COUNTER = Counter(
     f"{settings.METRICS_NAMESPACE}_cache_hits_total",
     "Cache hits by kind",
@@ -33,6 +42,13 @@ CACHE_MISS_COUNTER = Counter(
     registry=registry,
 )
 
+TIER_CACHE_COUNTER = Counter(
+    f"{settings.METRICS_NAMESPACE}_tier_cache_lookups_total",
+    "Cache lookups by cache, tier and result",
+    ["cache", "tier", "result"],  # cache: prompt | embedding；tier: l1 | l2；result: hit | miss
+    registry=registry,
+)
+
 TOKENS_PROMPT_COUNTER = Counter(
     f"{settings.METRICS_NAMESPACE}_tokens_prompt_total",
     "Prompt tokens total",
@@ -45,8 +61,60 @@ TOKENS_COMPLETION_COUNTER = Counter(
     registry=registry,
 )
 
+COALESCED_COUNTER = Counter(
+    f"{settings.METRICS_NAMESPACE}_coalesced_requests_total",
+    "Requests that reused an in-flight identical LLM call",
+    ["scope"],  # local | redis
+    registry=registry,
+)
+
+EMBED_BATCH_SIZE_HISTOGRAM = Histogram(
+    f"{settings.METRICS_NAMESPACE}_embed_batch_size",
+    "Number of embed requests sent per embeddings.create call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+    registry=registry,
+)
+
+EMBED_EVICTED_COUNTER = Counter(
+    f"{settings.METRICS_NAMESPACE}_embed_cache_evicted_total",
+    "Semantic cache entries evicted by reason",
+    ["reason"],  # ttl | lru | lfu
+    registry=registry,
+)
+
 COST_USD_COUNTER = Counter(
     f"{settings.METRICS_NAMESPACE}_cost_usd_total",
     "Accumulative cost in USD",
     registry=registry,
 )
+
+# 依 model / route / tenant 拆開的 token 與成本（由 core/accounting.record() 累加）
+LLM_TOKENS_COUNTER = Counter(
+    f"{settings.METRICS_NAMESPACE}_llm_tokens_total",
+    "LLM tokens by model, route and tenant",
+    ["model", "route", "tenant", "type"],  # type: prompt | completion
+    registry=registry,
+)
+
+LLM_COST_COUNTER = Counter(
+    f"{settings.METRICS_NAMESPACE}_llm_cost_usd_total",
+    "LLM cost in USD by model, route and tenant",
+    ["model", "route", "tenant"],
+    registry=registry,
+)
+accounting.configure(
+    cost_counter=LLM_COST_COUNTER,
+    token_counter=LLM_TOKENS_COUNTER,
+    default_price=accounting.Price(settings.PROMPT_COST_PER_1K * 1000, settings.COMPLETION_COST_PER_1K * 1000),
+    pricing_file=settings.PRICING_FILE,
+)
+
+# 各階段（llm / embed）延遲；TRACING_EXPORTER 有設時另外匯出 OpenTelemetry span（見 core/tracing.py）
+STAGE_LATENCY_HISTOGRAM = Histogram(
+    f"{settings.METRICS_NAMESPACE}_stage_latency_seconds",
+    "Per-stage latency",
+    ["stage"],
+    buckets=(0.01, 0.03, 0.1, 0.3, 1, 3, 10),
+    registry=registry,
+)
+tracing.configure(histogram=STAGE_LATENCY_HISTOGRAM, service_name=settings.METRICS_NAMESPACE)
@@ -0,0 +1,61 @@
+# core/prom_multiprocess.py
+"""
+Prometheus 多行程支援（gunicorn -w N / uvicorn --workers N）
+
+prometheus_client 預設每個行程各一份 registry：多 worker 時 Prometheus 每次 scrape
+只會拿到「剛好接到這個請求的 worker」的數字，counter 還會看起來忽大忽小。
+
+設了 PROMETHEUS_MULTIPROC_DIR（必須在啟動 worker 之前就設好，prometheus_client 在 import 時決定要不要用）：
+- 每個 worker 的 Counter / Histogram / Gauge 值寫在該目錄下的 mmap 檔（{type}_{pid}.db）
+- /metrics 每次都用 MultiProcessCollector 重讀整個目錄，把所有 worker（含已結束的）加總
+- worker 結束時 mark_worker_exit(pid)：刪掉該 pid 的 live gauge 檔；counter / histogram 保留，總數才不會倒退
+- 部署啟動時（還沒有 worker 之前）要 wipe_multiprocess_dir()，不然上一輪留下的檔案會被一起加總
+
+沒設 PROMETHEUS_MULTIPROC_DIR 就是原本的單行程 registry。
+
+用法：
+    data, content_type = render_latest()            # /metrics
+    mark_worker_exit()                              # lifespan 關閉時（或 gunicorn child_exit hook）
+"""
+from __future__ import annotations
+
+import glob
+import os
+from typing import Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+
+ENV_VAR = "PROMETHEUS_MULTIPROC_DIR"
+
+
+def multiprocess_dir() -> Optional[str]:
+    return os.environ.get(ENV_VAR) or None
+
+
+def scrape_registry(registry: Optional[CollectorRegistry] = None) -> CollectorRegistry:
+    """給 /metrics 用的 registry：多行程模式每次新建一個只掛 MultiProcessCollector 的 registry"""
+    if multiprocess_dir() is None:
+        return registry if registry is not None else REGISTRY
+    agg = CollectorRegistry()
+    multiprocess.MultiProcessCollector(agg)
+    return agg
+
+
+def render_latest(registry: Optional[CollectorRegistry] = None) -> Tuple[bytes, str]:
+    return generate_latest(scrape_registry(registry)), CONTENT_TYPE_LATEST
+
+
+def mark_worker_exit(pid: Optional[int] = None) -> None:
+    """worker 結束：清掉它的 live gauge 檔（單行程模式什麼都不做）"""
+    if multiprocess_dir() is not None:
+        multiprocess.mark_process_dead(pid if pid is not None else os.getpid())
+
+
+def wipe_multiprocess_dir() -> None:
+    """部署啟動前清掉上一輪的 *.db（只刪 .db，避免目錄設錯時誤刪其他檔案）"""
+    path = multiprocess_dir()
+    if path is None:
+        return
+    os.makedirs(path, exist_ok=True)
+    for f in glob.glob(os.path.join(path, "*.db")):
+        os.remove(f)
@@ -0,0 +1,188 @@
+# core/tracing.py
+"""
+輕量 per-stage tracing：一個慢的 /ask 到底花在快取查詢、embedding 還是 LLM
+
+- with span("embed"): ...                 # context manager（async 函式裡也能用）
+- @traced("retrieve")                     # decorator，sync / async 函式都可以
+- 每個 span 結束寫進 stage histogram（label: stage），由 configure(histogram=...) 指定
+- with trace() as t: ... → t.ms()：這個請求裡各 stage 的累計耗時（ms），可以放進 debug 回傳
+  （contextvar：asyncio.gather / create_task 出去的子 task 也會算進同一個 trace）
+- 選用 OpenTelemetry 匯出（需安裝 opentelemetry-sdk）：
+    TRACING_EXPORTER=none（預設）| console | file | otlp
+    file：寫到 TRACING_FILE（一行一個 span 的 JSON，預設 traces.jsonl）
+    otlp：送到 OTEL_EXPORTER_OTLP_ENDPOINT（需再安裝 opentelemetry-exporter-otlp-proto-http）
+- TRACING_ENABLED=false：span() 回傳共用的 no-op 物件，decorator 直接呼叫原函式（每個 span < 1µs）
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+log = logging.getLogger(__name__)
+
+
+class _Config:
+    enabled: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    histogram: Any = None
+    children: Dict[str, Any] = {}  # stage -> histogram.labels(stage)，省掉每次 labels() 的查表 + lock
+    otel_provider: Any = None
+    otel_tracer: Any = None
+
+
+_cfg = _Config()
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """一個請求內各 stage 的累計秒數（同一個 stage 出現多次會加總）"""
+
+    __slots__ = ("stages",)
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def ms(self) -> Dict[str, float]:
+        return {k: round(v * 1000, 2) for k, v in self.stages.items()}
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("stage", "_t0", "_otel_cm", "_otel")
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+        self._otel_cm = None
+        self._otel = None
+
+    def __enter__(self) -> "Span":
+        tracer = _cfg.otel_tracer
+        if tracer is not None:
+            self._otel_cm = tracer.start_as_current_span(self.stage)
+            self._otel = self._otel_cm.__enter__()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        seconds = time.perf_counter() - self._t0
+        if _cfg.histogram is not None:
+            child = _cfg.children.get(self.stage)
+            if child is None:
+                child = _cfg.children[self.stage] = _cfg.histogram.labels(self.stage)
+            child.observe(seconds)
+        t = _current.get()
+        if t is not None:
+            t.add(self.stage, seconds)
+        if self._otel_cm is not None:
+            self._otel_cm.__exit__(exc_type, exc, tb)
+        return False
+
+    def set(self, key: str, value: Any) -> None:
+        """附加屬性（只有開 OpenTelemetry 匯出時才會記錄）"""
+        if self._otel is not None:
+            self._otel.set_attribute(key, value)
+
+
+def span(stage: str):
+    return Span(stage) if _cfg.enabled else _NOOP
+
+
+def traced(stage: str) -> Callable[[Callable], Callable]:
+    def deco(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not _cfg.enabled:
+                    return await fn(*args, **kwargs)
+                with Span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _cfg.enabled:
+                return fn(*args, **kwargs)
+            with Span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    t = Trace()
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+
+
+def _build_otel(exporter: str, service_name: str):
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        log.warning("TRACING_EXPORTER=%s 但未安裝 opentelemetry-sdk，只記錄 histogram", exporter)
+        return None, None
+
+    if exporter == "console":
+        span_exporter = ConsoleSpanExporter()
+    elif exporter == "file":
+        out = open(os.getenv("TRACING_FILE", "traces.jsonl"), "a", encoding="utf-8")
+        span_exporter = ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")
+    elif exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        span_exporter = OTLPSpanExporter()
+    else:
+        raise ValueError(f"unknown TRACING_EXPORTER: {exporter}")
+
+    # 不動全域 TracerProvider，避免和其他套件的 instrumentation 互相覆蓋
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}))
+    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    return provider, provider.get_tracer(__name__)
+
+
+def configure(histogram: Any = None, enabled: Optional[bool] = None, exporter: Optional[str] = None,
+              service_name: str = "day21-cache") -> None:
+    """histogram：Histogram(labelnames=["stage"])；exporter 沒給就讀 TRACING_EXPORTER"""
+    if histogram is not None:
+        _cfg.histogram = histogram
+        _cfg.children = {}
+    if enabled is not None:
+        _cfg.enabled = enabled
+    shutdown()
+    exporter = (exporter or os.getenv("TRACING_EXPORTER", "none")).lower()
+    if exporter != "none":
+        _cfg.otel_provider, _cfg.otel_tracer = _build_otel(exporter, service_name)
+
+
+def shutdown() -> None:
+    """把還在 buffer 裡的 span 匯出完（lifespan 關閉時呼叫）"""
+    if _cfg.otel_provider is not None:
+        _cfg.otel_provider.shutdown()
+    _cfg.otel_provider = _cfg.otel_tracer = None
@@ -0,0 +1,116 @@
+# scripts/bench_embed_batching.py
+"""
+Embedding 微批次吞吐量基準測試（本機 stub OpenAI server，不會對外呼叫）
+
+stub server 模擬 /v1/embeddings：每次呼叫固定延遲 + 每筆 input 少量額外成本。
+分別以 1 / 10 / 100 個並發 client 呼叫 LLMService.embed()，比較開/關微批次的
+吞吐量（embeds/sec）與實際打到上游的次數。
+
+用法：
+    python scripts/bench_embed_batching.py
+    python scripts/bench_embed_batching.py --clients 1 10 100 --requests 20 --latency-ms 30
+"""
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+
+STUB_STATS = {"calls": 0}
+
+
+def build_stub_app(latency_ms: float, per_item_ms: float, dim: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/embeddings")
+    async def embeddings(req: Request):
+        body = await req.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        STUB_STATS["calls"] += 1
+        await asyncio.sleep((latency_ms + per_item_ms * len(inputs)) / 1000.0)
+
+        data = []
+        for i, text in enumerate(inputs):
+            v = np.zeros(dim, dtype=np.float32)
+            v[hash(text) % dim] = 1.0
+            emb = base64.b64encode(v.tobytes()).decode() if body.get("encoding_format") == "base64" else v.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": emb})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        }
+
+    return app
+
+
+def start_stub(app: FastAPI) -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def run(clients: int, requests: int, batched: bool) -> None:
+    from core.config import settings
+    from services.llm import LLMService
+
+    settings.EMBED_BATCH_ENABLED = batched
+    llm = LLMService()
+
+    async def client(cid: int):
+        for i in range(requests):
+            await llm.embed(f"client {cid} question {i}")
+
+    STUB_STATS["calls"] = 0
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(c) for c in range(clients)])
+    elapsed = time.perf_counter() - t0
+    total = clients * requests
+    mode = "batched  " if batched else "unbatched"
+    print(
+        f"clients={clients:>4}  {mode}  {total / elapsed:9.1f} embeds/s  "
+        f"upstream_calls={STUB_STATS['calls']:>5}  avg_batch={total / max(STUB_STATS['calls'], 1):6.1f}"
+    )
+    await llm.client.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--requests", type=int, default=20, help="每個 client 連續送幾筆")
+    ap.add_argument("--latency-ms", type=float, default=30.0, help="stub 每次呼叫的固定延遲")
+    ap.add_argument("--per-item-ms", type=float, default=0.2, help="stub 每筆 input 的額外延遲")
+    ap.add_argument("--dim", type=int, default=1536)
+    args = ap.parse_args()
+
+    base_url = start_stub(build_stub_app(args.latency_ms, args.per_item_ms, args.dim))
+    # 在 import LLMService 之前設定，讓它指向 stub
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["EMBED_CACHE_DIM"] = str(args.dim)
+
+    for clients in args.clients:
+        for batched in (False, True):
+            asyncio.run(run(clients, args.requests, batched))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# scripts/bench_prompt_cache_tiers.py
+"""
+Prompt Cache L1（行程內 LRU）vs L2（Redis）讀取延遲基準測試
+
+對一組熱門問題重複 get()，比較：
+- L2 only：PromptCache(l1_maxsize=0)，每次都走 Redis
+- L1 + L2：PromptCache(l1_maxsize=...)，第一次之後都命中 L1
+
+用法：
+    python scripts/bench_prompt_cache_tiers.py                       # fakeredis（不含網路延遲）
+    python scripts/bench_prompt_cache_tiers.py --redis-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import services.redis_client as rc  # noqa: E402
+from services.cache import PromptCache  # noqa: E402
+
+
+async def bench(pc: PromptCache, questions, rounds: int) -> np.ndarray:
+    samples = []
+    for _ in range(rounds):
+        for q in questions:
+            t0 = time.perf_counter()
+            await pc.get(q)
+            samples.append((time.perf_counter() - t0) * 1e6)
+    return np.asarray(samples)
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--redis-url", default=None, help="不給就用 fakeredis")
+    ap.add_argument("--hot", type=int, default=20, help="熱門問題數")
+    ap.add_argument("--rounds", type=int, default=200)
+    args = ap.parse_args()
+
+    if args.redis_url:
+        import redis.asyncio as redis
+        rc._redis = redis.from_url(args.redis_url, encoding="utf-8", decode_responses=True)
+    else:
+        import fakeredis
+        rc._redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    questions = [f"常見問題 #{i}" for i in range(args.hot)]
+    writer = PromptCache(l1_maxsize=0)
+    for q in questions:
+        await writer.set(q, {"answer": f"answer for {q}", "source": "llm"}, ttl=600)
+
+    results = {
+        "L2 only": await bench(PromptCache(l1_maxsize=0), questions, args.rounds),
+        "L1 + L2": await bench(PromptCache(l1_maxsize=1024, l1_ttl=600), questions, args.rounds),
+    }
+    for name, us in results.items():
+        print(
+            f"{name:<8}  p50={np.percentile(us, 50):8.1f} µs  "
+            f"p99={np.percentile(us, 99):8.1f} µs  mean={us.mean():8.1f} µs"
+        )
+
+    for q in questions:
+        await rc._redis.delete(PromptCache._key(q))
+    await rc._redis.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# scripts/bench_search_similar.py
+"""
+EmbeddingCacheRedis.search_similar 延遲基準測試（本機 fakeredis，不需啟動 Redis）
+
+比較兩種查詢路徑：
+- legacy：逐筆 HGETALL + json.loads + Python 迴圈算 cosine（舊版做法，向量存 JSON）
+- vectorized：pipeline 一次取回所有向量（二進位，np.frombuffer）→ float32 矩陣 → 單次矩陣-向量乘積
+
+註：fakeredis 是純 Python 實作，每個指令本身就有可觀開銷；
+    數字適合拿來比較兩種路徑的相對差距，絕對值請以真實 Redis 為準。
+
+用法：
+    pip install fakeredis
+    python scripts/bench_search_similar.py
+    python scripts/bench_search_similar.py --sizes 1000 10000 --dim 1536 --queries 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import fakeredis  # noqa: E402
+
+import services.redis_client as rc  # noqa: E402
+from services.embed_cache_redis import EmbeddingCacheRedis, _encode_vec  # noqa: E402
+
+
+async def _populate(ec: EmbeddingCacheRedis, n: int, rng: np.random.Generator, legacy_json: bool = False) -> None:
+    """直接以 pipeline 批次寫入（跳過 embed），只為快速建出 N 筆資料。"""
+    r = rc.get_redis_bytes()
+    batch = 1000
+    for start in range(0, n, batch):
+        pipe = r.pipeline(transaction=False)
+        for item_id in range(start + 1, min(start + batch, n) + 1):
+            v = rng.standard_normal(ec.dim).astype(np.float32)
+            v /= np.linalg.norm(v) + 1e-8
+            pipe.hset(
+                ec._item_key(item_id),
+                mapping={
+                    "q": f"question {item_id}",
+                    "a": f"answer {item_id}",
+                    "v": json.dumps(v.tolist()) if legacy_json else _encode_vec(v, ec.vector_format),
+                    "m": json.dumps({"prompt_tokens": 1, "completion_tokens": 1, "cost_usd": 0.0}),
+                },
+            )
+            pipe.sadd(ec.key_ids, item_id)
+        await pipe.execute()
+    await r.set(ec.key_next, n)
+
+
+async def _legacy_search(ec: EmbeddingCacheRedis, q_vec: np.ndarray) -> float:
+    """舊版逐筆取值的查詢路徑，僅供對照。"""
+    r = rc.get_redis()
+    best = -1.0
+    for sid in await r.smembers(ec.key_ids):
+        data = await r.hgetall(ec._item_key(int(sid)))
+        v = np.array(json.loads(data.get("v", "[]")), dtype=np.float32)
+        sim = float(np.dot(q_vec, v) / (np.linalg.norm(q_vec) * np.linalg.norm(v) + 1e-8))
+        best = max(best, sim)
+    return best
+
+
+def _percentiles(samples_ms):
+    arr = np.asarray(samples_ms)
+    return float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+async def bench_size(n: int, dim: int, queries: int, legacy_max: int, fmt: str) -> None:
+    server = fakeredis.FakeServer()
+    rc._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    rc._redis_bytes = fakeredis.FakeAsyncRedis(server=server, decode_responses=False)
+    rng = np.random.default_rng(42)
+    query_vecs = [rng.standard_normal(dim).astype(np.float32).tolist() for _ in range(queries)]
+    it = iter(query_vecs * 2)
+
+    async def embed(_text: str):
+        return next(it)
+
+    ec = EmbeddingCacheRedis(dim=dim, embed_fn=embed, prefix="bench", vector_format=fmt)
+    await _populate(ec, n, rng)
+
+    vec_ms = []
+    for _ in range(queries):
+        t0 = time.perf_counter()
+        await ec.search_similar("q", threshold=2.0)  # 門檻設 >1，確保掃完全部
+        vec_ms.append((time.perf_counter() - t0) * 1000)
+    p50, p99 = _percentiles(vec_ms)
+    print(f"N={n:>7,}  vectorized  p50={p50:9.2f} ms  p99={p99:9.2f} ms  ({fmt})")
+
+    if n <= legacy_max:
+        legacy_ec = EmbeddingCacheRedis(dim=dim, embed_fn=embed, prefix="bench_legacy")
+        await _populate(legacy_ec, n, rng, legacy_json=True)
+        legacy_ms = []
+        for q in query_vecs:
+            t0 = time.perf_counter()
+            await _legacy_search(legacy_ec, np.asarray(q, dtype=np.float32))
+            legacy_ms.append((time.perf_counter() - t0) * 1000)
+        p50, p99 = _percentiles(legacy_ms)
+        print(f"N={n:>7,}  legacy      p50={p50:9.2f} ms  p99={p99:9.2f} ms  (json)")
+    else:
+        print(f"N={n:>7,}  legacy      (skipped; > --legacy-max)")
+
+    await rc._redis.aclose()
+    await rc._redis_bytes.aclose()
+    rc._redis = None
+    rc._redis_bytes = None
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    # 100k × 1536 維的 JSON 向量會吃掉數 GB 記憶體，預設用較小維度；要貼近正式環境可改 --dim 1536
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--queries", type=int, default=20)
+    ap.add_argument("--format", default="f32", choices=["f32", "f16", "i8"])
+    ap.add_argument("--legacy-max", type=int, default=10_000, help="超過此筆數就不跑舊版路徑（太慢）")
+    args = ap.parse_args()
+
+    print(f"dim={args.dim} queries={args.queries} format={args.format}")
+    for n in args.sizes:
+        await bench_size(n, args.dim, args.queries, args.legacy_max, args.format)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
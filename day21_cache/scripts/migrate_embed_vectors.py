@@ -0,0 +1,52 @@
+# scripts/migrate_embed_vectors.py
+"""
+一次性轉檔：把語意快取中舊版 JSON 文字向量（v 欄位）改寫成二進位格式。
+
+用法：
+    python scripts/migrate_embed_vectors.py                 # 依 .env 的 EMBED_VECTOR_FORMAT
+    python scripts/migrate_embed_vectors.py --format f16    # 指定格式
+    python scripts/migrate_embed_vectors.py --prefix embed_cache
+
+已是二進位格式的資料會被略過，可重複執行。
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from core.config import settings  # noqa: E402
+from services.embed_cache_redis import EmbeddingCacheRedis  # noqa: E402
+from services.redis_client import get_redis, get_redis_bytes  # noqa: E402
+
+
+async def _no_embed(_text: str):
+    raise RuntimeError("migration should not call the embedding API")
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description="Migrate JSON embedding vectors to binary encoding")
+    ap.add_argument("--prefix", default="embed_cache")
+    ap.add_argument("--format", default=settings.EMBED_VECTOR_FORMAT, choices=["f32", "f16", "i8"])
+    ap.add_argument("--batch-size", type=int, default=500)
+    args = ap.parse_args()
+
+    ec = EmbeddingCacheRedis(
+        dim=settings.EMBED_CACHE_DIM,
+        embed_fn=_no_embed,
+        prefix=args.prefix,
+        vector_format=args.format,
+    )
+    try:
+        migrated = await ec.migrate_vectors(batch_size=args.batch_size)
+        print(f"[migrate] prefix={args.prefix} format={args.format} migrated={migrated} total={await ec.size()}")
+    finally:
+        await get_redis().aclose()
+        await get_redis_bytes().aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# scripts/soak_embed_cache_eviction.py
+"""
+語意快取淘汰 soak test（本機 fakeredis）
+
+以 Zipf 分佈模擬真實 FAQ 流量：熱門問題反覆出現、長尾問題偶爾出現。
+miss 時模擬「LLM 回答後寫回快取」（upsert），背景 run_evictor() 定期淘汰。
+每個視窗輸出：快取筆數、估計 Redis 記憶體、命中率、search_similar p50/p99，
+用來觀察各 policy 是否收斂到穩定狀態（筆數不再成長、延遲不再變慢）。
+
+用法：
+    python scripts/soak_embed_cache_eviction.py
+    python scripts/soak_embed_cache_eviction.py --policy lfu --capacity 2000 --queries 50000
+    python scripts/soak_embed_cache_eviction.py --capacity 0     # 不設上限，對照組
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import fakeredis  # noqa: E402
+
+import services.redis_client as rc  # noqa: E402
+from services.embed_cache_redis import EmbeddingCacheRedis  # noqa: E402
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--policy", default="lru", choices=EmbeddingCacheRedis.EVICTION_POLICIES)
+    ap.add_argument("--capacity", type=int, default=1000)
+    ap.add_argument("--ttl", type=float, default=0, help="ttl_seconds（0 = 不過期）")
+    ap.add_argument("--universe", type=int, default=20_000, help="不同問題的總數")
+    ap.add_argument("--zipf", type=float, default=1.2, help="Zipf 參數 a（越大越集中）")
+    ap.add_argument("--queries", type=int, default=20_000)
+    ap.add_argument("--window", type=int, default=2_000)
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--evict-interval", type=float, default=0.2)
+    args = ap.parse_args()
+
+    server = fakeredis.FakeServer()
+    rc._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    rc._redis_bytes = fakeredis.FakeAsyncRedis(server=server, decode_responses=False)
+
+    rng = np.random.default_rng(0)
+
+    async def embed(text: str):
+        # 每個問題 id 一個固定的隨機向量（不同問題之間幾乎正交）
+        return np.random.default_rng(int(text)).standard_normal(args.dim).astype(np.float32).tolist()
+
+    ec = EmbeddingCacheRedis(
+        dim=args.dim,
+        embed_fn=embed,
+        prefix="soak",
+        capacity=args.capacity,
+        eviction_policy=args.policy,
+        ttl_seconds=args.ttl,
+    )
+    evictor = asyncio.create_task(ec.run_evictor(args.evict_interval))
+    bytes_per_entry = None
+
+    print(f"policy={args.policy} capacity={args.capacity} universe={args.universe} zipf={args.zipf}")
+    print(f"{'queries':>8} {'entries':>8} {'est_MB':>8} {'hit_rate':>9} {'p50_ms':>8} {'p99_ms':>8}")
+    ids = np.minimum(rng.zipf(args.zipf, size=args.queries), args.universe) - 1
+    for start in range(0, args.queries, args.window):
+        lat_ms, hits = [], 0
+        for qid in ids[start : start + args.window]:
+            t0 = time.perf_counter()
+            near = await ec.search_similar(str(qid), threshold=0.99)
+            lat_ms.append((time.perf_counter() - t0) * 1000)
+            if near is not None:
+                hits += 1
+            else:
+                await ec.upsert(str(qid), f"answer {qid}", {"prompt_tokens": 1, "completion_tokens": 1})
+            await asyncio.sleep(0)  # 讓背景 evictor 有機會跑
+
+        entries = await ec.size()
+        if bytes_per_entry is None and entries:
+            r = rc.get_redis()
+            sample = next(iter(await r.smembers(ec.key_ids)))
+            key = ec._item_key(int(sample))
+            bytes_per_entry = sum([await r.hstrlen(key, f) for f in ("q", "a", "v", "m")])
+        est_mb = entries * (bytes_per_entry or 0) / 1e6
+        print(
+            f"{start + len(lat_ms):>8} {entries:>8} {est_mb:>8.2f} {hits / len(lat_ms):>9.2%} "
+            f"{np.percentile(lat_ms, 50):>8.2f} {np.percentile(lat_ms, 99):>8.2f}"
+        )
+
+    evictor.cancel()
+    await asyncio.gather(evictor, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
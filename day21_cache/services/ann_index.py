@@ -0,0 +1,103 @@
+# services/ann_index.py
+from __future__ import annotations
+from typing import Iterable, List, Set, Tuple
+import numpy as np
+
+
+class AnnIndex:
+    """
+    行程內（in-process）的 FAISS 向量索引，給語意快取當「先查這裡」的鏡像。
+    - 向量已 normalize → 用 inner product 即 cosine
+    - kind:
+        hnsw: IndexHNSWFlat（預設；查詢次線性，不支援刪除 → 用 tombstone 過濾，累積過多再重建）
+        flat: IndexFlatIP（暴力內積；支援直接 remove_ids）
+    - 以 IndexIDMap2 包起來，FAISS 內部 id = Redis 的 item id
+    faiss 為選用相依套件：只有啟用 ANN 時才會 import。
+    """
+
+    def __init__(self, dim: int, kind: str = "hnsw", hnsw_m: int = 32, ef_search: int = 64):
+        try:
+            import faiss
+        except ImportError as e:  # pragma: no cover - 取決於環境
+            raise ImportError("AnnIndex requires faiss; install with `pip install faiss-cpu`") from e
+        if kind not in ("hnsw", "flat"):
+            raise ValueError(f"kind must be 'hnsw' or 'flat', got {kind!r}")
+
+        self._faiss = faiss
+        self.dim = dim
+        self.kind = kind
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self._live: Set[int] = set()
+        self._dead: Set[int] = set()  # 只有 hnsw 會用到
+        self._index = self._new_index()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._live
+
+    def reset(self) -> None:
+        self._live.clear()
+        self._dead.clear()
+        self._index = self._new_index()
+
+    def add(self, item_ids: List[int], vecs: np.ndarray) -> None:
+        """加入向量；已存在的 id 直接略過（事件重播時會重複收到自己寫的資料）。"""
+        keep = [i for i, item_id in enumerate(item_ids) if item_id not in self._live]
+        if not keep:
+            return
+        ids = np.asarray([item_ids[i] for i in keep], dtype=np.int64)
+        # 先前被 tombstone 的 id 又回來 → 先真正重建，避免 HNSW 裡同 id 兩份
+        if self._dead.intersection(ids.tolist()):
+            self._compact()
+        self._index.add_with_ids(np.ascontiguousarray(vecs[keep], dtype=np.float32), ids)
+        self._live.update(ids.tolist())
+
+    def remove(self, item_ids: Iterable[int]) -> None:
+        gone = [i for i in item_ids if i in self._live]
+        if not gone:
+            return
+        self._live.difference_update(gone)
+        if self.kind == "flat":
+            self._index.remove_ids(np.asarray(gone, dtype=np.int64))
+            return
+        self._dead.update(gone)
+        if len(self._dead) > max(len(self._live), 1024):
+            self._compact()
+
+    def search(self, q_vec: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        """回傳 [(item_id, cosine), ...]，由高到低。"""
+        if not self._live:
+            return []
+        # tombstone 還佔著位置 → 多拿一些再過濾
+        fetch = min(k + len(self._dead), self._index.ntotal)
+        scores, ids = self._index.search(q_vec.reshape(1, -1).astype(np.float32, copy=False), fetch)
+        hits: List[Tuple[int, float]] = []
+        for score, item_id in zip(scores[0], ids[0]):
+            if item_id < 0 or int(item_id) in self._dead:
+                continue
+            hits.append((int(item_id), float(score)))
+            if len(hits) >= k:
+                break
+        return hits
+
+    # ---- helpers ----
+    def _new_index(self):
+        faiss = self._faiss
+        if self.kind == "flat":
+            base = faiss.IndexFlatIP(self.dim)
+        else:
+            base = faiss.IndexHNSWFlat(self.dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            base.hnsw.efSearch = self.ef_search
+        return faiss.IndexIDMap2(base)
+
+    def _compact(self) -> None:
+        """把 live 的向量取回來重建索引，真正丟掉 tombstone。"""
+        ids = sorted(self._live)
+        vecs = np.vstack([self._index.reconstruct(i) for i in ids]) if ids else None
+        self._dead.clear()
+        self._index = self._new_index()
+        if ids:
+            self._index.add_with_ids(vecs, np.asarray(ids, dtype=np.int64))
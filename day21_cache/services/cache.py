@@ -1,10 +1,35 @@
+import asyncio
 import hashlib
 import json
+import logging
+import uuid
 from typing import Any, Dict, Optional
+from core.config import settings
+from core.metrics import TIER_CACHE_COUNTER
+from services.local_cache import LocalLRU
 from services.redis_client import get_redis
 
+log = logging.getLogger(__name__)
+
 class PromptCache:
-    """字串精確匹配的 Prompt Cache（Key 用 SHA256），內容以 JSON 存。"""
+    """
+    字串精確匹配的 Prompt Cache（Key 用 SHA256），內容以 JSON 存。
+    - L1：行程內 LRU（筆數 + TTL 上限），熱門問題不用走網路
+    - L2：Redis
+    - set / invalidate 會 publish 到 invalidation channel，其他 worker 收到就丟掉自己的 L1
+      （訂閱由 listen_invalidations() 背景任務負責；L1 TTL 是最後一道防線）
+    l1_maxsize=0 表示關閉 L1。
+    """
+
+    def __init__(
+        self,
+        l1_maxsize: int = settings.L1_PROMPT_MAXSIZE if settings.L1_CACHE_ENABLED else 0,
+        l1_ttl: float = settings.L1_PROMPT_TTL_SECONDS,
+        channel: str = settings.CACHE_INVALIDATION_CHANNEL,
+    ) -> None:
+        self.l1: Optional[LocalLRU] = LocalLRU(l1_maxsize, l1_ttl) if l1_maxsize > 0 else None
+        self.channel = channel
+        self._node = uuid.uuid4().hex  # 自己發的失效訊息不用處理
 
     @staticmethod
     def _key(prompt: str) -> str:
@@ -12,10 +37,74 @@ class PromptCache:
         return f"prompt_cache:{h}"
 
     async def get(self, prompt: str) -> Optional[Dict[str, Any]]:
+        key = self._key(prompt)
+        if self.l1 is not None:
+            value = self.l1.get(key)
+            TIER_CACHE_COUNTER.labels(cache="prompt", tier="l1", result="hit" if value is not None else "miss").inc()
+            if value is not None:
+                return value
+
         r = get_redis()
-        raw = await r.get(self._key(prompt))
-        return json.loads(raw) if raw else None
+        if self.l1 is None:
+            raw, ttl_ms = await r.get(key), -1
+        else:
+            # 順便拿剩餘 TTL（同一個 round-trip），L1 不會活得比 Redis 久
+            pipe = r.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, ttl_ms = await pipe.execute()
+        TIER_CACHE_COUNTER.labels(cache="prompt", tier="l2", result="hit" if raw else "miss").inc()
+        if not raw:
+            return None
+        value = json.loads(raw)
+        if self.l1 is not None:
+            self.l1.set(key, value, ttl=ttl_ms / 1000.0 if ttl_ms > 0 else None)
+        return value
 
     async def set(self, prompt: str, value: Dict[str, Any], ttl: int = 3600) -> None:
+        key = self._key(prompt)
         r = get_redis()
-        await r.set(self._key(prompt), json.dumps(value, ensure_ascii=False), ex=ttl)
+        await r.set(key, json.dumps(value, ensure_ascii=False), ex=ttl)
+        if self.l1 is not None:
+            self.l1.set(key, value, ttl=ttl)
+            await r.publish(self.channel, f"{self._node} {key}")
+
+    async def invalidate(self, prompt: str) -> None:
+        key = self._key(prompt)
+        r = get_redis()
+        await r.delete(key)
+        if self.l1 is not None:
+            self.l1.delete(key)
+            await r.publish(self.channel, f"{self._node} {key}")
+
+    async def listen_invalidations(self, backoff: float = 0.5, max_backoff: float = 30.0) -> None:
+        """
+        背景任務：訂閱 invalidation channel，收到其他 worker 的 key 就丟掉本機 L1。
+        Redis 斷線時記 log、指數退避後重新訂閱；斷線期間可能漏掉失效訊息，所以重新訂閱後先清空 L1。
+        """
+        if self.l1 is None:
+            return
+        delay = backoff
+        while True:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                if delay > backoff:
+                    self.l1.clear()
+                    log.info("invalidation channel %s resubscribed; L1 cleared", self.channel)
+                delay = backoff
+                async for msg in pubsub.listen():
+                    node, _, key = str(msg["data"]).partition(" ")
+                    if node != self._node:
+                        self.l1.delete(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("invalidation listener on %s failed; retrying in %.1fs: %s", self.channel, delay, e)
+            finally:
+                try:
+                    await pubsub.aclose()  # 連線可能已經斷了：收尾失敗不影響重連
+                except Exception:
+                    pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_backoff)
@@ -0,0 +1,80 @@
+# services/embed_batcher.py
+from __future__ import annotations
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+
+Vector = List[float]
+BatchFn = Callable[[List[str]], Awaitable[List[Vector]]]
+
+
+class EmbedBatcher:
+    """
+    Embedding 微批次（micro-batching）佇列
+    - submit(text) 先進 pending，湊滿 max_batch 筆或等滿 max_wait_ms 就送出一次 batch_fn(texts)
+    - 結果依序拆回各呼叫者；batch_fn 失敗時同批所有呼叫者都收到同一個例外
+    - 同一批內重複的文字只送一次
+    on_flush(n) 在每次送出時呼叫（n = 該批請求數），給 metrics 記錄 batch size 用。
+    """
+
+    def __init__(
+        self,
+        batch_fn: BatchFn,
+        max_batch: int = 64,
+        max_wait_ms: float = 5.0,
+        on_flush: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        if max_batch < 1:
+            raise ValueError("max_batch must be >= 1")
+        self._batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._on_flush = on_flush
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()  # 保留參照，避免 task 被 GC
+
+    async def submit(self, text: str) -> Vector:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000.0, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        if self._on_flush is not None:
+            self._on_flush(len(batch))
+
+        # 去重：同一批的相同文字只 embed 一次
+        uniq: Dict[str, int] = {}
+        for text, _ in batch:
+            uniq.setdefault(text, len(uniq))
+
+        try:
+            vecs = await self._batch_fn(list(uniq))
+            if len(vecs) != len(uniq):
+                raise RuntimeError(f"batch_fn returned {len(vecs)} vectors for {len(uniq)} inputs")
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for text, fut in batch:
+            if not fut.done():
+                fut.set_result(vecs[uniq[text]])
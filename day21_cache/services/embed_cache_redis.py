@@ -1,20 +1,62 @@
 # services/embed_cache_redis.py
 from __future__ import annotations
 from typing import Any, Dict, List, Optional, Callable, Awaitable, Tuple
+import asyncio
 import json
+import struct
+import time
 import numpy as np
 
-from services.redis_client import get_redis
+from core.metrics import EMBED_EVICTED_COUNTER
+from services.ann_index import AnnIndex
+from services.redis_client import get_redis, get_redis_bytes
 
 Vector = List[float]
 EmbedFn = Callable[[str], Awaitable[Vector]]
 
+# ---- 向量二進位編碼 ----
+# header（8 bytes，讓後面的資料維持 4-byte 對齊，np.frombuffer 可直接 zero-copy）：
+#   magic  2B  b"EV"
+#   ver    1B  格式版本
+#   fmt    1B  0=f32 / 1=f16 / 2=i8
+#   scale  4B  little-endian float32（只有 i8 用得到，其餘填 1.0）
+# body：little-endian 原始向量
+_VEC_MAGIC = b"EV"
+_VEC_VERSION = 1
+_VEC_HEADER = struct.Struct("<2sBBf")
+_VEC_FORMATS = {"f32": (0, np.dtype("<f4")), "f16": (1, np.dtype("<f2")), "i8": (2, np.dtype("i1"))}
+_VEC_DTYPES = {code: dt for code, dt in _VEC_FORMATS.values()}
+
 def _l2_normalize(v: np.ndarray) -> np.ndarray:
     n = np.linalg.norm(v) + 1e-8
     return v / n
 
-def _cosine(a: np.ndarray, b: np.ndarray) -> float:
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-8))
+def _encode_vec(v: np.ndarray, fmt: str = "f32") -> bytes:
+    code, dtype = _VEC_FORMATS[fmt]
+    scale = 1.0
+    if fmt == "i8":
+        # 對稱量化：[-max, max] → [-127, 127]，scale 存在 header
+        scale = float(np.max(np.abs(v))) / 127.0 or 1.0
+        body = np.clip(np.rint(v / scale), -127, 127).astype(dtype)
+    else:
+        body = v.astype(dtype)
+    return _VEC_HEADER.pack(_VEC_MAGIC, _VEC_VERSION, code, scale) + body.tobytes()
+
+def _decode_vec(raw: bytes | str) -> np.ndarray:
+    """二進位格式走 np.frombuffer；舊版 JSON 文字（以 "[" 開頭）仍可讀。"""
+    if isinstance(raw, str) or raw[:1] == b"[":
+        return np.asarray(json.loads(raw), dtype=np.float32)
+    magic, version, code, scale = _VEC_HEADER.unpack_from(raw)
+    if magic != _VEC_MAGIC or version != _VEC_VERSION or code not in _VEC_DTYPES:
+        raise ValueError(f"unknown vector encoding: magic={magic!r} ver={version} fmt={code}")
+    v = np.frombuffer(raw, dtype=_VEC_DTYPES[code], offset=_VEC_HEADER.size)
+    if code == 0:
+        return v  # f32：唯讀 view，不複製
+    v = v.astype(np.float32)
+    return v * np.float32(scale) if code == 2 else v
+
+def _is_legacy_vec(raw: bytes | str) -> bool:
+    return isinstance(raw, str) or raw[:1] == b"["
 
 class EmbeddingCacheRedis:
     """
@@ -23,22 +65,67 @@ class EmbeddingCacheRedis:
         fields:
           q: question (str)
           a: answer (str)
-          v: vector JSON (list[float], 已 normalize)
+          v: vector bytes（已 normalize；格式見 _encode_vec：f32 / f16 / i8+scale）
+             * 舊版為 JSON 文字 list[float]，仍可讀；可用 scripts/migrate_embed_vectors.py 一次轉檔
           m: meta JSON (dict)
     - 以 Set 索引所有 id: {prefix}:ids
     - 以 INCR 產生遞增 id: {prefix}:next_id
-    - 查詢：拿 query 向量 → 掃描所有 id → cosine 相似度 → 命中門檻回傳
-      * 線性掃描 O(N)；適合小～中量 demo。大量資料時建議換 Redis Stack 或 FAISS/pgvector。
+    - 查詢：拿 query 向量 → pipeline 一次取回所有 v → 疊成 float32 矩陣
+            → 單次矩陣-向量乘積算 cosine → 只對最佳那筆取完整 payload
+      * 仍是線性掃描 O(N)，但只有 2 次 round-trip；大量資料時建議換 Redis Stack 或 FAISS/pgvector。
+    - 選用 ANN（ann_kind="hnsw" | "flat"）：行程內 FAISS 索引鏡像 {prefix}:ids
+        * 查詢先問本機索引，只有勝出那筆才回 Redis 取 payload
+        * 每次寫入/清空都 XADD 到 {prefix}:events；各 worker 查詢前 XREAD 增量套用，
+          並比對 SCARD 與本機筆數；不一致時先重讀一次 events + SCARD 再比，仍對不上（例如 stream 被 trim）才整包重載。
+          同步期間本機自己寫入過（本機 ANN 先一步更新）就不比對，留給下一次 sync
+    - 容量與淘汰（capacity / eviction_policy / ttl_seconds）：
+        * {prefix}:ctime / {prefix}:atime / {prefix}:hits 三個 ZSET 記錄建立時間、最後命中時間、命中次數
+          （search_similar 命中時與取 payload 同一個 pipeline 更新）
+        * evict()：先清掉超過 ttl_seconds 的，再依 policy 把超出 capacity 的踢掉
+            lru → 最久沒命中；lfu → 命中最少；ttl → 最早建立（FIFO）
+          * lfu 的新資料從「目前最少命中數 + 1」起算（類似 LFU-DA 的 aging）：
+            否則新寫入的命中數永遠是 0，快取滿了之後一進來就先被踢，根本等不到第一次命中
+        * run_evictor() 在背景定期執行，request path 不會被擋住
     """
-    def __init__(self, dim: int, embed_fn: EmbedFn, prefix: str = "embed_cache"):
+    EVENTS_MAXLEN = 10_000
+    EVICTION_POLICIES = ("lru", "lfu", "ttl")
+
+    def __init__(
+        self,
+        dim: int,
+        embed_fn: EmbedFn,
+        prefix: str = "embed_cache",
+        vector_format: str = "f32",
+        ann_kind: Optional[str] = None,
+        capacity: int = 0,
+        eviction_policy: str = "lru",
+        ttl_seconds: float = 0,
+    ):
+        if vector_format not in _VEC_FORMATS:
+            raise ValueError(f"vector_format must be one of {sorted(_VEC_FORMATS)}, got {vector_format!r}")
+        if eviction_policy not in self.EVICTION_POLICIES:
+            raise ValueError(f"eviction_policy must be one of {self.EVICTION_POLICIES}, got {eviction_policy!r}")
         self.dim = dim
         self._embed = embed_fn
         self.prefix = prefix
+        self.vector_format = vector_format
+        self.capacity = capacity  # 0 = 不限筆數
+        self.eviction_policy = eviction_policy
+        self.ttl_seconds = ttl_seconds  # 0 = 不過期
 
         self.key_ids = f"{prefix}:ids"
         self.key_next = f"{prefix}:next_id"  # INCR 產 id
+        self.key_events = f"{prefix}:events"  # 給 ANN 鏡像同步用的 stream
+        self.key_ctime = f"{prefix}:ctime"  # ZSET id → 建立時間
+        self.key_atime = f"{prefix}:atime"  # ZSET id → 最後命中時間
+        self.key_hits = f"{prefix}:hits"  # ZSET id → 命中次數
+        self.key_evict_lock = f"{prefix}:evict_lock"
         # item key: f"{prefix}:item:{id}"
 
+        self.ann: Optional[AnnIndex] = AnnIndex(dim, kind=ann_kind) if ann_kind else None
+        self._ann_last_event: Optional[str] = None  # None = 尚未載入
+        self._ann_local_writes = 0  # 本機直接改 ANN 的次數：sync 期間有變就不拿筆數比對
+
     # ---- public API ----
     async def upsert(self, question: str, answer: str, meta: Dict[str, Any]) -> int:
         r = get_redis()
@@ -49,23 +136,42 @@ class EmbeddingCacheRedis:
         # 2) 產生 id（遞增）
         item_id = int(await r.incr(self.key_next))
 
-        # 3) 寫入 Hash
+        # 2.5) lfu：新資料的起始命中數
+        initial_hits = 0.0
+        if self.eviction_policy == "lfu":
+            lowest = await r.zrange(self.key_hits, 0, 0, withscores=True)
+            initial_hits = (float(lowest[0][1]) if lowest else 0.0) + 1
+
+        # 3) 寫入 Hash + 收錄於 ids 索引 + 發事件（MULTI，讓其他 worker 看到一致的快照）
         key = self._item_key(item_id)
-        await r.hset(
+        pipe = r.pipeline(transaction=True)
+        pipe.hset(
             key,
             mapping={
                 "q": question,
                 "a": answer,
-                "v": json.dumps(vec.tolist()),
+                "v": _encode_vec(vec, self.vector_format),
                 "m": json.dumps(meta, ensure_ascii=False),
             },
         )
+        pipe.sadd(self.key_ids, item_id)
+        now = time.time()
+        pipe.zadd(self.key_ctime, {item_id: now})
+        pipe.zadd(self.key_atime, {item_id: now})
+        pipe.zadd(self.key_hits, {item_id: initial_hits})
+        pipe.xadd(self.key_events, {"op": "add", "id": item_id}, maxlen=self.EVENTS_MAXLEN, approximate=True)
+        await pipe.execute()
 
-        # 4) 收錄於 ids 索引
-        await r.sadd(self.key_ids, item_id)
+        # 4) 本機 ANN 直接更新（事件重播時會因 id 已存在而略過）
+        if self.ann is not None:
+            self.ann.add([item_id], vec.reshape(1, -1))
+            self._ann_local_writes += 1
         return item_id
 
     async def search_similar(self, query: str, threshold: float = 0.92) -> Optional[Dict[str, Any]]:
+        if self.ann is not None:
+            return await self._search_ann(query, threshold)
+
         r = get_redis()
         ids = await r.smembers(self.key_ids)
         if not ids:
@@ -73,38 +179,19 @@ class EmbeddingCacheRedis:
 
         q_vec = await self._to_vec(await self._embed(query))
 
-        # 逐筆計算 cosine，相似度最高且 >= threshold 就回傳
-        best: Tuple[float, Optional[Dict[str, Any]]] = (-1.0, None)
-
-        # Pipeline 可加速；這裡直接簡化逐筆取
-        for sid in ids:
-            key = self._item_key(int(sid))
-            data = await r.hgetall(key)
-            if not data:
-                continue
+        # 1) 一次 pipeline 取回所有候選向量，疊成 (N, dim) 矩陣
+        item_ids, matrix = await self._load_matrix(ids)
+        if not item_ids:
+            return None
 
-            try:
-                v = np.array(json.loads(data.get("v", "[]")), dtype=np.float32)
-            except Exception:
-                continue
+        # 2) 入庫向量與 query 皆已 normalize → 內積即 cosine，一次矩陣乘法算完
+        sims = matrix @ q_vec
+        best = int(np.argmax(sims))
+        if float(sims[best]) < threshold:
+            return None
 
-            sim = _cosine(q_vec, v)
-            if sim > best[0]:
-                # 準備 payload
-                payload = {
-                    "question": data.get("q", ""),
-                    "answer": data.get("a", ""),
-                }
-                # 附帶 meta
-                try:
-                    payload.update(json.loads(data.get("m", "{}")))
-                except Exception:
-                    pass
-                best = (sim, payload)
-
-        if best[0] >= threshold and best[1] is not None:
-            return best[1]
-        return None
+        # 3) 只對勝出的那筆取完整 payload
+        return await self._fetch_payload(item_ids[best])
 
     async def size(self) -> int:
         r = get_redis()
@@ -119,9 +206,195 @@ class EmbeddingCacheRedis:
             pipe.delete(self._item_key(int(sid)))
         pipe.delete(self.key_ids)
         pipe.delete(self.key_next)
+        pipe.delete(self.key_ctime, self.key_atime, self.key_hits)
+        pipe.xadd(self.key_events, {"op": "clear"}, maxlen=self.EVENTS_MAXLEN, approximate=True)
         await pipe.execute()
+        if self.ann is not None:
+            self.ann.reset()
+            self._ann_local_writes += 1
+
+    async def load_index(self) -> int:
+        """從 Redis 整包載入 ANN 鏡像（啟動預熱 / 偵測到不一致時使用），回傳筆數。"""
+        if self.ann is None:
+            return 0
+        r = get_redis()
+        # 先記下 stream 位置再讀資料：之後的事件會重播，add 本身是冪等的
+        pipe = r.pipeline(transaction=True)
+        pipe.xrevrange(self.key_events, count=1)
+        pipe.smembers(self.key_ids)
+        last, ids = await pipe.execute()
+
+        item_ids, matrix = await self._load_matrix(ids)
+        self.ann.reset()
+        if item_ids:
+            self.ann.add(item_ids, matrix)
+        self._ann_last_event = last[0][0] if last else "0-0"
+        return len(self.ann)
+
+    async def sync_index(self) -> None:
+        """增量套用其他 worker 的寫入事件；重讀一次後筆數仍與 Redis 對不上才整包重載。"""
+        if self.ann is None:
+            return
+        if self._ann_last_event is None:
+            await self.load_index()
+            return
+
+        for _ in range(2):
+            local_writes = self._ann_local_writes
+            total = await self._apply_events()
+            if self._ann_local_writes != local_writes:
+                return  # 等待期間本機寫入已先套用、事件還沒讀到 → 筆數暫時不準，下次 sync 再比
+            if len(self.ann) == total:
+                return
+            # 可能剛好有別的 worker 在這之間寫入：再讀一次 events + SCARD 確認
+        await self.load_index()
+
+    async def _apply_events(self) -> int:
+        """讀上次位置之後的事件套用到本機 ANN，回傳與事件同一個 MULTI 讀到的 SCARD。"""
+        r = get_redis()
+        pipe = r.pipeline(transaction=True)
+        pipe.xread({self.key_events: self._ann_last_event})
+        pipe.scard(self.key_ids)
+        streams, total = await pipe.execute()
+
+        added: List[int] = []
+        for _stream, entries in streams or []:
+            for event_id, fields in entries:
+                self._ann_last_event = event_id
+                op = fields.get("op")
+                if op == "add":
+                    added.append(int(fields["id"]))
+                elif op == "del":
+                    gone = {int(i) for i in fields["ids"].split(",")}
+                    added = [i for i in added if i not in gone]
+                    self.ann.remove(gone)
+                elif op == "clear":
+                    self.ann.reset()
+                    added.clear()
+
+        added = [i for i in added if i not in self.ann]
+        if added:
+            item_ids, matrix = await self._load_matrix(added)
+            if item_ids:
+                self.ann.add(item_ids, matrix)
+        return int(total)
+
+    async def evict(self) -> Dict[str, int]:
+        """執行一次淘汰，回傳 {reason: 筆數}；reason 為 ttl 或 capacity 超量時的 policy。"""
+        r = get_redis()
+        evicted: Dict[str, int] = {}
+
+        # 1) 過期
+        if self.ttl_seconds > 0:
+            expired = await r.zrangebyscore(self.key_ctime, "-inf", time.time() - self.ttl_seconds)
+            if expired:
+                evicted["ttl"] = await self._delete_items([int(i) for i in expired])
+
+        # 2) 超過容量 → 依 policy 挑 victim
+        if self.capacity > 0:
+            over = int(await r.scard(self.key_ids)) - self.capacity
+            if over > 0:
+                order_key = {"lru": self.key_atime, "lfu": self.key_hits, "ttl": self.key_ctime}[self.eviction_policy]
+                victims = await r.zrange(order_key, 0, over - 1)
+                if len(victims) < over:
+                    # 舊資料沒有 ZSET 紀錄 → 用 id（遞增）最小的補足
+                    tracked = set(victims)
+                    untracked = sorted(int(i) for i in await r.smembers(self.key_ids) if i not in tracked)
+                    victims = list(victims) + untracked[: over - len(victims)]
+                if victims:
+                    evicted[self.eviction_policy] = await self._delete_items([int(i) for i in victims])
+
+        for reason, n in evicted.items():
+            EMBED_EVICTED_COUNTER.labels(reason=reason).inc(n)
+        return evicted
+
+    async def run_evictor(self, interval: float = 5.0) -> None:
+        """
+        背景任務：每 interval 秒淘汰一次。
+        用 SET NX PX 搶鎖，多個 worker 同時跑時每輪只有一個真正執行，避免重複踢過頭。
+        """
+        if self.capacity <= 0 and self.ttl_seconds <= 0:
+            return
+        while True:
+            try:
+                r = get_redis()
+                if await r.set(self.key_evict_lock, "1", nx=True, px=max(int(interval * 1000), 1)):
+                    await self.evict()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[evictor] {self.prefix}: {e}")
+            await asyncio.sleep(interval)
+
+    async def migrate_vectors(self, batch_size: int = 500) -> int:
+        """一次性轉檔：把舊版 JSON 文字向量改寫成目前的二進位格式，回傳轉換筆數。"""
+        rb = get_redis_bytes()
+        item_ids = [int(sid) for sid in await rb.smembers(self.key_ids)]
+        migrated = 0
+        for start in range(0, len(item_ids), batch_size):
+            chunk = item_ids[start : start + batch_size]
+            pipe = rb.pipeline(transaction=False)
+            for item_id in chunk:
+                pipe.hget(self._item_key(item_id), "v")
+            raws = await pipe.execute()
+
+            pipe = rb.pipeline(transaction=False)
+            for item_id, raw in zip(chunk, raws):
+                if not raw or not _is_legacy_vec(raw):
+                    continue
+                vec = await self._to_vec(json.loads(raw))
+                pipe.hset(self._item_key(item_id), "v", _encode_vec(vec, self.vector_format))
+                migrated += 1
+            await pipe.execute()
+        return migrated
 
     # ---- helpers ----
+    async def _search_ann(self, query: str, threshold: float) -> Optional[Dict[str, Any]]:
+        await self.sync_index()
+        if len(self.ann) == 0:
+            return None
+
+        q_vec = await self._to_vec(await self._embed(query))
+        hits = self.ann.search(q_vec, k=1)
+        if not hits or hits[0][1] < threshold:
+            return None
+        return await self._fetch_payload(hits[0][0])
+
+    async def _fetch_payload(self, item_id: int) -> Optional[Dict[str, Any]]:
+        """取命中那筆的 payload，並在同一個 pipeline 記錄命中時間與次數（給 LRU / LFU 用）。"""
+        r = get_redis()
+        pipe = r.pipeline(transaction=False)
+        # v 是 bytes，不能用 decode 連線 HGETALL → 只取需要的欄位
+        pipe.hmget(self._item_key(item_id), "q", "a", "m")
+        pipe.zadd(self.key_atime, {item_id: time.time()}, xx=True)
+        pipe.zincrby(self.key_hits, 1, item_id)
+        (q, a, m), _, _ = await pipe.execute()
+        if q is None and a is None:
+            await r.zrem(self.key_hits, item_id)  # 已被淘汰，別留下孤兒計數
+            return None
+        return self._to_payload({"q": q or "", "a": a or "", "m": m or "{}"})
+
+    async def _delete_items(self, item_ids: List[int]) -> int:
+        r = get_redis()
+        pipe = r.pipeline(transaction=True)
+        for item_id in item_ids:
+            pipe.delete(self._item_key(item_id))
+        pipe.srem(self.key_ids, *item_ids)
+        pipe.zrem(self.key_ctime, *item_ids)
+        pipe.zrem(self.key_atime, *item_ids)
+        pipe.zrem(self.key_hits, *item_ids)
+        pipe.xadd(
+            self.key_events,
+            {"op": "del", "ids": ",".join(map(str, item_ids))},
+            maxlen=self.EVENTS_MAXLEN,
+            approximate=True,
+        )
+        results = await pipe.execute()
+        if self.ann is not None:
+            self.ann.remove(item_ids)
+            self._ann_local_writes += 1
+        return int(results[len(item_ids)])  # SREM 實際移除的筆數
+
     async def _to_vec(self, arr: Vector) -> np.ndarray:
         v = np.array(arr, dtype=np.float32)
         # 維度檢查（保守起見；不符就截/補零）
@@ -133,5 +406,45 @@ class EmbeddingCacheRedis:
                 v = np.concatenate([v, pad], axis=0)
         return _l2_normalize(v)
 
+    async def _load_matrix(self, ids) -> Tuple[List[int], np.ndarray]:
+        """以單次 pipeline 讀回所有 id 的 v 欄位；壞資料或維度不符的直接略過。"""
+        r = get_redis_bytes()
+        item_ids = [int(sid) for sid in ids]
+        pipe = r.pipeline(transaction=False)
+        for item_id in item_ids:
+            pipe.hget(self._item_key(item_id), "v")
+        raws = await pipe.execute()
+
+        kept: List[int] = []
+        rows: List[np.ndarray] = []
+        for item_id, raw in zip(item_ids, raws):
+            if not raw:
+                continue
+            try:
+                v = _decode_vec(raw)
+            except Exception:
+                continue
+            if v.shape != (self.dim,):
+                continue
+            kept.append(item_id)
+            rows.append(v)
+
+        if not rows:
+            return [], np.empty((0, self.dim), dtype=np.float32)
+        return kept, np.vstack(rows)
+
+    @staticmethod
+    def _to_payload(data: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {
+            "question": data.get("q", ""),
+            "answer": data.get("a", ""),
+        }
+        # 附帶 meta
+        try:
+            payload.update(json.loads(data.get("m", "{}")))
+        except Exception:
+            pass
+        return payload
+
     def _item_key(self, item_id: int) -> str:
         return f"{self.prefix}:item:{item_id}"
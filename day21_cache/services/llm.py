@@ -1,7 +1,12 @@
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List, Union
 from dataclasses import dataclass
 from openai import AsyncOpenAI
+from core import accounting
 from core.config import settings
+from core.metrics import EMBED_BATCH_SIZE_HISTOGRAM, TIER_CACHE_COUNTER
+from core.tracing import traced
+from services.embed_batcher import EmbedBatcher
+from services.local_cache import LocalLRU
 
 @dataclass
 class LLMResult:
@@ -19,12 +24,27 @@ class LLMService:
         # 若未設定 API Key，仍可跑 mock（見 chat() 的 fallback）
         self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, **kwargs)
 
+        # 並發的 embed() 會在這裡湊批，一次 embeddings.create(input=[...])
+        self._embed_batcher = EmbedBatcher(
+            self.embed_many,
+            max_batch=settings.EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBED_BATCH_MAX_WAIT_MS,
+            on_flush=EMBED_BATCH_SIZE_HISTOGRAM.observe,
+        )
+        # 同一問題的 query embedding 不變 → 行程內 LRU 直接重用
+        self._embed_l1 = (
+            LocalLRU(settings.L1_EMBED_MAXSIZE, settings.L1_EMBED_TTL_SECONDS)
+            if settings.L1_CACHE_ENABLED and settings.L1_EMBED_MAXSIZE > 0
+            else None
+        )
+
+    @traced("llm")
     async def chat(self, question: str) -> LLMResult:
         # 若沒設定 OPENAI_API_KEY，回 mock 讓系統仍可運作
         if not settings.OPENAI_API_KEY:
             answer = f"(mock) You asked: {question}\nSet OPENAI_API_KEY to call real API."
-            prompt_tokens = max(1, len(question) // 4)
-            completion_tokens = max(5, len(answer) // 4)
+            prompt_tokens = accounting.count_tokens(question, settings.OPENAI_MODEL)
+            completion_tokens = accounting.count_tokens(answer, settings.OPENAI_MODEL)
             return LLMResult(
                 answer=answer,
                 prompt_tokens=prompt_tokens,
@@ -51,6 +71,44 @@ class LLMService:
             cost_usd=cost,
         )
 
+    async def chat_stream(self, question: str) -> AsyncIterator[Union[str, LLMResult]]:
+        """逐段 yield 文字 delta；最後一個 item 是 LLMResult（完整答案 + usage / 成本）。"""
+        if not settings.OPENAI_API_KEY:
+            result = await self.chat(question)
+            for i in range(0, len(result.answer), 8):
+                yield result.answer[i : i + 8]
+            yield result
+            return
+
+        messages = [{"role": "user", "content": question}]
+        stream = await self.client.chat.completions.create(
+            model=settings.OPENAI_MODEL,
+            messages=messages,
+            timeout=settings.OPENAI_TIMEOUT_SECONDS,
+            stream=True,
+            stream_options={"include_usage": True},  # 最後一個 chunk 帶 usage
+        )
+
+        # 上游不支援 include_usage（部分相容 API）時，用 tokenizer 補算 prompt / completion tokens
+        usage = accounting.StreamUsage(settings.OPENAI_MODEL, messages)
+        async for chunk in stream:
+            if chunk.usage:
+                usage.usage = chunk.usage
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    usage.add(delta)
+                    yield delta
+
+        prompt_tokens, completion_tokens = usage.tokens()
+        yield LLMResult(
+            answer=usage.text.strip(),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost_usd=self._estimate_chat_cost(prompt_tokens, completion_tokens),
+        )
+
+    @traced("embed")
     async def embed(self, text: str) -> List[float]:
         # 若沒 key，一樣返回 mock embedding（維度需與 EMBED_CACHE_DIM 一致）
         if not settings.OPENAI_API_KEY:
@@ -58,17 +116,37 @@ class LLMService:
             dim = settings.EMBED_CACHE_DIM
             return [0.0] * dim
 
+        l1_key = (settings.OPENAI_EMBED_MODEL, text)
+        if self._embed_l1 is not None:
+            vec = self._embed_l1.get(l1_key)
+            TIER_CACHE_COUNTER.labels(cache="embedding", tier="l1", result="hit" if vec is not None else "miss").inc()
+            if vec is not None:
+                return vec
+
+        if settings.EMBED_BATCH_ENABLED:
+            vec = await self._embed_batcher.submit(text)
+        else:
+            vec = (await self.embed_many([text]))[0]
+
+        if self._embed_l1 is not None:
+            self._embed_l1.set(l1_key, vec)
+        return vec
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """一次 API 呼叫取回多筆 embedding（依輸入順序回傳）。"""
         resp = await self.client.embeddings.create(
             model=settings.OPENAI_EMBED_MODEL,
-            input=text,
+            input=texts,
             timeout=settings.OPENAI_TIMEOUT_SECONDS,
         )
-        vec = resp.data[0].embedding
-        return vec  # type: ignore[return-value]
+        data = sorted(resp.data, key=lambda d: d.index)
+        return [d.embedding for d in data]  # type: ignore[misc]
 
     @staticmethod
     def _estimate_chat_cost(prompt_tokens: int, completion_tokens: int) -> float:
-        # 估算成本（USD）；以 .env/設定檔為準
-        p_cost = (prompt_tokens / 1000.0) * settings.PROMPT_COST_PER_1K
-        c_cost = (completion_tokens / 1000.0) * settings.COMPLETION_COST_PER_1K
-        return round(p_cost + c_cost, 6)
+        # 成本（USD）；PROMPT/COMPLETION_COST_PER_1K 有明確設定（環境變數 / .env）時優先，
+        # 否則查 core/accounting 的價格表（表裡沒有的模型也用這兩個預設值）
+        if settings.model_fields_set & {"PROMPT_COST_PER_1K", "COMPLETION_COST_PER_1K"}:
+            price = accounting.Price(settings.PROMPT_COST_PER_1K * 1000, settings.COMPLETION_COST_PER_1K * 1000)
+            return round(price.cost(prompt_tokens, completion_tokens), 6)
+        return round(accounting.pricing.cost(settings.OPENAI_MODEL, prompt_tokens, completion_tokens), 6)
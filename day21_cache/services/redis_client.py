@@ -2,9 +2,17 @@ import redis.asyncio as redis
 from core.config import settings
 
 _redis: redis.Redis | None = None
+_redis_bytes: redis.Redis | None = None
 
 def get_redis() -> redis.Redis:
     global _redis
     if _redis is None:
         _redis = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
     return _redis
+
+def get_redis_bytes() -> redis.Redis:
+    """不做 decode 的連線：給二進位欄位（例如語意快取的向量）使用。"""
+    global _redis_bytes
+    if _redis_bytes is None:
+        _redis_bytes = redis.from_url(settings.REDIS_URL, decode_responses=False)
+    return _redis_bytes
@@ -0,0 +1,102 @@
+# services/singleflight.py
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import time
+import uuid
+
+from services.redis_client import get_redis
+
+Fn = Callable[[], Awaitable[Any]]
+Lookup = Callable[[], Awaitable[Optional[Any]]]
+
+# 只刪除自己持有的鎖（避免鎖過期後誤刪別人的）
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    行程內請求合併（single-flight）
+    - 同一個 key 同時間只會有一個 fn 在跑（leader）
+    - 其他同 key 的呼叫者直接 await leader 的 task（follower），共享結果或例外
+    - fn 跑在自己的 task 裡，所有呼叫者（含 leader）都透過 shield 等它：
+      任何一個呼叫者被取消（例如 client 斷線）都不會中斷共享的工作，其他還在等的人照常拿到結果
+    do() 回傳 (value, scope)：scope 為 None 表示自己是 leader，"local" 表示合併到本行程的 in-flight 呼叫
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Fn, lookup: Optional[Lookup] = None) -> Tuple[Any, Optional[str]]:
+        value, joined = await self._join(key, fn)
+        return value, ("local" if joined else None)
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def _join(self, key: str, fn: Fn) -> Tuple[Any, bool]:
+        task = self._inflight.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), False
+
+    def _done(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # 標記已讀取，所有呼叫者都已離開時避免 "exception was never retrieved"
+
+
+class RedisSingleFlight(SingleFlight):
+    """
+    跨 worker 的請求合併：先在本行程合併，再用 Redis 鎖（SET NX PX）選出全域 leader
+    - leader：執行 fn（應在回傳前把結果寫進快取），完成後釋放鎖
+    - 其他 worker：輪詢 lookup()（通常就是讀快取）直到拿到結果；
+      若 leader 失敗沒寫快取或掛掉，鎖釋放/過期後會有人接手重跑
+    scope 多一種 "redis"：表示結果來自其他 worker 的 leader
+    """
+
+    def __init__(self, lock_ttl: float = 30.0, poll_interval: float = 0.05, prefix: str = "singleflight") -> None:
+        super().__init__()
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+
+    async def do(self, key: str, fn: Fn, lookup: Optional[Lookup] = None) -> Tuple[Any, Optional[str]]:
+        if lookup is None:
+            raise ValueError("RedisSingleFlight requires a lookup() to read the leader's result")
+        (value, remote), joined = await self._join(key, lambda: self._global(key, fn, lookup))
+        if joined:
+            return value, "local"
+        return value, ("redis" if remote else None)
+
+    async def _global(self, key: str, fn: Fn, lookup: Lookup) -> Tuple[Any, bool]:
+        r = get_redis()
+        lock_key = f"{self.prefix}:{key}"
+        token = uuid.uuid4().hex
+        ttl_ms = int(self.lock_ttl * 1000)
+
+        while True:
+            if await r.set(lock_key, token, nx=True, px=ttl_ms):
+                try:
+                    return await fn(), False
+                finally:
+                    await r.eval(_RELEASE_LUA, 1, lock_key, token)
+
+            started = time.monotonic()
+            while time.monotonic() - started < self.lock_ttl:
+                value = await lookup()
+                if value is not None:
+                    return value, True
+                if not await r.exists(lock_key):
+                    break  # leader 結束但沒留下結果 → 回去搶鎖
+                await asyncio.sleep(self.poll_interval)
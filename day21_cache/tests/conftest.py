@@ -34,6 +34,13 @@ async def _isolate_redis_per_test(monkeypatch):
     if hasattr(rc, "redis_client"):
         monkeypatch.setattr(rc, "redis_client", r, raising=False)
 
+    # 行程內 L1 不會跟著 flushdb 清掉 → 一起清，避免測試之間互相污染
+    from api.routers import ask
+    if ask.prompt_cache.l1 is not None:
+        ask.prompt_cache.l1.clear()
+    if ask.llm._embed_l1 is not None:
+        ask.llm._embed_l1.clear()
+
     # 乾淨化
     await r.flushdb()
     try:
@@ -74,6 +81,9 @@ def mock_llm(monkeypatch):
 
     monkeypatch.setattr(llm_mod.LLMService, "chat", fake_chat, raising=False)
     monkeypatch.setattr(llm_mod.LLMService, "embed", fake_embed, raising=False)
+    # 語意快取在 import 時就綁了 llm.embed（bound method），換類別上的 embed 碰不到 → 連它手上的一起換
+    from api.routers import ask
+    monkeypatch.setattr(ask.embed_cache, "_embed", fake_embed.__get__(ask.llm))
     return True
 
 
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+from services.embed_batcher import EmbedBatcher
+
+
+def _fake_batch_fn(calls):
+    async def batch_fn(texts):
+        calls.append(list(texts))
+        await asyncio.sleep(0.01)
+        return [[float(len(t))] for t in texts]
+    return batch_fn
+
+
+@pytest.mark.asyncio
+async def test_embed_batcher_coalesces_concurrent_submits():
+    calls, sizes = [], []
+    b = EmbedBatcher(_fake_batch_fn(calls), max_batch=64, max_wait_ms=20, on_flush=sizes.append)
+
+    texts = [f"q{i}" * (i + 1) for i in range(10)]
+    vecs = await asyncio.gather(*[b.submit(t) for t in texts])
+
+    assert len(calls) == 1 and sizes == [10]
+    assert vecs == [[float(len(t))] for t in texts]
+
+
+@pytest.mark.asyncio
+async def test_embed_batcher_flushes_at_max_batch_and_dedupes():
+    calls = []
+    b = EmbedBatcher(_fake_batch_fn(calls), max_batch=4, max_wait_ms=1000)
+
+    # 8 筆 → 湊滿 4 筆就送，不用等 1 秒
+    vecs = await asyncio.wait_for(asyncio.gather(*[b.submit("same" if i < 4 else f"t{i}") for i in range(8)]), 0.5)
+
+    assert len(calls) == 2
+    assert calls[0] == ["same"]  # 同批重複文字只送一次
+    assert vecs[:4] == [[4.0]] * 4
+
+
+@pytest.mark.asyncio
+async def test_embed_batcher_propagates_errors_to_whole_batch():
+    async def boom(texts):
+        raise RuntimeError("rate limited")
+
+    b = EmbedBatcher(boom, max_batch=8, max_wait_ms=1)
+    results = await asyncio.gather(*[b.submit(f"t{i}") for i in range(3)], return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from services.embed_cache_redis import EmbeddingCacheRedis
+
+
+class _Clock:
+    def __init__(self, t: float = 1_000.0):
+        self.t = t
+
+    def __call__(self) -> float:
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    import services.embed_cache_redis as mod
+    c = _Clock()
+    monkeypatch.setattr(mod.time, "time", c)
+    return c
+
+
+def _one_hot_embed(dim: int = 8):
+    """每個問題名稱 → 固定的 one-hot 向量，問 "X" 只會命中 "X"。"""
+    async def embed(text: str):
+        v = [0.0] * dim
+        v[ord(text[0]) % dim] = 1.0
+        return v
+    return embed
+
+
+async def _questions_left(ec):
+    from services.redis_client import get_redis
+    r = get_redis()
+    return sorted([await r.hget(ec._item_key(int(i)), "q") for i in await r.smembers(ec.key_ids)])
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_least_recently_hit(clock):
+    ec = EmbeddingCacheRedis(dim=8, embed_fn=_one_hot_embed(), prefix="t_lru", capacity=2, eviction_policy="lru")
+    for q in "ABC":
+        clock.t += 1
+        await ec.upsert(q, q, {})
+    clock.t += 1
+    assert await ec.search_similar("A", threshold=0.9) is not None  # A 變成最近使用
+
+    assert await ec.evict() == {"lru": 1}
+    assert await _questions_left(ec) == ["A", "C"]
+
+
+@pytest.mark.asyncio
+async def test_lfu_evicts_least_frequently_hit(clock):
+    ec = EmbeddingCacheRedis(dim=8, embed_fn=_one_hot_embed(), prefix="t_lfu", capacity=2, eviction_policy="lfu")
+    for q in "ABC":
+        await ec.upsert(q, q, {})
+    for q in "AABBBC" + "C":
+        await ec.search_similar(q, threshold=0.9)
+    # 命中次數 A=2、B=3、C=2；新進來的 D 從最少命中數 + 1 = 3 起算，不會一進來就被踢
+    await ec.upsert("D", "D", {})
+
+    assert await ec.evict() == {"lfu": 2}
+    assert await _questions_left(ec) == ["B", "D"]
+
+
+@pytest.mark.asyncio
+async def test_ttl_expires_entries_and_counts_metric(clock):
+    from core.metrics import EMBED_EVICTED_COUNTER
+    before = EMBED_EVICTED_COUNTER.labels(reason="ttl")._value.get()
+
+    ec = EmbeddingCacheRedis(dim=8, embed_fn=_one_hot_embed(), prefix="t_ttl", eviction_policy="ttl", ttl_seconds=60)
+    await ec.upsert("A", "A", {})
+    clock.t += 30
+    await ec.upsert("B", "B", {})
+    clock.t += 31
+
+    assert await ec.evict() == {"ttl": 1}
+    assert await _questions_left(ec) == ["B"]
+    assert EMBED_EVICTED_COUNTER.labels(reason="ttl")._value.get() == before + 1
+
+
+@pytest.mark.asyncio
+async def test_eviction_propagates_to_ann_mirror(clock):
+    pytest.importorskip("faiss")
+    w1 = EmbeddingCacheRedis(dim=8, embed_fn=_one_hot_embed(), prefix="t_ann_evict", ann_kind="flat", capacity=1)
+    w2 = EmbeddingCacheRedis(dim=8, embed_fn=_one_hot_embed(), prefix="t_ann_evict", ann_kind="flat", capacity=1)
+    await w1.upsert("A", "A", {})
+    clock.t += 1
+    await w1.upsert("B", "B", {})
+    await w2.load_index()
+    assert len(w2.ann) == 2
+
+    await w1.evict()
+    assert await w2.search_similar("A", threshold=0.9) is None
+    assert len(w2.ann) == 1
+
+
+@pytest.mark.asyncio
+async def test_zipfian_stream_stays_within_capacity():
+    """縮小版 soak：Zipf 分佈查詢 + 定期淘汰，筆數維持在容量內，最熱門的問題留得住。"""
+    dim, universe, capacity = 16, 60, 12
+    rng = np.random.default_rng(7)
+    basis = rng.standard_normal((universe, dim)).astype(np.float32)
+
+    async def embed(text: str):
+        return basis[int(text)].tolist()
+
+    ec = EmbeddingCacheRedis(dim=dim, embed_fn=embed, prefix="t_zipf", capacity=capacity, eviction_policy="lfu")
+    ranks = np.minimum(rng.zipf(1.3, size=150), universe) - 1
+    hits = 0
+    for i, qid in enumerate(ranks):
+        if await ec.search_similar(str(qid), threshold=0.99) is not None:
+            hits += 1
+        else:
+            await ec.upsert(str(qid), f"answer {qid}", {})
+        if i % 15 == 14:
+            await ec.evict()
+            assert await ec.size() <= capacity
+
+    assert hits / len(ranks) > 0.5
+    assert await ec.search_similar("0", threshold=0.99) is not None  # rank-1 問題仍在
@@ -14,3 +14,200 @@ async def test_embed_cache_redis_upsert_and_search(lower_threshold, mock_llm):
     assert near is not None
     assert "answer" in near
     assert near["answer"].startswith("快取")
+
+
+@pytest.mark.asyncio
+async def test_embed_cache_redis_search_picks_most_similar():
+    # 每個問題對應不同方向的向量，確認一次矩陣運算後挑出的是最相近的那筆
+    vecs = {
+        "A": [1.0, 0.0, 0.0, 0.0],
+        "B": [0.0, 1.0, 0.0, 0.0],
+        "C": [0.0, 0.0, 1.0, 0.0],
+        "query": [0.1, 0.9, 0.1, 0.0],
+    }
+
+    async def embed(text: str):
+        return vecs[text]
+
+    ec = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix="test_embed")
+    for q in ("A", "B", "C"):
+        await ec.upsert(q, f"answer {q}", {"prompt_tokens": 1})
+
+    near = await ec.search_similar("query", threshold=0.9)
+    assert near is not None
+    assert near["question"] == "B"
+    assert near["answer"] == "answer B"
+    assert near["prompt_tokens"] == 1
+
+    # 門檻高於最佳相似度 → 不命中
+    assert await ec.search_similar("query", threshold=0.999) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["f32", "f16", "i8"])
+async def test_embed_cache_redis_binary_formats_roundtrip(fmt):
+    vecs = {"A": [0.6, 0.8, 0.0, 0.0], "B": [0.0, 0.0, 0.6, 0.8]}
+
+    async def embed(text: str):
+        return vecs[text]
+
+    ec = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix=f"test_{fmt}", vector_format=fmt)
+    await ec.upsert("A", "answer A", {})
+    await ec.upsert("B", "answer B", {})
+
+    near = await ec.search_similar("A", threshold=0.98)
+    assert near is not None and near["answer"] == "answer A"
+
+
+@pytest.mark.asyncio
+async def test_embed_cache_redis_migrates_legacy_json():
+    import json
+    from services.redis_client import get_redis, get_redis_bytes
+
+    async def embed(text: str):
+        return [1.0, 0.0, 0.0, 0.0]
+
+    ec = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix="test_legacy")
+    # 模擬舊版資料：v 為 JSON 文字
+    r = get_redis()
+    await r.hset(ec._item_key(1), mapping={"q": "舊問題", "a": "舊答案", "v": json.dumps([1.0, 0.0, 0.0, 0.0]), "m": "{}"})
+    await r.sadd(ec.key_ids, 1)
+
+    # 轉檔前仍可查
+    assert (await ec.search_similar("x", threshold=0.99))["answer"] == "舊答案"
+
+    assert await ec.migrate_vectors() == 1
+    raw = await get_redis_bytes().hget(ec._item_key(1), "v")
+    assert raw[:2] == b"EV"
+    assert (await ec.search_similar("x", threshold=0.99))["answer"] == "舊答案"
+
+    # 再跑一次不會重複轉
+    assert await ec.migrate_vectors() == 0
+
+
+@pytest.mark.asyncio
+async def test_embed_cache_redis_vector_size_and_decode_report():
+    """回報每筆向量在 Redis 的大小與單次查詢的 decode 時間（pytest -s 可看到輸出）。"""
+    import json
+    import time
+    import numpy as np
+    from services.embed_cache_redis import _decode_vec, _encode_vec
+    from services.redis_client import get_redis_bytes
+
+    dim, n = 1536, 200
+    rng = np.random.default_rng(0)
+    v = rng.standard_normal(dim).astype(np.float32)
+    v /= np.linalg.norm(v)
+
+    encoded = {"json": json.dumps(v.tolist()).encode()}
+    for fmt in ("f32", "f16", "i8"):
+        encoded[fmt] = _encode_vec(v, fmt)
+
+    rb = get_redis_bytes()
+    report = {}
+    for fmt, raw in encoded.items():
+        await rb.hset("test_size:item", fmt, raw)
+        stored = await rb.hstrlen("test_size:item", fmt)
+
+        t0 = time.perf_counter()
+        for _ in range(n):
+            decoded = _decode_vec(raw)
+        decode_us = (time.perf_counter() - t0) / n * 1e6
+
+        report[fmt] = (stored, decode_us)
+        assert np.allclose(decoded, v, atol=2e-2)
+
+    for fmt, (stored, decode_us) in report.items():
+        print(f"[vector] {fmt:>4}: {stored:>6} bytes/entry, decode {decode_us:8.2f} µs/lookup")
+
+    assert report["f32"][0] == 8 + dim * 4
+    assert report["json"][0] > 4 * report["f32"][0]
+    assert report["f16"][0] < report["f32"][0] and report["i8"][0] < report["f16"][0]
+    assert report["f32"][1] < report["json"][1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["hnsw", "flat"])
+async def test_embed_cache_redis_ann_mirror_converges_across_workers(kind):
+    pytest.importorskip("faiss")
+    vecs = {
+        "A": [1.0, 0.0, 0.0, 0.0],
+        "B": [0.0, 1.0, 0.0, 0.0],
+        "qB": [0.1, 0.9, 0.0, 0.0],
+    }
+
+    async def embed(text: str):
+        return vecs[text]
+
+    # 兩個實例共用同一個 Redis，模擬兩個 uvicorn worker
+    w1 = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix=f"test_ann_{kind}", ann_kind=kind)
+    w2 = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix=f"test_ann_{kind}", ann_kind=kind)
+
+    await w1.upsert("A", "answer A", {})
+    assert await w2.load_index() == 1
+
+    # w1 寫入 → w2 查詢前透過 events stream 增量同步
+    await w1.upsert("B", "answer B", {})
+    near = await w2.search_similar("qB", threshold=0.9)
+    assert near is not None and near["answer"] == "answer B"
+    assert len(w2.ann) == 2
+
+    # w2 清空 → w1 下次查詢跟著清空
+    await w2.clear()
+    assert await w1.search_similar("qB", threshold=0.0) is None
+    assert len(w1.ann) == 0
+
+
+@pytest.mark.asyncio
+async def test_embed_cache_redis_ann_reloads_when_out_of_sync():
+    pytest.importorskip("faiss")
+    from services.redis_client import get_redis
+
+    async def embed(text: str):
+        return [1.0, 0.0, 0.0, 0.0]
+
+    w1 = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix="test_ann_gap", ann_kind="flat")
+    w2 = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix="test_ann_gap", ann_kind="flat")
+    await w2.load_index()
+
+    await w1.upsert("A", "answer A", {})
+    # 模擬 stream 被 trim 掉（事件遺失）→ w2 靠 SCARD 比對發現不一致後整包重載
+    await get_redis().delete(w1.key_events)
+    near = await w2.search_similar("A", threshold=0.9)
+    assert near is not None and near["answer"] == "answer A"
+
+
+@pytest.mark.asyncio
+async def test_embed_cache_redis_ann_sync_skips_reload_on_concurrent_local_write(monkeypatch):
+    pytest.importorskip("faiss")
+
+    async def embed(text: str):
+        return [1.0, 0.0, 0.0, 0.0] if text == "A" else [0.0, 1.0, 0.0, 0.0]
+
+    w1 = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix="test_ann_race", ann_kind="flat")
+    w2 = EmbeddingCacheRedis(dim=4, embed_fn=embed, prefix="test_ann_race", ann_kind="flat")
+    await w2.load_index()
+    await w1.upsert("A", "answer A", {})
+
+    # w2 正在讀 A 的向量時，本機剛好寫入 B（ANN 先一步 add）→ 筆數暫時多一筆，但不該整包重載
+    load_matrix = w2._load_matrix
+
+    async def racing_load_matrix(ids):
+        out = await load_matrix(ids)
+        if not getattr(racing_load_matrix, "done", False):
+            racing_load_matrix.done = True
+            await w2.upsert("B", "answer B", {})
+        return out
+
+    reloads = []
+    load_index = w2.load_index
+
+    async def counting_load_index():
+        reloads.append(1)
+        return await load_index()
+
+    monkeypatch.setattr(w2, "_load_matrix", racing_load_matrix)
+    monkeypatch.setattr(w2, "load_index", counting_load_index)
+    await w2.sync_index()
+    await w2.sync_index()
+    assert reloads == [] and len(w2.ann) == 2
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from services.cache import PromptCache
+from services.local_cache import LocalLRU
+
+
+def test_local_lru_evicts_least_recently_used():
+    lru = LocalLRU(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1  # a 變成最新
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+
+
+def test_local_lru_expires_entries(monkeypatch):
+    import services.local_cache as lc
+    now = [100.0]
+    monkeypatch.setattr(lc.time, "monotonic", lambda: now[0])
+
+    lru = LocalLRU(maxsize=10, ttl=5)
+    lru.set("a", 1)
+    lru.set("b", 2, ttl=60)  # 不會超過 L1 自己的上限 5 秒
+    now[0] += 6
+    assert lru.get("a") is None and lru.get("b") is None
+    assert len(lru) == 0
+
+
+@pytest.mark.asyncio
+async def test_prompt_cache_l1_serves_without_redis():
+    from services.redis_client import get_redis
+
+    pc = PromptCache(l1_maxsize=16, l1_ttl=60)
+    await pc.set("熱門問題", {"answer": "A"}, ttl=60)
+
+    # 直接刪掉 Redis 裡的值 → L1 仍命中（證明沒有走網路）
+    await get_redis().delete(pc._key("熱門問題"))
+    assert (await pc.get("熱門問題"))["answer"] == "A"
+
+    # 沒 L1 的實例只看 Redis
+    assert await PromptCache(l1_maxsize=0).get("熱門問題") is None
+
+
+@pytest.mark.asyncio
+async def test_prompt_cache_l1_invalidated_by_other_worker():
+    w1 = PromptCache(l1_maxsize=16, l1_ttl=60)
+    w2 = PromptCache(l1_maxsize=16, l1_ttl=60)
+    listener = asyncio.create_task(w2.listen_invalidations())
+    await asyncio.sleep(0.05)  # 等訂閱建立
+    try:
+        await w1.set("q", {"answer": "v1"}, ttl=60)
+        assert (await w2.get("q"))["answer"] == "v1"  # 進 w2 的 L1
+
+        await w1.set("q", {"answer": "v2"}, ttl=60)
+        for _ in range(50):
+            if w2.l1.get(w2._key("q")) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert (await w2.get("q"))["answer"] == "v2"
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_prompt_cache_listener_reconnects_after_redis_drop(monkeypatch):
+    import services.cache as cache_mod
+    from redis.exceptions import ConnectionError as RedisConnectionError
+
+    real = cache_mod.get_redis()
+    calls = {"n": 0}
+
+    class _DroppingRedis:
+        """第一次訂閱馬上斷線，之後照常"""
+
+        def pubsub(self, **kw):
+            calls["n"] += 1
+            ps = real.pubsub(**kw)
+            if calls["n"] == 1:
+                async def listen():
+                    raise RedisConnectionError("connection reset")
+                    yield  # pragma: no cover
+                ps.listen = listen
+            return ps
+
+        def __getattr__(self, name):
+            return getattr(real, name)
+
+    monkeypatch.setattr(cache_mod, "get_redis", lambda: _DroppingRedis())
+    w1 = PromptCache(l1_maxsize=16, l1_ttl=60)
+    w2 = PromptCache(l1_maxsize=16, l1_ttl=60)
+    w2.l1.set(w2._key("stale"), {"answer": "old"})
+    listener = asyncio.create_task(w2.listen_invalidations(backoff=0.01))
+    try:
+        for _ in range(100):
+            if calls["n"] >= 2 and w2.l1.get(w2._key("stale")) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert w2.l1.get(w2._key("stale")) is None  # 斷線期間可能漏訊息 → 重新訂閱後清空 L1
+        assert not listener.done()
+
+        await asyncio.sleep(0.05)  # 等重新訂閱建立
+        w2.l1.set(w2._key("q"), {"answer": "v1"})
+        await w1.set("q", {"answer": "v2"}, ttl=60)
+        for _ in range(50):
+            if w2.l1.get(w2._key("q")) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert w2.l1.get(w2._key("q")) is None
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
@@ -17,6 +17,7 @@ async def test_metrics_and_json_updates(client, mock_llm, lower_threshold):
     tokens_prompt = f"{ns}_tokens_prompt_total"
     tokens_completion = f"{ns}_tokens_completion_total"
     cost_total = f"{ns}_cost_usd_total"
+    stage_hist = f"{ns}_stage_latency_seconds"
 
     # Prometheus 文字格式檢查
     m = await client.get("/metrics")
@@ -24,7 +25,7 @@ async def test_metrics_and_json_updates(client, mock_llm, lower_threshold):
     text = m.text
 
     # 關鍵 metrics 名稱存在
-    for key in [req_total, latency_hist, hits_total, miss_total, tokens_prompt, tokens_completion, cost_total]:
+    for key in [req_total, latency_hist, hits_total, miss_total, tokens_prompt, tokens_completion, cost_total, stage_hist]:
         assert key in text, f"missing {key} in /metrics output"
 
     # JSON metrics 應該 > 0
@@ -39,3 +40,43 @@ async def test_metrics_and_json_updates(client, mock_llm, lower_threshold):
 
     # 允許兩種情況：prompt 或 embed 至少有一者命中
     assert (data["cache_hits"]["prompt"] > 0) or (data["cache_hits"]["embed"] > 0)
+
+
+@pytest.mark.asyncio
+async def test_llm_cost_is_split_by_route_and_tenant(client, mock_llm, monkeypatch):
+    from api.routers.ask import registry
+
+    # 關掉語意快取：兩個問題都要真的走到 LLM（fake embed 向量都一樣，開著會命中）
+    monkeypatch.setattr(settings, "ENABLE_EMBED_CACHE", False)
+    ns = settings.METRICS_NAMESPACE
+    labels = {"model": settings.OPENAI_MODEL, "route": "/ask"}
+
+    def cost(tenant):
+        return registry.get_sample_value(f"{ns}_llm_cost_usd_total", {**labels, "tenant": tenant}) or 0.0
+
+    before = cost("default")
+
+    await client.post("/ask", json={"question": "租戶 A 的問題"}, headers={"X-Tenant-ID": "tenant-a"})
+    await client.post("/ask", json={"question": "沒帶租戶的問題"})
+
+    assert cost("tenant-a") == pytest.approx(0.0005)
+    assert cost("default") - before == pytest.approx(0.0005)
+    assert registry.get_sample_value(
+        f"{ns}_llm_tokens_total", {**labels, "tenant": "tenant-a", "type": "completion"}) >= 8
+
+
+def test_explicit_env_prices_override_pricing_table(monkeypatch):
+    from services.llm import LLMService
+
+    table = LLMService._estimate_chat_cost(1000, 1000)  # 預設 gpt-4o-mini：查價格表
+    assert table == pytest.approx((1000 * 0.15 + 1000 * 0.60) / 1_000_000)
+
+    # 明確設定（等同環境變數 / .env）→ 沿用舊的 per-1K 價格
+    fields_set = set(settings.model_fields_set)
+    try:
+        monkeypatch.setattr(settings, "PROMPT_COST_PER_1K", 0.003)
+        monkeypatch.setattr(settings, "COMPLETION_COST_PER_1K", 0.006)
+        assert LLMService._estimate_chat_cost(1000, 1000) == pytest.approx(0.009)
+    finally:
+        settings.model_fields_set.clear()
+        settings.model_fields_set.update(fields_set)
@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+from core.config import settings
+from services.singleflight import RedisSingleFlight, SingleFlight
+
+
+@pytest.fixture
+def counting_llm(monkeypatch, mock_llm):
+    """慢一點的假 LLM（embed 沿用 mock_llm），並記錄上游被呼叫幾次。"""
+    import services.llm as llm_mod
+    calls = {"n": 0}
+
+    async def slow_chat(self, question: str):
+        calls["n"] += 1
+        await asyncio.sleep(0.05)
+        return llm_mod.LLMResult(answer=f"[fake answer] {question}", prompt_tokens=4, completion_tokens=8, cost_usd=0.0005)
+
+    monkeypatch.setattr(llm_mod.LLMService, "chat", slow_chat, raising=False)
+    return calls
+
+
+def _coalesced_total(scope: str) -> float:
+    from core.metrics import COALESCED_COUNTER
+    return COALESCED_COUNTER.labels(scope=scope)._value.get()
+
+
+@pytest.mark.asyncio
+async def test_100_concurrent_identical_asks_hit_upstream_once(client, counting_llm):
+    before = _coalesced_total("local")
+
+    rs = await asyncio.gather(*[client.post("/ask", json={"question": "同時湧入的問題"}) for _ in range(100)])
+
+    assert all(r.status_code == 200 for r in rs)
+    assert {r.json()["answer"] for r in rs} == {"[fake answer] 同時湧入的問題"}
+    assert counting_llm["n"] == 1
+    # 沒趕上 leader 的請求要嘛合併，要嘛之後命中 prompt cache
+    assert _coalesced_total("local") > before
+
+
+@pytest.mark.asyncio
+async def test_singleflight_off_calls_upstream_per_request(client, counting_llm, monkeypatch):
+    monkeypatch.setattr(settings, "SINGLEFLIGHT_MODE", "off", raising=False)
+    rs = await asyncio.gather(*[client.post("/ask", json={"question": "不合併"}) for _ in range(5)])
+    assert all(r.status_code == 200 for r in rs)
+    assert counting_llm["n"] == 5
+
+
+@pytest.mark.asyncio
+async def test_singleflight_shares_exceptions():
+    sf = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*[sf.do("k", boom) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert sf.inflight() == 0
+
+
+@pytest.mark.asyncio
+async def test_singleflight_leader_cancel_does_not_fail_followers():
+    sf = SingleFlight()
+    calls = {"n": 0}
+
+    async def slow():
+        calls["n"] += 1
+        await asyncio.sleep(0.05)
+        return "done"
+
+    leader = asyncio.create_task(sf.do("k", slow))
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(sf.do("k", slow)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    leader.cancel()  # leader 的 client 斷線
+
+    assert await asyncio.gather(*followers) == [("done", "local")] * 3
+    assert leader.cancelled() and calls["n"] == 1
+    assert sf.inflight() == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_singleflight_coalesces_across_workers():
+    # 兩個實例模擬兩個 worker；結果經由「快取」交給另一個 worker
+    store = {}
+    calls = {"n": 0}
+
+    async def fn():
+        calls["n"] += 1
+        await asyncio.sleep(0.05)
+        store["v"] = "answer"
+        return "answer"
+
+    async def lookup():
+        return store.get("v")
+
+    w1 = RedisSingleFlight(poll_interval=0.01)
+    w2 = RedisSingleFlight(poll_interval=0.01)
+    results = await asyncio.gather(
+        *[w1.do("k", fn, lookup=lookup) for _ in range(5)],
+        *[w2.do("k", fn, lookup=lookup) for _ in range(5)],
+    )
+
+    assert calls["n"] == 1
+    assert {v for v, _ in results} == {"answer"}
+    scopes = [scope for _, scope in results]
+    assert scopes.count(None) == 1
+    assert scopes.count("redis") == 1  # 另一個 worker 的本機 leader
+    assert scopes.count("local") == 8
@@ -0,0 +1,70 @@
+import json
+import pytest
+from core.config import settings
+
+
+@pytest.fixture
+def mock_llm_stream(monkeypatch, mock_llm):
+    """mock 掉 LLMService.chat_stream：分三段吐出答案，最後給 LLMResult。"""
+    import services.llm as llm_mod
+
+    async def fake_chat_stream(self, question: str):
+        pieces = ["[fake ", "stream] ", question]
+        for p in pieces:
+            yield p
+        yield llm_mod.LLMResult(answer="".join(pieces), prompt_tokens=4, completion_tokens=8, cost_usd=0.0005)
+
+    monkeypatch.setattr(llm_mod.LLMService, "chat_stream", fake_chat_stream, raising=False)
+    return True
+
+
+def _events(text: str):
+    return [json.loads(line[len("data: "):]) for line in text.splitlines() if line.startswith("data: ")]
+
+
+@pytest.mark.asyncio
+async def test_ask_stream_forwards_tokens_then_writes_cache(client, mock_llm_stream):
+    r1 = await client.post("/ask/stream", json={"question": "串流問題"})
+    assert r1.status_code == 200
+    assert r1.headers["content-type"].startswith("text/event-stream")
+    ev1 = _events(r1.text)
+    assert [e["type"] for e in ev1] == ["token", "token", "token", "done"]
+    assert "".join(e["text"] for e in ev1[:-1]) == "[fake stream] 串流問題"
+    assert ev1[-1]["cache_hit"] is False and ev1[-1]["answer"] == "[fake stream] 串流問題"
+
+    # 串流結束後已回寫 Prompt Cache → /ask 與 /ask/stream 都命中
+    r2 = await client.post("/ask", json={"question": "串流問題"})
+    assert r2.json()["cache_hit"] is True
+
+    r3 = await client.post("/ask/stream", json={"question": "串流問題"})
+    ev3 = _events(r3.text)
+    assert len(ev3) == 1
+    assert ev3[0]["type"] == "done" and ev3[0]["cache_hit"] is True
+    assert ev3[0]["answer"] == "[fake stream] 串流問題"
+
+
+@pytest.mark.asyncio
+async def test_ask_stream_error_does_not_write_cache(client, mock_llm, monkeypatch):
+    import services.llm as llm_mod
+
+    async def broken_stream(self, question: str):
+        yield "partial "
+        raise RuntimeError("upstream reset")
+
+    monkeypatch.setattr(llm_mod.LLMService, "chat_stream", broken_stream, raising=False)
+
+    r = await client.post("/ask/stream", json={"question": "會斷線的問題"})
+    ev = _events(r.text)
+    assert ev[0] == {"type": "token", "text": "partial "}
+    assert ev[-1]["type"] == "error"
+
+    from api.routers.ask import prompt_cache
+    assert await prompt_cache.get("會斷線的問題") is None
+
+
+@pytest.mark.asyncio
+async def test_ask_stream_records_ttft(client, mock_llm_stream):
+    await client.post("/ask/stream", json={"question": "量 TTFT"})
+    text = (await client.get("/metrics")).text
+    assert f'{settings.METRICS_NAMESPACE}_time_to_first_token_seconds_count{{route="/ask/stream"}}' in text
+    assert f'{settings.METRICS_NAMESPACE}_request_latency_seconds_count{{route="/ask/stream"}}' in text
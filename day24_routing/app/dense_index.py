@@ -0,0 +1,90 @@
+# app/dense_index.py
+"""
+FAISS dense 索引（HybridRetriever 的 dense 那一路）
+
+- IndexIDMap2(IndexFlatIP)：向量已 l2 正規化，內積 = cosine；精確搜尋，不用訓練
+- 每篇文件一個遞增的 int64 label；upsert 時先 remove_ids 舊 label 再加新的，delete 直接 remove_ids
+- embed 在鎖外做（最花時間的部分）；FAISS 索引不能一邊改一邊查，所以 search 與寫入共用同一把鎖
+"""
+import threading
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from .embedder import Embedder
+
+Hit = Tuple[str, str, float]  # (doc id, text, cosine)
+
+_EMBED_BATCH = 1024
+
+
+class DenseIndex:
+    def __init__(self, embedder: Embedder):
+        self.embedder = embedder
+        self._lock = threading.Lock()
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(embedder.dim))
+        self._docs: Dict[int, Tuple[str, str]] = {}  # label → (doc id, text)
+        self._labels: Dict[str, int] = {}  # doc id → label
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._labels
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.embedder.dim), dtype=np.float32)
+        return np.vstack([self.embedder.embed(texts[i:i + _EMBED_BATCH]) for i in range(0, len(texts), _EMBED_BATCH)])
+
+    def build(self, docs: Iterable[Tuple[str, str]]) -> None:
+        """整批重建；同一個 id 出現多次時以最後一筆為準"""
+        docs = list(dict(docs).items())
+        vectors = self._embed([text for _, text in docs])
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.embedder.dim))
+        index.add_with_ids(vectors, np.arange(len(docs), dtype=np.int64))
+        with self._lock:
+            self._index, self._next = index, len(docs)
+            self._docs = dict(enumerate(docs))
+            self._labels = {doc_id: i for i, (doc_id, _) in enumerate(docs)}
+
+    def upsert(self, docs: Iterable[Tuple[str, str]]) -> int:
+        """新增文件；id 已存在就取代。回傳寫入筆數"""
+        docs = list(dict(docs).items())
+        if not docs:
+            return 0
+        vectors = self._embed([text for _, text in docs])
+        with self._lock:
+            self._remove([doc_id for doc_id, _ in docs])
+            labels = np.arange(self._next, self._next + len(docs), dtype=np.int64)
+            self._index.add_with_ids(vectors, labels)
+            self._next += len(docs)
+            for label, doc in zip(labels.tolist(), docs):
+                self._docs[label] = doc
+                self._labels[doc[0]] = label
+        return len(docs)
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        with self._lock:
+            return self._remove(doc_ids)
+
+    def _remove(self, doc_ids: Iterable[str]) -> int:
+        labels = [self._labels.pop(doc_id) for doc_id in doc_ids if doc_id in self._labels]
+        for label in labels:
+            del self._docs[label]
+        if labels:
+            self._index.remove_ids(np.asarray(labels, dtype=np.int64))
+        return len(labels)
+
+    def search(self, vectors: np.ndarray, k: int) -> List[List[Hit]]:
+        """每個 query 向量的前 k 篇（cosine 由高到低）"""
+        if len(vectors) == 0:
+            return []
+        with self._lock:
+            if not self._labels:
+                return [[] for _ in range(len(vectors))]
+            scores, labels = self._index.search(np.ascontiguousarray(vectors, dtype=np.float32), min(k, len(self._labels)))
+            return [[(*self._docs[label], float(score)) for label, score in zip(row_l.tolist(), row_s.tolist())
+                     if label >= 0] for row_l, row_s in zip(labels, scores)]
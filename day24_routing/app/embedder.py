@@ -0,0 +1,111 @@
+# app/embedder.py
+"""
+Dense 檢索用的文字 → 向量（HybridRetriever 的 dense 那一路）
+
+- 有裝 sentence-transformers：用 DENSE_MODEL（預設多語 MiniLM，中文可用），向量已 l2 正規化，內積 = cosine
+- 沒裝（或模型載不到）：退回 HashingEmbedder —— 字元 1–3 gram 做 feature hashing 成 DENSE_DIM 維，
+  不需要下載模型也不用 API key；抓的是字面相似（jieba 切法不同、錯字、少字時仍對得上），不是語意
+- query 向量有 LRU（DENSE_CACHE_SIZE），重複的 query 不會一再 encode
+"""
+import abc
+import functools
+import logging
+import os
+from typing import Sequence
+
+import numpy as np
+
+log = logging.getLogger("embedder")
+
+DENSE_MODEL = os.getenv("DENSE_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+DENSE_DIM = int(os.getenv("DENSE_DIM", "256"))
+DENSE_CACHE_SIZE = int(os.getenv("DENSE_CACHE_SIZE", "4096"))
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)  # 64-bit golden ratio，拿來打散 n-gram 的 hash
+
+
+class Embedder(abc.ABC):
+    """embed(texts) → (n, dim) float32，每列 l2 正規化；embed_query 帶 LRU"""
+
+    name = "base"
+    dim = 0
+
+    def __init__(self, cache_size: int = DENSE_CACHE_SIZE) -> None:
+        self._query = functools.lru_cache(maxsize=cache_size)(self._query_uncached)
+
+    @abc.abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        ...
+
+    def _query_uncached(self, text: str) -> np.ndarray:
+        v = self.embed([text])[0]
+        v.flags.writeable = False  # 快取裡的向量大家共用，不能被改
+        return v
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._query(text)
+
+    def cache_info(self):
+        return self._query.cache_info()
+
+    def cache_clear(self) -> None:
+        self._query.cache_clear()
+
+
+class HashingEmbedder(Embedder):
+    """字元 n-gram（小寫、空白壓成一個）→ signed feature hashing → l2 正規化"""
+
+    name = "hashing"
+
+    def __init__(self, dim: int = DENSE_DIM, ngrams: Sequence[int] = (1, 2, 3), cache_size: int = DENSE_CACHE_SIZE):
+        super().__init__(cache_size)
+        self.dim, self.ngrams = dim, tuple(ngrams)
+
+    def _vector(self, text: str) -> np.ndarray:
+        codes = np.frombuffer(" ".join(text.lower().split()).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        out = np.zeros(self.dim, dtype=np.float32)
+        for n in self.ngrams:
+            if len(codes) < n:
+                break
+            h = np.full(len(codes) - n + 1, n, dtype=np.uint64)
+            for i in range(n):  # 多項式 rolling hash：(((n · M + c0) · M + c1) · M + …)
+                h = h * _MIX + codes[i:len(codes) - n + 1 + i]
+            h ^= h >> np.uint64(31)
+            h *= _MIX
+            sign = np.where(h >> np.uint64(63), -1.0, 1.0)
+            out += np.bincount((h % np.uint64(self.dim)).astype(np.int64), weights=sign, minlength=self.dim)
+        norm = np.linalg.norm(out)
+        return out / norm if norm > 0 else out
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            out[i] = self._vector(text)
+        return out
+
+
+class SentenceTransformerEmbedder(Embedder):
+    name = "sentence-transformers"
+
+    def __init__(self, model: str = DENSE_MODEL, batch_size: int = 64, cache_size: int = DENSE_CACHE_SIZE):
+        super().__init__(cache_size)
+        from sentence_transformers import SentenceTransformer
+
+        self.model, self.batch_size = SentenceTransformer(model), batch_size
+        self.name = model
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return self.model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False).astype(np.float32, copy=False)
+
+
+def get_embedder(model: str = DENSE_MODEL) -> Embedder:
+    """DENSE_MODEL=hashing（或空字串）直接用 HashingEmbedder；否則試 sentence-transformers，失敗就退回 hashing"""
+    if model in ("", "hashing"):
+        return HashingEmbedder()
+    try:
+        return SentenceTransformerEmbedder(model)
+    except Exception as e:  # 沒裝 sentence-transformers / 模型下載失敗
+        log.info("sentence-transformers unavailable for model=%s (%s); using HashingEmbedder", model, e)
+        return HashingEmbedder()
@@ -0,0 +1,164 @@
+# app/hybrid.py
+"""
+Hybrid 檢索：BM25（sparse）+ FAISS（dense）兩路同時跑，融合成一份 top-k 與一組 RetrievalSignals 給 router.decide
+
+- sparse：SimpleRetriever 的 TfidfIndex 上直接算 BM25（同一份原始詞頻與倒排；增量更新、mmap snapshot 都沿用）
+- dense ：DenseIndex（FAISS 內積 = cosine），向量來自 app/embedder.py
+- 兩路並行：dense 丟到 thread pool，sparse 在呼叫端 thread 跑，延遲 ≈ max(兩路) 而不是相加
+  （jieba 分詞、hashing embedding 是 Python 程式碼要搶 GIL；FAISS 搜尋、scipy 矩陣運算、遠端 embedding API 會放開）
+- 融合（HYBRID_FUSION）：
+    rrf     ：Σ w / (HYBRID_RRF_K + rank)，只看名次，兩路分數尺度不同也不用校正（預設）
+    weighted：直接用下面的 hybrid 分數排序
+- 每篇文件回傳的 score（也是 max_score / avg_topk 的來源）一律是校正過的 hybrid 分數：
+    (1 - w) · BM25 / BM25 上限 + w · max(cosine, 0)，w = HYBRID_DENSE_WEIGHT，落在 [0, 1)
+  BM25 上限是這個 query 在 tf → ∞ 時的分數，所以不同 query 之間可以比，router 的門檻才有意義
+  （尺度跟 TF-IDF cosine 不同，換成 hybrid 時要重新調 ROUTER_THRESH_MAX / ROUTER_THRESH_AVG）
+- 兩路各取前 HYBRID_CANDIDATES 篇來融合；dense 低於 HYBRID_DENSE_MIN 的不算命中（不參與融合、不算進 num_docs）
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .dense_index import DenseIndex, Hit
+from .embedder import Embedder, get_embedder
+from .models import ContextChunk, RetrievalSignals
+from .retriever import SimpleRetriever
+from .tracing import span, traced
+
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "0.5"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+HYBRID_DENSE_MIN = float(os.getenv("HYBRID_DENSE_MIN", "0.2"))
+HYBRID_THREADS = int(os.getenv("HYBRID_THREADS", "4"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(HYBRID_THREADS, thread_name_prefix="hybrid-dense")
+    return _pool
+
+
+class HybridRetriever:
+    """介面與 SimpleRetriever 相同（search / search_batch / upsert / delete / reload），main.py 可以直接換"""
+
+    def __init__(self, kb_path: str, embedder: Optional[Embedder] = None, fusion: str = HYBRID_FUSION,
+                 dense_weight: float = HYBRID_DENSE_WEIGHT, candidates: int = HYBRID_CANDIDATES,
+                 dense_min: float = HYBRID_DENSE_MIN, parallel: bool = True, **sparse_kwargs):
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"unknown fusion: {fusion!r} (expected 'rrf' or 'weighted')")
+        self.fusion, self.dense_weight = fusion, dense_weight
+        self.candidates, self.dense_min, self.parallel = candidates, dense_min, parallel
+        self.sparse = SimpleRetriever(kb_path, **sparse_kwargs)
+        self.dense = DenseIndex(embedder or get_embedder())
+        self._build_dense()
+
+    def _build_dense(self) -> None:
+        # 以 sparse 索引的內容為準（可能是 mmap 載入的 snapshot），兩路的文件集合一致
+        snap = self.sparse.index.snapshot()
+        self.dense.build(snap.doc(i) for i in np.flatnonzero(snap.alive).tolist())
+
+    def reload(self) -> None:
+        self.sparse.reload()
+        self._build_dense()
+
+    def upsert(self, docs: Iterable[Tuple[str, str]]) -> int:
+        docs = list(docs)
+        self.dense.upsert(docs)
+        return self.sparse.upsert(docs)
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        doc_ids = list(doc_ids)
+        self.dense.delete(doc_ids)
+        return self.sparse.delete(doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.sparse)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.sparse
+
+    @traced("retrieve")
+    def search(self, query: str, top_k: int = 3) -> Tuple[List[ContextChunk], RetrievalSignals]:
+        return self._search_many([query], top_k)[0]
+
+    @traced("retrieve")
+    def search_batch(self, queries: Sequence[str], top_k: int = 3) -> List[Tuple[List[ContextChunk], RetrievalSignals]]:
+        return self._search_many(list(queries), top_k)
+
+    def _search_many(self, queries: List[str], top_k: int) -> List[Tuple[List[ContextChunk], RetrievalSignals]]:
+        if not queries:
+            return []
+        n_cand = max(top_k, self.candidates)
+        if self.parallel:
+            # copy_context：dense 那一路的 span 也記進這個請求的 trace
+            future = _executor().submit(contextvars.copy_context().run, self._dense_leg, queries, n_cand)
+            sparse = self._sparse_leg(queries, n_cand)
+            dense = future.result()
+        else:
+            sparse = self._sparse_leg(queries, n_cand)
+            dense = self._dense_leg(queries, n_cand)
+        return [self._fuse(s_hits, s_num, d_hits, top_k) for (s_hits, s_num), d_hits in zip(sparse, dense)]
+
+    def _sparse_leg(self, queries: List[str], n_cand: int) -> List[Tuple[List[Hit], int]]:
+        """每個 query：(前 n_cand 篇 (id, text, BM25 / 上限)，命中篇數)"""
+        with span("bm25"):
+            snap = self.sparse.index.snapshot()
+            scores, upper = snap.bm25_scores(queries, BM25_K1, BM25_B)
+            out = []
+            for row in range(len(queries)):
+                lo, hi = scores.indptr[row], scores.indptr[row + 1]
+                idx, val = scores.indices[lo:hi], scores.data[lo:hi]
+                if len(val) > n_cand:
+                    part = np.argpartition(-val, n_cand - 1)[:n_cand]
+                    idx, val = idx[part], val[part]
+                order = np.lexsort((idx, -val))
+                val = val[order] / upper[row] if upper[row] > 0 else val[order]
+                out.append(([(*snap.doc(i), v) for i, v in zip(idx[order].tolist(), val.tolist())], int(hi - lo)))
+            return out
+
+    def _dense_leg(self, queries: List[str], n_cand: int) -> List[List[Hit]]:
+        with span("dense"):
+            vectors = np.vstack([self.dense.embedder.embed_query(q) for q in queries])
+            hits = self.dense.search(vectors, n_cand)
+        return [[h for h in row if h[2] >= self.dense_min] for row in hits]
+
+    def _fuse(self, s_hits: List[Hit], s_num: int, d_hits: List[Hit], top_k: int
+              ) -> Tuple[List[ContextChunk], RetrievalSignals]:
+        w = self.dense_weight
+        texts: Dict[str, str] = {}
+        hybrid: Dict[str, float] = {}
+        rrf: Dict[str, float] = {}
+        for leg_w, hits in ((1.0 - w, s_hits), (w, d_hits)):
+            for rank, (doc_id, text, score) in enumerate(hits, start=1):
+                texts[doc_id] = text
+                hybrid[doc_id] = hybrid.get(doc_id, 0.0) + leg_w * max(score, 0.0)
+                rrf[doc_id] = rrf.get(doc_id, 0.0) + leg_w / (HYBRID_RRF_K + rank)
+        key = rrf if self.fusion == "rrf" else hybrid
+        # 同分時 hybrid 分數高的先，再來依出現順序（sparse 先於 dense），結果穩定
+        order = sorted(texts, key=lambda d: (-key[d], -hybrid[d]))[:top_k]
+
+        chunks = [ContextChunk(id=d, text=texts[d], score=hybrid[d]) for d in order]
+        scores = [c.score for c in chunks]
+        positive = [s for s in scores if s > 0]
+        signals = RetrievalSignals(
+            max_score=max(scores, default=0.0),
+            avg_topk=sum(positive) / len(positive) if positive else 0.0,
+            num_docs=max(s_num, len(d_hits)),
+            context_len=sum(len(c.text) for c in chunks),
+            sparse_max=s_hits[0][2] if s_hits else 0.0,
+            dense_max=d_hits[0][2] if d_hits else 0.0,
+        )
+        return chunks, signals
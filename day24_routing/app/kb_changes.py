@@ -0,0 +1,185 @@
+# app/kb_changes.py
+"""
+/kb/docs 的變更日誌（JSON Lines，KB_CHANGES_PATH，預設 {KB_PATH}.changes.jsonl）
+
+每個 worker（uvicorn --workers N）各有一份行程內索引。/kb/docs 的 upsert / delete、/kb/reload 不直接改索引，
+而是先 append 一行到這個檔；每個 worker 處理請求前讀「上次讀到的位置」之後的新行、照順序套用，
+所以不管請求落在哪個 worker，所有 worker 都會套用同樣的變更。重啟時載入 kb.jsonl（或 snapshot）後把整個日誌重播一次，
+變更不會因為重啟消失。
+
+- 一行一個事件：{"op": "upsert", "docs": [[id, text], ...]} / {"op": "delete", "ids": [...]} / {"op": "reload"}
+- 目前的 KB = kb.jsonl + 日誌裡所有 upsert / delete（照順序）；reload = 重讀 kb.jsonl 再重播在它之前的變更
+- 套用是冪等的（upsert 同 id 就取代、刪不存在的 id 略過）：snapshot 已經含某些變更也沒關係
+- 沒有新事件時只多一次 os.stat
+- append 先拿 {path}.lock 的 flock，多個 worker 同時寫也不會交錯
+- scripts/compact_kb.py 把日誌併回 kb.jsonl 並換一個空的日誌檔；各 worker 看到換檔（inode 變了 / 檔案變短）
+  就重讀 kb.jsonl、從頭讀新日誌
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：沒有 flock，只適用單一 worker
+    fcntl = None
+
+log = logging.getLogger("kb_changes")
+
+Event = Dict[str, Any]
+
+
+@contextmanager
+def locked(path: str) -> Iterator[None]:
+    """跨行程的排他鎖（{path}.lock）；append 與 compact 共用"""
+    with open(f"{path}.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_events(path: str, start: int = 0, end: Optional[int] = None) -> Tuple[List[Tuple[Event, int]], int, Optional[int]]:
+    """
+    讀 [start, end) 之間完整的行 → ([(事件, 該行結尾的位置)], 讀到的位置, inode)
+    寫到一半（沒有換行）的最後一行不算，下次再讀；壞掉的行略過
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return [], 0, None
+    with f:
+        ino = os.fstat(f.fileno()).st_ino
+        f.seek(start)
+        data = f.read() if end is None else f.read(max(end - start, 0))
+    cut = data.rfind(b"\n") + 1
+    events, pos = [], start
+    for line in data[:cut].splitlines(keepends=True):
+        pos += len(line)
+        try:
+            event = json.loads(line)
+        except ValueError:
+            log.warning("skipping bad line in %s at %d", path, pos - len(line))
+            continue
+        if isinstance(event, dict) and event.get("op") in ("upsert", "delete", "reload"):
+            events.append((event, pos))
+    return events, start + cut, ino
+
+
+class KBChangeLog:
+    """把 /kb 的寫入變成日誌事件，並把日誌裡的新事件套用到這個 worker 的 retriever"""
+
+    def __init__(self, path: str, retriever) -> None:
+        self.path = path
+        self.retriever = retriever
+        self._lock = threading.Lock()
+        self._ino: Optional[int] = None
+        self._offset = 0
+
+    # ---- 寫入（任何一個 worker） ----
+    def upsert(self, docs: Iterable[Tuple[str, str]]) -> int:
+        docs = [[doc_id, text] for doc_id, text in docs]
+        self._append({"op": "upsert", "docs": docs})
+        return len({doc_id for doc_id, _ in docs})
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        """只記錄這個 worker 目前看得到的 id，回傳筆數（0 = 都不存在）"""
+        self.sync()
+        ids = [doc_id for doc_id in doc_ids if doc_id in self.retriever]
+        if ids:
+            self._append({"op": "delete", "ids": ids})
+        return len(ids)
+
+    def reload(self) -> None:
+        self._append({"op": "reload"})
+
+    def _append(self, event: Event) -> None:
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        with locked(self.path):
+            with open(self.path, "ab") as f:
+                f.write(line)
+        self.sync()  # 自己的事件也走同一條路套用：和其他 worker 的事件順序一致
+
+    # ---- 套用（每個 worker） ----
+    def replay(self) -> int:
+        """啟動時：retriever 剛從 kb.jsonl / snapshot 載入，重播整個日誌（reload 事件略過），回傳事件數"""
+        with self._lock:
+            events, self._offset, self._ino = read_events(self.path)
+            self._apply([e for e, _ in events if e["op"] != "reload"])
+            return len(events)
+
+    def sync(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is not None and st.st_ino == self._ino and st.st_size == self._offset:
+            return  # 沒有新事件
+        with self._lock:
+            if st is None or (self._ino is not None and st.st_ino != self._ino) or st.st_size < self._offset:
+                if self._ino is not None:
+                    # 日誌被 compact（換檔）或刪掉：kb.jsonl 已含之前的變更，整批重建後從頭讀
+                    log.info("change log %s was replaced; rebuilding from the KB file", self.path)
+                    self.retriever.reload()
+                    self._ino, self._offset = None, 0
+                if st is None:
+                    return
+            events, offset, ino = read_events(self.path, self._offset)
+            if self._ino is None:
+                self._ino = ino
+            for event, pos in events:
+                if event["op"] == "reload":
+                    # 重讀 kb.jsonl，再重播這個 reload 之前的所有變更
+                    self.retriever.reload()
+                    before, _, _ = read_events(self.path, 0, pos)
+                    self._apply([e for e, _ in before if e["op"] != "reload"])
+                else:
+                    self._apply([event])
+            self._offset = offset
+
+    def _apply(self, events: List[Event]) -> None:
+        for event in events:
+            if event["op"] == "upsert":
+                self.retriever.upsert((doc_id, text) for doc_id, text in event["docs"])
+            elif event["op"] == "delete":
+                self.retriever.delete(event["ids"])
+
+
+def compact(kb_path: str, path: str) -> Dict[str, int]:
+    """
+    把日誌裡的變更併回 kb.jsonl，換上一個空的日誌檔（新的 inode），回傳 {"events", "docs"}
+    全程拿著 append 用的鎖：併的過程中不會有新事件寫進舊檔
+    """
+    with locked(path):
+        docs: Dict[str, str] = {}
+        if os.path.exists(kb_path):
+            with open(kb_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        obj = json.loads(line)
+                        docs[obj["id"]] = obj["text"]
+        events, _, _ = read_events(path)
+        for event, _ in events:
+            if event["op"] == "upsert":
+                docs.update((doc_id, text) for doc_id, text in event["docs"])
+            elif event["op"] == "delete":
+                for doc_id in event["ids"]:
+                    docs.pop(doc_id, None)
+
+        tmp = f"{kb_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for doc_id, text in docs.items():
+                f.write(json.dumps({"id": doc_id, "text": text}, ensure_ascii=False) + "\n")
+        os.replace(tmp, kb_path)
+        # 日誌最後換：中途掛掉的話，新的 kb.jsonl + 舊日誌重播（冪等）結果還是一樣
+        open(f"{path}.tmp", "wb").close()
+        os.replace(f"{path}.tmp", path)
+    return {"events": len(events), "docs": len(docs)}
@@ -1,7 +1,15 @@
 # app/llm_small.py
 import os
 
+from . import accounting
+from .tracing import traced
+
+SMALL_MODEL_NAME = os.getenv("SMALL_MODEL_NAME", "small-model")
+# 第三條路（router 選 large_model）：預設用價格表裡的 gpt-4o 計價
+LARGE_MODEL_NAME = os.getenv("LARGE_MODEL_NAME", "gpt-4o")
 SMALL_MODEL_PRICE_PER_1K = float(os.getenv("SMALL_MODEL_PRICE_PER_1K", "0"))
+# 小模型不在價格表裡 → 用 SMALL_MODEL_PRICE_PER_1K（prompt / completion 同價）；設成表裡的模型名稱就用表上的價格
+accounting.configure(default_price=accounting.Price(SMALL_MODEL_PRICE_PER_1K * 1000, SMALL_MODEL_PRICE_PER_1K * 1000))
 
 def _get(obj, name, default=None):
     # 同時支援 Pydantic 物件與 dict
@@ -9,12 +17,16 @@ def _get(obj, name, default=None):
         return obj.get(name, default)
     return getattr(obj, name, default)
 
-def _estimate_tokens(text: str) -> int:
-    ascii_words = len([w for w in text.split() if any(c.isascii() for c in w)])
-    cjk_chars = sum(1 for c in text if "\u4e00" <= c <= "\u9fff")
-    return ascii_words + cjk_chars
-
+@traced("llm")
 def answer_with_small_model(query: str, contexts):
+    return _answer(query, contexts, SMALL_MODEL_NAME)
+
+@traced("llm")
+def answer_with_large_model(query: str, contexts):
+    # demo：和小模型同一套模板，只有計價不同
+    return _answer(query, contexts, LARGE_MODEL_NAME)
+
+def _answer(query: str, contexts, model: str):
     # 「完全沒命中」= contexts 為空 或 全部 score<=0
     no_hit = (not contexts) or all((_get(c, "score", 0) or 0) <= 0 for c in contexts)
 
@@ -26,6 +38,7 @@ def answer_with_small_model(query: str, contexts):
         ctx_text = _get(top, "text", "")
         ans = f"根據知識庫：{ctx_text}"
 
-    used_tokens = _estimate_tokens(query) + _estimate_tokens(ans)
-    cost = (used_tokens / 1000.0) * SMALL_MODEL_PRICE_PER_1K
-    return ans, used_tokens, cost
+    prompt_tokens = accounting.count_tokens(query, model)
+    completion_tokens = accounting.count_tokens(ans, model)
+    cost = accounting.pricing.cost(model, prompt_tokens, completion_tokens)
+    return ans, prompt_tokens + completion_tokens, cost
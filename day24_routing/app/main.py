@@ -1,25 +1,81 @@
+import json
+import logging
 import os
-from fastapi import FastAPI
+import time
+import uuid
+from contextlib import asynccontextmanager
+from logging.handlers import RotatingFileHandler
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
-from .models import AskRequest, AskResponse
+from .models import AskRequest, AskResponse, Feedback, KBDoc
 from .retriever import SimpleRetriever
+from .kb_changes import KBChangeLog
 from .router import decide
-from .llm_small import answer_with_small_model
-from .metrics import track_request, ROUTE_DECISION, TOKENS, COST
+from .llm_small import LARGE_MODEL_NAME, SMALL_MODEL_NAME, answer_with_large_model, answer_with_small_model
+from .metrics import track_request, ROUTE_DECISION
+from .prom_multiprocess import mark_worker_exit, render_latest
+from . import accounting, tracing
 
 KB_PATH = os.getenv("KB_PATH", "data/kb.jsonl")
+# tfidf：jieba + TF-IDF cosine（預設）；hybrid：BM25 + FAISS dense 並行後融合（需要 faiss-cpu，見 app/hybrid.py）
+RETRIEVER = os.getenv("RETRIEVER", "tfidf")
+# /kb/docs、/kb/reload 的變更日誌：所有 worker 共用、重啟後重播（見 app/kb_changes.py）
+KB_CHANGES_PATH = os.getenv("KB_CHANGES_PATH") or f"{KB_PATH}.changes.jsonl"
+# 決策日誌（JSON lines）：每個 /ask 的特徵、路由、成本、延遲，加上 /feedback 的結果；
+# scripts/train_policy.py 拿來訓練路由策略、scripts/replay_policy.py 拿來比較策略。沒設就不寫
+ROUTER_LOG_PATH = os.getenv("ROUTER_LOG_PATH", "")
 
-app = FastAPI(title="Day24 Routing Demo", version="0.1.0")
+# LogRecord 內建屬性；其他屬性（decision_log.info(..., extra={...}) 帶進來的）都當成 JSON 欄位
+_STD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+               "msg": record.getMessage()}
+        out.update((k, v) for k, v in record.__dict__.items() if k not in _STD_ATTRS)
+        return json.dumps(out, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+decision_log = logging.getLogger("router.decisions")
+decision_log.propagate = False
+decision_log.setLevel(logging.INFO)
+decision_log_handler = None
+if ROUTER_LOG_PATH:
+    # /ask、/feedback 是同步 endpoint，跑在 threadpool：一行一次 write 不會卡住 event loop
+    # 每個 worker 寫自己的 {ROUTER_LOG_PATH}.{pid}：uvicorn --workers N 時多個 RotatingFileHandler 輪替同一個檔
+    # 會互相蓋掉備份、寫進已改名的舊檔；訓練 / replay 用 --log {ROUTER_LOG_PATH}* 一起讀（依 request_id 合併）
+    decision_log_handler = RotatingFileHandler(f"{ROUTER_LOG_PATH}.{os.getpid()}", maxBytes=50_000_000,
+                                               backupCount=5, encoding="utf-8", delay=True)
+    decision_log_handler.setFormatter(_JsonFormatter())
+    decision_log.addHandler(decision_log_handler)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    tracing.shutdown()
+    if decision_log_handler is not None:
+        decision_log_handler.close()
+    # 多 worker metrics（PROMETHEUS_MULTIPROC_DIR）：清掉本 worker 的 live gauge 檔
+    mark_worker_exit()
+
+app = FastAPI(title="Day24 Routing Demo", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"],
 )
 
-retriever = SimpleRetriever(KB_PATH)
+if RETRIEVER == "hybrid":
+    from .hybrid import HybridRetriever
+    retriever = HybridRetriever(KB_PATH)
+else:
+    retriever = SimpleRetriever(KB_PATH)
+kb_changes = KBChangeLog(KB_CHANGES_PATH, retriever)
+kb_changes.replay()
 
 @app.get("/healthz")
 def healthz():
@@ -27,33 +83,71 @@ def healthz():
 
 @app.get("/metrics")
 def metrics():
-    return PlainTextResponse(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    # 有設 PROMETHEUS_MULTIPROC_DIR 時是所有 worker 的加總
+    data, content_type = render_latest()
+    return PlainTextResponse(data, media_type=content_type)
+
+@app.post("/kb/docs")
+def upsert_docs(docs: List[KBDoc]):
+    # 寫進變更日誌再套用：每個 worker 都會套用、重啟後重播；
+    # 增量更新索引只對新文件分詞，/ask 不用等也不會讀到更新到一半的索引
+    n = kb_changes.upsert((d.id, d.text) for d in docs)
+    return {"upserted": n, "docs": len(retriever)}
+
+@app.delete("/kb/docs/{doc_id}")
+def delete_doc(doc_id: str):
+    if not kb_changes.delete([doc_id]):
+        raise HTTPException(status_code=404, detail=f"doc not found: {doc_id}")
+    return {"deleted": doc_id, "docs": len(retriever)}
+
+@app.post("/kb/reload")
+def reload_kb():
+    # 重新讀 KB_PATH 整批重建（新的詞彙表），再重播變更日誌；其他 worker 在下一個請求時跟著重建
+    kb_changes.reload()
+    return {"docs": len(retriever)}
 
 @track_request
 @app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest):
+def ask(req: AskRequest, x_tenant_id: Optional[str] = Header(None)):
+    request_id = uuid.uuid4().hex
+    start = time.perf_counter()
+    kb_changes.sync()  # 套用其他 worker 寫進變更日誌的 /kb 更新（沒有新事件時只是一次 stat）
     contexts, signals = retriever.search(req.query, top_k=req.top_k)
     route = decide(signals)
 
+    # token 數走 accounting 的 LRU：llm_small 會再算同一段 query，那次是快取命中
+    prompt_tokens = accounting.count_tokens(req.query, SMALL_MODEL_NAME)
     if route.target == "kb" and contexts:
         # 直接用 KB 第一名回覆（demo）
         answer = contexts[0].text
-        usage_tokens_est = int(len(req.query) / 4 + len(answer) / 4)
-        cost_usd_est = 0.0  # KB 回覆假設不花 API 費
+        model, cost_usd_est = "kb", 0.0  # KB 回覆假設不花 API 費
+        usage_tokens_est = prompt_tokens + accounting.count_tokens(answer, SMALL_MODEL_NAME)
+    elif route.target == "large_model":
+        answer, usage_tokens_est, cost_usd_est = answer_with_large_model(req.query, contexts)
+        model = LARGE_MODEL_NAME
     else:
-        answer, tokens, cost = answer_with_small_model(req.query, contexts)
-        usage_tokens_est = tokens
-        cost_usd_est = cost
+        answer, usage_tokens_est, cost_usd_est = answer_with_small_model(req.query, contexts)
+        model = SMALL_MODEL_NAME
 
     ROUTE_DECISION.labels(route.target).inc()
-    TOKENS.labels("prompt").inc(int(len(req.query) / 4))
-    TOKENS.labels("completion").inc(int(len(answer) / 4))
-    COST.inc(cost_usd_est)
+    accounting.record(model, prompt_tokens, usage_tokens_est - prompt_tokens,
+                      route=route.target, tenant=x_tenant_id, cost=cost_usd_est)
+    decision_log.info("route", extra={
+        "request_id": request_id, "route": route.target, "features": route.features, "model": model,
+        "cost_usd": cost_usd_est, "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+    })
 
     return AskResponse(
+        request_id=request_id,
         answer=answer,
         route=route,
         contexts=contexts,
         usage_tokens_est=usage_tokens_est,
         cost_usd_est=cost_usd_est,
     )
+
+@app.post("/feedback")
+def feedback(fb: Feedback):
+    # 回答有沒有解決問題；和同一個 request_id 的決策紀錄 join 起來就是路由策略的訓練資料
+    decision_log.info("feedback", extra={"request_id": fb.request_id, "ok": fb.ok})
+    return {"recorded": decision_log_handler is not None}
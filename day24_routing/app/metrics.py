@@ -2,15 +2,27 @@ import time
 from typing import Callable, Any, Dict
 from prometheus_client import Counter, Histogram
 
+from . import accounting, tracing
+
 REQUESTS = Counter("day24_requests_total", "Total /ask requests")
 ROUTE_DECISION = Counter("day24_route_decision_total", "Routing target", ["target"])
-TOKENS = Counter("day24_tokens_total", "Estimated tokens used", ["role"])  # role: prompt|completion
-COST = Counter("day24_cost_usd_total", "Estimated USD cost")
+TOKENS = Counter("day24_tokens_total", "Estimated tokens used", ["model", "route", "tenant", "role"])  # role: prompt|completion
+COST = Counter("day24_cost_usd_total", "Estimated USD cost", ["model", "route", "tenant"])
 LATENCY = Histogram(
     "day24_request_latency_seconds",
     "Request latency",
     buckets=(0.01, 0.03, 0.1, 0.3, 1, 3, 10)
 )
+# 各階段（retrieve / llm）延遲；TRACING_EXPORTER 有設時另外匯出 OpenTelemetry span（見 tracing.py）
+STAGE_LATENCY = Histogram(
+    "day24_stage_latency_seconds",
+    "Per-stage latency",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1, 3)
+)
+tracing.configure(histogram=STAGE_LATENCY)
+# token / 成本由 accounting.record() 累加（價格表、tokenizer 見 accounting.py）
+accounting.configure(cost_counter=COST, token_counter=TOKENS, kind_label="role")
 
 def track_request(func: Callable[..., Any]):
     def wrapper(*args, **kwargs):
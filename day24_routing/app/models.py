@@ -5,6 +5,10 @@ class AskRequest(BaseModel):
     query: str = Field(..., description="User question")
     top_k: int = Field(3, ge=1, le=10, description="Retriever top-k")
 
+class KBDoc(BaseModel):
+    id: str = Field(..., description="Document id（已存在就取代）")
+    text: str
+
 class ContextChunk(BaseModel):
     id: str
     text: str
@@ -15,15 +19,25 @@ class RetrievalSignals(BaseModel):
     avg_topk: float
     num_docs: int
     context_len: int
+    # HybridRetriever 才有：兩路各自的最高分（BM25 / 上限、dense cosine），方便除錯與調門檻
+    sparse_max: Optional[float] = None
+    dense_max: Optional[float] = None
 
 class RouteDecision(BaseModel):
-    target: Literal["kb", "small_model"]
+    target: Literal["kb", "small_model", "large_model"]
     reason: str
     signals: RetrievalSignals
+    # 做決策用的特徵（app/policy.py FEATURES 的順序）：寫進決策日誌給離線訓練 / replay，不放進 API 回應
+    features: Optional[List[float]] = Field(None, exclude=True)
 
 class AskResponse(BaseModel):
+    request_id: str
     answer: str
     route: RouteDecision
     contexts: List[ContextChunk]
     usage_tokens_est: Optional[int] = 0
     cost_usd_est: Optional[float] = 0.0
+
+class Feedback(BaseModel):
+    request_id: str
+    ok: bool = Field(..., description="回答是否解決問題（訓練路由策略用）")
@@ -0,0 +1,235 @@
+# app/policy.py
+"""
+路由策略引擎：RetrievalSignals → 走哪一條路（kb / small_model / large_model）
+
+- 特徵只算一次（featurize）：同一個向量拿去做決策，也原封不動寫進決策日誌（main.py，ROUTER_LOG_PATH），
+  離線訓練與 replay 直接用日誌裡的特徵，不用重跑檢索
+- ThresholdPolicy：原本的固定門檻（ROUTER_THRESH_MAX / ROUTER_THRESH_AVG / ROUTER_MIN_DOCS），只會選 kb / small_model
+- CostAwarePolicy：每條路一個「答得好」的機率模型 p_r(x)（logistic 或 gradient boosting，離線用 scripts/train_policy.py
+  從日誌 + feedback 訓練），選期望成本最低的路：
+      cost_r + miss_penalty · (1 - p_r(x))
+  cost_r / latency_r 是該路每個請求的平均成本與延遲（訓練時從日誌算）；latency_r 超過 latency_budget 的路不選
+- 推論全部向量化：一次算整批（replay）或單筆（線上），單筆 < 50 µs
+  （gradient boosting 的樹攤平成 (樹數, 節點數) 的陣列，所有樹一起往下走固定深度）
+
+策略檔（JSON，ROUTER_POLICY_FILE）：
+    {"version": "...", "kind": "logistic" | "gbdt", "features": [...], "routes": ["kb", "small_model", "large_model"],
+     "cost_usd": [...], "latency_ms": [...], "miss_penalty_usd": 0.01, "latency_budget_ms": 3000,
+     "model": {...}}
+"""
+from __future__ import annotations
+
+import abc
+import json
+import math
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import RetrievalSignals, RouteDecision
+
+ROUTES: Tuple[str, ...] = ("kb", "small_model", "large_model")
+FEATURES: Tuple[str, ...] = ("max_score", "avg_topk", "num_docs", "context_len", "sparse_max", "dense_max")
+
+
+def featurize(signals: RetrievalSignals) -> List[float]:
+    """訊號 → 特徵（FEATURES 的順序）；TF-IDF 檢索器沒有 sparse_max / dense_max，記成 0"""
+    return [signals.max_score, signals.avg_topk, float(signals.num_docs), float(signals.context_len),
+            signals.sparse_max or 0.0, signals.dense_max or 0.0]
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30.0, 30.0)))
+
+
+class LogisticModel:
+    """每條路一組 logistic 係數：p_r(x) = σ(x · coef_r + intercept_r)；標準化已折進係數"""
+
+    kind = "logistic"
+
+    def __init__(self, coef: np.ndarray, intercept: np.ndarray):
+        self.coef = np.asarray(coef, dtype=np.float64)            # (routes, features)
+        self.intercept = np.asarray(intercept, dtype=np.float64)  # (routes,)
+        self._coef_t = np.ascontiguousarray(self.coef.T)
+
+    def margin(self, X: np.ndarray) -> np.ndarray:
+        """(n, features) → (n, routes) 的 log-odds"""
+        return np.asarray(X, dtype=np.float64) @ self._coef_t + self.intercept
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """(n, features) → (n, routes) 的 p_r(x)"""
+        return _sigmoid(self.margin(X))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"coef": self.coef.tolist(), "intercept": self.intercept.tolist()}
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "LogisticModel":
+        return cls(np.asarray(d["coef"]), np.asarray(d["intercept"]))
+
+
+class TreeEnsembleModel:
+    """
+    Gradient boosting（sklearn GradientBoostingClassifier 匯出）：所有路的樹攤平成 (樹數, 節點數) 陣列
+    葉節點改成指回自己（threshold = +inf 一律往左），所有樹一起走 depth 步就都停在葉子上，不用逐棵迴圈
+    p_r(x) = σ(init_r + Σ_{樹屬於 r} value[葉])（learning rate 已乘進 value）
+    """
+
+    kind = "gbdt"
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 value: np.ndarray, tree_route: np.ndarray, init: np.ndarray, depth: int):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.tree_route = np.asarray(tree_route, dtype=np.intp)
+        self.init = np.asarray(init, dtype=np.float64)
+        self.depth = int(depth)
+        n_trees, width = self.feature.shape
+        # 攤平成 1-D：節點位置 = 樹 · 節點數 + 節點；left / right 也存攤平後的位置
+        offset = np.arange(n_trees, dtype=np.intp) * width
+        self._root = offset[None, :]  # (1, 樹數)：單筆時直接用，不用 broadcast
+        self._feature = self.feature.ravel()
+        self._threshold = self.threshold.ravel()
+        self._left = (self.left + offset[:, None]).ravel()
+        self._right = (self.right + offset[:, None]).ravel()
+        self._value = self.value.ravel()
+        self._n_nodes = n_trees * width
+        self._onehot = np.zeros((n_trees, len(self.init)))  # 葉值 → 各路加總：一次矩陣乘法
+        self._onehot[np.arange(n_trees), self.tree_route] = 1.0
+
+    def margin(self, X: np.ndarray) -> np.ndarray:
+        # sklearn 的樹用 float32 比較門檻，先轉一次才會和 sklearn 的結果一模一樣
+        X = np.asarray(X, dtype=np.float32)
+        # 先一次算出「每個節點往左嗎」（所有樹、所有節點），往下走每層只剩查表：單筆時 numpy 呼叫次數最少
+        go_left = (X.take(self._feature, axis=1) <= self._threshold).ravel()
+        node, rows = self._root, None
+        if len(X) > 1:
+            node = np.broadcast_to(node, (len(X), node.shape[1]))
+            rows = (np.arange(len(X), dtype=np.intp) * self._n_nodes)[:, None]
+        for _ in range(self.depth):
+            left = go_left.take(node if rows is None else node + rows)
+            node = np.where(left, self._left.take(node), self._right.take(node))
+        return self._value.take(node) @ self._onehot + self.init
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return _sigmoid(self.margin(X))
+
+    def to_dict(self) -> Dict[str, Any]:
+        thr = np.where(np.isinf(self.threshold), 1e308, self.threshold)  # JSON 沒有 inf
+        return {"feature": self.feature.tolist(), "threshold": thr.tolist(), "left": self.left.tolist(),
+                "right": self.right.tolist(), "value": self.value.tolist(), "tree_route": self.tree_route.tolist(),
+                "init": self.init.tolist(), "depth": self.depth}
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "TreeEnsembleModel":
+        thr = np.asarray(d["threshold"], dtype=np.float64)
+        thr[thr >= 1e308] = np.inf
+        return cls(np.asarray(d["feature"]), thr, np.asarray(d["left"]), np.asarray(d["right"]),
+                   np.asarray(d["value"]), np.asarray(d["tree_route"]), np.asarray(d["init"]), d["depth"])
+
+
+_MODELS = {m.kind: m for m in (LogisticModel, TreeEnsembleModel)}
+
+
+class Policy(abc.ABC):
+    """choose(X) → 每列選哪條路（ROUTES 的 index）；decide(signals) 是線上單筆版本"""
+
+    name = "base"
+    routes: Tuple[str, ...] = ROUTES
+
+    @abc.abstractmethod
+    def choose(self, X: np.ndarray) -> np.ndarray:
+        ...
+
+    def decide(self, signals: RetrievalSignals, features: Optional[List[float]] = None) -> RouteDecision:
+        x = featurize(signals) if features is None else features
+        route = self.routes[int(self.choose(np.asarray([x]))[0])]
+        return RouteDecision(target=route, reason=self.reason(signals, route), signals=signals, features=x)
+
+    def reason(self, signals: RetrievalSignals, route: str) -> str:
+        return (f"max={signals.max_score:.2f} avg={signals.avg_topk:.2f} "
+                f"docs={signals.num_docs} → {route}")
+
+
+class ThresholdPolicy(Policy):
+    """原本的規則：(max ≥ 門檻 或 avg ≥ 門檻) 且 num_docs ≥ min_docs → kb，否則 small_model"""
+
+    name = "threshold"
+
+    def __init__(self, thresh_max: float, thresh_avg: float, min_docs: int):
+        self.thresh_max, self.thresh_avg, self.min_docs = thresh_max, thresh_avg, min_docs
+
+    def choose(self, X: np.ndarray) -> np.ndarray:
+        go_kb = (X[:, 0] >= self.thresh_max) | (X[:, 1] >= self.thresh_avg)
+        go_kb &= X[:, 2] >= self.min_docs
+        return np.where(go_kb, ROUTES.index("kb"), ROUTES.index("small_model"))
+
+
+class CostAwarePolicy(Policy):
+    """選 cost_r + miss_penalty · (1 - p_r(x)) 最小、且 latency_r ≤ latency_budget 的路"""
+
+    name = "cost_aware"
+
+    def __init__(self, model, cost_usd: Sequence[float], latency_ms: Sequence[float], miss_penalty_usd: float,
+                 latency_budget_ms: float, routes: Sequence[str] = ROUTES, features: Sequence[str] = FEATURES,
+                 version: str = "unversioned"):
+        if tuple(features) != FEATURES:
+            raise ValueError(f"policy features {list(features)} do not match {list(FEATURES)}")
+        if tuple(routes) != ROUTES:
+            raise ValueError(f"policy routes {list(routes)} do not match {list(ROUTES)}")
+        self.model, self.version = model, version
+        self.name = f"{model.kind}@{version}"
+        self.cost_usd = np.asarray(cost_usd, dtype=np.float64)
+        self.latency_ms = np.asarray(latency_ms, dtype=np.float64)
+        self.miss_penalty_usd, self.latency_budget_ms = float(miss_penalty_usd), float(latency_budget_ms)
+        allowed = self.latency_ms <= self.latency_budget_ms
+        if not allowed.any():  # 全部超過預算：只留最快的那條
+            allowed = self.latency_ms == self.latency_ms.min()
+        # 超過延遲預算的路加一個很大的成本：choose 只剩一次 argmin
+        self._base = np.where(allowed, self.cost_usd + self.miss_penalty_usd, np.inf)
+        self._base_list = self._base.tolist()
+
+    def expected_cost(self, X: np.ndarray) -> np.ndarray:
+        """(n, routes) 的期望成本；p_r 只在這裡算一次"""
+        return self._base - self.miss_penalty_usd * self.model.predict(X)
+
+    def choose(self, X: np.ndarray) -> np.ndarray:
+        return np.argmin(self.expected_cost(X), axis=1)
+
+    def decide(self, signals: RetrievalSignals, features: Optional[List[float]] = None) -> RouteDecision:
+        x = featurize(signals) if features is None else features
+        # 單筆只有 3 條路：log-odds 之後的 sigmoid / argmin 用純 Python，比再跑幾個 numpy 呼叫快
+        z = self.model.margin([x])[0].tolist()
+        p = [1.0 / (1.0 + math.exp(-min(max(v, -30.0), 30.0))) for v in z]
+        cost = [b - self.miss_penalty_usd * q for b, q in zip(self._base_list, p)]
+        i = cost.index(min(cost))
+        reason = f"{Policy.reason(self, signals, self.routes[i])} p_ok={p[i]:.2f} ({self.name})"
+        return RouteDecision(target=self.routes[i], reason=reason, signals=signals, features=x)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": self.version, "kind": self.model.kind, "features": list(FEATURES), "routes": list(ROUTES),
+                "cost_usd": self.cost_usd.tolist(), "latency_ms": self.latency_ms.tolist(),
+                "miss_penalty_usd": self.miss_penalty_usd, "latency_budget_ms": self.latency_budget_ms,
+                "model": self.model.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "CostAwarePolicy":
+        kind = d.get("kind")
+        if kind not in _MODELS:
+            raise ValueError(f"unknown policy model kind: {kind!r} (expected one of {sorted(_MODELS)})")
+        return cls(_MODELS[kind].from_dict(d["model"]), d["cost_usd"], d["latency_ms"], d["miss_penalty_usd"],
+                   d["latency_budget_ms"], d.get("routes", ROUTES), d.get("features", FEATURES),
+                   str(d.get("version", "unversioned")))
+
+
+def load_policy(path: str) -> CostAwarePolicy:
+    with open(path, "r", encoding="utf-8") as f:
+        return CostAwarePolicy.from_dict(json.load(f))
+
+
+def save_policy(policy: CostAwarePolicy, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(policy.to_dict(), f, ensure_ascii=False, indent=1)
@@ -1,70 +1,162 @@
-from typing import List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 from pathlib import Path
+import hashlib
 import json
+import logging
+import os
 import numpy as np
-import jieba
-from sklearn.feature_extraction.text import TfidfVectorizer
 
 from .models import ContextChunk, RetrievalSignals
+from .tfidf_index import TfidfIndex
+from .tokenizer import Tokenizer
+from .tracing import traced
+
+log = logging.getLogger("retriever")
+
 
 class SimpleRetriever:
     """
     Jieba 分詞 + TF-IDF；kb.jsonl 每行: {"id": "doc1", "text": "..."}
+
+    索引可以增量更新（upsert / delete），不用重啟服務重建；見 app/tfidf_index.py。
+    啟動時如果 index_path 有跟目前 KB、分詞設定相符的 snapshot（scripts/build_index.py 產生），
+    直接 mmap 載入，不分詞也不建矩陣；多個 worker 共用同一份 page cache。
     """
 
-    def __init__(self, kb_path: str):
+    def __init__(self, kb_path: str, tokens_path: Optional[str] = None, index_path: Optional[str] = None,
+                 use_snapshot: bool = True):
         self.kb_path = Path(kb_path)
-        self.ids: List[str] = []
-        self.texts: List[str] = []
-        self._load()
-
-        # 初始化 jieba（可選：自定詞典可用 jieba.load_userdict(...)）
-        jieba.initialize()
-        jieba.load_userdict("data/userdict.txt") # 自訂辭典，讓 jieba 可以切出正確的詞彙
-
-        # 重要：tokenizer 搭配 token_pattern=None，否則 tokenizer 不會生效
-        self.vectorizer = TfidfVectorizer(
-            tokenizer=lambda s: list(jieba.cut(s, HMM=True)),
-            token_pattern=None,
-            ngram_range=(1, 2),       # 詞 + 2-gram 詞組
-            max_features=20_000,
-            norm="l2"
-        )
-        self.matrix = self.vectorizer.fit_transform(self.texts)
-
-    def _load(self):
-        self.ids.clear()
-        self.texts.clear()
+        # 整個 KB 的分詞結果存在這裡，重啟時沒改過的文件不用重跑 jieba
+        self.tokens_path = tokens_path or os.getenv("KB_TOKENS_PATH") or f"{kb_path}.tokens.json"
+        self.index_path = index_path or os.getenv("INDEX_PATH") or f"{kb_path}.index"
+        # 小寫 → jieba 分詞 → 詞 + 2-gram 詞組（同原本 TfidfVectorizer 的 analyzer），query 有 LRU 快取；
+        # IDF / 正規化 / 倒排由 TfidfIndex 維護
+        self.tokenizer = Tokenizer()
+        self.index = TfidfIndex(self.tokenizer.analyze)
+        if not (use_snapshot and self._load_snapshot()):
+            self.reload()
+
+    def _load(self) -> List[Tuple[str, str]]:
+        docs = []
         with self.kb_path.open("r", encoding="utf-8") as f:
             for line in f:
                 obj = json.loads(line)
-                self.ids.append(obj["id"])
-                self.texts.append(obj["text"])
+                docs.append((obj["id"], obj["text"]))
+        return docs
+
+    def _kb_sha1(self) -> str:
+        h = hashlib.sha1()
+        with self.kb_path.open("rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def _load_snapshot(self) -> bool:
+        meta = TfidfIndex.read_meta(self.index_path)
+        if meta is None:
+            return False
+        if meta.get("kb_sha1") != self._kb_sha1() or meta.get("tokenizer") != self.tokenizer.fingerprint:
+            # KB 或詞典改過：舊 snapshot 的詞彙表 / IDF 對不上，改走重建
+            log.warning("index snapshot %s is stale; rebuilding from %s", self.index_path, self.kb_path)
+            return False
+        self.index.load(self.index_path)
+        return True
+
+    def save(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        把目前的索引寫成 mmap 用的 snapshot（預設 index_path），記下 KB 與分詞設定的 hash 供載入時比對。
+        存的是記憶體裡這一版：upsert 進來但沒寫回 kb.jsonl 的文件也會一起存。
+        """
+        meta = {"kb_sha1": self._kb_sha1(), "tokenizer": self.tokenizer.fingerprint}
+        return self.index.save(path or self.index_path, meta)
+
+    def reload(self):
+        """重新讀 kb.jsonl 整批重建（新的詞彙表）；分詞走 Tokenizer 的磁碟快取 + process pool"""
+        docs = self._load()
+        terms = self.tokenizer.analyze_corpus([text for _, text in docs], cache_path=self.tokens_path)
+        self.index.build(docs, terms)
+
+    def upsert(self, docs: Iterable[Tuple[str, str]]) -> int:
+        """新增 / 取代文件（只對新文件跑 jieba），並行中的 search 不受影響"""
+        return self.index.upsert(docs)
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        return self.index.delete(doc_ids)
 
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.index
+
+    @traced("retrieve")
     def search(self, query: str, top_k: int = 3) -> Tuple[List[ContextChunk], RetrievalSignals]:
-        qv = self.vectorizer.transform([query])
-        # 對 TF-IDF，使用稀疏點積即可（等同於 cosine with l2 正規化）
-        scores = (self.matrix @ qv.T).toarray().ravel()
-
-        # 取前 K
-        top_idx = np.argsort(-scores)[:top_k]
-        chunks: List[ContextChunk] = [
-            ContextChunk(id=self.ids[i], text=self.texts[i], score=float(scores[i]))
-            for i in top_idx
-        ]
-
-        # 訊號
-        max_score = float(scores[top_idx[0]]) if len(top_idx) else 0.0
-        hits = scores[top_idx]
-        pos_hits = hits[hits > 0]
-        avg_topk = float(np.mean(pos_hits)) if pos_hits.size > 0 else 0.0
-        num_docs = int(np.sum(scores > 0.0))
-        context_len = sum(len(c.text) for c in chunks)
-
-        signals = RetrievalSignals(
-            max_score=max_score,
-            avg_topk=avg_topk,
-            num_docs=num_docs,
-            context_len=context_len,
-        )
-        return chunks, signals
+        return self._search_many([query], top_k)[0]
+
+    @traced("retrieve")
+    def search_batch(self, queries: Sequence[str], top_k: int = 3) -> List[Tuple[List[ContextChunk], RetrievalSignals]]:
+        """
+        多個 query 一次算：一個稀疏矩陣乘法 + argpartition 取 top-k，訊號也整批用 numpy 算。
+        回傳順序與 queries 相同，每筆和 search(query, top_k) 的結果一樣。
+        """
+        return self._search_many(list(queries), top_k)
+
+    def _search_many(self, queries: List[str], top_k: int) -> List[Tuple[List[ContextChunk], RetrievalSignals]]:
+        if not queries:
+            return []
+        snap = self.index.snapshot()  # 整批用同一版索引：更新中途換版也不會讀到一半
+        k = min(top_k, len(snap))
+        # (n_query × vocab) @ (vocab × n_doc)：走倒排（postings），只碰到有共同詞的文件；
+        # 對 TF-IDF（l2 正規化）稀疏點積等同 cosine
+        scores = snap.scores(queries)
+
+        top_idx = np.empty((len(queries), k), dtype=np.int64)
+        top_val = np.zeros((len(queries), k), dtype=np.float64)
+        for row in range(len(queries)):
+            lo, hi = scores.indptr[row], scores.indptr[row + 1]
+            idx, val = scores.indices[lo:hi], scores.data[lo:hi]
+            if len(val) > k:
+                # 只對非零分數做 argpartition（O(nnz)），再把這 k 個排好
+                part = np.argpartition(-val, k - 1)[:k]
+                idx, val = idx[part], val[part]
+            order = np.lexsort((idx, -val))
+            n = len(order)
+            top_idx[row, :n], top_val[row, :n] = idx[order], val[order]
+            if n < k:
+                # 命中不到 k 篇時跟原本一樣用 0 分文件補滿（取最前面幾篇還在的）
+                top_idx[row, n:] = _first_missing(np.sort(idx), snap.alive, k - n)
+
+        # 訊號：整批向量化
+        pos = top_val > 0
+        n_pos = pos.sum(axis=1)
+        max_score = top_val[:, 0] if k else np.zeros(len(queries))
+        avg_topk = np.divide(top_val.sum(axis=1), n_pos, out=np.zeros(len(queries)), where=n_pos > 0)
+        num_docs = np.diff(scores.indptr)
+        context_len = snap.text_len[top_idx].sum(axis=1)
+
+        results = []
+        for row in range(len(queries)):
+            chunks = []
+            for i, v in zip(top_idx[row].tolist(), top_val[row].tolist()):
+                doc_id, text = snap.doc(i)
+                chunks.append(ContextChunk(id=doc_id, text=text, score=float(v)))
+            signals = RetrievalSignals(
+                max_score=float(max_score[row]),
+                avg_topk=float(avg_topk[row]),
+                num_docs=int(num_docs[row]),
+                context_len=int(context_len[row]),
+            )
+            results.append((chunks, signals))
+        return results
+
+
+def _first_missing(taken: np.ndarray, alive: np.ndarray, n: int) -> np.ndarray:
+    """最小的 n 個不在 taken（已排序、不重複）裡、且沒被刪除的文件編號"""
+    out, i, j = [], 0, 0
+    while len(out) < n:
+        if j < len(taken) and taken[j] == i:
+            j += 1
+        elif alive[i]:
+            out.append(i)
+        i += 1
+    return np.asarray(out, dtype=np.int64)
@@ -1,19 +1,24 @@
 # app/router.py
 import os
+import random
+
 from .models import RetrievalSignals, RouteDecision
+from .policy import ROUTES, Policy, ThresholdPolicy, featurize, load_policy
 
 THRESH_MAX = float(os.getenv("ROUTER_THRESH_MAX", "0.30"))
 THRESH_AVG = float(os.getenv("ROUTER_THRESH_AVG", "0.12"))
 MIN_DOCS   = int(os.getenv("ROUTER_MIN_DOCS", "1"))
+# 離線訓練好的策略檔（scripts/train_policy.py）；沒設就用上面的固定門檻
+POLICY_FILE = os.getenv("ROUTER_POLICY_FILE", "")
+# 這個比例的請求隨機選一條路（記在決策日誌）：每條路都有資料，策略才學得到「換條路會不會比較好」
+EXPLORE = float(os.getenv("ROUTER_EXPLORE", "0"))
+
+POLICY: Policy = load_policy(POLICY_FILE) if POLICY_FILE else ThresholdPolicy(THRESH_MAX, THRESH_AVG, MIN_DOCS)
 
 def decide(signals: RetrievalSignals) -> RouteDecision:
-    go_kb = (
-        (signals.max_score >= THRESH_MAX or signals.avg_topk >= THRESH_AVG)
-        and signals.num_docs >= MIN_DOCS
-    )
-    target = "kb" if go_kb else "small_model"
-    reason = (
-        f"max={signals.max_score:.2f} avg={signals.avg_topk:.2f} "
-        f"docs={signals.num_docs} → {target}"
-    )
-    return RouteDecision(target=target, reason=reason, signals=signals)
+    features = featurize(signals)
+    if EXPLORE and random.random() < EXPLORE:
+        target = random.choice(ROUTES)
+        reason = f"{POLICY.reason(signals, target)} (explore)"
+        return RouteDecision(target=target, reason=reason, signals=signals, features=features)
+    return POLICY.decide(signals, features)
@@ -0,0 +1,532 @@
+# app/tfidf_index.py
+"""
+可增量更新的 TF-IDF 倒排索引（SimpleRetriever 用）
+
+- 每篇文件只分詞一次：存的是原始詞頻（term id + 次數），IDF 改變時不用重跑 jieba
+- 新增 / 刪除只更新 document frequency（df）與一個小的 delta segment；
+  IDF 與文件向量長度（l2 norm）等到下一次查詢才重算（lazy），連續寫入只算一次
+- delta 長到 base 的一定比例（或刪除太多）時合併回 base，成本攤提到每次寫入
+- 查詢拿到的是不可變的 IndexSnapshot；寫入在鎖裡組出新 snapshot 後整個換掉（一次 attribute 指派），
+  並行中的 search 不會看到寫到一半的索引
+- save() / load()：整份索引寫成一個目錄的 .npy（詞彙表、df、IDF、norm、CSR 的 data / indices / indptr、
+  doc id 與內文）；load 用 mmap_mode="r" 打開，多個 worker 透過 OS page cache 共用同一份記憶體，
+  啟動時不用分詞也不用建矩陣
+
+分數與 sklearn TfidfVectorizer(norm="l2", smooth_idf=True) 相同：
+idf = ln((1 + n) / (1 + df)) + 1，文件與 query 向量都做 l2 正規化後取內積。
+
+同一份原始詞頻也拿來算 BM25（IndexSnapshot.bm25_scores，HybridRetriever 的 sparse 那一路）：
+idf = ln(1 + (n - df + 0.5) / (df + 0.5))，tf 飽和項 tf · (k1 + 1) / (tf + k1 · (1 - b + b · dl / avgdl))。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+Analyzer = Callable[[str], Sequence[str]]
+Row = Tuple[np.ndarray, np.ndarray]  # (term ids, 次數)
+
+MERGE_MIN_DOCS = 1000
+MERGE_RATIO = 0.1
+SNAPSHOT_FORMAT = 1
+_BUILD_CHUNK = 8192   # build() 一次轉這麼多篇：只累積 CSR 陣列，不同時留著整個 KB 的 Counter
+_NORM_BLOCK = 65536   # 算文件 norm 時一次處理的列數（暫存的 tf² 只有這麼大）
+
+
+def _csr(rows: Sequence[Row], n_terms: int) -> sp.csr_matrix:
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c, _ in rows], out=indptr[1:])
+    if rows:
+        cols = np.concatenate([c for c, _ in rows])
+        data = np.concatenate([v for _, v in rows])
+    else:
+        cols, data = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+    return sp.csr_matrix((data, cols, indptr), shape=(len(rows), n_terms))
+
+
+def _widen(m: sp.csr_matrix, n_terms: int) -> sp.csr_matrix:
+    """後來才出現的詞只會加在最後面：舊 segment 補欄位即可（不複製資料）"""
+    return sp.csr_matrix((m.data, m.indices, m.indptr), shape=(m.shape[0], n_terms))
+
+
+def _sq_norms(tf: sp.csr_matrix, idf_sq: np.ndarray) -> np.ndarray:
+    """每篇文件的 Σ (tf · idf)²；分塊算，不常駐一份 tf² 矩陣"""
+    out = np.empty(tf.shape[0], dtype=np.float64)
+    for lo in range(0, tf.shape[0], _NORM_BLOCK):
+        hi = min(lo + _NORM_BLOCK, tf.shape[0])
+        s, e = tf.indptr[lo], tf.indptr[hi]
+        block = sp.csr_matrix((np.square(tf.data[s:e]), tf.indices[s:e], tf.indptr[lo:hi + 1] - s),
+                              shape=(hi - lo, tf.shape[1]))
+        out[lo:hi] = block @ idf_sq
+    return out
+
+
+def _term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _Strings:
+    """唯讀字串表：utf-8 串成一個 blob + offsets（兩個 .npy，可以 mmap）"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob, self.offsets = blob, offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+    @staticmethod
+    def save(directory: str, name: str, strings: Iterable[str]) -> None:
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        np.save(os.path.join(directory, f"{name}_blob.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> "_Strings":
+        return cls(np.load(os.path.join(directory, f"{name}_blob.npy"), mmap_mode="r"),
+                   np.load(os.path.join(directory, f"{name}_offsets.npy"), mmap_mode="r"))
+
+
+class _FrozenVocab:
+    """snapshot 的詞彙表：term hash 排好序做二分搜尋，每個 worker 不用各自建一份 dict"""
+
+    def __init__(self, terms: _Strings, hashes: np.ndarray, order: np.ndarray):
+        self.terms, self.hashes, self.order = terms, hashes, order
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms)
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        h = np.uint64(_term_hash(term))
+        i = int(np.searchsorted(self.hashes, h))
+        while i < len(self.hashes) and self.hashes[i] == h:  # hash 碰撞時比對原字串
+            j = int(self.order[i])
+            if self.terms[j] == term:
+                return j
+            i += 1
+        return default
+
+    @staticmethod
+    def save(directory: str, terms: Sequence[str]) -> None:
+        _Strings.save(directory, "vocab", terms)
+        hashes = np.fromiter(map(_term_hash, terms), dtype=np.uint64, count=len(terms))
+        order = np.argsort(hashes, kind="stable")
+        np.save(os.path.join(directory, "vocab_hash.npy"), hashes[order])
+        np.save(os.path.join(directory, "vocab_order.npy"), order.astype(np.int64))
+
+    @classmethod
+    def load(cls, directory: str) -> "_FrozenVocab":
+        return cls(_Strings.load(directory, "vocab"),
+                   np.load(os.path.join(directory, "vocab_hash.npy"), mmap_mode="r"),
+                   np.load(os.path.join(directory, "vocab_order.npy"), mmap_mode="r"))
+
+
+class _OverlayVocab:
+    """載入的詞彙表 + 之後 upsert 才出現的新詞（id 接在後面）"""
+
+    def __init__(self, base: _FrozenVocab):
+        self.base: _FrozenVocab = base
+        self.extra: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.extra)
+
+    def __iter__(self) -> Iterator[str]:
+        return chain(self.base, self.extra)
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        j = self.extra.get(term)
+        return j if j is not None else self.base.get(term, default)
+
+    def setdefault(self, term: str, default: int) -> int:
+        j = self.get(term)
+        return j if j is not None else self.extra.setdefault(term, default)
+
+
+class _Segment:
+    """一批文件的原始詞頻（不可變）：tf 是 doc × term，post 是 term × doc（倒排）"""
+
+    __slots__ = ("ids", "texts", "tf", "post", "text_len")
+
+    def __init__(self, ids: Sequence[str], texts: Sequence[str], tf: sp.csr_matrix,
+                 post: Optional[sp.csr_matrix] = None, text_len: Optional[np.ndarray] = None):
+        self.ids, self.texts, self.tf = ids, texts, tf
+        self.post = tf.T.tocsr() if post is None else post
+        if text_len is None:
+            text_len = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        self.text_len = text_len
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def n_terms(self) -> int:
+        return self.tf.shape[1]
+
+    def row_terms(self, row: int) -> np.ndarray:
+        return self.tf.indices[self.tf.indptr[row]:self.tf.indptr[row + 1]]
+
+
+_EMPTY = _Segment([], [], _csr([], 0))
+
+
+class IndexSnapshot:
+    """某一版索引（base + delta + 存活遮罩 + df）；查詢整批都用同一個 snapshot"""
+
+    def __init__(self, analyzer: Analyzer, vocab, base: _Segment, delta: _Segment, alive: np.ndarray,
+                 df: np.ndarray, weights: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        self.analyzer, self.vocab = analyzer, vocab
+        self.base, self.delta = base, delta
+        self.alive, self.df = alive, df
+        self.n_alive = int(alive.sum())
+        self.text_len = np.concatenate([base.text_len, delta.text_len]) if len(delta) else base.text_len
+        self._weights = weights
+        self._bm25: Dict[Tuple[float, float], Tuple[np.ndarray, List[sp.csr_matrix]]] = {}
+
+    def __len__(self) -> int:
+        return self.n_alive
+
+    def doc(self, pos: int) -> Tuple[str, str]:
+        nb = len(self.base)
+        seg, row = (self.base, pos) if pos < nb else (self.delta, pos - nb)
+        return seg.ids[row], seg.texts[row]
+
+    def weights(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(idf, 每篇文件的 1 / l2 norm；已刪除的為 0)，第一次用到才算；從磁碟載入的直接用存好的"""
+        w = self._weights
+        if w is None:
+            n = self.n_alive
+            # df = 0 的詞（所有含它的文件都刪了）視同不在詞彙表裡
+            idf = np.where(self.df > 0, np.log((1.0 + n) / (1.0 + self.df)) + 1.0, 0.0)
+            idf_sq = idf * idf
+            inv = []
+            for seg in (self.base, self.delta):
+                norm = np.sqrt(_sq_norms(seg.tf, idf_sq[:seg.n_terms]))
+                inv.append(np.divide(1.0, norm, out=np.zeros_like(norm), where=norm > 0))
+            inv_norm = np.concatenate(inv) * self.alive
+            # 兩個 thread 同時算也只是重複計算，結果一樣
+            self._weights = w = (idf, inv_norm)
+        return w
+
+    def transform(self, queries: Sequence[str]) -> sp.csr_matrix:
+        """query → l2 正規化的 TF-IDF，再乘一次 idf（把文件那側的 idf 折進來，文件只需存原始詞頻）"""
+        idf, _ = self.weights()
+        q = self._counts(queries, idf)
+        for row in range(q.shape[0]):
+            lo, hi = q.indptr[row], q.indptr[row + 1]
+            w = q.data[lo:hi] * idf[q.indices[lo:hi]]
+            norm = np.sqrt(w @ w)
+            q.data[lo:hi] = w * idf[q.indices[lo:hi]] / norm if norm > 0 else w
+        return q
+
+    def bm25_weights(self, k1: float, b: float) -> Tuple[np.ndarray, List[sp.csr_matrix]]:
+        """
+        (BM25 idf, 每個 segment 的 term × doc 飽和詞頻 tf · (k1 + 1) / (tf + k1 · (1 - b + b · dl / avgdl)))，
+        同一組 (k1, b) 只算一次；與 post 共用 indices / indptr（mmap 載入的也不複製），只多一份 data
+        """
+        w = self._bm25.get((k1, b))
+        if w is None:
+            n = self.n_alive
+            idf = np.where(self.df > 0, np.log1p((n - self.df + 0.5) / (self.df + 0.5)), 0.0)
+            # 文件長度 = 詞 + 2-gram 的個數（原始詞頻加總），已刪除的不算進平均
+            dl = np.concatenate([np.asarray(seg.tf.sum(axis=1)).ravel() for seg in (self.base, self.delta)])
+            avgdl = float(dl[self.alive].mean()) if n else 1.0
+            denom = k1 * (1.0 - b + b * dl / max(avgdl, 1e-9))
+            mats, offset = [], 0
+            for seg in (self.base, self.delta):
+                post = seg.post
+                data = post.data * (k1 + 1.0) / (post.data + denom[offset + post.indices])
+                mats.append(sp.csr_matrix((data, post.indices, post.indptr), shape=post.shape))
+                offset += len(seg)
+            self._bm25[(k1, b)] = w = (idf, mats)
+        return w
+
+    def bm25_scores(self, queries: Sequence[str], k1: float = 1.2, b: float = 0.75) -> Tuple[sp.csr_matrix, np.ndarray]:
+        """
+        (n_query × n_doc) 的 BM25 分數（只有命中的文件有值，已刪除的不會出現），以及每個 query 的分數上限
+        Σ qtf · idf · (k1 + 1)（tf → ∞ 時的值，索引裡沒有的詞用最大 idf）：分數除以上限就落在 [0, 1)，不同 query 之間可以比
+        """
+        idf, mats = self.bm25_weights(k1, b)
+        q, missing = self._counts(queries, idf, with_missing=True)
+        # 索引裡沒有的詞當作 df = 0 算進上限：query 的重點詞 KB 裡沒有時，只靠常見詞命中的分數就低
+        idf_max = np.log1p((self.n_alive + 0.5) / 0.5)
+        upper = (q @ idf + missing * idf_max) * (k1 + 1.0)
+        q.data *= idf[q.indices]
+        parts = [q[:, :seg.n_terms] @ m for seg, m in zip((self.base, self.delta), mats)]
+        scores = sp.hstack(parts, format="csr") if len(self.delta) else parts[0].tocsr()
+        scores.data *= self.alive[scores.indices]
+        scores.eliminate_zeros()
+        return scores, upper
+
+    def _counts(self, queries: Sequence[str], idf: np.ndarray, with_missing: bool = False):
+        """query → 詞頻（只留詞彙表裡、idf > 0 的詞）；with_missing 時另外回傳每個 query 有幾個詞不在索引裡"""
+        n_terms = len(self.df)
+        rows: List[Row] = []
+        missing = np.zeros(len(queries))
+        for i, q in enumerate(queries):
+            cols, cnts = [], []
+            for term, cnt in Counter(self.analyzer(q)).items():
+                j = self.vocab.get(term)
+                if j is not None and j < n_terms and idf[j] > 0:
+                    cols.append(j)
+                    cnts.append(cnt)
+                else:
+                    missing[i] += cnt
+            rows.append((np.asarray(cols, dtype=np.int32), np.asarray(cnts, dtype=np.float64)))
+        q = _csr(rows, n_terms)
+        return (q, missing) if with_missing else q
+
+    def scores(self, queries: Sequence[str]) -> sp.csr_matrix:
+        """(n_query × n_doc) 的 cosine 分數；只有命中的文件有值，已刪除的不會出現"""
+        _, inv_norm = self.weights()
+        q = self.transform(queries)
+        parts = [q[:, :seg.n_terms] @ seg.post for seg in (self.base, self.delta)]
+        scores = sp.hstack(parts, format="csr") if len(self.delta) else parts[0].tocsr()
+        scores.data *= inv_norm[scores.indices]
+        scores.eliminate_zeros()
+        return scores
+
+
+class TfidfIndex:
+    """寫入端：維護詞彙表、df、delta，產生新的 IndexSnapshot"""
+
+    def __init__(self, analyzer: Analyzer, merge_min: int = MERGE_MIN_DOCS, merge_ratio: float = MERGE_RATIO):
+        self.analyzer = analyzer
+        self.merge_min, self.merge_ratio = merge_min, merge_ratio
+        self._lock = threading.Lock()
+        self._vocab: Any = {}  # dict；從磁碟載入的是 _OverlayVocab
+        self._where: Optional[Dict[str, int]] = {}  # doc id → 在 snapshot 裡的位置；None = 載入後還沒用到，還沒建
+        self._delta_rows: List[Row] = []
+        self._snap = IndexSnapshot(analyzer, self._vocab, _EMPTY, _EMPTY, np.zeros(0, dtype=bool),
+                                   np.zeros(0, dtype=np.int64))
+
+    def snapshot(self) -> IndexSnapshot:
+        return self._snap
+
+    def __len__(self) -> int:
+        return len(self._snap)
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self._positions()
+
+    def _positions(self) -> Dict[str, int]:
+        """doc id → 位置；從磁碟載入時等到第一次寫入（或 in）才建，只查詢的 worker 不用付這份記憶體"""
+        if self._where is None:
+            snap = self._snap
+            ids = chain(snap.base.ids, snap.delta.ids)
+            self._where = {doc_id: i for i, doc_id in enumerate(ids) if snap.alive[i]}
+        return self._where
+
+    def _row(self, terms: Counter, vocab) -> Row:
+        cols = np.fromiter((vocab.setdefault(t, len(vocab)) for t in terms), dtype=np.int32, count=len(terms))
+        return cols, np.fromiter(terms.values(), dtype=np.float64, count=len(terms))
+
+    def build(self, docs: Iterable[Tuple[str, str]], terms: Optional[Iterable[Sequence[str]]] = None) -> None:
+        """
+        整批重建（新的詞彙表）；同一個 id 出現多次時以最後一筆為準。
+        terms 是已經分好詞的結果（與 docs 同順序，例如 Tokenizer.analyze_corpus），沒給就逐篇呼叫 analyzer；
+        可以是 iterator，分塊轉成 term id，記憶體裡不會同時有整個 KB 的 token list。
+        """
+        docs = list(docs)
+        ids = [doc_id for doc_id, _ in docs]
+        texts = [text for _, text in docs]
+        del docs
+        it = iter(map(self.analyzer, texts) if terms is None else terms)
+        vocab: Dict[str, int] = {}
+        lens = np.zeros(len(ids), dtype=np.int64)
+        cols_parts, data_parts, pos = [], [], 0
+        while True:
+            counts = [Counter(t) for t in islice(it, _BUILD_CHUNK)]
+            if not counts:
+                break
+            # 一塊一次轉 term id（map 走 C 層級的 dict lookup），比逐篇 setdefault 快好幾倍
+            new = [t for t in dict.fromkeys(chain.from_iterable(counts)) if t not in vocab]
+            vocab.update(zip(new, range(len(vocab), len(vocab) + len(new))))
+            n = sum(map(len, counts))
+            cols_parts.append(np.fromiter(map(vocab.__getitem__, chain.from_iterable(counts)), dtype=np.int32, count=n))
+            data_parts.append(np.fromiter(chain.from_iterable(c.values() for c in counts), dtype=np.float64, count=n))
+            lens[pos:pos + len(counts)] = [len(c) for c in counts]
+            pos += len(counts)
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(lens, out=indptr[1:])
+        cols = np.concatenate(cols_parts) if cols_parts else np.empty(0, dtype=np.int32)
+        data = np.concatenate(data_parts) if data_parts else np.empty(0, dtype=np.float64)
+        del cols_parts, data_parts
+        tf = sp.csr_matrix((data, cols, indptr), shape=(len(ids), len(vocab)))
+
+        where = {doc_id: i for i, doc_id in enumerate(ids)}
+        alive = np.zeros(len(ids), dtype=bool)
+        alive[list(where.values())] = True
+        live = tf.indices if alive.all() else tf.indices[np.repeat(alive, lens)]
+        df = np.bincount(live, minlength=len(vocab)).astype(np.int64)
+        with self._lock:
+            self._vocab, self._where, self._delta_rows = vocab, where, []
+            self._snap = IndexSnapshot(self.analyzer, vocab, _Segment(ids, texts, tf), _EMPTY, alive, df)
+
+    def upsert(self, docs: Iterable[Tuple[str, str]]) -> int:
+        """新增文件；id 已存在就取代。回傳寫入筆數"""
+        # 分詞在鎖外做（最花時間的部分），鎖內只動詞彙表 / df / delta
+        batch = [(doc_id, text, Counter(self.analyzer(text))) for doc_id, text in docs]
+        if not batch:
+            return 0
+        with self._lock:
+            snap = self._snap
+            alive = snap.alive.copy()
+            df = np.array(snap.df)  # 複製（從磁碟載入的是唯讀 mmap）
+            where = self._positions()
+            self._kill(snap, alive, df, [doc_id for doc_id, _, _ in batch])
+
+            # 同一批裡重複的 id 以最後一筆為準
+            last = {doc_id: i for i, (doc_id, _, _) in enumerate(batch)}
+            batch = [batch[i] for i in sorted(last.values())]
+            rows = [self._row(terms, self._vocab) for _, _, terms in batch]
+            n_terms = len(self._vocab)
+            df = np.concatenate([df, np.zeros(n_terms - len(df), dtype=np.int64)])
+            for cols, _ in rows:
+                df[cols] += 1
+
+            n = len(alive)
+            for i, (doc_id, _, _) in enumerate(batch):
+                where[doc_id] = n + i
+            alive = np.concatenate([alive, np.ones(len(batch), dtype=bool)])
+            self._delta_rows.extend(rows)
+            delta = snap.delta
+            delta = _Segment(delta.ids + [d for d, _, _ in batch], delta.texts + [t for _, t, _ in batch],
+                             _csr(self._delta_rows, n_terms))
+            self._publish(snap.base, delta, alive, df)
+        return len(batch)
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        """刪除文件，回傳實際刪掉的筆數（不存在的 id 略過）"""
+        with self._lock:
+            snap = self._snap
+            alive = snap.alive.copy()
+            df = np.array(snap.df)
+            removed = self._kill(snap, alive, df, doc_ids)
+            if removed:
+                self._publish(snap.base, snap.delta, alive, df)
+        return removed
+
+    def _kill(self, snap: IndexSnapshot, alive: np.ndarray, df: np.ndarray, doc_ids: Iterable[str]) -> int:
+        nb, removed, where = len(snap.base), 0, self._positions()
+        for doc_id in doc_ids:
+            pos = where.pop(doc_id, None)
+            if pos is None:
+                continue
+            alive[pos] = False
+            seg, row = (snap.base, pos) if pos < nb else (snap.delta, pos - nb)
+            df[seg.row_terms(row)] -= 1
+            removed += 1
+        return removed
+
+    def _publish(self, base: _Segment, delta: _Segment, alive: np.ndarray, df: np.ndarray) -> None:
+        n_dead = len(alive) - int(alive.sum())
+        limit = max(self.merge_min, self.merge_ratio * len(base))
+        if len(delta) > limit or n_dead > limit:
+            base, alive = self._merge(base, delta, alive, len(df)), np.ones(int(alive.sum()), dtype=bool)
+            delta, self._delta_rows = _EMPTY, []
+            self._where = {doc_id: i for i, doc_id in enumerate(base.ids)}
+        self._snap = IndexSnapshot(self.analyzer, self._vocab, base, delta, alive, df)
+
+    @staticmethod
+    def _merge(base: _Segment, delta: _Segment, alive: np.ndarray, n_terms: int) -> _Segment:
+        """delta 併回 base，順便把已刪除的文件真的拿掉（結果都在記憶體裡，不再指向 mmap）"""
+        keep = np.flatnonzero(alive)
+        tf = sp.vstack([_widen(base.tf, n_terms), _widen(delta.tf, n_terms)], format="csr")[keep]
+        ids, texts = list(chain(base.ids, delta.ids)), list(chain(base.texts, delta.texts))
+        return _Segment([ids[i] for i in keep], [texts[i] for i in keep], tf)
+
+    # --- 持久化（mmap 共用的 snapshot） ---
+
+    def save(self, path: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        把目前這一版（delta 併回、已刪除的拿掉）寫成 path 目錄下的 .npy，回傳寫進 meta.json 的內容。
+        先寫到暫存目錄再換名：正在 mmap 舊檔的 worker 不受影響（舊 inode 會留到它們關掉為止）。
+        """
+        with self._lock:
+            snap, terms = self._snap, list(self._vocab)
+        base = snap.base
+        if len(snap.delta) or len(base) != snap.n_alive:
+            base = self._merge(base, snap.delta, snap.alive, len(snap.df))
+        full = IndexSnapshot(self.analyzer, snap.vocab, base, _EMPTY, np.ones(len(base), dtype=bool), snap.df,
+                             weights=snap._weights if base is snap.base else None)
+        idf, inv_norm = full.weights()
+        tf = _widen(base.tf, len(snap.df))
+        post = base.post if base.post.shape[0] == len(snap.df) else tf.T.tocsr()
+
+        meta = dict(meta or {}, format=SNAPSHOT_FORMAT, n_docs=len(base), n_terms=len(snap.df),
+                    nnz=int(tf.nnz), created_at=time.time())
+        path = path.rstrip(os.sep)
+        tmp, old = f"{path}.tmp-{os.getpid()}", f"{path}.old-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        # 存的是 scipy 正規化過的 dtype：load 時組 csr_matrix 不會轉型（轉型就會複製，失去 mmap 共用）
+        arrays = {"df": snap.df, "idf": idf, "inv_norm": inv_norm, "text_len": base.text_len,
+                  "tf_data": tf.data, "tf_indices": tf.indices, "tf_indptr": tf.indptr,
+                  "post_data": post.data, "post_indices": post.indices, "post_indptr": post.indptr}
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(arr))
+        _FrozenVocab.save(tmp, terms)
+        _Strings.save(tmp, "ids", base.ids)
+        _Strings.save(tmp, "texts", base.texts)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+        return meta
+
+    @staticmethod
+    def read_meta(path: str) -> Optional[Dict[str, Any]]:
+        """snapshot 的 meta.json；不存在、讀不了或格式版本不同時回傳 None"""
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("format") == SNAPSHOT_FORMAT else None
+
+    def load(self, path: str) -> Dict[str, Any]:
+        """
+        mmap 載入 save() 寫的目錄，回傳 meta。之後照常可以 upsert / delete：
+        新的部分在這個行程的記憶體裡（delta），磁碟上的 snapshot 不會被改。
+        """
+        meta = self.read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f"no index snapshot at {path}")
+
+        def arr(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        n_docs, n_terms = meta["n_docs"], meta["n_terms"]
+        tf = sp.csr_matrix((arr("tf_data"), arr("tf_indices"), arr("tf_indptr")), shape=(n_docs, n_terms))
+        post = sp.csr_matrix((arr("post_data"), arr("post_indices"), arr("post_indptr")), shape=(n_terms, n_docs))
+        base = _Segment(_Strings.load(path, "ids"), _Strings.load(path, "texts"), tf, post, arr("text_len"))
+        vocab = _OverlayVocab(_FrozenVocab.load(path))
+        snap = IndexSnapshot(self.analyzer, vocab, base, _EMPTY, np.ones(n_docs, dtype=bool), arr("df"),
+                             weights=(arr("idf"), arr("inv_norm")))
+        with self._lock:
+            self._vocab, self._where, self._delta_rows = vocab, None, []
+            self._snap = snap
+        return meta
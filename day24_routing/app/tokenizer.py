@@ -0,0 +1,133 @@
+# app/tokenizer.py
+"""
+jieba 分詞服務（SimpleRetriever / TfidfIndex 用）
+
+- analyze(text)：小寫 → jieba.cut → 詞 + 2-gram 詞組，與 sklearn
+  TfidfVectorizer(tokenizer=jieba, token_pattern=None, ngram_range=(1, 2)).build_analyzer() 輸出相同；
+  結果有 LRU 快取（JIEBA_CACHE_SIZE），重複的 query 不會一再切詞
+- analyze_corpus(texts)：整個 KB 一次切（回傳 iterator，給 TfidfIndex.build 分塊吃）
+  - 先查磁碟上的分詞快取（KB_TOKENS_PATH，key 是文件內容 hash），重啟時沒改過的文件不用重切
+  - 沒命中的文件量夠大時切成 chunk 丟給 process pool（JIEBA_WORKERS 個 worker），各 worker 自己載詞典
+  - 快取帶有分詞設定的 fingerprint（jieba 版本、自訂詞典內容、HMM），任何一個改了就整份失效
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import jieba
+
+log = logging.getLogger("tokenizer")
+
+JIEBA_CACHE_SIZE = int(os.getenv("JIEBA_CACHE_SIZE", "4096"))
+JIEBA_WORKERS = int(os.getenv("JIEBA_WORKERS", "0")) or (os.cpu_count() or 1)
+PARALLEL_MIN_DOCS = 2000  # 太少的文件開 process pool 不划算
+_SEP = "\x1f"  # 快取檔裡一篇文件的 token 用 unit separator 串起來（比 list of list 讀得快很多）
+
+
+def _ngrams(tokens: List[str]) -> List[str]:
+    """詞 + 相鄰兩詞（空白連接），同 sklearn _word_ngrams(ngram_range=(1, 2))"""
+    return tokens + list(map(" ".join, zip(tokens, tokens[1:])))
+
+
+def _cut(text: str, hmm: bool) -> List[str]:
+    return list(jieba.cut(text.lower(), HMM=hmm))
+
+
+# --- process pool worker ---
+_worker_hmm = True
+
+
+def _init_worker(userdicts: Tuple[str, ...], hmm: bool) -> None:
+    global _worker_hmm
+    _worker_hmm = hmm
+    jieba.setLogLevel(logging.WARNING)
+    jieba.initialize()
+    for path in userdicts:
+        jieba.load_userdict(path)
+
+
+def _cut_chunk(texts: List[str]) -> List[str]:
+    return [_SEP.join(_cut(t, _worker_hmm)) for t in texts]
+
+
+class Tokenizer:
+    def __init__(self, userdicts: Sequence[str] = ("data/userdict.txt",), cache_size: int = JIEBA_CACHE_SIZE,
+                 workers: int = JIEBA_WORKERS, hmm: bool = True) -> None:
+        self.userdicts = tuple(userdicts)
+        self.workers, self.hmm = workers, hmm
+        # 初始化 jieba（可選：自定詞典可用 jieba.load_userdict(...)）
+        jieba.initialize()
+        for path in self.userdicts:
+            jieba.load_userdict(path)  # 自訂辭典，讓 jieba 可以切出正確的詞彙
+        self.fingerprint = self._fingerprint()
+        self._analyze = functools.lru_cache(maxsize=cache_size)(self._analyze_uncached)
+
+    def _fingerprint(self) -> str:
+        h = hashlib.sha1(f"jieba={jieba.__version__};hmm={self.hmm};lower=1".encode())
+        for path in self.userdicts:
+            with open(path, "rb") as f:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def _analyze_uncached(self, text: str) -> Tuple[str, ...]:
+        return tuple(_ngrams(_cut(text, self.hmm)))
+
+    def analyze(self, text: str) -> Tuple[str, ...]:
+        return self._analyze(text)
+
+    def cache_info(self):
+        return self._analyze.cache_info()
+
+    def cache_clear(self) -> None:
+        self._analyze.cache_clear()
+
+    def analyze_corpus(self, texts: Sequence[str], cache_path: Optional[str] = None) -> Iterator[List[str]]:
+        """
+        整批分詞（不經 LRU）；有 cache_path 時讀寫磁碟快取。
+        回傳 iterator（與 texts 同順序）：詞 + 2-gram 的 list 邊用邊產生，不會整個 KB 同時放在記憶體裡
+        """
+        keys = [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in texts]
+        cached = self._load(cache_path) if cache_path else {}
+        missing = list({k: t for k, t in zip(keys, texts) if k not in cached}.items())
+        if missing:
+            for (key, _), joined in zip(missing, self._cut_many([t for _, t in missing])):
+                cached[key] = joined
+            if cache_path:
+                self._save(cache_path, {k: cached[k] for k in keys})
+        return (_ngrams(cached[k].split(_SEP)) if cached[k] else [] for k in keys)
+
+    def _cut_many(self, texts: List[str]) -> Iterable[str]:
+        if self.workers <= 1 or len(texts) < PARALLEL_MIN_DOCS:
+            return [_SEP.join(_cut(t, self.hmm)) for t in texts]
+        # 每個 worker 約拿 4 個 chunk：chunk 大一點減少 IPC 次數，又不會讓最後一個 worker 拖太久
+        size = -(-len(texts) // (self.workers * 4))
+        chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.userdicts, self.hmm)) as pool:
+            return [joined for chunk in pool.map(_cut_chunk, chunks) for joined in chunk]
+
+    def _load(self, path: str) -> Dict[str, str]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning("token cache %s unreadable (%s); re-tokenizing", path, e)
+            return {}
+        if data.get("fingerprint") != self.fingerprint:
+            log.info("token cache %s was built with a different tokenizer; re-tokenizing", path)
+            return {}
+        return data.get("docs", {})
+
+    def _save(self, path: str, docs: Dict[str, str]) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": self.fingerprint, "docs": docs}, f, ensure_ascii=False)
+            os.replace(tmp, path)  # 原子替換：並行啟動的 worker 不會讀到寫一半的檔
+        except OSError as e:
+            log.warning("cannot write token cache %s (%s)", path, e)
@@ -0,0 +1,196 @@
+# scripts/bench_hybrid.py
+"""
+Hybrid 檢索的 recall@k 與延遲：TF-IDF（原本）/ BM25 / dense / hybrid（rrf、weighted）
+
+合成 --docs 篇中文 FAQ，每篇有唯一的表單編號（F + 6 位數）。query 都在找某一篇特定文件，分三種：
+
+- exact  ：完整表單編號（「表單編號 F482913 是哪個流程？」）
+- partial：只記得前 5 碼（「表單 F48291 開頭的是什麼？」）—— jieba 切出來的詞對不上
+- typo   ：主題 + 打錯兩碼順序的編號（「請假流程的表單 F482193」）
+
+另外產生同樣多「KB 裡沒有」的 query（不存在的主題 + 不存在的編號），量 router 用的 max_score
+能不能把「KB 答得出來」和「答不出來」分開（AUC：隨機挑一個答得出來、一個答不出來的 query，前者分數較高的機率）。
+
+延遲是單筆 search 的 p50 / p99（每次量之前清掉 jieba 與 query 向量的 LRU）：
+
+- hybrid seq：兩路依序跑（延遲 = 相加）
+- hybrid    ：dense 丟 thread pool 與 sparse 並行（延遲 ≈ max）
+- --embed-latency-ms：在 embedding 前多睡這麼久，模擬遠端 embedding API（day18 的 OpenAI embeddings）的網路延遲
+
+需要 faiss-cpu；有裝 sentence-transformers 時 dense 用 DENSE_MODEL，否則用字元 n-gram hashing（見 app/embedder.py）。
+需要在專案根目錄執行（會讀 data/userdict.txt）。
+
+用法：
+    python scripts/bench_hybrid.py
+    python scripts/bench_hybrid.py --docs 50000 --queries 300 --embed-latency-ms 30
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import jieba
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from app.embedder import Embedder, get_embedder  # noqa: E402
+from app.hybrid import HybridRetriever  # noqa: E402
+from bench_incremental_index import PHRASES, TOPICS  # noqa: E402
+
+OTHER_TOPICS = ["停車位申請", "員工旅遊", "咖啡機維修", "識別證補發", "宿舍分配", "團保理賠", "社團補助"]
+KS = (1, 5, 10)
+
+
+class _SlowEmbedder(Embedder):
+    """模擬遠端 embedding API：每次 embed 前先睡 latency 秒（網路往返，不佔 CPU）"""
+
+    def __init__(self, inner: Embedder, latency: float):
+        super().__init__()
+        self.inner, self.latency = inner, latency
+        self.name, self.dim = f"{inner.name} + {latency * 1000:.0f} ms", inner.dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        time.sleep(self.latency)
+        return self.inner.embed(texts)
+
+
+def _corpus(rnd: random.Random, n: int) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]], List[str]]:
+    forms = [f"F{x:06d}" for x in rnd.sample(range(10 ** 6), n + 1000)]
+    docs, meta = [], []
+    for i in range(n):
+        topic = rnd.choice(TOPICS)
+        text = (f"{topic}：{rnd.choice(PHRASES)}，{rnd.choice(PHRASES)}；"
+                f"適用部門 D{rnd.randrange(500)}，表單編號 {forms[i]}。")
+        docs.append((f"doc-{i}", text))
+        meta.append((topic, forms[i]))
+    return docs, meta, forms[n:]
+
+
+def _queries(rnd: random.Random, docs, meta, unused: List[str], n: int) -> Dict[str, List[Tuple[str, str]]]:
+    sets: Dict[str, List[Tuple[str, str]]] = {"exact": [], "partial": [], "typo": [], "none": []}
+    for pos in rnd.sample(range(len(docs)), n):
+        doc_id, (topic, form) = docs[pos][0], meta[pos]
+        j = rnd.randrange(2, 6)
+        typo = form[:j] + form[j + 1] + form[j] + form[j + 2:]
+        sets["exact"].append((f"表單編號 {form} 是哪個流程？", doc_id))
+        sets["partial"].append((f"表單 {form[:-1]} 開頭的是什麼？", doc_id))
+        sets["typo"].append((f"{topic}的表單 {typo}", doc_id))
+        sets["none"].append((f"{rnd.choice(OTHER_TOPICS)}的表單編號 {rnd.choice(unused)}", ""))
+    return sets
+
+
+def _auc(pos: List[float], neg: List[float]) -> float:
+    """Mann–Whitney：P(答得出來的分數 > 答不出來的分數)，同分算一半"""
+    p, q = np.asarray(pos)[:, None], np.asarray(neg)[None, :]
+    return float(((p > q).sum() + 0.5 * (p == q).sum()) / (p.size * q.size))
+
+
+def _pct(xs: List[float], q: float) -> float:
+    return sorted(xs)[min(len(xs) - 1, int(q * len(xs)))]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=50_000)
+    ap.add_argument("--queries", type=int, default=300, help="每種 query 幾個")
+    ap.add_argument("--embed-latency-ms", type=float, default=0.0)
+    args = ap.parse_args()
+
+    jieba.setLogLevel(60)
+    rnd = random.Random(0)
+    docs, meta, unused = _corpus(rnd, args.docs)
+    sets = _queries(rnd, docs, meta, unused, args.queries)
+    tmp = tempfile.mkdtemp(prefix="bench-hybrid-")
+    kb_path = os.path.join(tmp, "kb.jsonl")
+    with open(kb_path, "w", encoding="utf-8") as f:
+        for doc_id, text in docs:
+            f.write(json.dumps({"id": doc_id, "text": text}, ensure_ascii=False) + "\n")
+
+    try:
+        embedder = get_embedder()
+        if args.embed_latency_ms:
+            embedder = _SlowEmbedder(embedder, args.embed_latency_ms / 1000)
+        t0 = time.perf_counter()
+        r = HybridRetriever(kb_path, embedder=embedder, tokens_path=os.path.join(tmp, "kb.tokens.json"),
+                            index_path=os.path.join(tmp, "kb.index"), use_snapshot=False)
+        build_s = time.perf_counter() - t0
+        print(f"docs: {args.docs:,}  queries: {args.queries} × {len(sets)}  dense: {embedder.name} ({embedder.dim}d)"
+              f"  cpus: {os.cpu_count()}  build: {build_s:.1f} s")
+
+        def ids_of(hits) -> List[str]:
+            return [h[0] for h in hits]
+
+        def hybrid(fusion: str, parallel: bool = True) -> Callable[[str], Tuple[List[str], float]]:
+            def run(q: str):
+                r.fusion, r.parallel = fusion, parallel
+                chunks, signals = r.search(q, top_k=max(KS))
+                return [c.id for c in chunks], signals.max_score
+            return run
+
+        def tfidf(q: str):
+            chunks, signals = r.sparse.search(q, top_k=max(KS))
+            return [c.id for c in chunks if c.score > 0], signals.max_score
+
+        def bm25(q: str):
+            hits, _ = r._sparse_leg([q], max(KS))[0]
+            return ids_of(hits), hits[0][2] if hits else 0.0
+
+        def dense(q: str):
+            hits = r._dense_leg([q], max(KS))[0]
+            return ids_of(hits), hits[0][2] if hits else 0.0
+
+        systems = {"tfidf (before)": tfidf, "bm25": bm25, "dense": dense,
+                   "hybrid rrf": hybrid("rrf"), "hybrid weighted": hybrid("weighted")}
+        kinds = ("exact", "partial", "typo")
+        print(f"\n{'recall':<16}" + "".join(f"  {kind:>9}@{k:<2}" for kind in kinds for k in KS))
+        aucs = {}
+        for label, fn in systems.items():
+            cells = []
+            neg = [fn(q)[1] for q, _ in sets["none"]]
+            for kind in kinds:
+                results = [(fn(q), target) for q, target in sets[kind]]
+                for k in KS:
+                    hit = sum(target in ids[:k] for (ids, _), target in results) / len(results)
+                    cells.append(f"  {hit:>12.3f}")
+                aucs.setdefault(label, []).append(_auc([score for (_, score), _ in results], neg))
+            print(f"{label:<16}{''.join(cells)}")
+        print(f"\n{'route AUC':<16}" + "".join(f"  {kind + ' vs none':>16}" for kind in kinds))
+        for label, row in aucs.items():
+            print(f"{label:<16}" + "".join(f"  {auc:>16.3f}" for auc in row))
+
+        # 延遲：清 LRU 後量單筆 search；query 四種混在一起
+        queries = [q for name in ("exact", "partial", "typo", "none") for q, _ in sets[name]]
+        runs = {"tfidf (before)": tfidf, "bm25 leg": bm25, "dense leg": dense,
+                "hybrid seq": hybrid(r.fusion, parallel=False), "hybrid": hybrid(r.fusion, parallel=True)}
+        print(f"\n{'latency':<16} {'p50':>10} {'p99':>10}")
+        for label, fn in runs.items():
+            r.sparse.tokenizer.cache_clear()
+            embedder.cache_clear()
+            times = []
+            for q in queries:
+                t0 = time.perf_counter()
+                fn(q)
+                times.append(time.perf_counter() - t0)
+            print(f"{label:<16} {statistics.median(times) * 1000:8.2f} ms {_pct(times, 0.99) * 1000:8.2f} ms")
+    finally:
+        for root, dirs, files in os.walk(tmp, topdown=False):
+            for name in files:
+                os.unlink(os.path.join(root, name))
+            for name in dirs:
+                os.rmdir(os.path.join(root, name))
+        os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# scripts/bench_incremental_index.py
+"""
+KB 更新延遲：新增 1 篇（增量 upsert）vs 整批重建（reload：全部重跑 jieba + 重算 TF-IDF）
+
+合成 --docs 篇中文 FAQ（jieba 分詞，跟服務同一個 analyzer），然後量：
+
+- rebuild      ：SimpleRetriever.reload()，改版前每次改 KB 都要付的成本
+- upsert 1 doc ：新增一篇（含 jieba 分詞），p50 / p99 / max；max 會碰到 delta 併回 base 的那一次
+- 1st search   ：寫入後第一次查詢（lazy 重算 IDF 與文件 norm）
+- search       ：沒有新寫入時的一般查詢
+
+需要在專案根目錄執行（SimpleRetriever 會讀 data/userdict.txt）。
+
+用法：
+    python scripts/bench_incremental_index.py
+    python scripts/bench_incremental_index.py --docs 100000 --adds 2000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import jieba
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.retriever import SimpleRetriever  # noqa: E402
+
+TOPICS = ["公司 VPN 設定", "請假流程", "內部 Wi-Fi", "報帳規範", "開發流程", "版本控制", "例行會議",
+          "IT 支援", "年度健檢", "出差規定", "加班費計算", "新人報到", "資安規範", "會議室預約"]
+PHRASES = ["下載新版客戶端並以 SSO 登入", "主管核准後會自動同步至行事曆", "密碼由 IT 每季輪替",
+           "差旅需上傳發票影本", "必須先建立 Pull Request", "禁止直接推送主幹分支", "需準備上週進度與本週計劃",
+           "請至 Helpdesk 提交工單", "報名方式會提前寄送 Email", "經主管批准後方可訂票", "依勞基法規定加成給付",
+           "第一天需攜帶身分證件", "不得將機密資料上傳雲端", "可於內網系統查詢空檔"]
+
+
+def _doc(rnd: random.Random, i: int) -> str:
+    return (f"{rnd.choice(TOPICS)}（第 {i} 版）：{rnd.choice(PHRASES)}，{rnd.choice(PHRASES)}；"
+            f"適用部門 D{rnd.randrange(500)}，表單編號 F{rnd.randrange(100000)}。")
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:10.2f} ms"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=100_000)
+    ap.add_argument("--adds", type=int, default=2000, help="量 upsert 的次數（會跨過至少一次 delta 合併）")
+    args = ap.parse_args()
+
+    jieba.setLogLevel(60)
+    rnd = random.Random(0)
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+        for i in range(args.docs):
+            f.write(json.dumps({"id": f"doc-{i}", "text": _doc(rnd, i)}, ensure_ascii=False) + "\n")
+        kb_path = f.name
+    try:
+        r = SimpleRetriever(kb_path)  # 第一次：順便讓 jieba 載入詞典
+        t0 = time.perf_counter()
+        r.reload()
+        rebuild_s = time.perf_counter() - t0
+
+        queries = [f"{rnd.choice(TOPICS)} {rnd.choice(PHRASES)[:6]}" for _ in range(args.adds)]
+        adds, first, steady = [], [], []
+        for i in range(args.adds):
+            doc = (f"new-{i}", _doc(rnd, args.docs + i))
+            t0 = time.perf_counter()
+            r.upsert([doc])
+            t1 = time.perf_counter()
+            r.search(queries[i])
+            t2 = time.perf_counter()
+            r.search(queries[i])
+            t3 = time.perf_counter()
+            adds.append(t1 - t0)
+            first.append(t2 - t1)
+            steady.append(t3 - t2)
+        assert len(r) == args.docs + args.adds
+
+        def pct(xs, q):
+            return sorted(xs)[min(len(xs) - 1, int(q * len(xs)))]
+
+        upsert_p50 = statistics.median(adds)
+        print(f"docs: {args.docs:,}  adds: {args.adds:,}")
+        print(f"{'rebuild':<14} {_ms(rebuild_s)}")
+        print(f"{'upsert 1 doc':<14} {_ms(upsert_p50)} p50  {_ms(pct(adds, 0.99))} p99  {_ms(max(adds))} max"
+              f"  （p50 比 rebuild 快 {rebuild_s / upsert_p50:,.0f}x）")
+        print(f"{'1st search':<14} {_ms(statistics.median(first))} p50  {_ms(pct(first, 0.99))} p99")
+        print(f"{'search':<14} {_ms(statistics.median(steady))} p50  {_ms(pct(steady, 0.99))} p99")
+    finally:
+        os.unlink(kb_path)
+
+
+if __name__ == "__main__":
+    main()
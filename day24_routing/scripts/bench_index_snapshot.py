@@ -0,0 +1,166 @@
+# scripts/bench_index_snapshot.py
+"""
+多 worker 啟動時間與記憶體：每個 worker 各自建索引 vs mmap 載入同一份 snapshot（scripts/build_index.py）
+
+合成 --docs 篇中文 FAQ（同 bench_incremental_index），先建好分詞快取與 snapshot，然後同時開 N 個 worker 行程
+（模擬 uvicorn --workers N），每個 worker 建好 SimpleRetriever、跑 --queries 個 query 後回報：
+
+- startup：從 spawn 到可以回應（含 import、jieba 載詞典、建 / 載索引；N 個 worker 搶 CPU 時會互相拖慢）
+- jieba  ：jieba 載入詞典（兩種模式都一樣，不共用）
+- index  ：SimpleRetriever(...) 扣掉 jieba 之後，建 / 載索引的時間
+- query  ：啟動後前 --queries 個 query 的平均延遲（mmap 模式含第一次碰到頁面的 page fault）
+- RSS    ：常駐記憶體（mmap 的檔案頁面每個 worker 都算一次）
+- PSS    ：共用頁面按共用的行程數平分後的記憶體，N 個 worker 的 PSS 加總 ≈ 實際用掉的記憶體
+- USS    ：worker 私有的記憶體（Private_Clean + Private_Dirty）
+
+rebuild 模式（改版前：每個 worker 讀 kb.jsonl 自己建，分詞快取已是熱的）記憶體吃很多，
+用 --rebuild-workers 控制同時開幾個（預設 2，避免小機器 OOM）；per-worker 數字不受 worker 數影響。
+mmap 模式先跑 1 個 worker（query 延遲可以直接跟 rebuild 比），再同時跑 --workers 個。
+
+需要在專案根目錄執行（會讀 data/userdict.txt），只支援 Linux（讀 /proc/self/smaps_rollup）。
+
+用法：
+    python scripts/bench_index_snapshot.py
+    python scripts/bench_index_snapshot.py --docs 500000 --workers 8 --rebuild-workers 2
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+def _memory() -> Dict[str, float]:
+    """/proc/self/smaps_rollup 的 RSS / PSS / USS（MB）"""
+    kb = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == "kB":
+                kb[parts[0].rstrip(":")] = int(parts[1])
+    uss = kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)
+    return {"rss": kb["Rss"] / 1024, "pss": kb["Pss"] / 1024, "uss": uss / 1024}
+
+
+def _worker(args: argparse.Namespace) -> None:
+    """一個 worker：建 / 載索引 → 跑 query → 回報 ready → 等 parent 說量記憶體（此時所有 worker 都還活著）"""
+    import jieba
+
+    from app.retriever import SimpleRetriever
+    from bench_incremental_index import PHRASES, TOPICS
+
+    jieba.setLogLevel(60)
+    t0 = time.perf_counter()
+    jieba.initialize()  # SimpleRetriever 裡的 Tokenizer 會再呼叫一次（已載入就直接返回）
+    t1 = time.perf_counter()
+    r = SimpleRetriever(args.kb, tokens_path=args.tokens, index_path=args.index, use_snapshot=args.mode == "mmap")
+    t2 = time.perf_counter()
+    ready = time.time()
+    rnd = random.Random(os.getpid())
+    queries = [f"{rnd.choice(TOPICS)} {rnd.choice(PHRASES)[:6]}" for _ in range(args.queries)]
+    t3 = time.perf_counter()
+    for q in queries:
+        r.search(q)
+    query_s = (time.perf_counter() - t3) / max(1, len(queries))
+    print(json.dumps({"ready": ready, "jieba": t1 - t0, "index": t2 - t1, "query": query_s}), flush=True)
+    sys.stdin.readline()
+    print(json.dumps(_memory()), flush=True)
+
+
+def _run(args: argparse.Namespace, mode: str, n: int) -> List[Dict[str, float]]:
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", mode, "--kb", args.kb, "--tokens", args.tokens,
+           "--index", args.index, "--queries", str(args.queries)]
+    procs, spawned = [], []
+    for _ in range(n):
+        spawned.append(time.time())
+        procs.append(subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, cwd=os.getcwd()))
+    stats = []
+    for p, t0 in zip(procs, spawned):
+        ready = json.loads(p.stdout.readline())
+        stats.append({"startup": ready.pop("ready") - t0, **ready})
+    for p, s in zip(procs, stats):  # 全部 ready 之後才量：共用頁面的 PSS 才是 N 個行程平分的
+        p.stdin.write("\n")
+        p.stdin.flush()
+        s.update(json.loads(p.stdout.readline()))
+    for p in procs:
+        p.wait()
+    return stats
+
+
+def _report(label: str, stats: List[Dict[str, float]]) -> None:
+    def med(key: str) -> float:
+        return statistics.median(s[key] for s in stats)
+
+    total_pss = sum(s["pss"] for s in stats)
+    print(f"{label:<16} {len(stats):>3}  {med('startup'):8.1f} s  {med('jieba'):8.1f} s  {med('index'):8.2f} s"
+          f"  {med('query') * 1000:7.1f} ms  {med('rss'):8.0f} MB  {med('pss'):8.0f} MB  {med('uss'):8.0f} MB"
+          f"  {total_pss:10.0f} MB")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=500_000)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--rebuild-workers", type=int, default=2)
+    ap.add_argument("--queries", type=int, default=200, help="每個 worker 啟動後先跑幾個 query（碰到常用的頁面）")
+    ap.add_argument("--worker", choices=["mmap", "rebuild"], help=argparse.SUPPRESS)
+    ap.add_argument("--kb", help=argparse.SUPPRESS)
+    ap.add_argument("--tokens", help=argparse.SUPPRESS)
+    ap.add_argument("--index", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.worker:
+        args.mode = args.worker
+        _worker(args)
+        return
+
+    import jieba
+
+    from app.retriever import SimpleRetriever
+    from bench_incremental_index import _doc
+
+    jieba.setLogLevel(60)
+    tmp = tempfile.mkdtemp(prefix="bench-index-snapshot-")
+    args.kb = os.path.join(tmp, "kb.jsonl")
+    args.tokens = os.path.join(tmp, "kb.tokens.json")
+    args.index = os.path.join(tmp, "kb.index")
+    try:
+        rnd = random.Random(0)
+        with open(args.kb, "w", encoding="utf-8") as f:
+            for i in range(args.docs):
+                f.write(json.dumps({"id": f"doc-{i}", "text": _doc(rnd, i)}, ensure_ascii=False) + "\n")
+
+        # 建分詞快取 + snapshot（同 scripts/build_index.py）；之後兩種模式都不用再跑 jieba 切 KB
+        t0 = time.perf_counter()
+        r = SimpleRetriever(args.kb, tokens_path=args.tokens, index_path=args.index, use_snapshot=False)
+        t1 = time.perf_counter()
+        meta = r.save()
+        save_s = time.perf_counter() - t1
+        del r
+        size = sum(os.path.getsize(os.path.join(args.index, name)) for name in os.listdir(args.index))
+        print(f"docs: {meta['n_docs']:,}  terms: {meta['n_terms']:,}  nnz: {meta['nnz']:,}  cpus: {os.cpu_count()}")
+        print(f"build (cold tokenize) {t1 - t0:.1f} s, save {save_s:.1f} s, snapshot {size / 1e6:.0f} MB")
+
+        print(f"{'mode':<16} {'n':>3}  {'startup':>10}  {'jieba':>10}  {'index':>10}"
+              f"  {'query':>10}  {'RSS':>11}  {'PSS':>11}  {'USS':>11}  {'sum PSS':>13}")
+        _report("rebuild", _run(args, "rebuild", args.rebuild_workers))
+        _report("mmap snapshot", _run(args, "mmap", 1))  # 單一 worker：跟 rebuild 比 query 延遲（沒有搶 CPU）
+        _report("mmap snapshot", _run(args, "mmap", args.workers))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
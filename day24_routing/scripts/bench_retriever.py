@@ -0,0 +1,109 @@
+# scripts/bench_retriever.py
+"""
+檢索延遲：原本的 search（dense 分數 + 全量 argsort，一次一個 query）vs search_batch（稀疏倒排 + argpartition）
+
+KB 用合成資料：詞彙照 Zipf 分佈抽（常見詞出現在很多文件裡），每篇約 --terms 個詞；
+analyzer 用空白切，省掉百萬篇文件 jieba 分詞的時間（這裡只量打分數 + 取 top-k）。
+
+- legacy      ：sklearn TfidfVectorizer 全量 fit，(matrix @ qv.T).toarray() + np.argsort，一次一個 query（改版前的 search）
+- search      ：新版單筆 search（倒排 + argpartition）
+- search_batch：--batch 個 query 一起算，數字是攤到每個 query 的延遲
+
+用法：
+    python scripts/bench_retriever.py
+    python scripts/bench_retriever.py --docs 10000 100000 1000000 --queries 200 --batch 64
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.retriever import SimpleRetriever  # noqa: E402
+from app.tfidf_index import TfidfIndex  # noqa: E402
+
+
+def _build(n_docs: int, terms: int) -> Tuple[SimpleRetriever, TfidfVectorizer, sp.csr_matrix]:
+    """合成 KB：詞 t0, t1, … 照 Zipf 抽（小編號的詞很常見）；analyzer 用空白切，省掉 jieba 的時間"""
+    rng = np.random.default_rng(0)
+    words = rng.zipf(1.3, size=n_docs * terms) % 50_000
+    texts = [" ".join(f"t{w}" for w in row) for row in words.reshape(n_docs, terms).tolist()]
+
+    r = SimpleRetriever.__new__(SimpleRetriever)
+    r.index = TfidfIndex(str.split)
+    r.index.build((f"doc-{i}", t) for i, t in enumerate(texts))
+
+    # 改版前的作法：sklearn 全量 fit，查詢時 dense 分數 + argsort
+    ref = TfidfVectorizer(analyzer=str.split, norm="l2")
+    return r, ref, ref.fit_transform(texts)
+
+
+def _legacy(ref: TfidfVectorizer, matrix: sp.csr_matrix, query: str, top_k: int):
+    qv = ref.transform([query])
+    scores = (matrix @ qv.T).toarray().ravel()
+    top_idx = np.argsort(-scores)[:top_k]
+    hits = scores[top_idx]
+    pos_hits = hits[hits > 0]
+    return top_idx, float(np.mean(pos_hits)) if pos_hits.size else 0.0, int(np.sum(scores > 0.0))
+
+
+def _per_query_ms(n: int, seconds: float) -> str:
+    return f"{seconds / n * 1000:9.3f} ms/query"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--terms", type=int, default=20, help="每篇文件的詞數")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--top-k", type=int, default=3)
+    args = ap.parse_args()
+
+    for n_docs in args.docs:
+        rnd = random.Random(0)
+        t0 = time.perf_counter()
+        r, ref, matrix = _build(n_docs, args.terms)
+        build_s = time.perf_counter() - t0
+        queries = [" ".join(f"t{rnd.randrange(2000)}" for _ in range(rnd.randint(1, 3))) for _ in range(args.queries)]
+        # legacy 在 1M 篇時每筆要幾十 ms，只量一部分
+        n_legacy = max(10, min(len(queries), 2_000_000 // n_docs))
+        r.search_batch(queries[:2], args.top_k)  # 暖身
+
+        t0 = time.perf_counter()
+        legacy = [_legacy(ref, matrix, q, args.top_k) for q in queries[:n_legacy]]
+        legacy_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        single = [r.search(q, args.top_k) for q in queries]
+        single_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        batched = []
+        for i in range(0, len(queries), args.batch):
+            batched.extend(r.search_batch(queries[i:i + args.batch], args.top_k))
+        batch_s = time.perf_counter() - t0
+
+        # 結果要跟原本一致（同分時順序可能不同，所以比分數與訊號）
+        for (idx, avg, num), (chunks, sig), (bchunks, bsig) in zip(legacy, single, batched):
+            assert sig == bsig and [c.id for c in chunks] == [c.id for c in bchunks]
+            assert sig.num_docs == num and abs(sig.avg_topk - avg) < 1e-9
+
+        print(f"docs={n_docs:>9,}  nnz={matrix.nnz:,}  build={build_s:.1f}s")
+        print(f"  {'legacy':<13} {_per_query_ms(n_legacy, legacy_s)}")
+        print(f"  {'search':<13} {_per_query_ms(len(queries), single_s)}  ({legacy_s / n_legacy / (single_s / len(queries)):.1f}x)")
+        print(f"  {'search_batch':<13} {_per_query_ms(len(queries), batch_s)}  ({legacy_s / n_legacy / (batch_s / len(queries)):.1f}x)")
+        del r, ref, matrix
+
+
+if __name__ == "__main__":
+    main()
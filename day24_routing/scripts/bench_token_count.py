@@ -0,0 +1,77 @@
+# scripts/bench_token_count.py
+"""
+token 計數 / 送出前成本估計的吞吐量（路由層每個請求都要估一次，不能比檢索還慢）
+
+- cold          ：每段文字都不同（LRU 全 miss，等於 tokenizer 本身的速度）
+- warm          ：重複的 query / system prompt（LRU 命中）
+- estimate_cost ：messages → prompt tokens → 查價格表（路由層實際會呼叫的路徑，LRU 命中）
+
+有裝 tiktoken（且 encoding 檔可用）時量的是 tiktoken；否則是內建估算。
+
+用法：
+    python scripts/bench_token_count.py
+    python scripts/bench_token_count.py --texts 20000 --model gpt-4o-mini
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.accounting import PricingTable, TokenCounter  # noqa: E402
+
+SYSTEM_PROMPT = "你是公司內部 IT 與人資知識庫助理，請一律使用繁體中文、根據提供的資料回答。"
+SEEDS = ["如何設定公司 VPN？", "請假流程是什麼", "午餐補助怎麼領", "Wi-Fi 密碼多少", "reset my password",
+         "報帳需要哪些單據？", "新進員工 onboarding checklist", "加班費怎麼計算"]
+
+
+def _texts(n: int) -> list:
+    rnd = random.Random(0)
+    return [f"{rnd.choice(SEEDS)} #{i} " + "補充說明 " * rnd.randint(0, 20) for i in range(n)]
+
+
+def _rate(n: int, seconds: float) -> str:
+    return f"{n / seconds:>12,.0f} /s {seconds / n * 1e6:9.2f} µs"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--texts", type=int, default=10000)
+    ap.add_argument("--model", default="gpt-4o-mini")
+    args = ap.parse_args()
+
+    texts = _texts(args.texts)
+    counter = TokenCounter(cache_size=args.texts * 2)
+    counter.count("warmup", args.model)  # 載入 encoding 不算在內
+    print(f"backend: {counter._encoding_name(args.model)}  texts: {args.texts}  "
+          f"avg chars: {sum(map(len, texts)) / len(texts):.0f}")
+
+    t0 = time.perf_counter()
+    for t in texts:
+        counter.count(t, args.model)
+    cold = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for t in texts:
+        counter.count(t, args.model)
+    warm = time.perf_counter() - t0
+
+    pricing = PricingTable()
+    t0 = time.perf_counter()
+    for t in texts:
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": t}]
+        pricing.cost(args.model, counter.count_messages(messages, args.model), 256)
+    est = time.perf_counter() - t0
+
+    print(f"{'cold':<14} {_rate(len(texts), cold)}")
+    print(f"{'warm (LRU)':<14} {_rate(len(texts), warm)}")
+    print(f"{'estimate_cost':<14} {_rate(len(texts), est)}")
+    print(counter.cache_info())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# scripts/bench_tokenizer.py
+"""
+分詞吞吐量（tokens/s）與冷啟動時間：改版前（單行程逐篇 jieba）vs Tokenizer（process pool + 磁碟快取 + LRU）
+
+- corpus serial   ：單行程逐篇 jieba.cut（改版前 fit_transform 的分詞部分）
+- corpus pool     ：--workers 個 process 分 chunk 切
+- cold start      ：SimpleRetriever(kb) 從零開始（沒有分詞快取，切完順便寫快取）
+- warm start      ：再開一次（分詞快取命中，只剩建索引）
+- query           ：同一句 query 第一次（jieba）vs 之後（LRU 命中）
+
+需要在專案根目錄執行（會讀 data/userdict.txt）。
+
+用法：
+    python scripts/bench_tokenizer.py
+    python scripts/bench_tokenizer.py --docs 100000 --workers 8
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import jieba
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from app.retriever import SimpleRetriever  # noqa: E402
+from app.tfidf_index import TfidfIndex  # noqa: E402
+from app.tokenizer import JIEBA_WORKERS, Tokenizer  # noqa: E402
+from bench_incremental_index import PHRASES, TOPICS, _doc  # noqa: E402
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=100_000)
+    ap.add_argument("--workers", type=int, default=JIEBA_WORKERS)
+    ap.add_argument("--queries", type=int, default=2000)
+    args = ap.parse_args()
+
+    jieba.setLogLevel(60)
+    rnd = random.Random(0)
+    docs = [(f"doc-{i}", _doc(rnd, i)) for i in range(args.docs)]
+    texts = [t for _, t in docs]
+    tmp = tempfile.mkdtemp(prefix="bench-tokenizer-")
+    kb_path = os.path.join(tmp, "kb.jsonl")
+    with open(kb_path, "w", encoding="utf-8") as f:
+        for doc_id, text in docs:
+            f.write(json.dumps({"id": doc_id, "text": text}, ensure_ascii=False) + "\n")
+
+    try:
+        serial_tok = Tokenizer(workers=1)
+        pool_tok = Tokenizer(workers=args.workers)
+        terms, serial_s = _timed(lambda: list(serial_tok.analyze_corpus(texts)))
+        _, pool_s = _timed(lambda: list(pool_tok.analyze_corpus(texts)))
+        n_tokens = sum(len(t) for t in terms)  # 詞 + 2-gram
+
+        # 改版前的冷啟動：逐篇 jieba + 建索引
+        _, before_s = _timed(lambda: TfidfIndex(serial_tok._analyze_uncached).build(docs))
+        tokens_path = os.path.join(tmp, "kb.tokens.json")
+        _, cold_s = _timed(lambda: SimpleRetriever(kb_path, tokens_path=tokens_path))
+        r, warm_s = _timed(lambda: SimpleRetriever(kb_path, tokens_path=tokens_path))
+
+        queries = [f"{rnd.choice(TOPICS)}{rnd.choice(PHRASES)[:6]}（{i}）？" for i in range(args.queries)]
+        _, q_cold = _timed(lambda: [r.tokenizer.analyze(q) for q in queries])
+        _, q_warm = _timed(lambda: [r.tokenizer.analyze(q) for q in queries])
+
+        print(f"docs: {args.docs:,}  tokens: {n_tokens:,}  cpus: {os.cpu_count()}  workers: {args.workers}  "
+              f"token cache: {os.path.getsize(tokens_path) / 1e6:.0f} MB")
+        print(f"{'corpus serial':<14} {n_tokens / serial_s:>12,.0f} tokens/s  {serial_s:7.1f} s")
+        print(f"{'corpus pool':<14} {n_tokens / pool_s:>12,.0f} tokens/s  {pool_s:7.1f} s")
+        print(f"{'start (before)':<14} {before_s:>12.1f} s")
+        print(f"{'cold start':<14} {cold_s:>12.1f} s")
+        print(f"{'warm start':<14} {warm_s:>12.1f} s")
+        print(f"{'query jieba':<14} {q_cold / len(queries) * 1e6:>12.1f} µs")
+        print(f"{'query LRU':<14} {q_warm / len(queries) * 1e6:>12.1f} µs")
+    finally:
+        for name in os.listdir(tmp):
+            os.unlink(os.path.join(tmp, name))
+        os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# scripts/build_index.py
+"""
+從 kb.jsonl 建 TF-IDF 索引並寫成 mmap 用的 snapshot 目錄（.npy）
+
+服務啟動時（SimpleRetriever）發現 INDEX_PATH 有 KB 內容、分詞設定都對得上的 snapshot，
+就用 mmap_mode="r" 直接載入：不用分詞、不用建矩陣，多個 worker 共用同一份 page cache。
+KB 或自訂詞典改了之後重跑一次即可（舊 snapshot 會被判定過期，服務改走重建並印出警告）。
+
+需要在專案根目錄執行（會讀 data/userdict.txt）。
+
+用法：
+    python scripts/build_index.py
+    python scripts/build_index.py --kb data/kb.jsonl --out data/kb.jsonl.index
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.retriever import SimpleRetriever  # noqa: E402
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--kb", default=os.getenv("KB_PATH", "data/kb.jsonl"))
+    ap.add_argument("--out", default=None, help="snapshot 目錄（預設 INDEX_PATH 或 <kb>.index）")
+    ap.add_argument("--tokens", default=None, help="分詞快取（預設 KB_TOKENS_PATH 或 <kb>.tokens.json）")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    r = SimpleRetriever(args.kb, tokens_path=args.tokens, index_path=args.out, use_snapshot=False)
+    t1 = time.perf_counter()
+    meta = r.save()
+    t2 = time.perf_counter()
+    print(f"{r.index_path}: {meta['n_docs']:,} docs, {meta['n_terms']:,} terms, {meta['nnz']:,} nnz, "
+          f"{_dir_size(r.index_path) / 1e6:.1f} MB（build {t1 - t0:.1f} s, save {t2 - t1:.1f} s）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# scripts/compact_kb.py
+"""
+把 /kb/docs 的變更日誌（KB_CHANGES_PATH）併回 kb.jsonl，並換上一個空的日誌
+
+服務不用停：各 worker 在下一個請求發現日誌換檔，就重讀新的 kb.jsonl（整批重建）。
+併完之後 kb.jsonl 的內容變了，mmap snapshot 會被判定過期：要用 snapshot 的話重跑 scripts/build_index.py。
+
+用法：
+    python scripts/compact_kb.py
+    python scripts/compact_kb.py --kb data/kb.jsonl --changes data/kb.jsonl.changes.jsonl
+"""
+import argparse
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.kb_changes import compact  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--kb", default=os.getenv("KB_PATH", "data/kb.jsonl"))
+    ap.add_argument("--changes", default=None, help="變更日誌（預設 KB_CHANGES_PATH 或 <kb>.changes.jsonl）")
+    args = ap.parse_args()
+
+    changes = args.changes or os.getenv("KB_CHANGES_PATH") or f"{args.kb}.changes.jsonl"
+    res = compact(args.kb, changes)
+    print(f"{args.kb}: merged {res['events']} change events → {res['docs']} docs; {changes} is now empty")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# scripts/replay_policy.py
+"""
+拿決策日誌 replay 路由策略：如果當初用這個策略，成本、延遲、答得好的比例會是多少
+
+- 策略選的路和日誌裡實際走的一樣：直接用當時記下的成本、延遲、feedback
+- 不一樣（反事實）：成本用該路在日誌裡的平均；延遲從該路記下的延遲裡抽樣；
+  答得好的機率用「參考模型」估 —— 在這份日誌上每條路各 fit 一個 logistic（direct method）。
+  所以日誌裡很少走的路估得比較不準，「observed」欄是可以直接用實際結果的比例
+- 特徵直接讀日誌裡存的（做決策當下算的那份），不用重跑檢索
+- 同時量推論時間：線上單筆 decide()（含建 RouteDecision）與整批 choose() 每列
+
+用法：
+    python scripts/replay_policy.py --log logs/decisions.jsonl* --policy data/policy.json
+    python scripts/replay_policy.py --log logs/decisions.replay.jsonl --policy data/policy.logistic.json data/policy.gbdt.json
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from app.models import RetrievalSignals  # noqa: E402
+from app.policy import FEATURES, ROUTES, Policy, ThresholdPolicy, load_policy  # noqa: E402
+from app.router import MIN_DOCS, THRESH_AVG, THRESH_MAX  # noqa: E402
+from train_policy import Decisions, build_policy, read_decisions  # noqa: E402
+
+
+def replay(policy: Policy, data: Decisions, ref_p: np.ndarray, seed: int = 0) -> Dict[str, float]:
+    """一個策略在整份日誌上的 (route 比例, 成本, 延遲, 答得好的比例, 直接觀測到的比例)"""
+    rng = np.random.default_rng(seed)
+    n = len(data.route)
+    chosen = policy.choose(data.X)
+    same = chosen == data.route
+    cost = data.cost.copy()
+    latency = data.latency.copy()
+    ok = np.where(same & ~np.isnan(data.ok), data.ok, ref_p[np.arange(n), chosen])
+    for r in range(len(ROUTES)):
+        todo = ~same & (chosen == r)
+        logged = data.route == r
+        if not todo.any():
+            continue
+        cost[todo] = data.cost[logged].mean() if logged.any() else getattr(policy, "cost_usd", np.zeros(3))[r]
+        if logged.any():
+            latency[todo] = rng.choice(data.latency[logged], int(todo.sum()))
+        else:
+            latency[todo] = getattr(policy, "latency_ms", np.zeros(3))[r]
+    out = {f"%{name}": float((chosen == r).mean()) for r, name in enumerate(ROUTES)}
+    out.update({
+        "cost_per_1k": float(cost.mean() * 1000), "p50_ms": float(np.percentile(latency, 50)),
+        "p95_ms": float(np.percentile(latency, 95)), "ok_rate": float(ok.mean()),
+        "observed": float((same & ~np.isnan(data.ok)).mean()),
+    })
+    return out
+
+
+def time_inference(policy: Policy, data: Decisions, reps: int = 20_000) -> Dict[str, float]:
+    """線上單筆 decide()（RetrievalSignals → RouteDecision）每次的 p50 / p99，與整批 choose() 每列的時間"""
+    signals = [RetrievalSignals(max_score=x[0], avg_topk=x[1], num_docs=int(x[2]), context_len=int(x[3]),
+                                sparse_max=x[4], dense_max=x[5]) for x in data.X[:256].tolist()]
+    times: List[int] = []
+    for i in range(reps):
+        s = signals[i % len(signals)]
+        t0 = time.perf_counter_ns()
+        policy.decide(s)
+        times.append(time.perf_counter_ns() - t0)
+    t0 = time.perf_counter()
+    policy.choose(data.X)
+    batch = time.perf_counter() - t0
+    return {"decide_p50_us": float(np.percentile(times, 50)) / 1000, "decide_p99_us": float(np.percentile(times, 99)) / 1000,
+            "batch_us_per_row": batch / max(len(data.route), 1) * 1e6}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--log", nargs="+", required=True, help="決策日誌（可多個、可 .gz）")
+    ap.add_argument("--policy", nargs="*", default=[], help="策略檔（train_policy.py 的輸出）")
+    ap.add_argument("--no-threshold", action="store_true", help="不比較目前的固定門檻")
+    args = ap.parse_args()
+
+    data = read_decisions(args.log)
+    if not len(data.route):
+        raise SystemExit("no decisions found in log")
+    ref = build_policy(data, "logistic", version="replay-reference")
+    ref_p = ref.model.predict(data.X)
+
+    policies: List[Policy] = [] if args.no_threshold else [ThresholdPolicy(THRESH_MAX, THRESH_AVG, MIN_DOCS)]
+    policies += [load_policy(path) for path in args.policy]
+    logged = {f"%{name}": float((data.route == r).mean()) for r, name in enumerate(ROUTES)}
+    print(f"{len(data.route):,} requests, {int((~np.isnan(data.ok)).sum()):,} with feedback; "
+          f"logged mix: {', '.join(f'{k[1:]} {v:.1%}' for k, v in logged.items())}; features: {', '.join(FEATURES)}")
+    print(f"\n{'policy':<24} {'kb':>6} {'small':>6} {'large':>6} {'USD/1k req':>11} {'p50':>9} {'p95':>9} "
+          f"{'ok rate':>8} {'observed':>9} {'decide p50/p99':>16} {'batch/row':>10}")
+    for policy in policies:
+        res, t = replay(policy, data, ref_p), time_inference(policy, data)
+        print(f"{policy.name:<24} {res['%kb']:>6.1%} {res['%small_model']:>6.1%} {res['%large_model']:>6.1%} "
+              f"{res['cost_per_1k']:>11.4f} {res['p50_ms']:>6.0f} ms {res['p95_ms']:>6.0f} ms {res['ok_rate']:>8.3f} "
+              f"{res['observed']:>9.1%} {t['decide_p50_us']:>6.1f} / {t['decide_p99_us']:>4.1f} µs "
+              f"{t['batch_us_per_row']:>7.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
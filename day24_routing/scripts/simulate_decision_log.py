@@ -0,0 +1,91 @@
+# scripts/simulate_decision_log.py
+"""
+產生合成的決策日誌（格式與 ROUTER_LOG_PATH 相同），沒有真實流量時用來試 train_policy.py / replay_policy.py
+
+- 60% 的 query KB 答得出來（max_score 高、命中多），其餘 KB 沒有
+- 每條路「答得好」的真實機率（策略看不到，只能從 feedback 學）：
+    kb         ：σ(14 · (max_score - 0.35))，沒有命中文件時 0
+    small_model：0.35 + 0.4 · max_score
+    large_model：0.80 + 0.15 · max_score
+- 成本 / 延遲（lognormal 抖動）：kb 0 USD / ~8 ms、small ~0.0002 USD / ~350 ms、large ~0.004 USD / ~1400 ms
+- 實際走的路：原本的固定門檻（ThresholdPolicy），--explore 的比例隨機選；--feedback-rate 的請求有回 feedback
+
+用法：
+    python scripts/simulate_decision_log.py --n 20000 --out logs/decisions.sim.jsonl
+    python scripts/simulate_decision_log.py --n 20000 --seed 1 --explore 0 --out logs/decisions.replay.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.policy import ROUTES, ThresholdPolicy  # noqa: E402
+from app.router import MIN_DOCS, THRESH_AVG, THRESH_MAX  # noqa: E402
+
+COST_USD = np.array([0.0, 0.0002, 0.004])
+LATENCY_MS = np.array([8.0, 350.0, 1400.0])
+
+
+def true_ok_prob(X: np.ndarray) -> np.ndarray:
+    """(n, routes)：每條路答得好的真實機率"""
+    max_score, num_docs = X[:, 0], X[:, 2]
+    kb = 1.0 / (1.0 + np.exp(-14.0 * (max_score - 0.35))) * (num_docs > 0)
+    return np.stack([kb, 0.35 + 0.4 * max_score, 0.80 + 0.15 * max_score], axis=1)
+
+
+def simulate(n: int, seed: int = 0, explore: float = 0.2, feedback_rate: float = 0.5):
+    """回傳 (features, 走的路, 真實機率, ok（沒 feedback 為 None）, cost, latency)"""
+    rng = np.random.default_rng(seed)
+    in_kb = rng.random(n) < 0.6
+    max_score = np.clip(np.where(in_kb, rng.normal(0.5, 0.15, n), rng.normal(0.18, 0.1, n)), 0.0, 1.0)
+    num_docs = np.where(max_score > 0.02, rng.poisson(np.where(in_kb, 3.0, 1.0)) + 1, 0)
+    avg_topk = max_score * rng.uniform(0.4, 0.9, n)
+    context_len = num_docs * rng.integers(30, 90, n)
+    X = np.stack([max_score, avg_topk, num_docs, context_len, np.zeros(n), np.zeros(n)], axis=1)
+
+    route = ThresholdPolicy(THRESH_MAX, THRESH_AVG, MIN_DOCS).choose(X)
+    explored = rng.random(n) < explore
+    route = np.where(explored, rng.integers(0, len(ROUTES), n), route)
+
+    p = true_ok_prob(X)
+    ok = rng.random(n) < p[np.arange(n), route]
+    jitter = rng.lognormal(0.0, 0.3, n)
+    cost, latency = COST_USD[route] * jitter, LATENCY_MS[route] * jitter
+    has_feedback = rng.random(n) < feedback_rate
+    return X, route, p, [bool(o) if f else None for o, f in zip(ok, has_feedback)], cost, latency
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=20_000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--explore", type=float, default=0.2)
+    ap.add_argument("--feedback-rate", type=float, default=0.5)
+    ap.add_argument("--out", default="logs/decisions.sim.jsonl")
+    args = ap.parse_args()
+
+    X, route, _, ok, cost, latency = simulate(args.n, args.seed, args.explore, args.feedback_rate)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    ts = 1_750_000_000.0
+    with open(args.out, "w", encoding="utf-8") as f:
+        for i in range(args.n):
+            rid = f"sim-{args.seed}-{i}"
+            base = {"ts": round(ts + i * 0.1, 3), "level": "INFO", "logger": "router.decisions"}
+            f.write(json.dumps({**base, "msg": "route", "request_id": rid, "route": ROUTES[route[i]],
+                                "features": [round(v, 6) for v in X[i].tolist()], "cost_usd": round(cost[i], 8),
+                                "latency_ms": round(latency[i], 3)}) + "\n")
+            if ok[i] is not None:
+                f.write(json.dumps({**base, "msg": "feedback", "request_id": rid, "ok": ok[i]}) + "\n")
+    counts = np.bincount(route, minlength=len(ROUTES))
+    print(f"{args.out}: {args.n:,} requests ({', '.join(f'{r} {c:,}' for r, c in zip(ROUTES, counts))}), "
+          f"{sum(o is not None for o in ok):,} feedback")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# scripts/train_policy.py
+"""
+從決策日誌（ROUTER_LOG_PATH）訓練成本感知的路由策略，寫成 ROUTER_POLICY_FILE 用的 JSON
+
+- 讀「route」紀錄（特徵、走哪條路、成本、延遲）與「feedback」紀錄（ok），用 request_id 對起來；
+  沒有 feedback 的請求不拿來訓練（成本 / 延遲仍算進平均）。支援輪替檔與 .gz
+- 每條路各訓練一個 p(ok | 特徵)：只用實際走那條路的請求（ROUTER_EXPLORE 讓每條路都有資料）
+    logistic：numpy Newton 法 + L2，特徵先標準化、最後折回係數裡
+    gbdt    ：sklearn GradientBoostingClassifier，樹攤平成陣列存進 JSON（推論不需要 sklearn）
+  某條路資料太少（< --min-rows）或只有一種結果時退回常數機率（平滑後的成功率）
+- 每條路的 cost / latency 取日誌裡的平均；日誌裡沒有的路要用 --cost / --latency 指定
+- --holdout 留一部分請求算每條路的 AUC / log loss
+
+用法：
+    python scripts/train_policy.py --log logs/decisions.jsonl* --out data/policy.json
+    python scripts/train_policy.py --log logs/decisions.jsonl* --model gbdt --miss-penalty 0.02 \\
+        --latency-budget-ms 2000 --cost large_model=0.004 --latency large_model=1500
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.policy import (FEATURES, ROUTES, CostAwarePolicy, LogisticModel, TreeEnsembleModel,  # noqa: E402
+                        save_policy)
+
+
+class Decisions(NamedTuple):
+    X: np.ndarray        # (n, features)
+    route: np.ndarray    # (n,) ROUTES 的 index
+    ok: np.ndarray       # (n,) 1 / 0，沒有 feedback 為 nan
+    cost: np.ndarray     # (n,) USD
+    latency: np.ndarray  # (n,) ms
+
+
+def _lines(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            yield from f
+
+
+def read_decisions(paths: Sequence[str]) -> Decisions:
+    """決策日誌 → Decisions；壞掉的行、特徵數不對的紀錄跳過"""
+    rows: Dict[str, Tuple[List[float], int, float, float]] = {}
+    ok: Dict[str, bool] = {}
+    for line in _lines(paths):
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue
+        rid = rec.get("request_id")
+        if rid is None:
+            continue
+        if rec.get("msg") == "route":
+            x = rec.get("features")
+            if rec.get("route") in ROUTES and isinstance(x, list) and len(x) == len(FEATURES):
+                rows[rid] = (x, ROUTES.index(rec["route"]), float(rec.get("cost_usd") or 0.0),
+                             float(rec.get("latency_ms") or 0.0))
+        elif rec.get("msg") == "feedback":
+            ok[rid] = bool(rec.get("ok"))
+    n = len(rows)
+    X = np.empty((n, len(FEATURES)))
+    route, cost, latency = np.empty(n, dtype=np.intp), np.empty(n), np.empty(n)
+    y = np.full(n, np.nan)
+    for i, (rid, (x, r, c, lat)) in enumerate(rows.items()):
+        X[i], route[i], cost[i], latency[i] = x, r, c, lat
+        if rid in ok:
+            y[i] = ok[rid]
+    return Decisions(X, route, y, cost, latency)
+
+
+def _logit(p: float) -> float:
+    return float(np.log(p / (1.0 - p)))
+
+
+def _prior(y: np.ndarray) -> float:
+    """平滑過的成功率（Laplace），資料少時不會是 0 或 1"""
+    return (float(y.sum()) + 1.0) / (len(y) + 2.0)
+
+
+def fit_logistic(X: np.ndarray, y: np.ndarray, l2: float = 1.0, iters: int = 50) -> Tuple[np.ndarray, float]:
+    """Newton 法（IRLS）+ L2（intercept 不懲罰）；回傳原始特徵尺度上的 (coef, intercept)"""
+    mean, std = X.mean(axis=0), X.std(axis=0)
+    std[std == 0] = 1.0
+    Z = np.hstack([(X - mean) / std, np.ones((len(X), 1))])
+    w = np.zeros(Z.shape[1])
+    w[-1] = _logit(_prior(y))
+    reg = np.full(Z.shape[1], l2)
+    reg[-1] = 0.0
+    for _ in range(iters):
+        p = 1.0 / (1.0 + np.exp(-np.clip(Z @ w, -30, 30)))
+        grad = Z.T @ (p - y) + reg * w
+        hess = (Z * (p * (1 - p))[:, None]).T @ Z + np.diag(reg) + 1e-9 * np.eye(len(w))
+        step = np.linalg.solve(hess, grad)
+        w -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    coef = w[:-1] / std
+    return coef, float(w[-1] - coef @ mean)
+
+
+def fit_gbdt(X: np.ndarray, y: np.ndarray, n_estimators: int = 30, max_depth: int = 3,
+             learning_rate: float = 0.1, min_samples_leaf: int = 50) -> Tuple[List[Dict[str, np.ndarray]], float]:
+    """
+    sklearn GradientBoostingClassifier → (每棵樹的陣列, init 的 log-odds)；learning rate 乘進葉值
+    樹的數量 × 深度決定線上推論時間（每條路 30 棵、深度 3 約 30 µs）；葉子至少 min_samples_leaf 筆，避免學到雜訊
+    """
+    from sklearn.ensemble import GradientBoostingClassifier
+
+    est = GradientBoostingClassifier(n_estimators=n_estimators, max_depth=max_depth, learning_rate=learning_rate,
+                                     min_samples_leaf=min_samples_leaf, random_state=0).fit(X, y)
+    trees = []
+    leaf_sum = np.zeros(len(X))
+    for reg in est.estimators_[:, 0]:
+        t = reg.tree_
+        leaf = t.children_left == -1
+        nodes = np.arange(t.node_count)
+        trees.append({
+            "feature": np.where(leaf, 0, t.feature),
+            "threshold": np.where(leaf, np.inf, t.threshold),
+            "left": np.where(leaf, nodes, t.children_left),  # 葉子指回自己
+            "right": np.where(leaf, nodes, t.children_right),
+            "value": t.value[:, 0, 0] * learning_rate,
+            "depth": t.max_depth,
+        })
+        leaf_sum += reg.predict(X.astype(np.float32)) * learning_rate
+    # init（先驗 log-odds）是常數：decision_function 減掉所有樹的貢獻
+    init = float(np.mean(est.decision_function(X) - leaf_sum))
+    return trees, init
+
+
+def _pack_trees(per_route: List[Tuple[List[Dict[str, np.ndarray]], float]]) -> TreeEnsembleModel:
+    """各路的樹補到同樣的節點數後疊成 (樹數, 節點數) 陣列；沒有樹的路只剩 init"""
+    trees = [(r, t) for r, (ts, _) in enumerate(per_route) for t in ts]
+    if not trees:  # 每條路都是常數：放一棵值為 0 的單節點樹，陣列形狀才一致
+        trees = [(0, {"feature": np.zeros(1, dtype=int), "threshold": np.array([np.inf]), "left": np.zeros(1, dtype=int),
+                      "right": np.zeros(1, dtype=int), "value": np.zeros(1), "depth": 0})]
+    width = max(len(t["value"]) for _, t in trees)
+
+    def pad(key: str, fill) -> np.ndarray:
+        out = np.empty((len(trees), width), dtype=np.asarray(trees[0][1][key]).dtype)
+        for i, (_, t) in enumerate(trees):
+            out[i] = fill
+            out[i, :len(t[key])] = t[key]
+        return out
+
+    # 補出來的節點不會被走到，值填什麼都可以；left / right 指向 0 讓陣列索引合法
+    return TreeEnsembleModel(pad("feature", 0), pad("threshold", np.inf), pad("left", 0), pad("right", 0),
+                             pad("value", 0.0), np.array([r for r, _ in trees]),
+                             np.array([init for _, init in per_route]), max(t["depth"] for _, t in trees))
+
+
+def build_policy(data: Decisions, kind: str = "logistic", miss_penalty_usd: float = 0.01,
+                 latency_budget_ms: float = 3000.0, cost: Optional[Dict[str, float]] = None,
+                 latency: Optional[Dict[str, float]] = None, min_rows: int = 30, l2: float = 1.0,
+                 version: Optional[str] = None) -> CostAwarePolicy:
+    cost, latency = dict(cost or {}), dict(latency or {})
+    labeled = ~np.isnan(data.ok)
+    costs, latencies, coefs, intercepts, per_route = [], [], [], [], []
+    for r, name in enumerate(ROUTES):
+        on_route = data.route == r
+        if name not in cost and not on_route.any():
+            raise ValueError(f"no logged requests for route {name!r}: pass --cost {name}=USD --latency {name}=MS")
+        costs.append(cost.get(name, float(data.cost[on_route].mean()) if on_route.any() else 0.0))
+        latencies.append(latency.get(name, float(data.latency[on_route].mean()) if on_route.any() else 0.0))
+
+        mask = on_route & labeled
+        X, y = data.X[mask], data.ok[mask]
+        constant = len(y) < min_rows or y.min(initial=1) == y.max(initial=0)
+        if kind == "logistic":
+            coef, b = (np.zeros(len(FEATURES)), _logit(_prior(y))) if constant else fit_logistic(X, y, l2)
+            coefs.append(coef)
+            intercepts.append(b)
+        elif kind == "gbdt":
+            per_route.append(([], _logit(_prior(y))) if constant else fit_gbdt(X, y))
+        else:
+            raise ValueError(f"unknown model kind: {kind!r} (expected 'logistic' or 'gbdt')")
+    model = LogisticModel(np.array(coefs), np.array(intercepts)) if kind == "logistic" else _pack_trees(per_route)
+    return CostAwarePolicy(model, costs, latencies, miss_penalty_usd, latency_budget_ms,
+                           version=version or time.strftime("%Y%m%d-%H%M%S"))
+
+
+def _auc(score: np.ndarray, y: np.ndarray) -> float:
+    pos, neg = score[y == 1], score[y == 0]
+    if not len(pos) or not len(neg):
+        return float("nan")
+    order = np.argsort(np.concatenate([pos, neg]), kind="mergesort")
+    ranks = np.empty(len(order))
+    ranks[order] = np.arange(1, len(order) + 1)
+    return float((ranks[:len(pos)].sum() - len(pos) * (len(pos) + 1) / 2) / (len(pos) * len(neg)))
+
+
+def _route_kv(items: Sequence[str]) -> Dict[str, float]:
+    out = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        if name not in ROUTES:
+            raise SystemExit(f"unknown route {name!r} (expected one of {', '.join(ROUTES)})")
+        out[name] = float(value)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--log", nargs="+", required=True, help="決策日誌（可多個、可 .gz）")
+    ap.add_argument("--out", default="data/policy.json")
+    ap.add_argument("--model", choices=("logistic", "gbdt"), default="logistic")
+    ap.add_argument("--miss-penalty", type=float, default=0.01, help="答不好一次的代價（USD）")
+    ap.add_argument("--latency-budget-ms", type=float, default=3000.0)
+    ap.add_argument("--cost", nargs="*", default=[], metavar="ROUTE=USD", help="覆寫某條路每個請求的成本")
+    ap.add_argument("--latency", nargs="*", default=[], metavar="ROUTE=MS", help="覆寫某條路的延遲")
+    ap.add_argument("--min-rows", type=int, default=30)
+    ap.add_argument("--holdout", type=float, default=0.2, help="留多少比例的請求做評估（0 = 全部拿來訓練）")
+    args = ap.parse_args()
+
+    data = read_decisions(args.log)
+    rng = np.random.default_rng(0)
+    test = rng.random(len(data.route)) < args.holdout
+    train = Decisions(*(a[~test] for a in data))
+    policy = build_policy(train, args.model, args.miss_penalty, args.latency_budget_ms,
+                          _route_kv(args.cost), _route_kv(args.latency), args.min_rows)
+
+    print(f"{len(data.route):,} requests, {int((~np.isnan(data.ok)).sum()):,} with feedback, "
+          f"holdout {int(test.sum()):,}  →  {args.out} ({policy.name})")
+    print(f"{'route':<12} {'n':>8} {'ok rate':>8} {'cost USD':>10} {'latency':>10} {'AUC':>6} {'logloss':>8}")
+    p = policy.model.predict(data.X[test]) if test.any() else np.zeros((0, len(ROUTES)))
+    for r, name in enumerate(ROUTES):
+        on_route = (data.route == r) & ~np.isnan(data.ok)
+        held = on_route[test]
+        y, pr = data.ok[test][held], np.clip(p[held, r], 1e-9, 1 - 1e-9)
+        logloss = float(-np.mean(y * np.log(pr) + (1 - y) * np.log(1 - pr))) if len(y) else float("nan")
+        rate = float(np.nanmean(data.ok[on_route])) if on_route.any() else float("nan")
+        print(f"{name:<12} {int((data.route == r).sum()):>8,} {rate:>8.3f} {policy.cost_usd[r]:>10.6f} "
+              f"{policy.latency_ms[r]:>7.0f} ms {_auc(pr, y):>6.3f} {logloss:>8.4f}")
+    save_policy(policy, args.out)
+
+
+if __name__ == "__main__":
+    main()
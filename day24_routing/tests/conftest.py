@@ -6,3 +6,8 @@ import sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+# /kb/docs 的變更日誌寫到暫存檔：測試不會在 data/ 留下日誌，重跑也不會重播上一次的變更
+import tempfile  # noqa: E402
+
+os.environ.setdefault("KB_CHANGES_PATH", os.path.join(tempfile.mkdtemp(prefix="kb_changes_"), "kb.changes.jsonl"))
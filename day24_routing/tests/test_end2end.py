@@ -15,3 +15,14 @@ def test_ask():
     assert "answer" in data
     assert data["route"]["target"] in ("kb", "small_model")
     assert isinstance(data["contexts"], list)
+
+def test_kb_upsert_and_delete_without_restart():
+    query = {"query": "季度尾牙抽獎規則", "top_k": 1}
+    resp = client.post("/kb/docs", json=[{"id": "tmp-001", "text": "季度尾牙抽獎規則：每人一張抽獎券，現場公布得獎名單。"}])
+    assert resp.status_code == 200 and resp.json()["upserted"] == 1
+    assert client.post("/ask", json=query).json()["contexts"][0]["id"] == "tmp-001"
+
+    assert client.delete("/kb/docs/tmp-001").status_code == 200
+    assert client.delete("/kb/docs/tmp-001").status_code == 404
+    contexts = client.post("/ask", json=query).json()["contexts"]
+    assert all(c["id"] != "tmp-001" for c in contexts)
@@ -0,0 +1,89 @@
+# tests/test_hybrid.py
+"""
+HybridRetriever：BM25 + dense 融合（rrf / weighted）、兩路並行（延遲 ≈ max 不是相加）、
+增量更新同時進兩路、訊號可以直接給 router.decide
+"""
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("faiss")
+
+from app.embedder import HashingEmbedder  # noqa: E402
+from app.hybrid import HybridRetriever  # noqa: E402
+from app.router import decide  # noqa: E402
+
+DOCS = [
+    ("faq-001", "公司 VPN 設定：下載新版客戶端，並以 SSO 登入，表單編號 F482913。"),
+    ("faq-002", "請假流程：登入 HR 系統提交假單，表單編號 F120387。"),
+    ("faq-003", "內部 Wi-Fi：SSID 為 Corp-5G，密碼由 IT 每季輪替，表單編號 F775104。"),
+    ("faq-004", "報帳規範：差旅需上傳發票影本，經主管審核，表單編號 F300552。"),
+]
+
+
+@pytest.fixture
+def kb(tmp_path: Path) -> str:
+    path = tmp_path / "kb.jsonl"
+    path.write_text("".join(json.dumps({"id": i, "text": t}, ensure_ascii=False) + "\n" for i, t in DOCS),
+                    encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("fusion", ["rrf", "weighted"])
+def test_hybrid_finds_keyword_and_fuzzy_matches(kb, fusion):
+    r = HybridRetriever(kb, embedder=HashingEmbedder(dim=128), fusion=fusion, dense_min=0.1)
+    chunks, signals = r.search("請假流程要登入哪個系統", top_k=2)
+    assert chunks[0].id == "faq-002"
+    assert 0 < signals.max_score < 1 and signals.sparse_max > 0 and signals.dense_max > 0
+    assert signals.context_len == sum(len(c.text) for c in chunks)
+    assert decide(signals).signals == signals
+
+    # 只記得表單編號前幾碼：jieba 切出來的詞對不上（BM25 沒命中），字元 n-gram 的 dense 那一路找得到
+    chunks, signals = r.search("F77510", top_k=1)
+    assert signals.sparse_max == 0 and chunks[0].id == "faq-003"
+
+
+def test_parallel_matches_sequential_and_overlaps_legs(kb, monkeypatch):
+    r = HybridRetriever(kb, embedder=HashingEmbedder(dim=128))
+    queries = ["VPN 登入", "報帳", "完全無關的問題", "F300552"]
+    parallel = r.search_batch(queries, top_k=3)
+    r.parallel = False
+    assert r.search_batch(queries, top_k=3) == parallel
+    assert [r.search(q, top_k=3) for q in queries] == parallel
+    r.parallel = True
+
+    # 兩路各自卡 0.3 s：並行時總共約 0.3 s，不是 0.6 s
+    sparse_leg, dense_leg = r._sparse_leg, r._dense_leg
+    monkeypatch.setattr(r, "_sparse_leg", lambda *a: (time.sleep(0.3), sparse_leg(*a))[1])
+    monkeypatch.setattr(r, "_dense_leg", lambda *a: (time.sleep(0.3), dense_leg(*a))[1])
+    t0 = time.perf_counter()
+    assert r.search_batch(queries, top_k=3) == parallel
+    assert time.perf_counter() - t0 < 0.5
+
+
+def test_upsert_and_delete_reach_both_legs(kb):
+    r = HybridRetriever(kb, embedder=HashingEmbedder(dim=128))
+    r.upsert([("faq-011", "尾牙抽獎：每人一張抽獎券，表單編號 F999001。")])
+    assert "faq-011" in r and "faq-011" in r.dense and len(r) == 5
+    assert r.search("尾牙抽獎", top_k=1)[0][0].id == "faq-011"
+
+    assert r.delete(["faq-011", "missing"]) == 1
+    assert "faq-011" not in r.dense
+    assert all(c.id != "faq-011" for c in r.search("尾牙抽獎 F999001", top_k=4)[0])
+
+
+def test_unknown_fusion_is_rejected(kb):
+    with pytest.raises(ValueError):
+        HybridRetriever(kb, embedder=HashingEmbedder(dim=16), fusion="max")
+
+
+def test_rrf_prefers_docs_found_by_both_legs(kb):
+    r = HybridRetriever(kb, embedder=HashingEmbedder(dim=128), fusion="rrf", dense_min=0.0)
+    s_hits = [("a", "A", 0.9), ("b", "B", 0.5)]
+    d_hits = [("c", "C", 0.8), ("b", "B", 0.7)]
+    chunks, signals = r._fuse(s_hits, 2, d_hits, top_k=3)
+    assert [c.id for c in chunks][0] == "b"
+    assert chunks[0].score == pytest.approx(0.5 * 0.5 + 0.5 * 0.7)
+    assert signals.num_docs == 2 and signals.sparse_max == 0.9 and signals.dense_max == 0.8
@@ -0,0 +1,97 @@
+import json
+from pathlib import Path
+
+from app.kb_changes import KBChangeLog, compact
+from app.retriever import SimpleRetriever
+
+
+def _kb(tmp_path: Path) -> Path:
+    kb = tmp_path / "kb.jsonl"
+    kb.write_text(
+        '{"id":"a","text":"公司 VPN 設定：以 SSO 登入"}\n'
+        '{"id":"b","text":"請假流程：登入 HR 系統提交假單"}\n',
+        encoding="utf-8",
+    )
+    return kb
+
+
+def _worker(kb: Path, changes: Path):
+    """模擬一個 uvicorn worker：自己的 retriever，共用 kb.jsonl 與變更日誌"""
+    r = SimpleRetriever(str(kb), use_snapshot=False)
+    log = KBChangeLog(str(changes), r)
+    log.replay()
+    return r, log
+
+
+def test_changes_reach_other_workers(tmp_path: Path):
+    kb, changes = _kb(tmp_path), tmp_path / "kb.changes.jsonl"
+    r1, log1 = _worker(kb, changes)
+    r2, log2 = _worker(kb, changes)
+
+    assert log1.upsert([("c", "報帳流程：上傳發票到費用系統")]) == 1
+    assert "c" in r1 and "c" not in r2
+    log2.sync()
+    assert "c" in r2
+    assert r2.search("報帳 發票", top_k=1)[0][0].id == "c"
+
+    assert log2.delete(["a", "missing"]) == 1
+    log1.sync()
+    assert "a" not in r1 and "a" not in r2
+    assert log1.delete(["a"]) == 0
+
+
+def test_changes_survive_restart(tmp_path: Path):
+    kb, changes = _kb(tmp_path), tmp_path / "kb.changes.jsonl"
+    _, log = _worker(kb, changes)
+    log.upsert([("c", "報帳流程")])
+    log.delete(["b"])
+
+    r, _ = _worker(kb, changes)  # 重啟：重新載入 kb.jsonl 後重播日誌
+    assert "c" in r and "a" in r and "b" not in r
+
+
+def test_reload_event_keeps_logged_changes(tmp_path: Path):
+    kb, changes = _kb(tmp_path), tmp_path / "kb.changes.jsonl"
+    r1, log1 = _worker(kb, changes)
+    r2, log2 = _worker(kb, changes)
+    log1.upsert([("c", "報帳流程")])
+    with kb.open("a", encoding="utf-8") as f:
+        f.write('{"id":"d","text":"新人報到"}\n')
+    log1.reload()
+    log2.sync()
+    for r in (r1, r2):
+        assert all(doc_id in r for doc_id in "abcd")
+
+
+def test_sync_skips_partial_line(tmp_path: Path):
+    kb, changes = _kb(tmp_path), tmp_path / "kb.changes.jsonl"
+    r, log = _worker(kb, changes)
+    line = json.dumps({"op": "upsert", "docs": [["c", "報帳流程"]]}, ensure_ascii=False)
+    with changes.open("a", encoding="utf-8") as f:
+        f.write(line[:10])  # 另一個行程寫到一半
+    log.sync()
+    assert "c" not in r
+    with changes.open("a", encoding="utf-8") as f:
+        f.write(line[10:] + "\n")
+    log.sync()
+    assert "c" in r
+
+
+def test_compact_folds_log_into_kb(tmp_path: Path):
+    kb, changes = _kb(tmp_path), tmp_path / "kb.changes.jsonl"
+    r1, log1 = _worker(kb, changes)
+    r2, log2 = _worker(kb, changes)
+    log1.upsert([("c", "報帳流程"), ("a", "VPN 新版設定")])
+    log1.delete(["b"])
+    log2.sync()
+
+    assert compact(str(kb), str(changes)) == {"events": 2, "docs": 2}
+    assert changes.read_bytes() == b""
+    assert [json.loads(line)["id"] for line in kb.read_text(encoding="utf-8").splitlines()] == ["a", "c"]
+
+    log2.upsert([("d", "新人報到")])  # worker 發現日誌換檔：重讀 kb.jsonl 後接著讀新日誌
+    log1.sync()
+    for r in (r1, r2):
+        assert "c" in r and "d" in r and "b" not in r
+    r3, _ = _worker(kb, changes)
+    assert len(r3) == 3
@@ -27,3 +27,15 @@ def test_answer_with_valid_context():
     assert ans.startswith("根據知識庫：")
     assert "公司 VPN 設定" in ans
     assert tokens > 0
+
+def test_tokens_and_cost_use_shared_accounting(monkeypatch):
+    from app import accounting, llm_small
+
+    # 小模型若設成價格表裡的模型，就用表上的價格
+    monkeypatch.setattr(llm_small, "SMALL_MODEL_NAME", "gpt-4o-mini")
+    contexts = [ContextChunk(id="faq-001", text="公司 VPN 設定", score=0.5)]
+    ans, tokens, cost = answer_with_small_model("如何設定公司 VPN？", contexts)
+    prompt = accounting.count_tokens("如何設定公司 VPN？", "gpt-4o-mini")
+    completion = accounting.count_tokens(ans, "gpt-4o-mini")
+    assert tokens == prompt + completion
+    assert cost == pytest.approx((prompt * 0.15 + completion * 0.60) / 1_000_000)
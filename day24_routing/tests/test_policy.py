@@ -0,0 +1,195 @@
+# tests/test_policy.py
+"""
+路由策略引擎：固定門檻向量化與單筆一致、logistic / gbdt 訓練與匯出（和 sklearn 結果一樣）、
+成本 + 延遲預算的選路、策略檔存讀、決策日誌解析、replay、/ask 走 large_model 與探索
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from app import router
+from app.models import RetrievalSignals
+from app.policy import FEATURES, ROUTES, CostAwarePolicy, LogisticModel, ThresholdPolicy, load_policy, save_policy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import replay_policy  # noqa: E402
+import simulate_decision_log as sim  # noqa: E402
+import train_policy as tp  # noqa: E402
+
+
+def _signals(x) -> RetrievalSignals:
+    return RetrievalSignals(max_score=x[0], avg_topk=x[1], num_docs=int(x[2]), context_len=int(x[3]),
+                            sparse_max=x[4], dense_max=x[5])
+
+
+def _write_log(path, n=4000, seed=0, explore=0.3):
+    X, route, _, ok, cost, latency = sim.simulate(n, seed, explore, feedback_rate=0.8)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(json.dumps({"msg": "route", "request_id": f"r{i}", "route": ROUTES[route[i]],
+                                "features": X[i].tolist(), "cost_usd": cost[i], "latency_ms": latency[i]}) + "\n")
+            if ok[i] is not None:
+                f.write(json.dumps({"msg": "feedback", "request_id": f"r{i}", "ok": ok[i]}) + "\n")
+    return str(path)
+
+
+def test_threshold_policy_batch_matches_single_decisions():
+    X, *_ = sim.simulate(300, seed=3)
+    policy = ThresholdPolicy(router.THRESH_MAX, router.THRESH_AVG, router.MIN_DOCS)
+    batch = policy.choose(X)
+    for x, r in zip(X.tolist(), batch):
+        decision = policy.decide(_signals(x))
+        assert decision.target == ROUTES[r]
+        assert decision.features == pytest.approx(x)
+
+
+def test_fit_logistic_recovers_true_probabilities():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(20000, 3)) * [1.0, 5.0, 0.1] + [0.0, 10.0, 1.0]
+    coef, intercept = np.array([1.5, -0.4, 8.0]), -5.0
+    p = 1.0 / (1.0 + np.exp(-(X @ coef + intercept)))
+    y = (rng.random(len(X)) < p).astype(float)
+    got_coef, got_intercept = tp.fit_logistic(X, y, l2=1e-3)
+    got = LogisticModel(got_coef[None, :], np.array([got_intercept])).predict(X)[:, 0]
+    assert np.abs(got - p).mean() < 0.01
+
+
+def test_gbdt_export_matches_sklearn():
+    from sklearn.ensemble import GradientBoostingClassifier
+
+    X, *_ = sim.simulate(3000, seed=1)
+    y = (X[:, 0] + 0.1 * np.random.default_rng(0).normal(size=len(X)) > 0.35).astype(float)
+    trees, init = tp.fit_gbdt(X, y, n_estimators=20, min_samples_leaf=20)
+    model = tp._pack_trees([(trees, init), ([], 0.0), (trees[:5], -1.0)])
+    ref = GradientBoostingClassifier(n_estimators=20, max_depth=3, learning_rate=0.1, min_samples_leaf=20,
+                                     random_state=0).fit(X, y)
+    np.testing.assert_allclose(model.predict(X)[:, 0], ref.predict_proba(X)[:, 1], atol=1e-9)
+    np.testing.assert_allclose(model.predict(X[:1])[0, 0], ref.predict_proba(X[:1])[0, 1], atol=1e-9)
+    assert model.predict(X)[:, 1] == pytest.approx(0.5)  # 沒有樹的路只剩 init
+
+
+def test_cost_aware_policy_trades_cost_against_miss_penalty_and_latency_budget():
+    # p_kb 隨 max_score 上升，small 固定 0.6，large 固定 0.9
+    coef = np.zeros((3, len(FEATURES)))
+    coef[0, 0] = 20.0
+    model = LogisticModel(coef, np.array([-8.0, np.log(0.6 / 0.4), np.log(0.9 / 0.1)]))
+    X = np.zeros((3, len(FEATURES)))
+    X[:, 0] = [0.9, 0.2, 0.0]
+    policy = CostAwarePolicy(model, [0.0, 0.001, 0.01], [10, 300, 1500], miss_penalty_usd=0.1, latency_budget_ms=3000)
+    assert [ROUTES[r] for r in policy.choose(X)] == ["kb", "large_model", "large_model"]
+    # 答錯比較便宜時改走小模型
+    cheap = CostAwarePolicy(model, [0.0, 0.001, 0.01], [10, 300, 1500], miss_penalty_usd=0.02, latency_budget_ms=3000)
+    assert [ROUTES[r] for r in cheap.choose(X)] == ["kb", "small_model", "small_model"]
+    # large 超過延遲預算就不選
+    tight = CostAwarePolicy(model, [0.0, 0.001, 0.01], [10, 300, 1500], miss_penalty_usd=0.1, latency_budget_ms=1000)
+    assert ROUTES.index("large_model") not in tight.choose(X)
+    assert policy.decide(_signals(X[1].tolist())).target == "large_model"
+
+
+def test_policy_file_round_trip(tmp_path):
+    data = tp.read_decisions([_write_log(tmp_path / "d.jsonl")])
+    X = data.X[:500]
+    for kind in ("logistic", "gbdt"):
+        policy = tp.build_policy(data, kind, version="t")
+        save_policy(policy, str(tmp_path / f"{kind}.json"))
+        loaded = load_policy(str(tmp_path / f"{kind}.json"))
+        assert loaded.name == f"{kind}@t"
+        np.testing.assert_allclose(loaded.expected_cost(X), policy.expected_cost(X))
+
+    bad = policy.to_dict()
+    bad["kind"] = "forest"
+    with pytest.raises(ValueError):
+        CostAwarePolicy.from_dict(bad)
+    bad = policy.to_dict()
+    bad["features"] = ["max_score"]
+    with pytest.raises(ValueError):
+        CostAwarePolicy.from_dict(bad)
+
+
+def test_read_decisions_joins_feedback_and_skips_bad_lines(tmp_path):
+    path = tmp_path / "d.jsonl"
+    x = [0.5, 0.3, 2, 80, 0, 0]
+    path.write_text("\n".join([
+        json.dumps({"msg": "route", "request_id": "a", "route": "kb", "features": x, "cost_usd": 0, "latency_ms": 5}),
+        json.dumps({"msg": "route", "request_id": "b", "route": "small_model", "features": x, "cost_usd": 0.001,
+                    "latency_ms": 300}),
+        json.dumps({"msg": "route", "request_id": "c", "route": "kb", "features": [1, 2]}),  # 特徵數不對
+        "not json",
+        json.dumps({"msg": "feedback", "request_id": "b", "ok": False}),
+        json.dumps({"msg": "feedback", "request_id": "zzz", "ok": True}),  # 沒有對應的決策
+    ]) + "\n", encoding="utf-8")
+    data = tp.read_decisions([str(path)])
+    assert data.route.tolist() == [0, 1]
+    assert np.isnan(data.ok[0]) and data.ok[1] == 0.0
+    assert data.cost.tolist() == [0.0, 0.001] and data.latency.tolist() == [5.0, 300.0]
+
+
+def test_build_policy_needs_cost_for_unlogged_route(tmp_path):
+    data = tp.read_decisions([_write_log(tmp_path / "d.jsonl", explore=0.0)])  # 只有門檻策略：沒有 large_model
+    with pytest.raises(ValueError, match="large_model"):
+        tp.build_policy(data)
+    policy = tp.build_policy(data, cost={"large_model": 0.004}, latency={"large_model": 1500})
+    assert policy.cost_usd[2] == 0.004
+    assert policy.model.coef[2].tolist() == [0.0] * len(FEATURES)  # 沒資料：常數機率
+
+
+def test_replay_uses_logged_outcomes_when_policy_agrees(tmp_path):
+    data = tp.read_decisions([_write_log(tmp_path / "d.jsonl", explore=0.0)])
+    ref_p = np.full((len(data.route), len(ROUTES)), 0.5)
+    res = replay_policy.replay(ThresholdPolicy(router.THRESH_MAX, router.THRESH_AVG, router.MIN_DOCS), data, ref_p)
+    assert res["cost_per_1k"] == pytest.approx(data.cost.mean() * 1000)
+    labeled = ~np.isnan(data.ok)
+    assert res["observed"] == pytest.approx(labeled.mean())
+    assert res["ok_rate"] == pytest.approx(np.where(labeled, data.ok, 0.5).mean())
+
+
+def test_ask_routes_to_large_model_and_explores(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    model = LogisticModel(np.zeros((3, len(FEATURES))), np.array([-5.0, -5.0, 5.0]))
+    monkeypatch.setattr(router, "POLICY", CostAwarePolicy(model, [0.0, 0.0, 0.001], [1, 1, 1], 1.0, 1000))
+    data = client.post("/ask", json={"query": "如何設定公司 VPN？"}).json()
+    assert data["route"]["target"] == "large_model" and data["cost_usd_est"] > 0
+    assert "features" not in data["route"] and data["request_id"]
+    assert client.post("/feedback", json={"request_id": data["request_id"], "ok": True}).status_code == 200
+
+    monkeypatch.setattr(router, "EXPLORE", 1.0)
+    decision = router.decide(_signals([0.9, 0.9, 3, 100, 0, 0]))
+    assert decision.reason.endswith("(explore)") and decision.target in ROUTES
+
+
+def test_each_worker_writes_its_own_decision_log(tmp_path):
+    """uvicorn --workers N：每個 worker 寫 {ROUTER_LOG_PATH}.{pid}，訓練時用 glob 一起讀、依 request_id 合併"""
+    import glob
+    import subprocess
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    env = {**os.environ, "ROUTER_LOG_PATH": str(tmp_path / "decisions.jsonl")}
+    worker = (
+        "import sys\n"
+        "from fastapi.testclient import TestClient\n"
+        "from app.main import app\n"
+        "with TestClient(app) as c:\n"
+        "    if sys.argv[1] == 'ask':\n"
+        "        print(c.post('/ask', json={'query': '如何設定公司 VPN？'}).json()['request_id'])\n"
+        "    else:\n"
+        "        c.post('/feedback', json={'request_id': sys.argv[2], 'ok': True})\n"
+    )
+
+    def run(*args):
+        out = subprocess.run([sys.executable, "-c", worker, *args], cwd=root, env=env,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip().splitlines()[-1] if out.stdout.strip() else ""
+
+    rid = run("ask")
+    run("feedback", rid)  # feedback 落在另一個 worker
+
+    files = glob.glob(str(tmp_path / "decisions.jsonl*"))
+    assert len(files) == 2 and not os.path.exists(tmp_path / "decisions.jsonl")
+    data = tp.read_decisions(files)
+    assert len(data.route) == 1 and data.ok.tolist() == [1.0]
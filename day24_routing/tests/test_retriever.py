@@ -1,6 +1,11 @@
+import json
+import threading
+
 from app.retriever import SimpleRetriever
 from pathlib import Path
 import jieba
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
 
 def test_search_top1(tmp_path: Path):
     kb = tmp_path / "kb.jsonl"
@@ -39,3 +44,64 @@ def test_search_chinese_with_userdict(tmp_path: Path):
     assert len(chunks) == 1
     assert chunks[0].id == "faq-002"
     assert signals.max_score > 0
+
+def test_search_batch_matches_single_search_and_dense_scores(tmp_path: Path):
+    kb = tmp_path / "kb.jsonl"
+    kb.write_text(
+        '{"id":"faq-001","text":"公司 VPN 設定：下載新版客戶端，並以 SSO 登入。"}\n'
+        '{"id":"faq-002","text":"請假流程：登入 HR 系統提交假單。"}\n'
+        '{"id":"faq-003","text":"內部 Wi-Fi：SSID 為 Corp-5G，密碼由 IT 每季輪替。"}\n'
+        '{"id":"faq-004","text":"報帳規範：差旅需上傳發票影本，經主管審核。"}\n',
+        encoding="utf-8"
+    )
+    r = SimpleRetriever(str(kb))
+    ref = TfidfVectorizer(analyzer=r.index.analyzer, norm="l2")
+    ref_matrix = ref.fit_transform(json.loads(line)["text"] for line in kb.read_text(encoding="utf-8").splitlines())
+    queries = ["VPN 登入", "請假流程", "Wi-Fi 密碼", "完全無關的問題", "登入"]
+
+    batch = r.search_batch(queries, top_k=3)
+    assert len(batch) == len(queries)
+    for q, (chunks, signals) in zip(queries, batch):
+        assert (chunks, signals) == r.search(q, top_k=3)
+
+        # 與 sklearn TfidfVectorizer 全量 fit + dense 算法一致
+        dense = (ref_matrix @ ref.transform([q]).T).toarray().ravel()
+        assert [c.score for c in chunks] == pytest.approx(sorted(dense, reverse=True)[:3])
+        assert signals.num_docs == int((dense > 0).sum())
+        assert signals.context_len == sum(len(c.text) for c in chunks)
+
+    # 命中不足 top_k：跟原本一樣用 0 分文件補滿，avg_topk 只算有分數的
+    chunks, signals = batch[-1]
+    assert len(chunks) == 3 and chunks[-1].score == 0.0
+    assert signals.num_docs == 2
+    assert signals.avg_topk == pytest.approx(sum(c.score for c in chunks) / 2)
+
+    assert r.search_batch([], top_k=3) == []
+    assert len(r.search("VPN", top_k=10)[0]) == 4
+
+def test_index_snapshot_is_loaded_and_rebuilt_when_stale(tmp_path: Path, monkeypatch):
+    kb = tmp_path / "kb.jsonl"
+    kb.write_text(
+        '{"id":"faq-001","text":"公司 VPN 設定：下載新版客戶端，並以 SSO 登入。"}\n'
+        '{"id":"faq-002","text":"請假流程：登入 HR 系統提交假單。"}\n',
+        encoding="utf-8"
+    )
+    built = SimpleRetriever(str(kb), use_snapshot=False)
+    built.save()
+    expected = built.search_batch(["VPN 登入", "請假"], top_k=2)
+
+    # snapshot 對得上：直接 mmap 載入，不重建
+    def no_rebuild(self):
+        raise AssertionError("rebuilt although the snapshot is fresh")
+    monkeypatch.setattr(SimpleRetriever, "reload", no_rebuild)
+    r = SimpleRetriever(str(kb))
+    assert r.search_batch(["VPN 登入", "請假"], top_k=2) == expected
+    r.upsert([("faq-003", "內部 Wi-Fi 密碼由 IT 每季輪替")])
+    assert r.search("Wi-Fi", top_k=1)[0][0].id == "faq-003"
+    monkeypatch.undo()
+
+    # KB 改了：snapshot 過期，改走重建
+    with kb.open("a", encoding="utf-8") as f:
+        f.write('{"id":"faq-004","text":"報帳規範：差旅需上傳發票影本。"}\n')
+    r = SimpleRetriever(str(kb))
+    assert "faq-004" in r and len(r) == 3
@@ -0,0 +1,201 @@
+# tests/test_tfidf_index.py
+"""
+TfidfIndex：增量新增 / 取代 / 刪除後的分數要和整批重 fit 的 sklearn TfidfVectorizer 一樣；
+合併 delta、舊 snapshot 不受寫入影響、並行 search + upsert、存成 .npy 後 mmap 載入、BM25 分數
+"""
+import threading
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.tfidf_index import TfidfIndex
+
+DOCS = [
+    ("a", "vpn sso login client"),
+    ("b", "leave process hr system login"),
+    ("c", "wifi password rotate it"),
+    ("d", "expense invoice manager review"),
+]
+QUERIES = ["vpn login", "hr leave", "password", "invoice review manager", "nothing here"]
+
+
+def _assert_same_as_full_fit(index: TfidfIndex, docs: dict):
+    """把 index 的分數依 doc id 對齊，和 sklearn 在同一批文件上 fit 的結果比"""
+    snap = index.snapshot()
+    ref = TfidfVectorizer(analyzer=str.split, norm="l2")
+    ids = list(docs)
+    ref_scores = (ref.fit_transform(docs.values()) @ ref.transform(QUERIES).T).toarray().T
+    got = snap.scores(QUERIES).toarray()
+    assert len(snap) == len(docs)
+    for pos in range(got.shape[1]):
+        doc_id, text = snap.doc(pos)
+        if not snap.alive[pos]:
+            assert not got[:, pos].any()
+            continue
+        assert text == docs[doc_id]
+        np.testing.assert_allclose(got[:, pos], ref_scores[:, ids.index(doc_id)], atol=1e-12)
+
+
+def test_upsert_replace_delete_match_full_rebuild():
+    index = TfidfIndex(str.split)
+    index.build(DOCS)
+    docs = dict(DOCS)
+    _assert_same_as_full_fit(index, docs)
+
+    index.upsert([("e", "vpn client download new version"), ("f", "brand new words only")])
+    docs.update(e="vpn client download new version", f="brand new words only")
+    _assert_same_as_full_fit(index, docs)
+
+    index.upsert([("b", "leave process needs manager approval")])  # 取代
+    docs["b"] = "leave process needs manager approval"
+    assert index.delete(["c", "missing"]) == 1
+    del docs["c"]
+    _assert_same_as_full_fit(index, docs)
+    assert "c" not in index and "b" in index
+
+
+def test_delta_merges_into_base_and_drops_deleted_docs():
+    index = TfidfIndex(str.split, merge_min=2, merge_ratio=0.0)
+    index.build(DOCS[:2])
+    docs = dict(DOCS[:2])
+    for i, (doc_id, text) in enumerate(DOCS[2:] + [("g", "password review"), ("h", "login wifi")]):
+        index.upsert([(doc_id, text)])
+        docs[doc_id] = text
+        if i == 1:
+            index.delete(["a"])
+            del docs["a"]
+        _assert_same_as_full_fit(index, docs)
+
+    snap = index.snapshot()
+    assert snap.base.ids == ["b", "c", "d", "g"] and snap.delta.ids == ["h"]  # 已合併一次，a 真的被移除
+    index.delete(["h"])  # 合併後的位置對照要跟著更新
+    del docs["h"]
+    _assert_same_as_full_fit(index, docs)
+
+
+def test_old_snapshot_is_unaffected_by_writes():
+    index = TfidfIndex(str.split)
+    index.build(DOCS)
+    before = index.snapshot()
+    expected = before.scores(QUERIES).toarray()
+
+    index.upsert([("e", "vpn vpn vpn")])
+    index.delete(["a"])
+    assert index.snapshot() is not before
+    np.testing.assert_array_equal(before.scores(QUERIES).toarray(), expected)
+    assert len(before) == 4 and len(index) == 4
+
+
+def test_concurrent_search_during_upserts():
+    index = TfidfIndex(str.split, merge_min=16, merge_ratio=0.0)
+    index.build(DOCS)
+    errors, stop = [], threading.Event()
+
+    def reader():
+        try:
+            while not stop.is_set():
+                snap = index.snapshot()
+                scores = snap.scores(QUERIES)
+                assert scores.shape == (len(QUERIES), len(snap.alive))
+                assert np.all(scores.data <= 1.0 + 1e-9)
+        except Exception as e:  # pragma: no cover - 失敗時才會走到
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(200):
+        index.upsert([(f"n{i}", f"vpn login extra{i}")])
+        if i % 3 == 0:
+            index.delete([f"n{i // 2}"])
+    stop.set()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(index) == 4 + 200 - len({f"n{i // 2}" for i in range(0, 200, 3)})
+
+
+def test_empty_index_returns_no_scores():
+    index = TfidfIndex(str.split)
+    assert index.snapshot().scores(["vpn"]).nnz == 0
+    index.upsert([("a", "vpn")])
+    assert index.snapshot().scores(["vpn"]).toarray().ravel() == pytest.approx([1.0])
+
+
+def _is_mmap(a: np.ndarray) -> bool:
+    while a is not None:
+        if isinstance(a, np.memmap):
+            return True
+        a = a.base
+    return False
+
+
+def test_save_and_mmap_load_round_trip(tmp_path):
+    index = TfidfIndex(str.split)
+    index.build(DOCS)
+    index.upsert([("e", "vpn client download new version")])
+    index.delete(["c"])
+    docs = {**dict(DOCS), "e": "vpn client download new version"}
+    del docs["c"]
+    path = str(tmp_path / "kb.index")
+    meta = index.save(path, {"kb_sha1": "x"})
+    assert meta["n_docs"] == 4 and meta["kb_sha1"] == "x"
+
+    loaded = TfidfIndex(str.split)
+    assert loaded.load(path) == TfidfIndex.read_meta(path)
+    snap = loaded.snapshot()
+    # 載入後不複製：CSR 陣列、IDF、norm 都還是 mmap（多個 worker 共用 page cache）
+    for a in (snap.base.post.data, snap.base.post.indices, snap.base.post.indptr,
+              snap.base.tf.indices, *snap.weights()):
+        assert _is_mmap(a)
+    _assert_same_as_full_fit(loaded, docs)
+    assert "e" in loaded and "c" not in loaded
+
+    # 載入後照常增量更新；磁碟上的 snapshot 不受影響
+    loaded.upsert([("f", "brand new words only"), ("a", "vpn sso")])
+    loaded.delete(["d"])
+    updated = {**docs, "f": "brand new words only", "a": "vpn sso"}
+    del updated["d"]
+    _assert_same_as_full_fit(loaded, updated)
+    again = TfidfIndex(str.split)
+    again.load(path)
+    _assert_same_as_full_fit(again, docs)
+
+
+def test_load_missing_snapshot_raises(tmp_path):
+    assert TfidfIndex.read_meta(str(tmp_path / "nope")) is None
+    with pytest.raises(FileNotFoundError):
+        TfidfIndex(str.split).load(str(tmp_path / "nope"))
+
+
+def test_bm25_matches_reference_formula():
+    index = TfidfIndex(str.split)
+    index.build(DOCS)
+    index.upsert([("e", "vpn vpn client download"), ("b", "leave process login login hr")])
+    index.delete(["c"])
+    docs = {doc_id: text.split() for doc_id, text in DOCS if doc_id != "c"}
+    docs.update(e="vpn vpn client download".split(), b="leave process login login hr".split())
+    n, avgdl, k1, b = len(docs), sum(map(len, docs.values())) / len(docs), 1.2, 0.75
+
+    def ref(query: str, doc_id: str) -> float:
+        toks, score = docs[doc_id], 0.0
+        for term in query.split():  # query 裡重複的詞算兩次
+            df = sum(term in d for d in docs.values())
+            if df:
+                tf = toks.count(term)
+                idf = np.log1p((n - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(toks) / avgdl))
+        return score
+
+    snap = index.snapshot()
+    queries = QUERIES + ["login login"]
+    scores, upper = snap.bm25_scores(queries, k1, b)
+    got = scores.toarray()
+    for qi, q in enumerate(queries):
+        for pos in range(got.shape[1]):
+            doc_id, _ = snap.doc(pos)
+            expected = ref(q, doc_id) if snap.alive[pos] else 0.0
+            assert got[qi, pos] == pytest.approx(expected, abs=1e-12)
+        assert got[qi].max() < upper[qi] or upper[qi] == 0  # 除以上限後落在 [0, 1)
@@ -0,0 +1,62 @@
+# tests/test_tokenizer.py
+"""
+Tokenizer：與 sklearn analyzer 輸出一致、query LRU、KB 分詞的磁碟快取（重啟不重切、設定改了就失效）、process pool
+"""
+import jieba
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app import tokenizer as tk
+from app.tokenizer import Tokenizer
+
+TEXTS = [
+    "公司 VPN 設定：下載新版客戶端，並以 SSO 登入。",
+    "請假流程：登入 HR 系統提交假單。",
+    "Reset My PASSWORD please",
+    "",
+    "公司 VPN 設定：下載新版客戶端，並以 SSO 登入。",  # 重複的文件
+]
+
+
+@pytest.fixture
+def tokenizer(tmp_path):
+    userdict = tmp_path / "userdict.txt"
+    userdict.write_text("請假流程\n公司VPN\n", encoding="utf-8")
+    return Tokenizer([str(userdict)], cache_size=16, workers=1)
+
+
+def test_analyze_matches_sklearn_analyzer_and_is_cached(tokenizer):
+    ref = TfidfVectorizer(tokenizer=lambda s: list(jieba.cut(s, HMM=True)), token_pattern=None,
+                          ngram_range=(1, 2)).build_analyzer()
+    for text in TEXTS:
+        assert list(tokenizer.analyze(text)) == ref(text)
+    assert "請假流程" in tokenizer.analyze("我要請假流程")
+    assert tokenizer.cache_info().hits == 1  # TEXTS 裡重複的那一篇
+
+
+def test_corpus_tokens_are_persisted_and_reused(tokenizer, tmp_path, monkeypatch):
+    path = str(tmp_path / "kb.tokens.json")
+    first = list(tokenizer.analyze_corpus(TEXTS, cache_path=path))
+    assert first == [list(tokenizer.analyze(t)) for t in TEXTS]
+
+    # 重啟：全部命中快取，不該再呼叫 jieba
+    def boom(text, hmm):
+        raise AssertionError(f"re-tokenized: {text!r}")
+    monkeypatch.setattr(tk, "_cut", boom)
+    assert list(tokenizer.analyze_corpus(TEXTS, cache_path=path)) == first
+
+    # 詞典改了 → fingerprint 不同 → 整份失效
+    monkeypatch.undo()
+    with open(tokenizer.userdicts[0], "a", encoding="utf-8") as f:
+        f.write("新版客戶端\n")
+    changed = Tokenizer(tokenizer.userdicts, workers=1)
+    assert changed.fingerprint != tokenizer.fingerprint
+    assert "新版客戶端" in next(changed.analyze_corpus(TEXTS, cache_path=path))
+
+
+def test_parallel_corpus_tokenization_matches_serial(tokenizer, monkeypatch):
+    texts = [f"{t} 第{i}版" for i, t in enumerate(TEXTS * 10)]
+    serial = list(tokenizer.analyze_corpus(texts))
+    monkeypatch.setattr(tk, "PARALLEL_MIN_DOCS", 1)
+    tokenizer.workers = 2
+    assert list(tokenizer.analyze_corpus(texts)) == serial
@@ -2,6 +2,8 @@ import re
 from typing import Dict, List, Tuple
 from html import escape
 
+from app.tracing import traced
+
 def compile_patterns(patterns: List[str]) -> List[re.Pattern]:
     return [re.compile(p) for p in patterns]
 
@@ -35,6 +37,7 @@ class Guardrails:
         self.input_patterns = compile_patterns(policy.get("input", {}).get("deny_patterns", []))
         self.output_patterns = compile_patterns(policy.get("output", {}).get("deny_patterns", []))
 
+    @traced("guardrail.check_input")
     def check_input(self, text: str, mode: str) -> Tuple[bool, List[str]]:
         violations = []
         if mode == "off":
@@ -50,6 +53,7 @@ class Guardrails:
                     return True, violations
         return False, violations
 
+    @traced("guardrail.redact_pii")
     def redact_pii(self, text: str, mode: str) -> Tuple[str, Dict[str, int]]:
         stats = {}
         result = text or ""
@@ -91,6 +95,7 @@ class Guardrails:
 
         return result, stats
 
+    @traced("guardrail.check_output")
     def check_output(self, text: str, mode: str) -> Tuple[bool, List[str]]:
         violations = []
         if mode == "off":
@@ -103,6 +108,7 @@ class Guardrails:
                     return True, violations
         return False, violations
 
+    @traced("guardrail.enforce_acl")
     def enforce_acl(self, user_role: str, doc_ids: List[str], mode: str) -> Tuple[bool, List[str]]:
         violations = []
         if mode == "off":
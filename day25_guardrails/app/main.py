@@ -1,12 +1,24 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import Response, JSONResponse
-from prometheus_client import Counter, Histogram, generate_latest
+from prometheus_client import Counter, Histogram
 from app.guardrails import Guardrails, sanitize_input
+from app.prom_multiprocess import mark_worker_exit, render_latest
+from app import tracing
 import os
 import time
 import yaml
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    tracing.shutdown()
+    # 多 worker metrics（PROMETHEUS_MULTIPROC_DIR）：清掉本 worker 的 live gauge 檔
+    mark_worker_exit()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # === Prometheus 指標 ===
 REQUEST_COUNT = Counter(
@@ -39,6 +51,14 @@ REQUEST_LATENCY = Histogram(
     ["route", "method"]
 )
 
+STAGE_LATENCY = Histogram(
+    "gateway_stage_latency_seconds",
+    "各階段延遲（秒）",
+    ["stage"]  # stage = guardrail.check_input / guardrail.redact_pii / ...
+)
+# guardrail 各步驟耗時寫進 STAGE_LATENCY；TRACING_EXPORTER 有設時另外匯出 OpenTelemetry span
+tracing.configure(histogram=STAGE_LATENCY)
+
 # === Policy 載入 + 熱更新 ===
 policy_path = os.path.join(os.path.dirname(__file__), "..", "policy.yaml")
 policy_mtime = None
@@ -80,8 +100,9 @@ async def health():
 
 @app.get("/metrics")
 async def metrics():
-    # 回傳 Prometheus exposition format（純文字）
-    return Response(generate_latest(), media_type="text/plain")
+    # 回傳 Prometheus exposition format（純文字）；多 worker 時為所有 worker 加總
+    data, content_type = render_latest()
+    return Response(data, media_type=content_type)
 
 
 @app.post("/ask")
@@ -23,3 +23,16 @@ def test_metrics_exposed():
     # 驗證是否包含主要的計數器與直方圖指標
     assert "gateway_requests_total" in text
     assert "gateway_request_latency_seconds" in text
+
+
+def test_stage_latency_exposed():
+    """
+    測試情境：
+    打一次 /ask 後，/metrics 應該有 guardrail 各步驟的延遲直方圖
+    （gateway_stage_latency_seconds{stage="guardrail.check_input"} 等）。
+    """
+    client.post("/ask", json={"query": "請問請假流程？", "user": {"id": "u1", "role": "employee"}})
+
+    text = client.get("/metrics").text
+    assert 'gateway_stage_latency_seconds_count{stage="guardrail.check_input"}' in text
+    assert 'gateway_stage_latency_seconds_count{stage="guardrail.redact_pii"}' in text